@@ -21,6 +21,15 @@ def create_app(config_class=Config):
     
     # Import models
     from EcoPlot.models.user import User
+    from EcoPlot.models.recommendation_cache import RecommendationCacheEntry
+    from EcoPlot.models.recommendation_job import RecommendationJob
+    from EcoPlot.models.recommendation_job_event import RecommendationJobEvent
+    from EcoPlot.models.recommendation_lock import RecommendationLock
+    from EcoPlot.models.recommendation_fingerprint import RecommendationFingerprint
+    from EcoPlot.models.usage_rollup import UsageRollup, UsageRollupStatus
+    from EcoPlot.models.usage_archive import UsageArchiveSegment
+    from EcoPlot.models.ev_charge_plan import EVChargePlan
+    from EcoPlot.models.forecast_model import ForecastModel
     
     @login_manager.user_loader
     def load_user(user_id):
@@ -32,12 +41,72 @@ def create_app(config_class=Config):
     from EcoPlot.routes.admin_routes import admin_bp
     from EcoPlot.routes.device_routes import devices_bp
     from EcoPlot.routes.recommendation_routes import recommendations_bp
+    from EcoPlot.routes.usage_routes import usage_bp
+    from EcoPlot.routes.schedule_routes import schedule_bp
+    from EcoPlot.routes.battery_routes import battery_bp
+    from EcoPlot.routes.tariff_routes import tariff_bp
+    from EcoPlot.routes.scenario_routes import scenario_bp
+    from EcoPlot.routes.forecast_routes import forecast_bp
 
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(admin_bp)
     app.register_blueprint(devices_bp)
     app.register_blueprint(recommendations_bp)
+    app.register_blueprint(usage_bp)
+    app.register_blueprint(schedule_bp)
+    app.register_blueprint(battery_bp)
+    app.register_blueprint(tariff_bp)
+    app.register_blueprint(scenario_bp)
+    app.register_blueprint(forecast_bp)
+       
+    # Set up the recommendation cache
+    from EcoPlot.services.recommendation_cache import init_recommendation_cache
+    init_recommendation_cache(app)
+
+    # Set up coalescing of identical concurrent recommendation requests
+    from EcoPlot.services.single_flight import init_single_flight
+    init_single_flight(app)
+
+    # Set up the Gemini circuit breaker
+    from EcoPlot.services.circuit_breaker import init_circuit_breaker
+    init_circuit_breaker(app)
+
+    # Keep the usage rollups in step with the usage logs
+    from EcoPlot.services.usage_rollups import init_usage_rollups
+    init_usage_rollups(app)
+
+    # Set up the solar production model and its irradiance cache
+    from EcoPlot.services.solar_model import init_solar_model
+    init_solar_model(app)
+
+    # Set up the wind production model and its weather data
+    from EcoPlot.services.wind_model import init_wind_model
+    init_wind_model(app)
+
+    # Set up the regional grid carbon intensity profiles
+    from EcoPlot.services.carbon_accounting import init_carbon_accounting
+    init_carbon_accounting(app)
+
+    # Set up the compiled rate plans
+    from EcoPlot.services.tariffs import init_tariff_engine
+    init_tariff_engine(app)
+
+    # Set up the cache of the last appliance schedules
+    from EcoPlot.services.appliance_scheduler import init_appliance_scheduler
+    init_appliance_scheduler(app)
+
+    # Set up the what-if scenario worker pool
+    from EcoPlot.services.scenarios import init_scenarios
+    init_scenarios(app)
+
+    # Set up the recommendation job queue
+    from EcoPlot.services.recommendation_jobs import init_recommendation_jobs
+    init_recommendation_jobs(app)
+
+    # Register CLI commands
+    from EcoPlot.commands import register_commands
+    register_commands(app)
        
     # Create database tables
     with app.app_context():
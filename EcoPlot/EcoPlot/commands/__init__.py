@@ -0,0 +1,19 @@
+# EcoPlot/commands/__init__.py
+
+def register_commands(app):
+    """Register the flask CLI command groups"""
+    from .carbon import carbon_cli
+    from .ev import ev_cli
+    from .forecast import forecast_cli
+    from .recommendations import recommendations_cli
+    from .rollups import rollups_cli
+    from .synthetic import synthetic_cli
+    from .usage import usage_cli
+
+    app.cli.add_command(carbon_cli)
+    app.cli.add_command(ev_cli)
+    app.cli.add_command(forecast_cli)
+    app.cli.add_command(recommendations_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(synthetic_cli)
+    app.cli.add_command(usage_cli)
@@ -0,0 +1,28 @@
+# EcoPlot/commands/carbon.py
+import click
+from flask.cli import AppGroup
+from EcoPlot.services.carbon_accounting import CarbonAccountingService
+from EcoPlot.services.usage_rollups import UsageRollupService
+
+carbon_cli = AppGroup('carbon', help='Carbon accounting commands.')
+
+@carbon_cli.command('backfill')
+@click.option('--recompute', is_flag=True, help='Also replace carbon values already stored.')
+@click.option('--chunk-rows', default=None, type=int, help='Logs per transaction (default: CARBON_BACKFILL_CHUNK_ROWS).')
+@click.option('--skip-rollups', is_flag=True, help='Leave the rollups of the updated users for a later flask rollups rebuild.')
+def backfill(recompute, chunk_rows, skip_rollups):
+    """Compute the carbon footprint of stored usage logs from the regional grid intensity"""
+    with click.progressbar(length=0, label='Backfilling') as bar:
+        def progress(done, total):
+            bar.length = total
+            bar.update(done - bar.pos)
+
+        result = CarbonAccountingService.backfill(recompute=recompute, chunk_rows=chunk_rows, progress=progress)
+    click.echo(f"Updated {result['logs_updated']} logs of {len(result['user_ids'])} user(s) in "
+               f"{result['chunks']} chunk(s) and {result['segments_updated']} archive segment(s) in "
+               f"{result['seconds']}s, {result['rows_per_second']} rows/s.")
+
+    if not skip_rollups:
+        for user_id in result['user_ids']:
+            UsageRollupService.rebuild_user(user_id)
+        click.echo(f"Rebuilt the usage rollups of {len(result['user_ids'])} user(s).")
@@ -0,0 +1,15 @@
+# EcoPlot/commands/ev.py
+import click
+from flask.cli import AppGroup
+from EcoPlot.services.ev_charging import EVChargingService
+
+ev_cli = AppGroup('ev', help='EV charging commands.')
+
+@ev_cli.command('plan')
+@click.option('--chunk-users', default=None, type=int, help='Users planned together (default: EV_PLAN_CHUNK_USERS).')
+def plan(chunk_users):
+    """Plan the next charging session of every EV charger; run nightly, e.g. from cron"""
+    result = EVChargingService.plan_all(chunk_users=chunk_users)
+    click.echo(f"Planned {result['chargers']} charger(s) of {result['users']} user(s) in {result['seconds']}s "
+               f"({result['ms_per_user']} ms per user); {result['short_of_target']} cannot reach their target "
+               f"by departure.")
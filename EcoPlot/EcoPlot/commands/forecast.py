@@ -0,0 +1,16 @@
+# EcoPlot/commands/forecast.py
+import click
+from flask.cli import AppGroup
+from EcoPlot.models.user import User
+from EcoPlot.services.forecasting import ForecastService
+
+forecast_cli = AppGroup('forecast', help='Consumption forecasting commands.')
+
+@forecast_cli.command('fit')
+@click.option('--chunk-users', default=None, type=int, help='Users fitted together (default: FORECAST_CHUNK_USERS).')
+def fit(chunk_users):
+    """Refit every household's consumption forecast model; run nightly, e.g. from cron"""
+    with click.progressbar(length=User.query.count(), label='Fitting') as bar:
+        result = ForecastService.fit_all(chunk_users=chunk_users, progress=lambda done: bar.update(done - bar.pos))
+    click.echo(f"Fitted {result['fitted']} model(s) of {result['users']} user(s) in {result['seconds']}s "
+               f"({result['ms_per_user']} ms per user); {result['without_history']} have no usage history yet.")
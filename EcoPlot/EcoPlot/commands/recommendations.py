@@ -0,0 +1,21 @@
+# EcoPlot/commands/recommendations.py
+import time
+import click
+from flask.cli import AppGroup
+from EcoPlot.services.recommendation_jobs import get_recommendation_jobs
+
+recommendations_cli = AppGroup('recommendations', help='Recommendation job commands.')
+
+@recommendations_cli.command('worker')
+@click.option('--workers', default=None, type=int, help='Number of worker threads (default: RECOMMENDATION_JOB_WORKERS).')
+def run_worker(workers):
+    """Run recommendation jobs in a dedicated process until interrupted"""
+    queue = get_recommendation_jobs()
+    queue.start(worker_count=workers)
+    click.echo(f"Recommendation worker running with {len(queue._threads)} thread(s). Press CTRL+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        click.echo("Stopping recommendation worker...")
+        queue.shutdown()
@@ -0,0 +1,23 @@
+# EcoPlot/commands/rollups.py
+import click
+from flask.cli import AppGroup
+from EcoPlot import db
+from EcoPlot.models.user import User
+from EcoPlot.services.usage_rollups import UsageRollupService, pending_rebuilds
+
+rollups_cli = AppGroup('rollups', help='Usage rollup commands.')
+
+@rollups_cli.command('rebuild')
+@click.option('--user-id', default=None, type=int, help='Rebuild one user only (default: all users).')
+@click.option('--pending', is_flag=True, help='Rebuild only users whose rollups are for another timezone.')
+def rebuild(user_id, pending):
+    """Recompute the usage rollups from the usage logs, e.g. after a backfill"""
+    if pending:
+        with db.engine.connect() as conn:
+            user_ids = pending_rebuilds(conn)
+    else:
+        user_ids = [user_id] if user_id is not None else [user.id for user in User.query.all()]
+    for current_id in user_ids:
+        rows = UsageRollupService.rebuild_user(current_id)
+        click.echo(f"User {current_id}: {rows} rollup rows")
+    click.echo(f"Rebuilt the usage rollups of {len(user_ids)} user(s).")
@@ -0,0 +1,32 @@
+# EcoPlot/commands/synthetic.py
+import click
+from flask.cli import AppGroup
+from EcoPlot.services.synthetic_data import PASSWORD, RESOLUTIONS, STORAGES, SyntheticDataService
+
+synthetic_cli = AppGroup('synthetic', help='Synthetic data commands.')
+
+@synthetic_cli.command('generate')
+@click.option('--users', required=True, type=int, help='Households to create.')
+@click.option('--days', default=365, type=int, help='Days of usage logs, ending today.')
+@click.option('--resolution', type=click.Choice(list(RESOLUTIONS)), default='hour', help='One log per hour or per minute of use.')
+@click.option('--storage', type=click.Choice(STORAGES), default='rows', help='Insert the logs as rows or write them to the archive.')
+@click.option('--seed', default=None, type=int, help='Seed for a reproducible data set.')
+@click.option('--prefix', default='synthetic', help='Start of the usernames.')
+@click.option('--no-rollups', is_flag=True, help='Skip the rollups (build them later with flask rollups rebuild).')
+def generate(users, days, resolution, storage, seed, prefix, no_rollups):
+    """Create households with devices and usage logs for load and scale testing"""
+    with click.progressbar(length=users, label='Generating') as bar:
+        def progress(users_done, logs_written):
+            bar.update(users_done - bar.pos)
+
+        try:
+            result = SyntheticDataService.generate(users, days, resolution=resolution, storage=storage,
+                                                   rollups=not no_rollups, seed=seed, prefix=prefix,
+                                                   progress=progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    click.echo(f"Created {result['users']} users with {result['devices']} devices and {result['logs']} "
+               f"usage logs ({result['rollup_rows']} rollup rows) from {result['start']} to {result['end']} "
+               f"in {result['seconds']}s, {result['logs_per_second']} logs/s.")
+    click.echo(f"Every generated user has the password '{PASSWORD}'.")
@@ -0,0 +1,81 @@
+# EcoPlot/commands/usage.py
+import os
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from EcoPlot import db
+from EcoPlot.models.user import User
+from EcoPlot.services.meter_import import FORMATS as METER_FORMATS
+from EcoPlot.services.meter_import import MeterImportError, MeterImportService, detect_format
+from EcoPlot.services.usage_archive import UsageArchiveService
+from EcoPlot.services.usage_ingest import FORMATS, UsageIngestService
+
+usage_cli = AppGroup('usage', help='Usage log commands.')
+
+@usage_cli.command('import')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--user-id', required=True, type=int, help='Owner of the devices the logs belong to.')
+@click.option('--format', 'data_format', type=click.Choice(FORMATS), default=None, help='Input format (default: from the file extension).')
+@click.option('--batch-size', default=None, type=int, help='Rows per insert (default: USAGE_INGEST_BATCH_SIZE).')
+def import_usage(source, user_id, data_format, batch_size):
+    """Import usage logs from an NDJSON or CSV file, or - for stdin"""
+    if data_format is None:
+        extension = os.path.splitext(source.name)[1].lower()
+        data_format = 'csv' if extension == '.csv' else 'ndjson'
+
+    result = UsageIngestService.ingest(user_id, source, data_format, batch_size=batch_size)
+    for error in result['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    if result['errors_truncated']:
+        click.echo("... more errors not shown", err=True)
+    click.echo(f"Inserted {result['rows_inserted']} of {result['rows_received']} rows "
+               f"({result['rows_rejected']} rejected) in {result['seconds']}s, "
+               f"{result['rows_per_second']} rows/s.")
+
+@usage_cli.command('import-meter')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user-id', required=True, type=int, help='Owner of the device.')
+@click.option('--device-id', required=True, type=int, help='Device the meter data is stored under.')
+@click.option('--format', 'data_format', type=click.Choice(METER_FORMATS), default=None, help='greenbutton or csv (default: detected).')
+@click.option('--interval-minutes', default=None, type=int, help='Interval length for CSV files without end times.')
+def import_meter(path, user_id, device_id, data_format, interval_minutes):
+    """Import a Green Button XML or utility interval CSV file"""
+    user = db.session.get(User, user_id)
+    if user is None:
+        raise click.ClickException(f"User {user_id} not found")
+
+    with open(path, 'rb') as source:
+        if data_format is None:
+            data_format = detect_format(path, source.read(512))
+            source.seek(0)
+
+        with click.progressbar(length=os.path.getsize(path), label='Importing') as bar:
+            def progress(bytes_read, intervals_read):
+                bar.update(bytes_read - bar.pos)
+
+            try:
+                result = MeterImportService.import_file(user, device_id, source, data_format,
+                                                        interval_minutes=interval_minutes, progress=progress)
+            except MeterImportError as e:
+                raise click.ClickException(str(e))
+
+    for error in result['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    click.echo(f"Inserted {result['intervals_inserted']} of {result['intervals_read']} intervals "
+               f"({result['duplicates']} duplicates, {result['overlaps_skipped']} overlapping, "
+               f"{result['already_stored']} already stored, {result['exports_skipped']} exports skipped) "
+               f"in {result['seconds']}s.")
+
+@usage_cli.command('archive')
+@click.option('--user-id', default=None, type=int, help='Archive one user only (default: all users).')
+@click.option('--older-than-days', default=None, type=int, help='Age of the logs to archive (default: USAGE_ARCHIVE_AFTER_DAYS).')
+def archive_usage(user_id, older_than_days):
+    """Move old usage logs into the columnar archive, whole months at a time"""
+    before = None
+    if older_than_days is not None:
+        before = datetime.utcnow() - timedelta(days=older_than_days)
+
+    result = UsageArchiveService.archive(before=before, user_id=user_id)
+    click.echo(f"Archived {result['logs_archived']} logs before {result['cutoff']} from "
+               f"{result['devices']} device(s) into {result['segments_written']} segment(s), "
+               f"{result['bytes_written']} bytes, in {result['seconds']}s.")
@@ -16,4 +16,108 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     REMEMBER_COOKIE_DURATION = timedelta(days=30)
     # Gemini API config
-    GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY') or 'API_KEY_HERE'
\ No newline at end of file
+    GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY') or 'API_KEY_HERE'
+    GEMINI_API_BASE_URL = os.environ.get('GEMINI_API_BASE_URL')  # override the endpoint, e.g. for a local stand-in
+    GEMINI_MAX_IN_FLIGHT = int(os.environ.get('GEMINI_MAX_IN_FLIGHT', 8))  # concurrent Gemini calls per worker process
+    GEMINI_SLOT_TIMEOUT = 30  # seconds to wait for a free in-flight slot
+    GEMINI_REQUEST_TIMEOUT = 60  # seconds
+    GEMINI_KEEPALIVE_EXPIRY = 60  # seconds an idle pooled connection is kept open
+    GEMINI_PROMPT_TOKEN_BUDGET = int(os.environ.get('GEMINI_PROMPT_TOKEN_BUDGET', 6000))  # estimated tokens per prompt before devices are split into parallel calls
+    GEMINI_PROMPT_MAX_CHUNKS = 16  # upper bound on parallel calls for one request
+    # Circuit breaker around Gemini calls
+    GEMINI_CIRCUIT_FAILURE_RATE = 0.5  # share of failed or slow calls in the window that opens the circuit
+    GEMINI_CIRCUIT_MIN_CALLS = 5  # calls in the window before the failure rate is evaluated
+    GEMINI_CIRCUIT_WINDOW = 60  # seconds of call outcomes considered
+    GEMINI_CIRCUIT_SLOW_CALL = 15  # seconds after which a call counts as failed
+    GEMINI_CIRCUIT_OPEN_SECONDS = 30  # seconds to fail fast before letting a probe call through
+    # Recommendation cache config
+    RECOMMENDATION_CACHE_BACKEND = os.environ.get('RECOMMENDATION_CACHE_BACKEND') or 'memory'  # memory, sqlite or redis
+    RECOMMENDATION_CACHE_URL = os.environ.get('RECOMMENDATION_CACHE_URL')  # e.g. redis://localhost:6379/0
+    RECOMMENDATION_CACHE_CLIENT_FACTORY = os.environ.get('RECOMMENDATION_CACHE_CLIENT_FACTORY')  # module:attribute building the redis client from the URL, e.g. fakeredis:FakeRedis.from_url
+    RECOMMENDATION_CACHE_TTL = int(os.environ.get('RECOMMENDATION_CACHE_TTL', 24 * 60 * 60))  # seconds
+    RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.environ.get('RECOMMENDATION_CACHE_MAX_ENTRIES', 1024))
+    # Recommendation job queue config
+    RECOMMENDATION_JOB_WORKERS = int(os.environ.get('RECOMMENDATION_JOB_WORKERS', 2))
+    RECOMMENDATION_JOB_INLINE_WORKERS = os.environ.get('RECOMMENDATION_JOB_INLINE_WORKERS', 'true').lower() == 'true'  # false when running `flask recommendations worker`
+    RECOMMENDATION_JOB_POLL_INTERVAL = 1.0  # seconds between queue polls
+    RECOMMENDATION_JOB_EVENTS_POLL_INTERVAL = 1.0  # seconds before the browser reconnects to a job's event stream
+    RECOMMENDATION_JOB_TIMEOUT = 300  # seconds before a running job is considered stalled
+    RECOMMENDATION_JOB_MAX_ATTEMPTS = 6  # attempts before a job answered by the rules fallback fails
+    RECOMMENDATION_JOB_RETRY_BACKOFF = 15  # seconds before retrying a job, doubled after every attempt
+    RECOMMENDATION_REVALIDATE_INTERVAL = 300  # seconds a finished revalidation job answers new stale requests
+    # Coalescing of identical concurrent recommendation requests
+    RECOMMENDATION_LOCK_TTL = 120  # seconds a cross-process lock row is honoured
+    RECOMMENDATION_LOCK_POLL_INTERVAL = 0.1  # seconds between lock row checks while waiting
+    # Rule-based recommendation engine
+    FREE_TIER_RECOMMENDATION_ENGINE = os.environ.get('FREE_TIER_RECOMMENDATION_ENGINE') or 'rules'  # rules or gemini
+    TOU_PEAK_START_HOUR = 16  # start of the time-of-use peak window
+    TOU_PEAK_END_HOUR = 21  # end of the time-of-use peak window
+    # Dashboard energy aggregation
+    DEFAULT_TIMEZONE = os.environ.get('DEFAULT_TIMEZONE') or 'UTC'  # for users without a timezone
+    DEFAULT_ELECTRICITY_RATE_PER_KWH = 0.15  # used for savings when neither logs nor profile have a rate
+    GRID_CARBON_INTENSITY_KG_PER_KWH = 0.4  # kg CO2 per grid kWh in regions without an intensity profile
+    # Bulk usage log ingestion
+    USAGE_INGEST_BATCH_SIZE = 5000  # rows per executemany and commit
+    USAGE_INGEST_MAX_ERRORS = 100  # row errors reported per import
+    # Usage rollups
+    USAGE_ROLLUP_REBUILD_INLINE_WORKER = os.environ.get('USAGE_ROLLUP_REBUILD_INLINE_WORKER', 'true').lower() == 'true'  # false to leave timezone rebuilds to `flask rollups rebuild --pending`
+    # Smart-meter interval data import
+    METER_IMPORT_CHUNK_SIZE = 10000  # intervals deduplicated and inserted together
+    METER_IMPORT_DEFAULT_INTERVAL_MINUTES = 15  # for CSV exports without end times
+    # Columnar archive of old usage logs
+    USAGE_ARCHIVE_DIR = os.environ.get('USAGE_ARCHIVE_DIR') or os.path.join(data_dir, 'archive')
+    USAGE_ARCHIVE_AFTER_DAYS = int(os.environ.get('USAGE_ARCHIVE_AFTER_DAYS', 365))  # logs older than this move to the archive, in whole months
+    # Synthetic data generator
+    SYNTHETIC_DATA_CHUNK_USERS = 50  # households generated and written per transaction
+    # Solar production model
+    SOLAR_MODEL_TILE_DEGREES = 0.05  # sites within a tile of this size share cached irradiance
+    SOLAR_MODEL_CACHE_DAYS = 20000  # cached (tile, tilt, azimuth, day) irradiance profiles, about 1.2 KB each
+    SOLAR_PERFORMANCE_RATIO = 0.8  # AC output per kW of panel rating at 1000 W/m2 (inverter, wiring, heat, soiling)
+    SOLAR_DEGRADATION_PER_YEAR = 0.005  # output lost per year since the installation date
+    # Wind production model
+    WIND_WEATHER_FILE = os.environ.get('WIND_WEATHER_FILE') or os.path.join(data_dir, 'weather', 'wind.csv')  # CSV of timestamped wind speeds in m/s, a typical year or longer
+    WIND_MEASUREMENT_HEIGHT_M = 10.0  # anemometer height for files without a height column
+    WIND_SHEAR_MODEL = 'log'  # log (roughness length) or power (shear exponent) extrapolation to hub height
+    WIND_ROUGHNESS_LENGTH_M = 0.1  # open country with hedges; about 0.5 for suburbs
+    WIND_SHEAR_EXPONENT = 0.143  # 1/7 power law
+    WIND_LOSSES = 0.1  # share of output lost to downtime, wakes and wiring
+    # Appliance scheduler
+    SCHEDULE_POWER_CAP_KW = 7.2  # household peak power scheduled devices must stay under (30 A at 240 V)
+    SCHEDULE_CARBON_PRICE_PER_KG = 0.05  # $ per kg CO2 when balancing cost and carbon
+    SCHEDULE_GENERATION_SHARE = 0.5  # share of the clear-sky solar and wind output counted on for scheduled devices
+    SCHEDULE_CACHE_USERS = 1000  # last schedules kept for incremental re-solves
+    # EV charging planner
+    EV_PLAN_SLOT_MINUTES = 15  # 15 or 60
+    EV_PLAN_CHUNK_USERS = 1000  # EV users planned together by flask ev plan
+    EV_CHARGING_EFFICIENCY = 0.9  # kWh stored per kWh drawn by the charger
+    EV_DEFAULT_DAILY_USAGE_KWH = 10.0  # for users without a typical daily usage
+    EV_DEFAULT_PLUG_IN_HOUR = 18  # local plug-in time of chargers without a preferred start time
+    EV_DEFAULT_DEPARTURE_HOUR = 7  # local departure time of chargers without a preferred end time
+    # Home battery simulator
+    BATTERY_DEFAULT_CAPACITY_KWH = 10.0  # simulated for users without a battery in their profile
+    BATTERY_MAX_C_RATE = 0.5  # charge and discharge power per kWh of capacity when no power is given
+    BATTERY_ROUND_TRIP_EFFICIENCY = 0.9  # energy delivered per kWh stored
+    BATTERY_BACKUP_RESERVE = 0.2  # share of the capacity the backup_reserve strategy keeps for outages
+    BATTERY_SIM_CLEAR_SKY_SHARE = 0.75  # share of the modeled clear-sky output produced on average
+    BATTERY_SIM_MIN_HISTORY_DAYS = 30  # usage history needed before batteries or scenarios are simulated
+    # Tariff engine
+    TARIFF_DEFAULT_PLAN = 'tou'  # plan of users without a known electricity_rate_plan
+    TARIFF_PLANS_FILE = os.path.join(data_dir, 'tariffs.json')  # optional JSON rate plans added to the built-in ones
+    TARIFF_CACHE_PLANS = 64  # compiled plan years (plan, timezone, year) kept in memory
+    # Carbon accounting
+    GRID_INTENSITY_DIR = os.path.join(data_dir, 'grid_intensity')  # <REGION>.csv hourly profiles, e.g. US-CA.csv, US.csv
+    CARBON_BACKFILL_CHUNK_ROWS = 50000  # usage logs per transaction of flask carbon backfill
+    # What-if scenarios
+    SCENARIO_MAX_PER_REQUEST = 50  # scenarios one POST /api/scenarios may compare
+    SCENARIO_WORKERS = None  # worker processes evaluating scenarios, None for one per CPU
+    SCENARIO_MIN_PARALLEL = 4  # fewer scenarios than this are evaluated in the request process
+    SCENARIO_SOLAR_COST_PER_KW = 2500.0  # installed cost of added panels, $ per kW
+    SCENARIO_BATTERY_COST_PER_KWH = 800.0  # installed cost of an added battery, $ per kWh
+    SCENARIO_EV_CHARGE_KW = 7.2  # charger power of an added EV when none is given
+    # Consumption forecasting
+    FORECAST_HISTORY_DAYS = 84  # hourly history each household's model is fitted on
+    FORECAST_HALF_LIFE_DAYS = 21  # age at which an hour counts half as much in the fit
+    FORECAST_RIDGE_ALPHA = 1.0  # shrinkage of the hour, weekday/weekend and trend coefficients
+    FORECAST_CHUNK_USERS = 1000  # users fitted together by flask forecast fit
+    FORECAST_MAX_AGE_HOURS = 36  # older models are refitted when a forecast is requested
+    FORECAST_MAX_HOURS = 168  # furthest /api/forecast looks ahead
\ No newline at end of file
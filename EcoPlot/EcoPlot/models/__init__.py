@@ -6,6 +6,15 @@ from .device_usage import DeviceUsageLog
 from .device_type import DeviceType
 from .device_brand import DeviceBrand
 from .user import User
+from .recommendation_cache import RecommendationCacheEntry
+from .recommendation_job import RecommendationJob
+from .recommendation_job_event import RecommendationJobEvent
+from .recommendation_lock import RecommendationLock
+from .recommendation_fingerprint import RecommendationFingerprint
+from .usage_rollup import UsageRollup, UsageRollupStatus
+from .usage_archive import UsageArchiveSegment
+from .ev_charge_plan import EVChargePlan
+from .forecast_model import ForecastModel
 
 # Make all models available when importing EcoPlot.models
 __all__ = [
@@ -13,5 +22,15 @@ __all__ = [
     'DeviceUsageLog',
     'DeviceType',
     'DeviceBrand',
-    'User'
+    'User',
+    'RecommendationCacheEntry',
+    'RecommendationJob',
+    'RecommendationJobEvent',
+    'RecommendationLock',
+    'RecommendationFingerprint',
+    'UsageRollup',
+    'UsageRollupStatus',
+    'UsageArchiveSegment',
+    'EVChargePlan',
+    'ForecastModel'
 ]
\ No newline at end of file
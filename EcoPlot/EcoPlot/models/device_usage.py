@@ -4,6 +4,10 @@ from datetime import datetime
 
 class DeviceUsageLog(db.Model):
     __tablename__ = 'device_usage_logs'
+    __table_args__ = (
+        # Aggregation reads a device's logs by time range
+        db.Index('ix_device_usage_logs_device_start', 'device_id', 'start_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.Integer, db.ForeignKey('devices.id'), nullable=False)
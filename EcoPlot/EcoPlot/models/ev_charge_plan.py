@@ -0,0 +1,53 @@
+# EcoPlot/models/ev_charge_plan.py
+from EcoPlot import db
+from datetime import datetime, timezone
+import json
+
+class EVChargePlan(db.Model):
+    """Latest charging plan of an EV charger, replaced by each planning run"""
+    __tablename__ = 'ev_charge_plans'
+
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    preference = db.Column(db.String(20), nullable=False)  # cheapest, greenest or fastest
+
+    # Slots of the plan; charge_kw_json holds the charging power of each slot
+    plan_start = db.Column(db.DateTime, nullable=False)  # UTC
+    slot_minutes = db.Column(db.Integer, nullable=False)
+    charge_kw_json = db.Column(db.Text, nullable=False)
+    plug_in = db.Column(db.DateTime)  # UTC; None when the charger has no window in the plan
+    departure = db.Column(db.DateTime)  # UTC
+
+    # Energy drawn from the charger and what it costs
+    target_kwh = db.Column(db.Float, nullable=False)
+    energy_kwh = db.Column(db.Float, nullable=False)
+    onsite_kwh = db.Column(db.Float, nullable=False)
+    cost = db.Column(db.Float, nullable=False)
+    carbon_kg = db.Column(db.Float, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<EVChargePlan device {self.device_id} from {self.plan_start}>'
+
+    def to_dict(self, tz=timezone.utc):
+        """Convert plan to dictionary for API responses, with times in the given timezone"""
+        def local(value):
+            return value.replace(tzinfo=timezone.utc).astimezone(tz).isoformat() if value else None
+
+        return {
+            'device_id': self.device_id,
+            'preference': self.preference,
+            'plan_start': local(self.plan_start),
+            'slot_minutes': self.slot_minutes,
+            'charge_kw': json.loads(self.charge_kw_json),
+            'plug_in': local(self.plug_in),
+            'departure': local(self.departure),
+            'target_kwh': self.target_kwh,
+            'energy_kwh': self.energy_kwh,
+            'shortfall_kwh': round(max(self.target_kwh - self.energy_kwh, 0), 3),
+            'onsite_kwh': self.onsite_kwh,
+            'cost': self.cost,
+            'carbon_kg': self.carbon_kg,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
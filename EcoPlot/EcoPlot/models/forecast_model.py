@@ -0,0 +1,42 @@
+# EcoPlot/models/forecast_model.py
+from EcoPlot import db
+from datetime import datetime, timezone
+import json
+
+class ForecastModel(db.Model):
+    """Fitted consumption forecast of a household, replaced by each fitting run"""
+    __tablename__ = 'forecast_models'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    timezone_name = db.Column(db.String(50), nullable=False)  # zone the hour-of-day features were built in
+
+    # Hourly history the model was fitted on
+    history_start = db.Column(db.DateTime, nullable=False)  # UTC
+    history_end = db.Column(db.DateTime, nullable=False)  # UTC; the trend feature is 0 here
+    history_hours = db.Column(db.Integer, nullable=False)  # hours with data
+
+    # Ridge coefficients in the order of the forecasting FEATURES layout
+    coefficients_json = db.Column(db.Text, nullable=False)
+    rmse_kwh = db.Column(db.Float, nullable=False)  # weighted in-sample error of an hour
+
+    fitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ForecastModel user {self.user_id} fitted {self.fitted_at}>'
+
+    def coefficients(self):
+        """The fitted coefficients as a list"""
+        return json.loads(self.coefficients_json)
+
+    def to_dict(self, tz=timezone.utc):
+        """Convert model metadata to dictionary for API responses, with times in the given timezone"""
+        def local(value):
+            return value.replace(tzinfo=timezone.utc).astimezone(tz).isoformat() if value else None
+
+        return {
+            'history_start': local(self.history_start),
+            'history_end': local(self.history_end),
+            'history_hours': self.history_hours,
+            'rmse_kwh': self.rmse_kwh,
+            'fitted_at': local(self.fitted_at)
+        }
@@ -0,0 +1,16 @@
+# EcoPlot/models/recommendation_cache.py
+from EcoPlot import db
+from datetime import datetime
+
+class RecommendationCacheEntry(db.Model):
+    """Cached Gemini recommendations keyed by an input fingerprint"""
+    __tablename__ = 'recommendation_cache'
+
+    key = db.Column(db.String(64), primary_key=True)  # sha256 hex digest of the prompt inputs
+    value_json = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # used for LRU eviction
+
+    def __repr__(self):
+        return f'<RecommendationCacheEntry {self.key[:12]}>'
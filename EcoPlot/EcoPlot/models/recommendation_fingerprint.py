@@ -0,0 +1,14 @@
+# EcoPlot/models/recommendation_fingerprint.py
+from EcoPlot import db
+
+class RecommendationFingerprint(db.Model):
+    """Inputs a stored device recommendation was generated from, used to reuse it while they are unchanged"""
+    __tablename__ = 'recommendation_fingerprints'
+
+    history_id = db.Column(db.Integer, db.ForeignKey('recommendation_history.id'), primary_key=True)
+    device_id = db.Column(db.Integer, primary_key=True, index=True)
+    device_fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of the device fields in the prompt
+    profile_fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of the profile fields in the prompt
+
+    def __repr__(self):
+        return f'<RecommendationFingerprint device {self.device_id} in history {self.history_id}>'
@@ -0,0 +1,62 @@
+# EcoPlot/models/recommendation_job.py
+from EcoPlot import db
+from datetime import datetime
+import json
+import uuid
+
+class RecommendationJob(db.Model):
+    """Durable queue entry for asynchronous recommendation generation"""
+    __tablename__ = 'recommendation_jobs'
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_QUEUED, index=True)
+    force_refresh = db.Column(db.Boolean, default=False)
+    # Set for single-device jobs, whose result is merged into the latest stored run
+    device_id = db.Column(db.Integer)
+
+    # Snapshot of the prompt inputs taken when the job was enqueued
+    input_json = db.Column(db.Text, nullable=False)
+    result_json = db.Column(db.Text)
+    error = db.Column(db.Text)
+    history_id = db.Column(db.Integer, db.ForeignKey('recommendation_history.id'))
+    attempts = db.Column(db.Integer, default=0)
+    # Queued jobs are not claimed before this time, e.g. while Gemini's circuit is open
+    not_before = db.Column(db.DateTime, index=True)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<RecommendationJob {self.id} ({self.status})>'
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def to_dict(self, include_result=True):
+        """Convert job to dictionary for API responses"""
+        job_dict = {
+            'id': self.id,
+            'status': self.status,
+            'device_id': self.device_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'not_before': self.not_before.isoformat() if self.not_before else None,
+            'attempts': self.attempts,
+            'history_id': self.history_id,
+            'error': self.error
+        }
+
+        if include_result and self.result_json:
+            job_dict['recommendations'] = json.loads(self.result_json)
+
+        return job_dict
@@ -0,0 +1,27 @@
+# EcoPlot/models/recommendation_job_event.py
+from EcoPlot import db
+from datetime import datetime
+import json
+
+class RecommendationJobEvent(db.Model):
+    """Recommendation section streamed by a running job, relayed to clients through the job's events"""
+    __tablename__ = 'recommendation_job_events'
+    # Ids are never reused, so they serve as the Last-Event-ID cursor of the event stream
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), db.ForeignKey('recommendation_jobs.id'), nullable=False, index=True)
+    event = db.Column(db.String(40), nullable=False)  # e.g. overall_recommendation or device_recommendation
+    payload_json = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RecommendationJobEvent {self.id} {self.event} of job {self.job_id}>'
+
+    def to_dict(self):
+        """Convert event to dictionary for API responses"""
+        return {
+            'id': self.id,
+            'event': self.event,
+            'payload': json.loads(self.payload_json)
+        }
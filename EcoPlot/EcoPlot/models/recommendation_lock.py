@@ -0,0 +1,15 @@
+# EcoPlot/models/recommendation_lock.py
+from EcoPlot import db
+from datetime import datetime
+
+class RecommendationLock(db.Model):
+    """Lock row held by the process generating recommendations for an input fingerprint"""
+    __tablename__ = 'recommendation_locks'
+
+    key = db.Column(db.String(64), primary_key=True)  # input fingerprint
+    owner = db.Column(db.String(64), nullable=False)  # host:pid:thread of the holder
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)  # lets other processes take over from a crashed holder
+
+    def __repr__(self):
+        return f'<RecommendationLock {self.key[:12]} by {self.owner}>'
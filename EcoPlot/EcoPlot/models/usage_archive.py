@@ -0,0 +1,18 @@
+# EcoPlot/models/usage_archive.py
+from EcoPlot import db
+from datetime import datetime
+
+class UsageArchiveSegment(db.Model):
+    """One month of a device's archived usage logs, stored as a columnar .npy file"""
+    __tablename__ = 'usage_archive_segments'
+
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id'), primary_key=True)
+    month = db.Column(db.DateTime, primary_key=True)  # first instant of the UTC month
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped when logs are merged into the file
+    rows = db.Column(db.Integer, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    last_end = db.Column(db.DateTime, nullable=False)  # latest end of the archived logs, UTC
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UsageArchiveSegment device {self.device_id} {self.month:%Y-%m} v{self.version}>'
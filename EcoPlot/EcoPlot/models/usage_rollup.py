@@ -0,0 +1,38 @@
+# EcoPlot/models/usage_rollup.py
+from EcoPlot import db
+from datetime import datetime
+
+class UsageRollup(db.Model):
+    """Device usage summed per hour, day or month, maintained as usage logs change"""
+    __tablename__ = 'usage_rollups'
+
+    ALL_DEVICES = 0  # device_id of the per-user totals
+
+    grain = db.Column(db.String(5), primary_key=True)  # hour, day or month
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    device_id = db.Column(db.Integer, primary_key=True)  # ALL_DEVICES for the user's totals
+    bucket_start = db.Column(db.DateTime, primary_key=True)  # UTC; days and months start at local midnight
+
+    kwh = db.Column(db.Float, nullable=False, default=0)
+    onsite_kwh = db.Column(db.Float, nullable=False, default=0)  # from solar or wind
+    cost = db.Column(db.Float, nullable=False, default=0)
+    carbon_kg = db.Column(db.Float, nullable=False, default=0)
+    grid_kwh = db.Column(db.Float, nullable=False, default=0)
+    grid_cost = db.Column(db.Float, nullable=False, default=0)
+    grid_carbon_kg = db.Column(db.Float, nullable=False, default=0)
+    battery_kwh = db.Column(db.Float, nullable=False, default=0)  # discharged from a battery, also in grid_kwh
+
+    def __repr__(self):
+        return f'<UsageRollup {self.grain} {self.bucket_start} user {self.user_id} device {self.device_id}>'
+
+
+class UsageRollupStatus(db.Model):
+    """Marks a user's rollups as complete for the timezone their day and month buckets use"""
+    __tablename__ = 'usage_rollup_status'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    timezone = db.Column(db.String(50), nullable=False)
+    rebuilt_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<UsageRollupStatus user {self.user_id} in {self.timezone}>'
@@ -3,14 +3,44 @@ from flask import Blueprint, render_template, jsonify, flash, redirect, url_for
 from flask_login import login_required
 from EcoPlot import db
 from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
 from EcoPlot.models.device_type import DeviceType
 from EcoPlot.models.device_brand import DeviceBrand
 from EcoPlot.models.user import User
+from EcoPlot.models.usage_rollup import UsageRollupStatus
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import joinedload
 from EcoPlot.seeds.seed_devices import seed_device_types_and_brands
+from EcoPlot.services.recommendation_cache import get_recommendation_cache
+from EcoPlot.services.single_flight import get_single_flight
+from EcoPlot.services.circuit_breaker import get_circuit_breaker
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+def add_missing_columns():
+    """
+    Add model columns that existing tables lack.
+
+    Returns:
+        list: The added columns as table.column
+    """
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}"
+                if not column.nullable and column.default is not None and column.default.is_scalar:
+                    ddl += f" NOT NULL DEFAULT {column.default.arg!r}"
+                connection.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
 @admin_bp.route('/panel')
 @login_required
 def admin_panel():
@@ -88,6 +118,51 @@ def get_all_users():
             'message': str(e)
         }), 500
 
+@admin_bp.route('/api/recommendation-cache', methods=['GET'])
+@login_required
+def get_recommendation_cache_stats():
+    """API endpoint to get recommendation cache hit/miss counters"""
+    try:
+        return jsonify({
+            'success': True,
+            'cache': get_recommendation_cache().stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@admin_bp.route('/api/recommendation-coalescing', methods=['GET'])
+@login_required
+def get_recommendation_coalescing_stats():
+    """API endpoint to get how many recommendation calls were coalesced"""
+    try:
+        return jsonify({
+            'success': True,
+            'coalescing': get_single_flight().stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@admin_bp.route('/api/gemini-circuit', methods=['GET'])
+@login_required
+def get_gemini_circuit_stats():
+    """API endpoint to get the state of the Gemini circuit breaker"""
+    try:
+        return jsonify({
+            'success': True,
+            'circuit': get_circuit_breaker().stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
 @admin_bp.route('/run-seeds')
 @login_required
 def run_seeds():
@@ -103,6 +178,16 @@ def run_seeds():
 def run_upgrades():
     try:
         # Add any database upgrade logic here
+        # Indexes added to existing tables are not created by db.create_all()
+        for index in DeviceUsageLog.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        # Neither are columns
+        added = add_missing_columns()
+        if 'usage_rollups.battery_kwh' in added:
+            # Rollups built without battery energy are read from the logs until rebuilt
+            UsageRollupStatus.query.delete()
+            db.session.commit()
+            flash('Run "flask rollups rebuild" to bring the usage rollups up to date.', 'info')
         flash('Upgrades completed successfully!', 'success')
     except Exception as e:
         flash(f'Error running upgrades: {str(e)}', 'danger')
@@ -0,0 +1,28 @@
+# EcoPlot/routes/battery_routes.py
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+from EcoPlot.services.battery_simulator import BatterySimulatorService
+
+battery_bp = Blueprint('battery', __name__)
+
+@battery_bp.route('/api/battery/simulate', methods=['GET'])
+@login_required
+def simulate_battery():
+    """
+    API endpoint to simulate a home battery over the user's last year.
+
+    "capacity_kwh" and "power_kw" size the battery (defaulting to the profile's
+    battery); "series=true" adds the state of charge of every 15-minute step.
+    """
+    capacity_kwh = request.args.get('capacity_kwh', type=float)
+    power_kw = request.args.get('power_kw', type=float)
+    include_series = request.args.get('series', 'false').lower() == 'true'
+
+    try:
+        result = BatterySimulatorService.simulate(current_user, capacity_kwh, power_kw,
+                                                  include_series=include_series)
+        return jsonify({'success': True, **result})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
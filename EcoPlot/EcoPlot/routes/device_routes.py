@@ -5,6 +5,7 @@ from EcoPlot import db
 from EcoPlot.models.device import Device
 from EcoPlot.models.device_type import DeviceType
 from EcoPlot.models.device_brand import DeviceBrand
+from EcoPlot.services.ev_charging import EVChargingService
 from datetime import datetime, time
 
 devices_bp = Blueprint('devices', __name__, url_prefix='/devices')
@@ -163,6 +164,7 @@ def update_device(device_id):
     """API endpoint to update a device"""
     device = Device.query.filter_by(id=device_id, user_id=current_user.id).first_or_404()
     data = request.get_json()
+    was_ev_charger = device.is_ev_charger
     
     try:
         # Process each field in the data
@@ -199,6 +201,9 @@ def update_device(device_id):
                 # Set the attribute
                 setattr(device, key, value)
         
+        if was_ev_charger or device.is_ev_charger:
+            # The stored charging plans no longer match the user's chargers
+            EVChargingService.invalidate(current_user.id)
         db.session.commit()
         
         return jsonify({
@@ -220,6 +225,8 @@ def delete_device(device_id):
     device = Device.query.filter_by(id=device_id, user_id=current_user.id).first_or_404()
     
     try:
+        if device.is_ev_charger:
+            EVChargingService.invalidate(current_user.id)
         db.session.delete(device)
         db.session.commit()
         
@@ -0,0 +1,26 @@
+# EcoPlot/routes/forecast_routes.py
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+from EcoPlot.services.forecasting import ForecastService
+
+forecast_bp = Blueprint('forecast', __name__)
+
+@forecast_bp.route('/api/forecast', methods=['GET'])
+@login_required
+def get_forecast():
+    """
+    API endpoint to forecast the user's hourly consumption.
+
+    "hours" sets how far ahead, defaulting to 24 (168 for a week); the stored
+    model of the nightly fit is used unless it is stale or "refresh" is true.
+    """
+    hours = request.args.get('hours', 24, type=int)
+    refresh = request.args.get('refresh', 'false').lower() == 'true'
+
+    try:
+        result = ForecastService.forecast(current_user, hours, refresh=refresh)
+        return jsonify({'success': True, **result})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
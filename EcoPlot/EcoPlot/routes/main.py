@@ -1,5 +1,5 @@
 # EcoPlot/routes/main.py (updated)
-from flask import Blueprint, render_template, flash, redirect, url_for, request, jsonify
+from flask import Blueprint, render_template, flash, redirect, url_for, request, jsonify, current_app
 from flask_login import login_required, current_user
 from EcoPlot import db
 from EcoPlot.forms.profile import ProfileForm
@@ -7,6 +7,8 @@ from EcoPlot.models.device import Device
 from EcoPlot.models.device_type import DeviceType
 from EcoPlot.models.device_brand import DeviceBrand
 from EcoPlot.models.recommendation import RecommendationHistory
+from EcoPlot.services.energy_aggregation import EnergyAggregationService, PERIODS
+from EcoPlot.services.usage_rollups import get_rollup_rebuilds
 from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 
@@ -28,45 +30,19 @@ def dashboard_summary():
     try:
         # Get time period from query parameter (default: day)
         period = request.args.get('period', 'day')
+        if period not in PERIODS:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown period: {period}"
+            }), 400
         
-        # In a real implementation, this would query the database
-        # For now, let's return some mock data
-        
-        # Calculate different values based on the period
-        energy_used = 0
-        energy_produced = 0
-        carbon_saved = 0
-        cost_savings = 0
-        
-        if period == 'day':
-            energy_used = 12.5
-            energy_produced = 8.7
-            carbon_saved = 3.8
-            cost_savings = 2.35
-        elif period == 'week':
-            energy_used = 78.3
-            energy_produced = 54.2
-            carbon_saved = 24.5
-            cost_savings = 14.75
-        else:  # month
-            energy_used = 320.6
-            energy_produced = 210.8
-            carbon_saved = 95.7
-            cost_savings = 58.20
+        # Totals of the period and their change from the previous period, from the usage logs
+        summary = EnergyAggregationService.summary(current_user, period)
         
         return jsonify({
             'success': True,
             'period': period,
-            'summary': {
-                'energy_used': energy_used,
-                'energy_used_change': -5.2,  # percentage change
-                'energy_produced': energy_produced,
-                'energy_produced_change': 12.3,
-                'carbon_saved': carbon_saved,
-                'carbon_saved_change': 8.7,
-                'cost_savings': cost_savings,
-                'cost_savings_change': 10.5
-            }
+            'summary': summary
         })
     except Exception as e:
         return jsonify({
@@ -131,87 +107,26 @@ def dashboard_energy_usage():
     try:
         # Get time period from query parameter (default: day)
         period = request.args.get('period', 'day')
+        if period not in PERIODS:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown period: {period}"
+            }), 400
         
-        # In a real implementation, this would query usage logs from the database
-        # For now, return mock data with appropriate time labels
-        
-        # Generate time labels based on period
-        time_labels = []
-        consumption_data = []
-        production_data = []
-        
-        if period == 'day':
-            # Hourly data for a day
-            for i in range(24):
-                time_labels.append(f"{i}:00")
-                
-                # Create realistic usage pattern
-                if i < 6:  # Night (low)
-                    consumption = 0.2 + (i * 0.05)
-                elif i < 10:  # Morning peak
-                    consumption = 0.5 + ((i - 5) * 0.2)
-                elif i < 16:  # Midday (medium)
-                    consumption = 0.5 + (i % 3) * 0.1
-                elif i < 22:  # Evening peak
-                    consumption = 0.8 + ((i - 15) * 0.15)
-                else:  # Late night (low)
-                    consumption = 0.5 - ((i - 21) * 0.15)
-                
-                # Solar production follows sun pattern
-                if i >= 6 and i <= 20:  # Daylight hours
-                    # Bell curve centered at 1pm (hour 13)
-                    hour_offset = abs(i - 13)
-                    production = max(0, 0.8 - (hour_offset * 0.12))
-                else:
-                    production = 0
-                
-                consumption_data.append(round(consumption, 2))
-                production_data.append(round(production, 2))
-                
-        elif period == 'week':
-            # Daily data for a week
-            days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            for i, day in enumerate(days):
-                time_labels.append(day)
-                
-                # Higher usage on weekends
-                is_weekend = i >= 5
-                base_consumption = 10 if is_weekend else 8
-                consumption = base_consumption + (i * 0.5) % 2
-                
-                # Solar production varies by day (simulated weather effects)
-                weather_factor = 0.8 + (i * 0.1) % 0.4
-                production = 7 * weather_factor
-                
-                consumption_data.append(round(consumption, 2))
-                production_data.append(round(production, 2))
-                
-        else:  # month
-            # Generate 30 days of data
-            for i in range(1, 31):
-                time_labels.append(f"Day {i}")
-                
-                # Weekend effect (every 6th and 7th day)
-                is_weekend = (i % 7 == 6) or (i % 7 == 0)
-                base_consumption = 12 if is_weekend else 9.5
-                
-                # Random daily fluctuation
-                daily_factor = 0.8 + (i * 0.13) % 0.5
-                consumption = base_consumption * daily_factor
-                
-                # Solar production with weather patterns
-                weather_factor = 0.7 + (i * 0.19) % 0.6
-                production = 8 * weather_factor
-                
-                consumption_data.append(round(consumption, 2))
-                production_data.append(round(production, 2))
+        # Hourly bins for a day, daily bins for a week or month, monthly bins for a year,
+        # in the user's timezone
+        series = EnergyAggregationService.usage_series(current_user, period)
         
         return jsonify({
             'success': True,
             'period': period,
-            'labels': time_labels,
-            'consumption': consumption_data,
-            'production': production_data
+            'labels': series['labels'],
+            'consumption': series['consumption'],
+            'production': series['production'],
+            'expected_production': series['expected_production'],
+            'cost': series['cost'],
+            'carbon': series['carbon'],
+            'timezone': series['timezone']
         })
     except Exception as e:
         return jsonify({
@@ -358,6 +273,7 @@ def profile():
         current_user.postal_code = form.postal_code.data
         current_user.latitude = form.latitude.data
         current_user.longitude = form.longitude.data
+        timezone_changed = current_user.timezone != form.timezone.data
         current_user.timezone = form.timezone.data
         
         # Home characteristics
@@ -411,6 +327,11 @@ def profile():
         # Save to database
         db.session.commit()
         flash('Your profile has been updated!', 'success')
+
+        if timezone_changed:
+            # Day and month rollups start at local midnight; the dashboard reads raw logs
+            # until the background worker has rebuilt them
+            get_rollup_rebuilds().wake()
         
         # Redirect based on profile completion status
         if is_profile_complete and request.form.get('origin') == 'registration':
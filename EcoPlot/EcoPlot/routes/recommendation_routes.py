@@ -1,16 +1,40 @@
 # EcoPlot/routes/recommendation_routes.py
-from flask import Blueprint, render_template, jsonify, request, current_app
+from flask import Blueprint, render_template, jsonify, request, current_app, url_for, Response
 from flask_login import login_required, current_user
 from EcoPlot import db
 from EcoPlot.models.device import Device
-from EcoPlot.models.device_type import DeviceType
-from EcoPlot.models.device_brand import DeviceBrand
 from EcoPlot.models.recommendation import RecommendationHistory
-from EcoPlot.services.gemini_service import GeminiService
-from sqlalchemy.orm import joinedload
+from EcoPlot.models.recommendation_job import RecommendationJob
+from EcoPlot.models.recommendation_job_event import RecommendationJobEvent
+from EcoPlot.services.recommendation_jobs import job_inputs
+from EcoPlot.services.recommendation_service import RecommendationService
+from datetime import datetime
+import json
 
 recommendations_bp = Blueprint('recommendations', __name__)
 
+def _queued_response(user_data, devices_data, force_refresh, **fields):
+    """
+    Queue generation and answer 202 with the recommendations to show until the job has
+    new ones: the user's stored run marked as stale, or the rule-based ones.
+    """
+    # Gemini is only called by the job workers
+    stale, job = RecommendationService.serve_stale(user_data, devices_data, force_refresh=force_refresh)
+    interim = stale or RecommendationService.generate_quick(user_data, devices_data)
+    status_url = url_for('recommendations.get_recommendation_job', job_id=job.id)
+
+    return jsonify({
+        'success': True,
+        **fields,
+        'cached': False,
+        'stale': stale is not None,
+        'source': 'history' if stale is not None else 'rules',
+        'recommendations': interim,
+        'job': job.to_dict(include_result=False),
+        'status_url': status_url,
+        'events_url': url_for('recommendations.recommendation_job_events', job_id=job.id)
+    }), 202, {'Location': status_url}
+
 @recommendations_bp.route('/recommendations')
 @login_required
 def recommendations_page():
@@ -30,171 +54,208 @@ def get_recommendations():
                 'error': 'No devices found. Please add at least one device to get recommendations.'
             }), 400
 
-        # Get all user devices with related information
-        devices_query = db.session.query(
-            Device,
-            DeviceType.name.label('device_type_name'),
-            DeviceBrand.name.label('brand_name')
-        ).join(
-            DeviceType, Device.device_type_id == DeviceType.id
-        ).join(
-            DeviceBrand, Device.brand_id == DeviceBrand.id
-        ).filter(
-            Device.user_id == current_user.id
-        ).all()
-        
-        # Format devices data for the Gemini service
-        devices_data = []
-        for device, device_type_name, brand_name in devices_query:
-            devices_data.append({
-                'id': device.id,
-                'name': device.name,
-                'device_type_name': device_type_name,
-                'brand_name': brand_name,
-                'power_consumption_watts': device.power_consumption_watts,
-                'standby_power_watts': device.standby_power_watts,
-                'average_usage_hours_per_day': device.average_usage_hours_per_day,
-                'usage_flexibility': device.usage_flexibility,
-                'is_schedulable': device.is_schedulable,
-                'is_smart_device': device.is_smart_device,
-                'is_ev_charger': device.is_ev_charger,
-                'priority_level': device.priority_level
-            })
-        
-        # Create user profile data for recommendations
-        user_data = {
-            'id': current_user.id,
-            'username': current_user.username,
-            'location': f"{current_user.city}, {current_user.state}, {current_user.country}" 
-                if (current_user.city and current_user.state and current_user.country) else None,
-            'city': current_user.city,
-            'state': current_user.state,
-            'country': current_user.country,
-            'has_solar': current_user.has_solar,
-            'solar_capacity_kw': current_user.solar_capacity_kw,
-            'solar_panel_orientation': current_user.solar_panel_orientation,
-            'solar_panel_tilt': current_user.solar_panel_tilt,
-            'has_battery_storage': current_user.has_battery_storage,
-            'battery_capacity_kwh': current_user.battery_capacity_kwh,
-            'has_ev': current_user.has_ev,
-            'ev_battery_capacity_kwh': current_user.ev_battery_capacity_kwh,
-            'energy_savings_goal': current_user.energy_savings_goal,
-            'environmental_priority': current_user.environmental_priority,
-            'electricity_rate_plan': current_user.electricity_rate_plan,
-            'peak_rate_per_kwh': current_user.peak_rate_per_kwh,
-            'off_peak_rate_per_kwh': current_user.off_peak_rate_per_kwh,
-        }
-        
-        # Get recommendations from Gemini service
-        gemini_service = GeminiService()
-        recommendations = gemini_service.generate_device_recommendations(user_data, devices_data)
-        
-        # Store the recommendations for historical comparison if successful
-        if recommendations.get('success', False):
-            try:
-                # Create a new recommendation history entry
-                history = RecommendationHistory.create_from_response(
-                    user_id=current_user.id,
-                    recommendations_data=recommendations,
-                    device_count=len(devices_data),
-                    has_solar=current_user.has_solar,
-                    has_ev=current_user.has_ev,
-                    has_battery=current_user.has_battery_storage
-                )
-                db.session.add(history)
-                db.session.commit()
-            except Exception as history_error:
-                current_app.logger.error(f"Error saving recommendation history: {str(history_error)}")
-                # Continue even if saving history fails
+        # Get all user devices and profile data for the Gemini service
+        devices_data = RecommendationService.build_devices_data(current_user.id)
+        user_data = RecommendationService.build_user_data(current_user)
         
-        # Return recommendations as JSON
-        return jsonify({
-            'success': True,
+        # Serve unchanged inputs from the cache unless the user asked for a refresh
+        force_refresh = request.args.get('refresh', 'false') == 'true'
+        recommendations, source = RecommendationService.lookup(
+            user_data, devices_data, force_refresh=force_refresh
+        )
+
+        response = {
             'user': {
                 'id': current_user.id,
                 'username': current_user.username,
                 'has_solar': current_user.has_solar,
                 'has_ev': current_user.has_ev
             },
+            'devices_count': len(devices_data)
+        }
+        if recommendations is not None:
+            return jsonify({'success': True, **response, 'cached': True, 'stale': False, 'source': source,
+                            'recommendations': recommendations})
+
+        return _queued_response(user_data, devices_data, force_refresh, **response)
+    
+    except Exception as e:
+        current_app.logger.error(f"Error generating recommendations: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@recommendations_bp.route('/api/recommendations/quick', methods=['GET'])
+@login_required
+def get_quick_recommendations():
+    """Rule-based recommendations computed locally, used for first paint"""
+    try:
+        devices_data = RecommendationService.build_devices_data(current_user.id)
+        if not devices_data:
+            return jsonify({
+                'success': False,
+                'error': 'No devices found. Please add at least one device to get recommendations.'
+            }), 400
+
+        user_data = RecommendationService.build_user_data(current_user)
+        recommendations = RecommendationService.generate_quick(user_data, devices_data)
+
+        return jsonify({
+            'success': True,
             'devices_count': len(devices_data),
             'recommendations': recommendations
         })
-    
     except Exception as e:
-        current_app.logger.error(f"Error generating recommendations: {str(e)}")
+        current_app.logger.error(f"Error generating quick recommendations: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@recommendations_bp.route('/api/recommendations/jobs', methods=['POST'])
+@login_required
+def create_recommendation_job():
+    """Queue recommendation generation and return immediately with a job id"""
+    try:
+        device_count = Device.query.filter_by(user_id=current_user.id).count()
+        if device_count == 0:
+            return jsonify({
+                'success': False,
+                'error': 'No devices found. Please add at least one device to get recommendations.'
+            }), 400
+
+        data = request.get_json(silent=True) or {}
+        force_refresh = bool(data.get('refresh', False))
+        devices_data = RecommendationService.build_devices_data(current_user.id)
+        user_data = RecommendationService.build_user_data(current_user)
+
+        # Rule-engine users and unchanged inputs are answered immediately without queueing
+        result, source = RecommendationService.lookup(user_data, devices_data, force_refresh=force_refresh)
+
+        if result is not None:
+            job = RecommendationJob(
+                user_id=current_user.id,
+                status=RecommendationJob.STATUS_SUCCEEDED,
+                input_json=job_inputs(user_data, devices_data),
+                result_json=json.dumps(result),
+                finished_at=datetime.utcnow()
+            )
+            db.session.add(job)
+            db.session.commit()
+            return jsonify({
+                'success': True,
+                'cached': True,
+                'stale': False,
+                'source': source,
+                'recommendations': result,
+                'job': job.to_dict()
+            })
+
+        return _queued_response(user_data, devices_data, force_refresh)
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error queueing recommendation job: {str(e)}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@recommendations_bp.route('/api/recommendations/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_recommendation_job(job_id):
+    """Get the status of a recommendation job, including the result once finished"""
+    job = RecommendationJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+@recommendations_bp.route('/api/recommendations/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def recommendation_job_events(job_id):
+    """
+    Server-Sent Events snapshot of a job: the sections it streamed since the client's
+    Last-Event-ID and its current state. Each response ends right away; the retry field
+    makes EventSource reconnect for the next one until the job is done, so no request
+    worker waits on the job.
+    """
+    job = RecommendationJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+
+    if job.is_finished:
+        body = f"event: done\ndata: {json.dumps(job.to_dict())}\n\n"
+    else:
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('after', '')
+        events = RecommendationJobEvent.query.filter(
+            RecommendationJobEvent.job_id == job_id,
+            RecommendationJobEvent.id > (int(last_event_id) if last_event_id.isdigit() else 0)
+        ).order_by(RecommendationJobEvent.id).all()
+
+        retry = int(current_app.config.get('RECOMMENDATION_JOB_EVENTS_POLL_INTERVAL', 1.0) * 1000)
+        body = ''.join(
+            f"id: {event.id}\nevent: {event.event}\ndata: {event.payload_json}\n\n" for event in events
+        )
+        body += f"retry: {retry}\nevent: status\ndata: {json.dumps(job.to_dict(include_result=False))}\n\n"
+
+    return Response(body, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
 @recommendations_bp.route('/api/recommendations/device/<int:device_id>', methods=['GET'])
 @login_required
 def get_device_recommendations(device_id):
     """Get recommendations for a specific device"""
     try:
         # Get the specific device with its type and brand
-        device_query = db.session.query(
-            Device,
-            DeviceType.name.label('device_type_name'),
-            DeviceBrand.name.label('brand_name')
-        ).join(
-            DeviceType, Device.device_type_id == DeviceType.id
-        ).join(
-            DeviceBrand, Device.brand_id == DeviceBrand.id
-        ).filter(
-            Device.id == device_id,
-            Device.user_id == current_user.id
-        ).first()
+        device_data = RecommendationService.build_devices_data(current_user.id, device_id=device_id)
         
-        if not device_query:
+        if not device_data:
             return jsonify({
                 'success': False,
                 'error': 'Device not found or not owned by user'
             }), 404
         
-        device, device_type_name, brand_name = device_query
-        
-        # Format device data
-        device_data = [{
-            'id': device.id,
-            'name': device.name,
-            'device_type_name': device_type_name,
-            'brand_name': brand_name,
-            'power_consumption_watts': device.power_consumption_watts,
-            'standby_power_watts': device.standby_power_watts,
-            'average_usage_hours_per_day': device.average_usage_hours_per_day,
-            'usage_flexibility': device.usage_flexibility,
-            'is_schedulable': device.is_schedulable,
-            'is_smart_device': device.is_smart_device,
-            'is_ev_charger': device.is_ev_charger,
-            'priority_level': device.priority_level
-        }]
-        
         # Create user profile data
-        user_data = {
-            'id': current_user.id,
-            'username': current_user.username,
-            'location': f"{current_user.city}, {current_user.state}, {current_user.country}" 
-                if (current_user.city and current_user.state and current_user.country) else None,
-            'has_solar': current_user.has_solar,
-            'solar_capacity_kw': current_user.solar_capacity_kw,
-            'has_battery_storage': current_user.has_battery_storage,
-            'battery_capacity_kwh': current_user.battery_capacity_kwh,
-            'has_ev': current_user.has_ev,
-            'electricity_rate_plan': current_user.electricity_rate_plan,
-            'peak_rate_per_kwh': current_user.peak_rate_per_kwh,
-            'off_peak_rate_per_kwh': current_user.off_peak_rate_per_kwh,
-        }
-        
-        # Get specific recommendations for this device
-        gemini_service = GeminiService()
-        recommendations = gemini_service.generate_device_recommendations(user_data, device_data)
+        user_data = RecommendationService.build_user_data(current_user)
         
+        # Serve the device's entry from the latest full run, generating it only if its inputs changed
+        force_refresh = request.args.get('refresh', 'false') == 'true'
+        recommendations, source = RecommendationService.resolve_device(
+            user_data, device_data[0], force_refresh=force_refresh
+        )
+        if recommendations is not None:
+            return jsonify({
+                'success': True,
+                'device': device_data[0],
+                'cached': True,
+                'source': source,
+                'recommendations': recommendations
+            })
+
+        # Answer with the rule-based advice while a job generates and stores the device's entry
+        job = RecommendationService.queue(user_data, device_data, force_refresh=force_refresh, device_id=device_id)
+        status_url = url_for('recommendations.get_recommendation_job', job_id=job.id)
+
         return jsonify({
             'success': True,
             'device': device_data[0],
-            'recommendations': recommendations
-        })
+            'cached': False,
+            'source': 'rules',
+            'recommendations': RecommendationService.generate_quick(user_data, device_data),
+            'job': job.to_dict(include_result=False),
+            'status_url': status_url,
+            'events_url': url_for('recommendations.recommendation_job_events', job_id=job.id)
+        }), 202, {'Location': status_url}
     
     except Exception as e:
         current_app.logger.error(f"Error generating device recommendations: {str(e)}")
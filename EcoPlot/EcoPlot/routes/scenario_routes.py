@@ -0,0 +1,26 @@
+# EcoPlot/routes/scenario_routes.py
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+from EcoPlot.services.scenarios import ScenarioService
+
+scenario_bp = Blueprint('scenario', __name__)
+
+@scenario_bp.route('/api/scenarios', methods=['POST'])
+@login_required
+def compare_scenarios():
+    """
+    API endpoint to compare what-if changes to the user's household over the last year.
+
+    The body's "scenarios" list holds overrides such as {"name": "solar + battery",
+    "solar_kw": 5, "battery_kwh": 10}, "ev_daily_kwh", "rate_plan" or "swap" of a
+    device for one with another power rating.
+    """
+    data = request.get_json(silent=True) or {}
+
+    try:
+        result = ScenarioService.compare(current_user, data.get('scenarios'))
+        return jsonify({'success': True, **result})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,64 @@
+# EcoPlot/routes/schedule_routes.py
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+from datetime import datetime, timedelta
+from EcoPlot.models.device import Device
+from EcoPlot.models.ev_charge_plan import EVChargePlan
+from EcoPlot.services.appliance_scheduler import OBJECTIVES, ApplianceSchedulerService
+from EcoPlot.services.energy_aggregation import user_timezone
+from EcoPlot.services.ev_charging import HORIZON_HOURS, EVChargingService
+
+schedule_bp = Blueprint('schedule', __name__)
+
+@schedule_bp.route('/api/schedule', methods=['GET', 'POST'])
+@login_required
+def get_schedule():
+    """
+    API endpoint to plan start times for the user's schedulable devices.
+
+    Places each device in 15-minute slots over the next 24 hours inside its preferred
+    window. "objective" (cost, carbon or balanced) and "power_cap_kw" come from the
+    query string or a JSON body.
+    """
+    params = request.get_json(silent=True) or {}
+    objective = params.get('objective') or request.args.get('objective', 'cost')
+    if objective not in OBJECTIVES:
+        return jsonify({'success': False, 'error': f"objective must be one of {', '.join(OBJECTIVES)}"}), 400
+
+    power_cap_kw = params.get('power_cap_kw', request.args.get('power_cap_kw'))
+    if power_cap_kw is not None:
+        try:
+            power_cap_kw = float(power_cap_kw)
+        except (TypeError, ValueError):
+            power_cap_kw = -1
+        if power_cap_kw <= 0:
+            return jsonify({'success': False, 'error': 'power_cap_kw must be a positive number'}), 400
+
+    try:
+        devices = Device.query.filter_by(user_id=current_user.id, is_schedulable=True).all()
+        result = ApplianceSchedulerService.schedule(current_user, devices, objective, power_cap_kw)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@schedule_bp.route('/api/schedule/ev', methods=['GET'])
+@login_required
+def get_ev_charging_plan():
+    """
+    API endpoint to get the charging plans of the user's EV chargers.
+
+    Returns the plans of the nightly planning run while their departure is ahead,
+    and plans the chargers now when there are none or "refresh" is true.
+    """
+    try:
+        plans = EVChargePlan.query.filter_by(user_id=current_user.id).all()
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        now = datetime.utcnow()
+        stale = any(plan.plan_start <= now - timedelta(hours=HORIZON_HOURS)
+                    or (plan.departure and plan.departure <= now) for plan in plans)
+        if refresh or stale or not plans:
+            plans = EVChargingService.plan_user(current_user)
+        tz = user_timezone(current_user)
+        return jsonify({'success': True, 'timezone': tz.key, 'plans': [plan.to_dict(tz) for plan in plans]})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,45 @@
+# EcoPlot/routes/tariff_routes.py
+from datetime import date, datetime
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+from EcoPlot.services.energy_aggregation import user_timezone
+from EcoPlot.services.tariffs import bill_month, get_tariff_engine
+
+tariff_bp = Blueprint('tariff', __name__)
+
+@tariff_bp.route('/api/tariff', methods=['GET'])
+@login_required
+def get_tariff():
+    """
+    API endpoint to get the user's rate plan and the price of every 15-minute slot of a day.
+
+    "date" (YYYY-MM-DD) picks the local day, defaulting to today.
+    """
+    try:
+        day = request.args.get('date')
+        day = date.fromisoformat(day) if day else None
+        return jsonify({'success': True, **get_tariff_engine().describe(current_user, day)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@tariff_bp.route('/api/tariff/bill', methods=['GET'])
+@login_required
+def get_bill():
+    """
+    API endpoint to bill the user's grid usage of one month under their rate plan.
+
+    "month" (YYYY-MM) picks the local month, defaulting to the current one.
+    """
+    try:
+        month = request.args.get('month')
+        if month:
+            first = datetime.strptime(month, '%Y-%m')
+        else:
+            first = datetime.now(user_timezone(current_user))
+        return jsonify({'success': True, **bill_month(current_user, first.year, first.month)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,64 @@
+# EcoPlot/routes/usage_routes.py
+import io
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, current_user
+from EcoPlot.services.meter_import import MeterImportError, MeterImportService, detect_format
+from EcoPlot.services.meter_import import FORMATS as METER_FORMATS
+from EcoPlot.services.usage_ingest import FORMATS, UsageIngestService, format_for_content_type
+
+usage_bp = Blueprint('usage', __name__)
+
+@usage_bp.route('/api/usage/bulk', methods=['POST'])
+@login_required
+def bulk_ingest():
+    """
+    API endpoint to import usage logs from an NDJSON or CSV body.
+
+    The format comes from the format query parameter or the Content-Type header
+    (application/x-ndjson or text/csv). The body is parsed as it streams in.
+    """
+    data_format = request.args.get('format') or format_for_content_type(request.mimetype)
+    if data_format not in FORMATS:
+        return jsonify({
+            'success': False,
+            'error': 'Send application/x-ndjson or text/csv, or set format=ndjson|csv'
+        }), 400
+
+    try:
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        result = UsageIngestService.ingest(current_user.id, lines, data_format)
+        return jsonify({'success': True, 'result': result})
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'error': 'Body must be UTF-8 encoded'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@usage_bp.route('/api/usage/import', methods=['POST'])
+@login_required
+def import_meter_data():
+    """
+    API endpoint to import a Green Button XML or utility interval CSV file.
+
+    Expects a multipart upload with the file in "file" and the device the meter data
+    is stored under in "device_id". The format is detected unless "format" is given.
+    """
+    upload = request.files.get('file')
+    device_id = request.form.get('device_id', type=int)
+    if upload is None or device_id is None:
+        return jsonify({'success': False, 'error': 'A file and a device_id are required'}), 400
+
+    data_format = request.form.get('format') or detect_format(upload.filename, upload.stream.read(512))
+    upload.stream.seek(0)
+    if data_format not in METER_FORMATS:
+        return jsonify({'success': False, 'error': f"Unknown format: {data_format}"}), 400
+
+    try:
+        result = MeterImportService.import_file(
+            current_user, device_id, upload.stream, data_format,
+            interval_minutes=request.form.get('interval_minutes', type=int)
+        )
+        return jsonify({'success': True, 'result': result})
+    except (MeterImportError, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,505 @@
+# EcoPlot/services/appliance_scheduler.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+import numpy as np
+from flask import current_app
+from EcoPlot.services.energy_aggregation import (
+    GRID_CARBON, GRID_KWH, distribute, load_usage, user_timezone
+)
+from EcoPlot.services.tariffs import get_tariff_engine
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = 15
+SLOT_SECONDS = SLOT_MINUTES * 60
+SLOT_HOURS = SLOT_MINUTES / 60
+HORIZON_SLOTS = 24 * 60 // SLOT_MINUTES
+
+# Run length of devices without an operation duration
+DEFAULT_DURATION_MINUTES = 60
+
+# What the schedule minimizes; balanced prices carbon at SCHEDULE_CARBON_PRICE_PER_KG
+OBJECTIVES = ('cost', 'carbon', 'balanced')
+
+# Weight of the other signal when minimizing one, so equal-cost slots are split by carbon
+TIE_BREAK = 1e-3
+
+# Best-response passes over all devices after the first placement
+MAX_PASSES = 8
+
+# Days of hourly grid carbon history averaged into the intensity profile
+CARBON_HISTORY_DAYS = 28
+
+
+def horizon_start(now=None):
+    """First slot boundary at or after now, UTC epoch seconds"""
+    now = now or datetime.now(timezone.utc)
+    return -(-int(now.timestamp()) // SLOT_SECONDS) * SLOT_SECONDS
+
+
+def hourly_carbon_intensity(user, tz, start):
+    """
+    Grid carbon intensity by local hour of day, from the user's recent logs.
+
+    Args:
+        user (User): User whose grid imports are read
+        tz (ZoneInfo): User's timezone
+        start (int): End of the history, UTC epoch seconds
+
+    Returns:
+        ndarray: (24,) kg CO2 per grid kWh; hours without data use the overall
+            intensity, or GRID_CARBON_INTENSITY_KG_PER_KWH without any data
+    """
+    from EcoPlot.services.usage_rollups import grain_edges, load_rollup_bins
+    edges = grain_edges('hour', tz, start - CARBON_HISTORY_DAYS * 86400, start - 1)
+    bins = load_rollup_bins(user.id, tz, 'hour', edges)
+    if bins is None:
+        _, log_start, log_end, values = load_usage(user.id, int(edges[0]), int(edges[-1]))
+        bins = distribute(edges, log_start, log_end, values)
+
+    hour = np.array([datetime.fromtimestamp(edge, tz).hour for edge in edges[:-1].tolist()])
+    grid_kwh = np.bincount(hour, weights=bins[GRID_KWH], minlength=24)
+    grid_carbon = np.bincount(hour, weights=bins[GRID_CARBON], minlength=24)
+
+    total_kwh, total_carbon = grid_kwh.sum(), grid_carbon.sum()
+    if total_kwh > 0 and total_carbon > 0:
+        fallback = total_carbon / total_kwh
+    else:
+        fallback = current_app.config.get('GRID_CARBON_INTENSITY_KG_PER_KWH', 0.4)
+    has_data = (grid_kwh > 0) & (grid_carbon > 0)
+    return np.where(has_data, grid_carbon / np.where(has_data, grid_kwh, 1), fallback)
+
+
+def schedule_signals(user, start, power_cap_kw=None):
+    """
+    Price, carbon and on-site generation of each slot of the next 24 hours.
+
+    Args:
+        user (User): Household being scheduled
+        start (int): First slot, UTC epoch seconds on a slot boundary
+        power_cap_kw (float, optional): Household peak power, defaults to SCHEDULE_POWER_CAP_KW
+
+    Returns:
+        dict: Per-slot arrays (epoch, local_minute, price, export_price, carbon,
+            generation_kw) and the scalars power_cap_kw and timezone
+    """
+    from EcoPlot.services.solar_model import get_solar_model, solar_sites
+    from EcoPlot.services.wind_model import get_wind_model, wind_sites
+    tz = user_timezone(user)
+    edges = start + np.arange(HORIZON_SLOTS + 1, dtype=np.int64) * SLOT_SECONDS
+    local = [datetime.fromtimestamp(edge, tz) for edge in edges[:-1].tolist()]
+    local_minute = np.array([moment.hour * 60 + moment.minute for moment in local])
+    local_hour = local_minute // 60
+    tariff = get_tariff_engine().series(user, edges[:-1])
+
+    # Average modeled output over each slot, scaled down for clouds and the base load
+    generation = (get_solar_model().energy(solar_sites([user]), edges)[0]
+                  + get_wind_model().energy(wind_sites([user]), edges)[0]) / SLOT_HOURS
+    generation *= current_app.config.get('SCHEDULE_GENERATION_SHARE', 0.5)
+
+    if power_cap_kw is None:
+        power_cap_kw = current_app.config.get('SCHEDULE_POWER_CAP_KW', 7.2)
+    return {
+        'timezone': tz,
+        'epoch': edges[:-1],
+        'local_minute': local_minute,
+        'price': tariff['price'],
+        'carbon': hourly_carbon_intensity(user, tz, start)[local_hour],
+        'generation_kw': generation,
+        'export_price': tariff['export_price'],
+        'power_cap_kw': float(power_cap_kw)
+    }
+
+
+def window_mask(local_minute, start_time, end_time):
+    """
+    Slots that lie wholly inside a daily preferred window.
+
+    Args:
+        local_minute (ndarray): Local minute of day at the start of each slot
+        start_time (time): Window start, or None for the whole day
+        end_time (time): Window end; before the start means the window wraps midnight
+
+    Returns:
+        ndarray: Boolean mask over the slots
+    """
+    if start_time is None or end_time is None:
+        return np.ones(local_minute.size, dtype=bool)
+    opens = start_time.hour * 60 + start_time.minute
+    length = (end_time.hour * 60 + end_time.minute - opens) % 1440 or 1440
+    return (local_minute - opens) % 1440 + SLOT_MINUTES <= length
+
+
+def device_fingerprint(device):
+    """Fields of a device that change its placement"""
+    return (device.power_consumption_watts, device.operation_duration_minutes,
+            device.preferred_start_time, device.preferred_end_time,
+            device.usage_flexibility, device.priority_level)
+
+
+def schedulable_loads(devices, local_minute):
+    """
+    Describe the schedulable devices as arrays of run length, power and allowed starts.
+
+    Devices with a usage flexibility of 0 run at the first slot of their window.
+
+    Args:
+        devices (list): Device rows; devices that are not schedulable or draw no power are skipped
+        local_minute (ndarray): Local minute of day at the start of each slot
+
+    Returns:
+        list: One dict per load (device_id, name, power_kw, slots, priority,
+            fingerprint, allowed), highest priority first
+    """
+    loads = []
+    for device in devices:
+        if not device.is_schedulable or not device.power_consumption_watts:
+            continue
+        slots = -(-(device.operation_duration_minutes or DEFAULT_DURATION_MINUTES) // SLOT_MINUTES)
+        mask = window_mask(local_minute, device.preferred_start_time, device.preferred_end_time)
+        # A start is allowed when every slot of the run is inside the window
+        inside = np.concatenate(([0], np.cumsum(mask)))
+        allowed = np.zeros(local_minute.size, dtype=bool)
+        if slots <= local_minute.size:
+            allowed[:local_minute.size - slots + 1] = inside[slots:] - inside[:-slots] == slots
+        if device.usage_flexibility == 0 and allowed.any():
+            allowed[np.argmax(allowed) + 1:] = False
+        loads.append({
+            'device_id': device.id,
+            'name': device.name,
+            'power_kw': device.power_consumption_watts / 1000.0,
+            'slots': int(slots),
+            'priority': device.priority_level or 0,
+            'fingerprint': device_fingerprint(device),
+            'allowed': allowed
+        })
+    loads.sort(key=lambda load: (-load['priority'], -load['power_kw'] * load['slots'], load['device_id']))
+    return loads
+
+
+def slot_weights(signals, objective, carbon_price):
+    """
+    Value per kWh of grid energy and of on-site energy in each slot under an objective.
+
+    Returns:
+        tuple: (grid weight per slot, on-site weight per slot)
+    """
+    if objective == 'carbon':
+        cost_weight, carbon_weight = TIE_BREAK, 1.0
+    elif objective == 'balanced':
+        cost_weight, carbon_weight = 1.0, carbon_price
+    else:
+        cost_weight, carbon_weight = 1.0, TIE_BREAK
+    grid = cost_weight * signals['price'] + carbon_weight * signals['carbon']
+    # Using on-site output forgoes exporting it at the plan's export price
+    onsite = cost_weight * signals['export_price']
+    return grid, onsite
+
+
+class ScheduleProblem:
+    """
+    Place each load's contiguous run so the weighted grid and on-site energy is smallest.
+
+    Each placement is exact for one device given the others: the marginal value of
+    every slot under the current load and generation is prefix-summed, so all
+    starts are priced at once. Devices are placed in priority order, then moved in
+    best-response passes until no move lowers the total. Devices that cannot start
+    anywhere without exceeding the power cap are left unscheduled, lowest priority
+    first since they are placed last.
+    """
+
+    def __init__(self, loads, generation_kw, grid_weight, onsite_weight, power_cap_kw):
+        self.loads = loads
+        self.generation = np.asarray(generation_kw, dtype=np.float64)
+        self.grid_weight = grid_weight
+        self.onsite_weight = onsite_weight
+        self.cap = power_cap_kw
+        self.load = np.zeros(self.generation.size)
+        self.starts = [None] * len(loads)
+
+    def _add(self, index, sign):
+        load = self.loads[index]
+        start = self.starts[index]
+        self.load[start:start + load['slots']] += sign * load['power_kw']
+
+    def _marginal(self, power, base):
+        """Weighted value of adding power on top of base in each slot"""
+        before = np.maximum(base - self.generation, 0)
+        added_grid = np.maximum(base + power - self.generation, 0) - before
+        return (added_grid * self.grid_weight + (power - added_grid) * self.onsite_weight) * SLOT_HOURS
+
+    def best_start(self, index, base=None, capped=True):
+        """
+        Cheapest allowed start of a load on top of a base load.
+
+        Returns:
+            tuple: (start slot, weighted value), or (None, inf) when no start fits
+        """
+        load = self.loads[index]
+        base = self.load if base is None else base
+        slots, power = load['slots'], load['power_kw']
+        if slots > base.size:
+            return None, np.inf
+        allowed = load['allowed'][:base.size - slots + 1]
+        if capped:
+            over = np.concatenate(([0], np.cumsum(base + power > self.cap + 1e-9)))
+            allowed = allowed & (over[slots:] - over[:-slots] == 0)
+        if not allowed.any():
+            return None, np.inf
+        value = np.concatenate(([0], np.cumsum(self._marginal(power, base))))
+        window = np.where(allowed, value[slots:] - value[:-slots], np.inf)
+        start = int(np.argmin(window))
+        return start, float(window[start])
+
+    def fits(self, index, start):
+        load = self.loads[index]
+        if start is None or start < 0 or start + load['slots'] > self.load.size or not load['allowed'][start]:
+            return False
+        return bool(np.all(self.load[start:start + load['slots']] + load['power_kw'] <= self.cap + 1e-9))
+
+    def solve(self, initial=None):
+        """
+        Place all loads, keeping the given starts where they still fit.
+
+        Args:
+            initial (dict, optional): Load index -> start slot of a previous schedule
+
+        Returns:
+            int: Number of loads placed from scratch
+        """
+        initial = initial or {}
+        placed = 0
+        for index, start in initial.items():
+            if self.fits(index, start):
+                self.starts[index] = start
+                self._add(index, 1)
+        for index in range(len(self.loads)):
+            if self.starts[index] is None:
+                self.starts[index], _ = self.best_start(index)
+                placed += 1
+                if self.starts[index] is not None:
+                    self._add(index, 1)
+
+        for _ in range(MAX_PASSES):
+            moved = False
+            for index in range(len(self.loads)):
+                if self.starts[index] is None:
+                    continue
+                current = self.starts[index]
+                self._add(index, -1)
+                slots = self.loads[index]['slots']
+                marginal = self._marginal(self.loads[index]['power_kw'], self.load)
+                current_value = float(marginal[current:current + slots].sum())
+                start, value = self.best_start(index)
+                if start is not None and value < current_value - 1e-9:
+                    self.starts[index] = start
+                    moved = True
+                self._add(index, 1)
+            if not moved:
+                break
+        return placed
+
+    def lower_bound(self):
+        """Sum of each load's best value on its own; sharing generation and the cap only adds to it"""
+        empty = np.zeros(self.generation.size)
+        bound = 0.0
+        for index in range(len(self.loads)):
+            if self.starts[index] is not None:
+                bound += self.best_start(index, base=empty, capped=False)[1]
+        return bound
+
+
+def settle(loads, starts, signals):
+    """
+    Split the grid and on-site energy of a schedule between its devices.
+
+    Each slot's generation is shared in proportion to the devices' power in it.
+
+    Returns:
+        tuple: (per-load dict of kwh, cost, carbon_kg and onsite_kwh, totals dict)
+    """
+    size = signals['epoch'].size
+    load_kw = np.zeros(size)
+    for load, start in zip(loads, starts):
+        if start is not None:
+            load_kw[start:start + load['slots']] += load['power_kw']
+    onsite_share = np.minimum(signals['generation_kw'], load_kw) / np.where(load_kw > 0, load_kw, 1)
+    grid_cost = signals['price'] * (1 - onsite_share) + signals['export_price'] * onsite_share
+    grid_carbon = signals['carbon'] * (1 - onsite_share)
+
+    settled = []
+    for load, start in zip(loads, starts):
+        if start is None:
+            settled.append(None)
+            continue
+        span = slice(start, start + load['slots'])
+        kwh = load['power_kw'] * SLOT_HOURS
+        settled.append({
+            'kwh': kwh * load['slots'],
+            'cost': kwh * float(grid_cost[span].sum()),
+            'carbon_kg': kwh * float(grid_carbon[span].sum()),
+            'onsite_kwh': kwh * float(onsite_share[span].sum())
+        })
+    totals = {
+        name: sum(entry[name] for entry in settled if entry) for name in ('kwh', 'cost', 'carbon_kg', 'onsite_kwh')
+    }
+    totals['peak_kw'] = float(load_kw.max(initial=0))
+    return settled, totals
+
+
+class AppliancePlanCache:
+    """
+    Last schedule of each user, kept to re-solve incrementally when one device changes.
+
+    Entries are keyed by user and hold the solve settings, each device's fingerprint
+    and its start as epoch seconds, so a later horizon can reuse the starts still ahead.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+            return entry
+
+    def put(self, user_id, entry):
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class ApplianceSchedulerService:
+    """Day-ahead start times for a household's schedulable devices"""
+
+    @staticmethod
+    def schedule(user, devices, objective='cost', power_cap_kw=None, now=None):
+        """
+        Assign start times over the next 24 hours in 15-minute slots.
+
+        Args:
+            user (User): Household being scheduled
+            devices (list): The household's devices; only schedulable ones are placed
+            objective (str): cost, carbon or balanced
+            power_cap_kw (float, optional): Household peak power, defaults to SCHEDULE_POWER_CAP_KW
+            now (datetime, optional): Aware reference time, defaults to the current time
+
+        Returns:
+            dict: Per-device starts and costs, devices left out, totals against running
+                each device at its earliest start, and solve statistics
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective: {objective}")
+        started = time.perf_counter()
+        start = horizon_start(now)
+        signals = schedule_signals(user, start, power_cap_kw)
+        loads = schedulable_loads(devices, signals['local_minute'])
+        carbon_price = current_app.config.get('SCHEDULE_CARBON_PRICE_PER_KG', 0.05)
+        grid_weight, onsite_weight = slot_weights(signals, objective, carbon_price)
+        problem = ScheduleProblem(loads, signals['generation_kw'], grid_weight, onsite_weight,
+                                  signals['power_cap_kw'])
+
+        # Keep the previous starts of unchanged devices when the settings are the same
+        cache = get_appliance_plan_cache()
+        settings = (objective, signals['power_cap_kw'], carbon_price)
+        previous = cache.get(user.id)
+        initial = {}
+        if previous is not None and previous['settings'] == settings:
+            for index, load in enumerate(loads):
+                kept = previous['devices'].get(load['device_id'])
+                if kept and kept[0] == load['fingerprint'] and kept[1] is not None and kept[1] >= start:
+                    initial[index] = int((kept[1] - start) // SLOT_SECONDS)
+        placed = problem.solve(initial)
+        cache.put(user.id, {
+            'settings': settings,
+            'devices': {
+                load['device_id']: (load['fingerprint'],
+                                    None if slot is None else start + slot * SLOT_SECONDS)
+                for load, slot in zip(loads, problem.starts)
+            }
+        })
+
+        settled, totals = settle(loads, problem.starts, signals)
+        earliest = [int(np.argmax(load['allowed'])) if load['allowed'].any() else None for load in loads]
+        _, baseline = settle(loads, [first if slot is not None else None
+                                     for first, slot in zip(earliest, problem.starts)], signals)
+        lower_bound = problem.lower_bound()
+        final_value = float(np.sum(
+            np.maximum(problem.load - problem.generation, 0) * grid_weight
+            + np.minimum(problem.load, problem.generation) * onsite_weight) * SLOT_HOURS)
+
+        tz = signals['timezone']
+        schedule, unscheduled = [], []
+        for load, slot, entry in zip(loads, problem.starts, settled):
+            if slot is None:
+                reason = 'no_window' if not load['allowed'].any() else 'power_cap'
+                unscheduled.append({'device_id': load['device_id'], 'name': load['name'], 'reason': reason})
+                continue
+            begin = start + slot * SLOT_SECONDS
+            schedule.append({
+                'device_id': load['device_id'],
+                'name': load['name'],
+                'start': datetime.fromtimestamp(begin, tz).isoformat(),
+                'end': datetime.fromtimestamp(begin + load['slots'] * SLOT_SECONDS, tz).isoformat(),
+                'power_kw': round(load['power_kw'], 3),
+                'kwh': round(entry['kwh'], 3),
+                'cost': round(entry['cost'], 4),
+                'carbon_kg': round(entry['carbon_kg'], 4),
+                'onsite_kwh': round(entry['onsite_kwh'], 3)
+            })
+        schedule.sort(key=lambda item: (item['start'], item['device_id']))
+
+        solve_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Scheduled {len(schedule)} of {len(loads)} devices for user {user.id} "
+                    f"in {solve_ms:.1f} ms ({len(loads) - placed} kept from the last schedule)")
+        return {
+            'objective': objective,
+            'timezone': tz.key,
+            'start': datetime.fromtimestamp(start, tz).isoformat(),
+            'slot_minutes': SLOT_MINUTES,
+            'power_cap_kw': signals['power_cap_kw'],
+            'schedule': schedule,
+            'unscheduled': unscheduled,
+            'totals': {
+                'kwh': round(totals['kwh'], 3),
+                'cost': round(totals['cost'], 4),
+                'carbon_kg': round(totals['carbon_kg'], 4),
+                'onsite_kwh': round(totals['onsite_kwh'], 3),
+                'peak_kw': round(totals['peak_kw'], 3),
+                # Every device at the first start of its window, ignoring the cap
+                'baseline_cost': round(baseline['cost'], 4),
+                'baseline_carbon_kg': round(baseline['carbon_kg'], 4),
+                'cost_savings': round(baseline['cost'] - totals['cost'], 4),
+                'carbon_saved_kg': round(baseline['carbon_kg'] - totals['carbon_kg'], 4),
+                'objective_value': round(final_value, 4),
+                'lower_bound': round(lower_bound, 4)
+            },
+            'incremental': bool(initial),
+            'replaced': placed,
+            'solve_ms': round(solve_ms, 2)
+        }
+
+
+def init_appliance_scheduler(app):
+    """Create the per-user cache of the last schedules"""
+    cache = AppliancePlanCache(app.config.get('SCHEDULE_CACHE_USERS', 1000))
+    app.extensions['appliance_plan_cache'] = cache
+    return cache
+
+
+def get_appliance_plan_cache():
+    """Return the schedule cache of the current app"""
+    return current_app.extensions['appliance_plan_cache']
@@ -0,0 +1,336 @@
+# EcoPlot/services/battery_simulator.py
+import logging
+import math
+import time
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from EcoPlot.services.energy_aggregation import KWH, distribute, load_usage, local_midnight, user_timezone
+from EcoPlot.services.tariffs import get_tariff_engine
+
+logger = logging.getLogger(__name__)
+
+STEP_MINUTES = 15
+STEP_SECONDS = STEP_MINUTES * 60
+STEP_HOURS = STEP_MINUTES / 60
+
+# self_consumption: store surplus on-site output, discharge whenever the home draws from the grid
+# backup_reserve: the same, but never below BATTERY_BACKUP_RESERVE of the capacity
+# tou_arbitrage: discharge only in peak hours; without on-site output, charge from the grid off-peak
+STRATEGIES = ('self_consumption', 'backup_reserve', 'tou_arbitrage')
+
+
+# Steps composed together before the block totals are scanned
+SCAN_BLOCK = 16
+
+
+def _compose(inner, outer, out):
+    """
+    Write the composition applying inner and then outer into out.
+
+    Each argument is a (shift, low, high) triple of equally shaped arrays, or arrays
+    that broadcast; out must not overlap inner or outer.
+    """
+    inner_shift, inner_low, inner_high = inner
+    outer_shift, outer_low, outer_high = outer
+    out_shift, out_low, out_high = out
+    for inner_bound, out_bound in ((inner_low, out_low), (inner_high, out_high)):
+        np.add(inner_bound, outer_shift, out=out_bound)
+        np.maximum(out_bound, outer_low, out=out_bound)
+        np.minimum(out_bound, outer_high, out=out_bound)
+    np.add(inner_shift, outer_shift, out=out_shift)
+
+
+def _doubling_scan(parts):
+    """
+    Prefix compositions along the first axis, in log2(length) rounds.
+
+    Rounds alternate between the given arrays and a second set of buffers so no
+    round allocates.
+
+    Returns:
+        list: The (shift, low, high) arrays holding the result
+    """
+    spare = [np.empty_like(part) for part in parts]
+    offset = 1
+    while offset < parts[0].shape[0]:
+        _compose([part[:-offset] for part in parts], [part[offset:] for part in parts],
+                 [part[offset:] for part in spare])
+        for part, target in zip(parts, spare):
+            target[:offset] = part[:offset]
+        parts, spare = spare, parts
+        offset *= 2
+    return parts
+
+
+def _running_scan(parts):
+    """
+    In-place prefix compositions along the last axis, one position at a time.
+
+    Each position is composed onto the previous one for all rows at once, so every
+    element is touched once; suited to a short last axis and many rows.
+    """
+    shift, low, high = parts
+    lower, upper = np.empty_like(low[..., 0]), np.empty_like(high[..., 0])
+    for position in range(1, shift.shape[-1]):
+        step_shift, step_low, step_high = shift[..., position], low[..., position], high[..., position]
+        for previous, bound in ((low[..., position - 1], lower), (high[..., position - 1], upper)):
+            np.add(previous, step_shift, out=bound)
+            np.maximum(bound, step_low, out=bound)
+            np.minimum(bound, step_high, out=bound)
+        step_low[...] = lower
+        step_high[...] = upper
+        np.add(shift[..., position - 1], step_shift, out=step_shift)
+
+
+def clamp_scan(increments, low, high):
+    """
+    Prefix compositions of the steps s -> clip(s + x, low, high).
+
+    A clip after a shift is again a clip after a shift, with
+    clip(clip(s + a1, l1, h1) + a2, l2, h2) = clip(s + a1 + a2, clip(l1 + a2, l2, h2), clip(h1 + a2, l2, h2)),
+    so the state of charge after every step follows from a scan over the whole
+    series instead of a Python loop over the steps. Steps are composed within
+    blocks of SCAN_BLOCK, the block totals are scanned, and each block's prefix is
+    applied to its steps, which keeps the full-length passes to a handful.
+
+    Args:
+        increments (ndarray): (..., steps) change applied at each step
+        low, high (ndarray): Bounds of each step, broadcastable to increments
+
+    Returns:
+        tuple: (shift, low, high) arrays so that the state after step t is
+            clip(initial + shift[t], low[t], high[t])
+    """
+    increments = np.asarray(increments, dtype=np.float64)
+    *lead, steps = increments.shape
+    blocks = -(-steps // SCAN_BLOCK)
+    parts = []
+    # Padding steps are the identity: no shift and unbounded
+    for values, fill in ((increments, 0.0), (low, -np.inf), (high, np.inf)):
+        part = np.empty((*lead, blocks * SCAN_BLOCK))
+        part[..., :steps] = values
+        part[..., steps:] = fill
+        parts.append(part.reshape(*lead, blocks, SCAN_BLOCK))
+    _running_scan(parts)
+
+    # Compositions up to the end of each block, applied before the next block's steps
+    totals = _doubling_scan([np.ascontiguousarray(np.moveaxis(part[..., -1], -1, 0)) for part in parts])
+    before = [np.moveaxis(total[:-1], 0, -1)[..., None] for total in totals]
+    result = [np.empty_like(part) for part in parts]
+    _compose(before, [part[..., 1:, :] for part in parts], [part[..., 1:, :] for part in result])
+    for part, target in zip(parts, result):
+        target[..., 0, :] = part[..., 0, :]
+
+    return tuple(part.reshape(*lead, blocks * SCAN_BLOCK)[..., :steps] for part in result)
+
+
+def dispatch(consumption, production, peak, capacity_kwh, power_kw, efficiency, reserve, grid_charging=True):
+    """
+    Simulate the battery strategies over a series of steps.
+
+    Args:
+        consumption, production (ndarray): kWh per step
+        peak (ndarray): True in time-of-use peak steps
+        capacity_kwh (float): Usable capacity
+        power_kw (float): Charge and discharge power limit
+        efficiency (float): Round-trip efficiency, split evenly between charging and discharging
+        reserve (float): Share of the capacity the backup_reserve strategy keeps
+        grid_charging (bool): Let tou_arbitrage charge from the grid off-peak
+
+    Returns:
+        dict: (strategies, steps) arrays soc_kwh, charge_kwh (drawn into the battery) and
+            discharge_kwh (delivered to the home), in the order of STRATEGIES
+    """
+    one_way = math.sqrt(efficiency)
+    limit = power_kw * STEP_HOURS
+    surplus = production - consumption
+    charge = np.minimum(np.maximum(surplus, 0), limit) * one_way
+    discharge = np.minimum(np.maximum(-surplus, 0), limit) / one_way
+    follow = np.where(surplus > 0, charge, -discharge)
+    off_peak = limit * one_way if grid_charging else 0.0
+    arbitrage = np.where(surplus > 0, charge, np.where(peak, -discharge, off_peak))
+
+    soc = np.empty((len(STRATEGIES), consumption.size))
+    for index, (increments, floor) in enumerate(((follow, 0.0), (follow, reserve * capacity_kwh), (arbitrage, 0.0))):
+        shift, low, high = clamp_scan(increments, floor, capacity_kwh)
+        # Each strategy starts the series full
+        np.minimum(np.maximum(capacity_kwh + shift, low), high, out=soc[index])
+
+    change = np.diff(soc, axis=1, prepend=capacity_kwh)
+    return {
+        'soc_kwh': soc,
+        'charge_kwh': np.maximum(change, 0) / one_way,
+        'discharge_kwh': np.maximum(-change, 0) * one_way
+    }
+
+
+def household_series(user, edges, tz):
+    """
+    Consumption from the user's logs and modeled on-site production per step.
+
+    Hourly rollups are spread evenly over their 15-minute steps when they are
+    available; otherwise the raw logs are distributed over the steps.
+
+    Returns:
+        tuple: (consumption, production) kWh per step
+    """
+    from EcoPlot.services.solar_model import get_solar_model, solar_sites
+    from EcoPlot.services.usage_rollups import load_rollup_bins
+    from EcoPlot.services.wind_model import get_wind_model, wind_sites
+    per_hour = 3600 // STEP_SECONDS
+    bins = None
+    if edges[0] % 3600 == 0 and (edges.size - 1) % per_hour == 0:
+        bins = load_rollup_bins(user.id, tz, 'hour', edges[::per_hour])
+    if bins is not None:
+        consumption = np.repeat(bins[KWH] / per_hour, per_hour)
+    else:
+        _, start, end, values = load_usage(user.id, int(edges[0]), int(edges[-1]))
+        consumption = distribute(edges, start, end, values[KWH:KWH + 1])[0]
+
+    production = (get_solar_model().energy(solar_sites([user]), edges)[0]
+                  + get_wind_model().energy(wind_sites([user]), edges)[0])
+    production *= current_app.config.get('BATTERY_SIM_CLEAR_SKY_SHARE', 0.75)
+    return consumption, production
+
+
+def clip_to_history(edges, consumption, production):
+    """
+    Drop the steps before the household's first usage. Without logs they would count
+    as zero consumption while production is modeled for them.
+
+    Args:
+        edges (ndarray): Step edges of the window, starting on an hour
+        consumption, production (ndarray): kWh per step from household_series
+
+    Returns:
+        tuple: (edges, consumption, production, coverage) of the covered part, with
+            coverage its share of the window
+
+    Raises:
+        ValueError: With less than BATTERY_SIM_MIN_HISTORY_DAYS of usage history
+    """
+    per_hour = 3600 // STEP_SECONDS
+    used = np.flatnonzero(consumption > 0)
+    # Whole hours are kept so the rollups still line up with the window
+    first = int(used[0]) // per_hour * per_hour if used.size else consumption.size
+    days = (consumption.size - first) * STEP_SECONDS / 86400
+    min_days = current_app.config.get('BATTERY_SIM_MIN_HISTORY_DAYS', 30)
+    if days < min_days:
+        raise ValueError(f"At least {min_days} days of usage history are needed, found {days:.0f}")
+    return edges[first:], consumption[first:], production[first:], (consumption.size - first) / consumption.size
+
+
+class BatterySimulatorService:
+    """What a home battery would have done over the household's last year"""
+
+    @staticmethod
+    def simulate(user, capacity_kwh=None, power_kw=None, now=None, include_series=False):
+        """
+        Run every dispatch strategy over the last 365 days at 15-minute resolution, or
+        over the household's history when it is shorter. Annual figures are then
+        scaled up from the covered share of the year.
+
+        Args:
+            user (User): Household whose consumption and production are simulated
+            capacity_kwh (float, optional): Battery size, defaults to the profile's battery
+                or BATTERY_DEFAULT_CAPACITY_KWH
+            power_kw (float, optional): Power limit, defaults to BATTERY_MAX_C_RATE times the capacity
+            now (datetime, optional): Aware reference time, defaults to the current time
+            include_series (bool): Also return each strategy's state of charge per step
+
+        Returns:
+            dict: Per-strategy totals and monthly figures against the household without a battery
+
+        Raises:
+            ValueError: For a non-positive size or too little usage history
+        """
+        config = current_app.config
+        if capacity_kwh is None:
+            capacity_kwh = user.battery_capacity_kwh if user.has_battery_storage and user.battery_capacity_kwh \
+                else config.get('BATTERY_DEFAULT_CAPACITY_KWH', 10.0)
+        if power_kw is None:
+            power_kw = capacity_kwh * config.get('BATTERY_MAX_C_RATE', 0.5)
+        if capacity_kwh <= 0 or power_kw <= 0:
+            raise ValueError('Battery capacity and power must be positive')
+
+        tz = user_timezone(user)
+        today = local_midnight((now or datetime.now(tz)).astimezone(tz), tz)
+        end = int(today.timestamp()) // 3600 * 3600
+        edges = np.arange(end - 365 * 86400, end + 1, STEP_SECONDS, dtype=np.int64)
+
+        consumption, production = household_series(user, edges, tz)
+        edges, consumption, production, coverage = clip_to_history(edges, consumption, production)
+        epoch = edges[:-1]
+        engine = get_tariff_engine()
+        tariff = engine.series(user, epoch)
+        price, peak = tariff['price'], tariff['peak']
+
+        # Charging from the grid off-peak pays when the peak price beats the off-peak price plus losses;
+        # with on-site output the battery is left to the surplus instead
+        efficiency = config.get('BATTERY_ROUND_TRIP_EFFICIENCY', 0.9)
+        grid_charging = bool(production.sum() <= 0 and peak.any() and (~peak).any()
+                             and price[peak].min() * efficiency > price[~peak].max())
+
+        started = time.perf_counter()
+        result = dispatch(consumption, production, peak, capacity_kwh, power_kw, efficiency,
+                          reserve=config.get('BATTERY_BACKUP_RESERVE', 0.2), grid_charging=grid_charging)
+        net = consumption - production + result['charge_kwh'] - result['discharge_kwh']
+        grid_import = np.maximum(net, 0)
+        grid_export = np.maximum(-net, 0)
+        simulate_ms = (time.perf_counter() - started) * 1000
+
+        # Billed under the user's rate plan, so tiers, demand charges and export pricing count too
+        base_net = consumption - production
+        base_import = np.maximum(base_net, 0)
+        base_export = np.maximum(-base_net, 0)
+        base_bill = engine.bill(user, int(epoch[0]), base_import, base_export)
+        base_monthly = np.array([month['total'] for month in base_bill['monthly']])
+
+        total_consumption, total_production = float(consumption.sum()), float(production.sum())
+        strategies = {}
+        for index, name in enumerate(STRATEGIES):
+            imported, exported = float(grid_import[index].sum()), float(grid_export[index].sum())
+            bill = engine.bill(user, int(epoch[0]), grid_import[index], grid_export[index])
+            monthly_savings = base_monthly - np.array([month['total'] for month in bill['monthly']])
+            strategy = {
+                'grid_import_kwh': round(imported, 1),
+                'grid_export_kwh': round(exported, 1),
+                'cost': round(bill['total'], 2),
+                'savings': round(base_bill['total'] - bill['total'], 2),
+                'annual_savings': round((base_bill['total'] - bill['total']) / coverage, 2),
+                'demand_charges': round(bill['demand'], 2),
+                'cycles': round(float(result['discharge_kwh'][index].sum()) / capacity_kwh, 1),
+                # Grid charging can import more than the home uses
+                'self_sufficiency': round(max(1 - imported / total_consumption, 0), 3) if total_consumption else None,
+                'self_consumption': round(1 - exported / total_production, 3) if total_production else None,
+                'monthly_savings': np.round(monthly_savings, 2).tolist()
+            }
+            if include_series:
+                strategy['soc_percent'] = np.round(result['soc_kwh'][index] / capacity_kwh * 100, 1).tolist()
+            strategies[name] = strategy
+
+        logger.info(f"Simulated a {capacity_kwh} kWh battery for user {user.id} over {epoch.size} steps "
+                    f"in {simulate_ms:.1f} ms")
+        return {
+            'capacity_kwh': capacity_kwh,
+            'power_kw': power_kw,
+            'start': datetime.fromtimestamp(int(edges[0]), tz).isoformat(),
+            'end': datetime.fromtimestamp(int(edges[-1]), tz).isoformat(),
+            'step_minutes': STEP_MINUTES,
+            'history_days': round(epoch.size * STEP_SECONDS / 86400, 1),
+            'coverage': round(coverage, 3),
+            'rate_plan': engine.plan_name(user),
+            'months': [month['month'] for month in base_bill['monthly']],
+            'consumption_kwh': round(total_consumption, 1),
+            'production_kwh': round(total_production, 1),
+            'without_battery': {
+                'grid_import_kwh': round(float(base_import.sum()), 1),
+                'grid_export_kwh': round(float(base_export.sum()), 1),
+                'cost': round(base_bill['total'], 2),
+                'annual_cost': round(base_bill['total'] / coverage, 2),
+                'demand_charges': round(base_bill['demand'], 2)
+            },
+            'strategies': strategies,
+            'simulate_ms': round(simulate_ms, 2)
+        }
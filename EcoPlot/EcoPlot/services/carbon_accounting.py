@@ -0,0 +1,449 @@
+# EcoPlot/services/carbon_accounting.py
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+import numpy as np
+from flask import current_app
+from sqlalchemy import bindparam, func, select, update
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.usage_archive import UsageArchiveSegment
+from EcoPlot.models.user import User
+from EcoPlot.services.energy_aggregation import (
+    BATTERY_KWH, BATTERY_SOURCES, ONSITE_KWH, ONSITE_SOURCES, _epoch_seconds, distribute, load_usage,
+    timezone_from_name, user_timezone
+)
+from EcoPlot.services.usage_archive import NO_END, UsageArchiveService, read_segment, segment_path
+from EcoPlot.services.usage_rollups import execute_driver_many, grain_edges, load_rollup_bins
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_YEAR = 8760
+
+# How a log's energy source is accounted
+GRID, ONSITE, BATTERY = range(3)
+
+# Points of a log's interval whose grid intensity is averaged
+INTENSITY_SAMPLES = 4
+
+# Country names as users enter them -> the region code of the profile files
+COUNTRY_CODES = {
+    'united states': 'US',
+    'united states of america': 'US',
+    'usa': 'US',
+    'united kingdom': 'GB',
+    'uk': 'GB',
+    'great britain': 'GB',
+    'canada': 'CA',
+    'australia': 'AU',
+    'germany': 'DE',
+    'france': 'FR',
+    'india': 'IN'
+}
+
+
+def region_keys(country, state):
+    """Profile keys to try for a location, most specific first, e.g. ['US-CA', 'US']"""
+    if not country:
+        return []
+    country = country.strip()
+    code = COUNTRY_CODES.get(country.lower(), country).upper()
+    keys = [code]
+    if state and state.strip():
+        keys.insert(0, f"{code}-{state.strip().upper()}")
+    return keys
+
+
+def load_profile(path):
+    """
+    Read one region's hourly intensity profile.
+
+    The CSV has a header row and the columns hour,kg_per_kwh: 24 rows for a
+    typical day or 8760 rows for a typical year, in the region's local time.
+
+    Returns:
+        ndarray: kg CO2 per kWh for each hour of the year
+
+    Raises:
+        ValueError: When the file has neither 24 nor 8760 non-negative values
+    """
+    values = np.loadtxt(path, delimiter=',', skiprows=1, usecols=1, ndmin=1, dtype=np.float64)
+    if values.size not in (24, HOURS_PER_YEAR) or np.any(values < 0) or np.any(np.isnan(values)):
+        raise ValueError(f"{path}: expected 24 or {HOURS_PER_YEAR} non-negative hourly values")
+    return np.tile(values, HOURS_PER_YEAR // values.size)
+
+
+class GridIntensityProfiles:
+    """
+    Hourly grid carbon intensity of a typical year for every region, held as one array.
+
+    Row 0 is the GRID_CARBON_INTENSITY_KG_PER_KWH fallback for users in regions
+    without a profile file.
+    """
+
+    def __init__(self, directory, default_intensity):
+        self.regions = {}
+        rows = [np.full(HOURS_PER_YEAR, default_intensity, dtype=np.float64)]
+        if directory and os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                key, extension = os.path.splitext(name)
+                if extension.lower() != '.csv':
+                    continue
+                self.regions[key.upper()] = len(rows)
+                rows.append(load_profile(os.path.join(directory, name)))
+        self.table = np.vstack(rows)
+        # Cleanest hour of each day, the hour a grid-charged battery is assumed to charge in
+        self.daily_min = self.table.reshape(len(rows), HOURS_PER_YEAR // 24, 24).min(axis=2)
+        self.table.flags.writeable = False
+        self.daily_min.flags.writeable = False
+        logger.info(f"Loaded grid intensity profiles of {len(self.regions)} region(s)")
+
+    def region_row(self, country, state):
+        """Row of the most specific profile for a location, 0 for the fallback"""
+        for key in region_keys(country, state):
+            if key in self.regions:
+                return self.regions[key]
+        return 0
+
+
+@lru_cache(maxsize=256)
+def utc_offsets(tz_key, year):
+    """UTC offset in seconds of every UTC hour of a year in a timezone"""
+    tz = timezone_from_name(tz_key)
+    first = int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp())
+    last = int(datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp())
+    offsets = np.array([
+        datetime.fromtimestamp(hour, timezone.utc).astimezone(tz).utcoffset().total_seconds()
+        for hour in range(first, last, 3600)
+    ], dtype=np.int64)
+    offsets.flags.writeable = False
+    return first, offsets
+
+
+def local_epoch(epoch, zone, zones):
+    """
+    Shift UTC timestamps to wall-clock seconds in their own timezones.
+
+    Args:
+        epoch (ndarray): UTC epoch seconds
+        zone (ndarray): Index into zones for each timestamp
+        zones (list): Timezone names
+
+    Returns:
+        ndarray: Local time as seconds since 1970-01-01 00:00 on the wall clock
+    """
+    epoch = np.asarray(epoch, dtype=np.int64)
+    if not epoch.size:
+        return epoch
+    # One row of hourly offsets per timezone over the UTC years spanned, gathered at once
+    years = range(datetime.fromtimestamp(int(epoch.min()), timezone.utc).year,
+                  datetime.fromtimestamp(int(epoch.max()), timezone.utc).year + 1)
+    first = utc_offsets(zones[0], years[0])[0]
+    offsets = np.vstack([np.concatenate([utc_offsets(tz_key, year)[1] for year in years]) for tz_key in zones])
+    return epoch + offsets[zone, (epoch - first) // 3600]
+
+
+def local_hour_of_year(epoch, zone, zones):
+    """
+    Local hour of the year of each timestamp in its own timezone.
+
+    Args:
+        epoch (ndarray): UTC epoch seconds
+        zone (ndarray): Index into zones for each timestamp
+        zones (list): Timezone names
+
+    Returns:
+        ndarray: Hours 0-8759; the last day of a leap year wraps to the first
+    """
+    local = local_epoch(epoch, zone, zones)
+    year_start = local.astype('datetime64[s]').astype('datetime64[Y]').astype('datetime64[s]').astype(np.int64)
+    return (local - year_start) // 3600 % HOURS_PER_YEAR
+
+
+def source_kinds(sources):
+    """GRID, ONSITE or BATTERY for each energy source name; unknown and missing sources are grid"""
+    kinds = {}
+    for source in set(sources):
+        name = (source or '').strip().lower()
+        kinds[source] = ONSITE if name in ONSITE_SOURCES else BATTERY if name in BATTERY_SOURCES else GRID
+    return np.fromiter((kinds[source] for source in sources), dtype=np.int8, count=len(sources))
+
+
+def log_carbon(profiles, region, zone, zones, start, end, kwh, kind, charged_onsite, efficiency):
+    """
+    Carbon emitted and avoided by usage logs, computed for a whole batch at once.
+
+    Grid energy emits at the regional intensity averaged over INTENSITY_SAMPLES
+    points of the log's interval. On-site energy emits nothing and avoids what the
+    grid would have emitted. Battery energy was charged from on-site output when
+    the household generates its own, else from the grid in the cleanest hour of
+    the day, and avoids the grid emissions at discharge less those of charging.
+
+    Args:
+        profiles (GridIntensityProfiles): Regional intensity profiles
+        region (ndarray): Profile row of each log
+        zone (ndarray): Index into zones of each log's timezone
+        zones (list): Timezone names
+        start, end (ndarray): Log intervals, UTC epoch seconds
+        kwh (ndarray): Energy of each log
+        kind (ndarray): GRID, ONSITE or BATTERY for each log
+        charged_onsite (ndarray): True where the household has solar or wind
+        efficiency (float): Battery round-trip efficiency
+
+    Returns:
+        tuple: (carbon_kg, avoided_kg) arrays
+    """
+    fractions = (np.arange(INTENSITY_SAMPLES) + 0.5) / INTENSITY_SAMPLES
+    points = start[:, None] + (end - start)[:, None] * fractions
+    hours = local_hour_of_year(points.ravel(), np.repeat(zone, INTENSITY_SAMPLES), zones)
+    hours = hours.reshape(points.shape)
+    intensity = profiles.table[region[:, None], hours].mean(axis=1)
+    grid_kg = kwh * intensity
+
+    charge_intensity = np.where(charged_onsite, 0.0, profiles.daily_min[region, hours[:, 0] // 24])
+    battery_kg = kwh / efficiency * charge_intensity
+    carbon = np.select([kind == ONSITE, kind == BATTERY], [0.0, battery_kg], grid_kg)
+    avoided = np.select([kind == ONSITE, kind == BATTERY], [grid_kg, grid_kg - battery_kg], 0.0)
+    return carbon, avoided
+
+
+def _user_context(users):
+    """Profile row, timezone index and on-site flag per user, and the timezone names"""
+    profiles = get_grid_intensity()
+    zones, zone_index = [], {}
+    context = {}
+    for user_id, country, state, tz_name, has_solar, has_wind in users:
+        tz_key = timezone_from_name(tz_name).key
+        if tz_key not in zone_index:
+            zone_index[tz_key] = len(zones)
+            zones.append(tz_key)
+        context[user_id] = (profiles.region_row(country, state), zone_index[tz_key], bool(has_solar or has_wind))
+    return context, zones
+
+
+class CarbonAccountingService:
+    """Carbon emitted by usage logs and avoided by on-site generation and batteries"""
+
+    @staticmethod
+    def fill_missing(user, start, end, kwh, sources, carbon):
+        """
+        Compute the carbon of the logs of one ingest batch that arrive without it.
+
+        Args:
+            user (User): Owner of the logs
+            start, end (ndarray): Log intervals, UTC epoch seconds
+            kwh (ndarray): Energy of each log, NaN when missing
+            sources (sequence): energy_source of each log
+            carbon (ndarray): carbon_footprint_kg of each log, NaN when missing
+
+        Returns:
+            ndarray: carbon with the missing values computed; logs without energy stay NaN
+        """
+        missing = np.isnan(carbon) & ~np.isnan(kwh)
+        if not missing.any():
+            return carbon
+        context, zones = _user_context([(user.id, user.country, user.state, user.timezone,
+                                         user.has_solar, user.has_wind_turbine)])
+        region, zone, charged_onsite = context[user.id]
+        count = int(missing.sum())
+        computed, _ = log_carbon(
+            get_grid_intensity(), np.full(count, region), np.full(count, zone), zones,
+            start[missing], end[missing], kwh[missing],
+            source_kinds([source for source, take in zip(sources, missing.tolist()) if take]),
+            np.full(count, charged_onsite), current_app.config.get('BATTERY_ROUND_TRIP_EFFICIENCY', 0.9)
+        )
+        carbon = carbon.copy()
+        carbon[missing] = computed
+        return carbon
+
+    @staticmethod
+    def avoided(user, edges):
+        """
+        Carbon avoided by on-site generation and by battery discharge in each bin.
+
+        Both come from the hourly rollups, which include archived logs. Battery energy
+        avoids the grid emissions of its hour less those of charging it, as in log_carbon.
+
+        Args:
+            user (User): Household
+            edges (ndarray): Bin edges, UTC epoch seconds
+
+        Returns:
+            tuple: (onsite_kg, battery_kg) per bin
+        """
+        tz = user_timezone(user)
+        profiles = get_grid_intensity()
+        region = profiles.region_row(user.country, user.state)
+        zones = [tz.key]
+
+        hours = grain_edges('hour', tz, int(edges[0]), int(edges[-1]) - 1)
+        bins = load_rollup_bins(user.id, tz, 'hour', hours)
+        if bins is None:
+            _, start, end, values = load_usage(user.id, int(hours[0]), int(hours[-1]))
+            bins = distribute(hours, start, end, values)
+        hour_of_year = local_hour_of_year(hours[:-1] + 1800, np.zeros(hours.size - 1, dtype=np.int64), zones)
+        intensity = profiles.table[region, hour_of_year]
+        if user.has_solar or user.has_wind_turbine:
+            charge_kg = 0.0
+        else:
+            efficiency = current_app.config.get('BATTERY_ROUND_TRIP_EFFICIENCY', 0.9)
+            charge_kg = profiles.daily_min[region, hour_of_year // 24] / efficiency
+        avoided_kg = np.vstack([bins[ONSITE_KWH] * intensity, bins[BATTERY_KWH] * (intensity - charge_kg)])
+
+        # Bins of whole hours are summed exactly; half-hour offset zones spread the hours over them
+        index = np.searchsorted(hours, edges)
+        if index[-1] < hours.size and np.array_equal(hours[index], edges):
+            avoided_kg = np.add.reduceat(avoided_kg, index[:-1], axis=1)
+        else:
+            avoided_kg = distribute(edges, hours[:-1].astype(np.float64), hours[1:].astype(np.float64), avoided_kg)
+        return avoided_kg[0], avoided_kg[1]
+
+    @staticmethod
+    def backfill(recompute=False, chunk_rows=None, progress=None):
+        """
+        Compute carbon_footprint_kg for stored usage logs in chunks of rows.
+
+        Logs are walked in id order, each chunk read, computed and updated in its own
+        transaction, so the job can be stopped and rerun; without recompute only logs
+        whose carbon is NULL are touched. Archived logs follow, one monthly segment per
+        transaction, each changed segment written as a new version. Rollups are not
+        changed; rebuild those of the returned users afterwards.
+
+        Args:
+            recompute (bool): Also replace carbon values already stored
+            chunk_rows (int, optional): Logs per chunk, defaults to CARBON_BACKFILL_CHUNK_ROWS
+            progress (callable, optional): Called with (logs done, logs to do) after each chunk;
+                archived logs count as done once their segment is checked
+
+        Returns:
+            dict: Logs updated, the users they belong to and throughput
+        """
+        config = current_app.config
+        chunk_rows = chunk_rows or config.get('CARBON_BACKFILL_CHUNK_ROWS', 50000)
+        efficiency = config.get('BATTERY_ROUND_TRIP_EFFICIENCY', 0.9)
+        profiles = get_grid_intensity()
+        logs = DeviceUsageLog.__table__
+        devices = Device.__table__
+        users = User.__table__
+
+        with db.engine.connect() as connection:
+            context, zones = _user_context(connection.execute(select(
+                users.c.id, users.c.country, users.c.state, users.c.timezone,
+                users.c.has_solar, users.c.has_wind_turbine
+            )).all())
+            pending = logs.c.energy_consumed_kwh.is_not(None)
+            if not recompute:
+                pending = pending & logs.c.carbon_footprint_kg.is_(None)
+            total = connection.execute(select(func.count()).select_from(logs).where(pending)).scalar()
+            segments = UsageArchiveSegment.__table__
+            archived = connection.execute(select(
+                segments.c.device_id, devices.c.user_id, segments.c.month, segments.c.version, segments.c.rows
+            ).select_from(
+                segments.join(devices, segments.c.device_id == devices.c.id)
+            ).order_by(segments.c.device_id, segments.c.month)).all()
+            total += sum(segment.rows for segment in archived)
+
+        statement = update(logs).where(logs.c.id == bindparam('log_id')).values(
+            carbon_footprint_kg=bindparam('carbon_kg')
+        )
+        started = time.perf_counter()
+        done = chunks = 0
+        last_id = 0
+        touched = set()
+        while True:
+            with db.engine.begin() as connection:
+                rows = connection.execute(select(
+                    logs.c.id,
+                    devices.c.user_id,
+                    _epoch_seconds(logs.c.start_time),
+                    _epoch_seconds(func.coalesce(logs.c.end_time, logs.c.start_time)),
+                    logs.c.energy_consumed_kwh,
+                    logs.c.energy_source
+                ).select_from(
+                    logs.join(devices, logs.c.device_id == devices.c.id)
+                ).where(
+                    pending, logs.c.id > last_id
+                ).order_by(logs.c.id).limit(chunk_rows)).all()
+                if not rows:
+                    break
+                log_ids, user_ids, start, end, kwh, sources = zip(*rows)
+                user_context = np.array([context[user_id] for user_id in user_ids], dtype=np.int64)
+                carbon, _ = log_carbon(
+                    profiles, user_context[:, 0], user_context[:, 1], zones,
+                    np.array(start, dtype=np.float64), np.array(end, dtype=np.float64),
+                    np.array(kwh, dtype=np.float64), source_kinds(sources),
+                    user_context[:, 2].astype(bool), efficiency
+                )
+                execute_driver_many(connection, statement, {'log_id': log_ids, 'carbon_kg': carbon.tolist()})
+
+            last_id = log_ids[-1]
+            touched.update(user_ids)
+            done += len(rows)
+            chunks += 1
+            if progress is not None:
+                progress(done, total)
+
+        updated = done
+        segments_updated = 0
+        for device_id, user_id, month, version, segment_rows in archived:
+            columns = read_segment(segment_path(device_id, month, version))
+            kwh = np.asarray(columns['kwh'], dtype=np.float64)
+            carbon = np.asarray(columns['carbon'], dtype=np.float64)
+            todo = ~np.isnan(kwh) if recompute else np.isnan(carbon) & ~np.isnan(kwh)
+            if todo.any():
+                region, zone, charged_onsite = context[user_id]
+                count = int(todo.sum())
+                start = columns['start'][todo].astype(np.float64) + np.datetime64(month, 's').astype(np.int64)
+                duration = columns['duration'][todo]
+                end = np.where(duration == NO_END, start, start + duration)
+                sources = np.asarray(columns['source_names'], dtype=object)[columns['source'][todo]]
+                carbon[todo], _ = log_carbon(
+                    profiles, np.full(count, region), np.full(count, zone), zones,
+                    start, end, kwh[todo], source_kinds(sources.tolist()),
+                    np.full(count, charged_onsite), efficiency
+                )
+                with db.engine.begin() as connection:
+                    replaced = UsageArchiveService.replace_column(
+                        connection, device_id, month, version, 'carbon', carbon
+                    )
+                if replaced:
+                    updated += count
+                    segments_updated += 1
+                    touched.add(user_id)
+                else:
+                    logger.warning(f"Archive segment {month:%Y-%m} of device {device_id} changed during "
+                                   f"the carbon backfill; rerun it to fill the segment")
+
+            done += segment_rows
+            if progress is not None:
+                progress(done, total)
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Backfilled the carbon of {updated} usage logs in {chunks} chunk(s) and "
+                    f"{segments_updated} archive segment(s) in {elapsed:.1f}s")
+        return {
+            'logs_updated': updated,
+            'chunks': chunks,
+            'segments_updated': segments_updated,
+            'user_ids': sorted(touched),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(done / elapsed) if elapsed > 0 else None
+        }
+
+
+def init_carbon_accounting(app):
+    """Load the regional grid intensity profiles into memory"""
+    profiles = GridIntensityProfiles(
+        app.config.get('GRID_INTENSITY_DIR'),
+        app.config.get('GRID_CARBON_INTENSITY_KG_PER_KWH', 0.4)
+    )
+    app.extensions['grid_intensity'] = profiles
+    return profiles
+
+
+def get_grid_intensity():
+    """Return the grid intensity profiles of the current app"""
+    return current_app.extensions['grid_intensity']
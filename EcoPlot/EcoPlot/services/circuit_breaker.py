@@ -0,0 +1,161 @@
+# EcoPlot/services/circuit_breaker.py
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from flask import current_app
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling Gemini while the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to the Gemini API.
+
+    Outcomes of recent calls are kept for a rolling window. When enough calls failed or
+    were slower than the slow-call threshold the circuit opens and calls fail fast for
+    open_seconds. After that a single probe call is let through (half-open); its outcome
+    closes the circuit again or re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, min_calls=5, window_seconds=60,
+                 slow_call_seconds=15, open_seconds=30):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._outcomes = deque()  # (finished at, failed) within the window
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self):
+        """
+        Check whether a call may go to Gemini now.
+
+        Returns:
+            bool: False while the circuit is open
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def is_open(self):
+        """Check whether calls are currently failing fast, without claiming the probe"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.open_seconds
+            return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def retry_after(self):
+        """
+        Get the time until an open circuit lets a probe call through.
+
+        Returns:
+            float: Seconds to wait, 0 when the circuit is not open
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+            return 0.0
+
+    def record(self, failed, elapsed):
+        """
+        Record the outcome of a call that allow() let through.
+
+        Args:
+            failed (bool): Whether the call raised an error
+            elapsed (float): Call duration in seconds
+        """
+        failed = failed or elapsed >= self.slow_call_seconds
+        now = time.monotonic()
+
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append((now, failed))
+            while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+                self._outcomes.popleft()
+
+            if self.state == self.CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, outcome in self._outcomes if outcome)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open(now)
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        self._outcomes.clear()
+
+    @contextmanager
+    def guard(self):
+        """Run a Gemini call under the breaker, failing fast while the circuit is open"""
+        if not self.allow():
+            raise CircuitOpenError("Gemini is unavailable, recommendations are served from history")
+        started = time.monotonic()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # Also runs when a streaming client disconnects, so a probe is never left pending
+            self.record(failed, time.monotonic() - started)
+
+    def stats(self):
+        """Return the breaker state and counters for monitoring"""
+        with self._lock:
+            failures = sum(1 for _, outcome in self._outcomes if outcome)
+            return {
+                'state': self.state,
+                'recent_calls': len(self._outcomes),
+                'recent_failures': failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected
+            }
+
+
+def init_circuit_breaker(app):
+    """Create the Gemini circuit breaker for the app"""
+    breaker = CircuitBreaker(
+        failure_rate=app.config.get('GEMINI_CIRCUIT_FAILURE_RATE', 0.5),
+        min_calls=app.config.get('GEMINI_CIRCUIT_MIN_CALLS', 5),
+        window_seconds=app.config.get('GEMINI_CIRCUIT_WINDOW', 60),
+        slow_call_seconds=app.config.get('GEMINI_CIRCUIT_SLOW_CALL', 15),
+        open_seconds=app.config.get('GEMINI_CIRCUIT_OPEN_SECONDS', 30)
+    )
+    app.extensions['gemini_circuit_breaker'] = breaker
+    return breaker
+
+
+def get_circuit_breaker():
+    """Return the Gemini circuit breaker of the current app"""
+    return current_app.extensions['gemini_circuit_breaker']
@@ -0,0 +1,390 @@
+# EcoPlot/services/energy_aggregation.py
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, func, select
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
+
+# Energy sources generated on site; their kWh count as production
+ONSITE_SOURCES = ('solar', 'wind')
+# Energy sources discharged from storage; their kWh avoid grid emissions at the time of use
+BATTERY_SOURCES = ('battery',)
+
+# Dashboard period -> (bin size, number of bins)
+PERIODS = {
+    'day': ('hour', 1),
+    'week': ('day', 7),
+    'month': ('day', 30),
+    'year': ('month', 12)
+}
+
+# Rows of the value matrix spread over the bins
+KWH, ONSITE_KWH, COST, CARBON, GRID_KWH, GRID_COST, GRID_CARBON, BATTERY_KWH = range(8)
+
+
+def timezone_from_name(name):
+    """Return the named timezone, falling back to the configured default"""
+    try:
+        return ZoneInfo(name or current_app.config.get('DEFAULT_TIMEZONE', 'UTC'))
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo('UTC')
+
+
+def user_timezone(user):
+    """Return the user's timezone, falling back to the configured default"""
+    return timezone_from_name(getattr(user, 'timezone', None))
+
+
+def local_midnight(day, tz):
+    # Wall-clock midnight in the user's timezone; timestamp() resolves DST offsets
+    return datetime(day.year, day.month, day.day, tzinfo=tz)
+
+
+def month_start(day, months, tz):
+    month_index = day.month - 1 + months
+    return datetime(day.year + month_index // 12, month_index % 12 + 1, 1, tzinfo=tz)
+
+
+def period_bins(period, tz, now=None):
+    """
+    Build the bin edges of a dashboard period in the user's timezone.
+
+    Args:
+        period (str): day, week, month or year
+        tz (ZoneInfo): User's timezone
+        now (datetime, optional): Aware reference time, defaults to the current time
+
+    Returns:
+        tuple: (edges as UTC epoch seconds with the start of the previous period
+            prepended, labels of the current period's bins)
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period: {period}")
+    bin_size, count = PERIODS[period]
+    today = (now or datetime.now(timezone.utc)).astimezone(tz).date()
+
+    if bin_size == 'hour':
+        previous_start = local_midnight(today - timedelta(days=1), tz)
+        start = int(local_midnight(today, tz).timestamp())
+        end = int(local_midnight(today + timedelta(days=1), tz).timestamp())
+        # Hours have a fixed length in UTC, so DST days get 23 or 25 bins
+        edges = list(range(start, end + 1, 3600))
+        labels = [f"{datetime.fromtimestamp(edge, tz).hour}:00" for edge in edges[:-1]]
+    elif bin_size == 'day':
+        previous_start = local_midnight(today - timedelta(days=2 * count - 1), tz)
+        days = [local_midnight(today + timedelta(days=offset), tz) for offset in range(-count + 1, 2)]
+        edges = [int(day.timestamp()) for day in days]
+        label_format = '%A' if count == 7 else '%b %d'
+        labels = [day.strftime(label_format) for day in days[:-1]]
+    else:
+        previous_start = month_start(today, -2 * count + 1, tz)
+        months = [month_start(today, offset, tz) for offset in range(-count + 1, 2)]
+        edges = [int(month.timestamp()) for month in months]
+        labels = [month.strftime('%b %Y') for month in months[:-1]]
+
+    edges = np.array([int(previous_start.timestamp())] + edges, dtype=np.int64)
+    return edges, labels
+
+
+def _epoch_seconds(column):
+    """SQL expression converting a naive UTC datetime column to epoch seconds"""
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(column) - 2440587.5) * 86400.0
+    return func.extract('epoch', column)
+
+
+def usage_values(kwh, cost, carbon, is_onsite, is_battery):
+    """
+    Build the value matrix of usage logs.
+
+    Args:
+        kwh, cost, carbon (ndarray): Per-log energy, cost and carbon footprint
+        is_onsite (ndarray): 1.0 where the energy came from an on-site source
+        is_battery (ndarray): 1.0 where the energy came from a battery; it counts as grid
+            energy in the other rows
+
+    Returns:
+        ndarray: (8, n) matrix with the rows KWH, ONSITE_KWH, COST, CARBON, GRID_KWH,
+            GRID_COST, GRID_CARBON and BATTERY_KWH
+    """
+    grid = 1.0 - is_onsite
+    return np.vstack([
+        kwh,
+        kwh * is_onsite,
+        cost,
+        carbon,
+        kwh * grid,
+        cost * grid,
+        carbon * grid,
+        kwh * is_battery
+    ])
+
+
+def source_flags(sources):
+    """
+    Flag the energy source names of usage logs for usage_values.
+
+    Args:
+        sources (sequence): energy_source of each log, None when missing
+
+    Returns:
+        tuple: (is_onsite, is_battery) arrays of 1.0 and 0.0
+    """
+    names = [(source or '').lower() for source in sources]
+    is_onsite = np.array([1.0 if name in ONSITE_SOURCES else 0.0 for name in names])
+    is_battery = np.array([1.0 if name in BATTERY_SOURCES else 0.0 for name in names])
+    return is_onsite, is_battery
+
+
+def load_usage(user_id, window_start=None, window_end=None, connection=None):
+    """
+    Load the user's usage logs overlapping a window as NumPy arrays.
+
+    Logs moved to the columnar archive are read from their segment files and
+    merged with the live rows.
+
+    Args:
+        user_id (int): Owner of the devices
+        window_start (int, optional): Window start, UTC epoch seconds
+        window_end (int, optional): Window end, UTC epoch seconds
+        connection (Connection, optional): Connection to read through, e.g. during a flush
+
+    Returns:
+        tuple: device id, start and end (epoch seconds) arrays and the usage_values matrix
+    """
+    logs = DeviceUsageLog.__table__
+    devices = Device.__table__
+    end_time = func.coalesce(logs.c.end_time, logs.c.start_time)
+    onsite = case((func.lower(logs.c.energy_source).in_(ONSITE_SOURCES), 1.0), else_=0.0)
+    battery = case((func.lower(logs.c.energy_source).in_(BATTERY_SOURCES), 1.0), else_=0.0)
+
+    query = select(
+        logs.c.device_id,
+        _epoch_seconds(logs.c.start_time),
+        _epoch_seconds(end_time),
+        func.coalesce(logs.c.energy_consumed_kwh, 0.0),
+        func.coalesce(logs.c.cost, 0.0),
+        func.coalesce(logs.c.carbon_footprint_kg, 0.0),
+        onsite,
+        battery
+    ).select_from(
+        logs.join(devices, logs.c.device_id == devices.c.id)
+    ).where(
+        devices.c.user_id == user_id
+    )
+    if window_end is not None:
+        query = query.where(logs.c.start_time < datetime.fromtimestamp(window_end, timezone.utc).replace(tzinfo=None))
+    if window_start is not None:
+        query = query.where(end_time >= datetime.fromtimestamp(window_start, timezone.utc).replace(tzinfo=None))
+
+    from EcoPlot.services.usage_archive import load_archived_usage
+    if connection is not None:
+        rows = connection.execute(query).all()
+        archived = load_archived_usage(connection, user_id, window_start, window_end)
+    else:
+        with db.engine.connect() as conn:
+            rows = conn.execute(query).all()
+            archived = load_archived_usage(conn, user_id, window_start, window_end)
+
+    # Flatten the rows; building the array from Row objects directly is far slower
+    data = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * 8).reshape(-1, 8)
+    device_ids, start, end, kwh, cost, carbon, is_onsite, is_battery = data.T
+    usage = (device_ids.astype(np.int64), start, end, usage_values(kwh, cost, carbon, is_onsite, is_battery))
+    if archived is None:
+        return usage
+    return tuple(np.concatenate([live, old], axis=-1) for live, old in zip(usage, archived))
+
+
+def distribute(edges, start, end, values):
+    """
+    Sum values into bins, spreading each one evenly over its [start, end) interval.
+
+    Every log is treated as a constant rate between its start and end, so the amount
+    in a bin is the difference of the cumulative amount at the bin's edges. The
+    cumulative amount at all edges is computed from sorted interval bounds with
+    searchsorted and prefix sums, O((n + m) log n) for n logs and m edges.
+
+    Args:
+        edges (ndarray): Bin edges, ascending epoch seconds
+        start (ndarray): Interval starts
+        end (ndarray): Interval ends; equal to start for instantaneous readings
+        values (ndarray): (k, n) matrix of quantities per interval
+
+    Returns:
+        ndarray: (k, len(edges) - 1) per-bin sums
+    """
+    # Work relative to the first edge to keep the prefix sums well conditioned
+    origin = float(edges[0])
+    edges = edges.astype(np.float64) - origin
+    start = start - origin
+    end = end - origin
+
+    k = values.shape[0]
+    cumulative = np.zeros((k, edges.size))
+    duration = end - start
+    spread = duration > 0
+
+    instant = ~spread
+    if instant.any():
+        # Readings without a duration count fully in the bin containing their start
+        order = np.argsort(start[instant], kind='stable')
+        at = start[instant][order]
+        sums = np.concatenate([np.zeros((k, 1)), np.cumsum(values[:, instant][:, order], axis=1)], axis=1)
+        cumulative += sums[:, np.searchsorted(at, edges, side='left')]
+
+    if spread.any():
+        rate = values[:, spread] / duration[spread]
+        # Each interval adds a ramp at its start and removes it at its end
+        for bounds, sign in ((start[spread], 1.0), (end[spread], -1.0)):
+            order = np.argsort(bounds, kind='stable')
+            at = bounds[order]
+            ordered_rate = rate[:, order]
+            rate_sums = np.concatenate([np.zeros((k, 1)), np.cumsum(ordered_rate, axis=1)], axis=1)
+            weighted_sums = np.concatenate([np.zeros((k, 1)), np.cumsum(ordered_rate * at, axis=1)], axis=1)
+            index = np.searchsorted(at, edges, side='right')
+            cumulative += sign * (edges * rate_sums[:, index] - weighted_sums[:, index])
+
+    return np.diff(cumulative, axis=1)
+
+
+def _percent_change(current, previous):
+    if previous == 0:
+        return 0.0
+    return round((current - previous) / abs(previous) * 100, 1)
+
+
+class EnergyAggregationService:
+    """Dashboard energy metrics computed from the user's device usage logs"""
+
+    @staticmethod
+    def aggregate(user, period='day', now=None):
+        """
+        Bucket a user's usage logs into the bins of a dashboard period.
+
+        Args:
+            user (User): User whose devices are aggregated
+            period (str): day (hourly bins), week or month (daily bins) or year (monthly bins)
+            now (datetime, optional): Aware reference time, defaults to the current time
+
+        Returns:
+            dict: Labels, per-bin series and the totals of the previous period
+        """
+        tz = user_timezone(user)
+        edges, labels = period_bins(period, tz, now)
+        # Pre-summed rollups when they line up with the bins, otherwise the raw logs
+        from EcoPlot.services.usage_rollups import load_rollup_bins
+        bins = load_rollup_bins(user.id, tz, PERIODS[period][0], edges)
+        if bins is None:
+            _, start, end, values = load_usage(user.id, int(edges[0]), int(edges[-1]))
+            bins = distribute(edges, start, end, values)
+
+        # Bin 0 is the whole previous period
+        previous = bins[:, 0]
+        current = bins[:, 1:]
+        totals = current.sum(axis=1)
+
+        # Modeled output of the profile's solar panels and wind turbine, for comparison
+        # with the logged production
+        from EcoPlot.services.solar_model import get_solar_model, solar_sites
+        from EcoPlot.services.wind_model import get_wind_model, wind_sites
+        expected_production = (get_solar_model().energy(solar_sites([user]), edges[1:])[0]
+                               + get_wind_model().energy(wind_sites([user]), edges[1:])[0])
+
+        rate = EnergyAggregationService._grid_rate(user, totals[GRID_COST], totals[GRID_KWH])
+        # Priced at what the previous period's own grid energy cost, so a rate change
+        # between the periods does not show up as a change in savings
+        previous_rate = EnergyAggregationService._grid_rate(user, previous[GRID_COST], previous[GRID_KWH])
+        # Grid emissions avoided at the regional intensity of the hours the energy was used
+        from EcoPlot.services.carbon_accounting import CarbonAccountingService
+        onsite_avoided, battery_avoided = CarbonAccountingService.avoided(user, edges)
+        carbon_saved = onsite_avoided + battery_avoided
+
+        return {
+            'period': period,
+            'timezone': tz.key,
+            'labels': labels,
+            'consumption': current[KWH],
+            'production': current[ONSITE_KWH],
+            'expected_production': expected_production,
+            'cost': current[COST],
+            'carbon': current[CARBON],
+            # On-site energy avoided buying from and emitting through the grid
+            'cost_savings': current[ONSITE_KWH] * rate,
+            'carbon_saved': carbon_saved[1:],
+            'carbon_saved_onsite': onsite_avoided[1:],
+            'carbon_saved_battery': battery_avoided[1:],
+            'previous': {
+                'consumption': previous[KWH],
+                'production': previous[ONSITE_KWH],
+                'cost': previous[COST],
+                'carbon': previous[CARBON],
+                'cost_savings': previous[ONSITE_KWH] * previous_rate,
+                'carbon_saved': carbon_saved[0],
+                'carbon_saved_onsite': onsite_avoided[0],
+                'carbon_saved_battery': battery_avoided[0]
+            }
+        }
+
+    @staticmethod
+    def summary(user, period='day', now=None):
+        """
+        Get the dashboard summary cards for a period.
+
+        Args:
+            user (User): User whose devices are aggregated
+            period (str): day, week, month or year
+            now (datetime, optional): Aware reference time
+
+        Returns:
+            dict: Totals of the period with percentage changes from the previous period
+        """
+        aggregate = EnergyAggregationService.aggregate(user, period, now)
+        previous = aggregate['previous']
+
+        summary = {}
+        for name, series in (('energy_used', 'consumption'), ('energy_produced', 'production'),
+                             ('carbon_saved', 'carbon_saved'), ('carbon_saved_onsite', 'carbon_saved_onsite'),
+                             ('carbon_saved_battery', 'carbon_saved_battery'), ('cost_savings', 'cost_savings'),
+                             ('cost', 'cost'), ('carbon_emitted', 'carbon')):
+            total = float(aggregate[series].sum())
+            summary[name] = round(total, 2)
+            summary[f'{name}_change'] = _percent_change(total, float(previous[series]))
+        return summary
+
+    @staticmethod
+    def usage_series(user, period='day', now=None):
+        """
+        Get the consumption and production chart series for a period.
+
+        Args:
+            user (User): User whose devices are aggregated
+            period (str): day, week, month or year
+            now (datetime, optional): Aware reference time
+
+        Returns:
+            dict: Labels and rounded per-bin series
+        """
+        aggregate = EnergyAggregationService.aggregate(user, period, now)
+        return {
+            'labels': aggregate['labels'],
+            'timezone': aggregate['timezone'],
+            'consumption': np.round(aggregate['consumption'], 2).tolist(),
+            'production': np.round(aggregate['production'], 2).tolist(),
+            'expected_production': np.round(aggregate['expected_production'], 2).tolist(),
+            'cost': np.round(aggregate['cost'], 2).tolist(),
+            'carbon': np.round(aggregate['carbon'], 2).tolist()
+        }
+
+    @staticmethod
+    def _grid_rate(user, grid_cost, grid_kwh):
+        """Price per grid kWh: observed in the logs, else the user's rates, else the default"""
+        if grid_kwh > 0 and grid_cost > 0:
+            return grid_cost / grid_kwh
+        rates = [rate for rate in (user.peak_rate_per_kwh, user.off_peak_rate_per_kwh) if rate]
+        if rates:
+            return sum(rates) / len(rates)
+        return current_app.config.get('DEFAULT_ELECTRICITY_RATE_PER_KWH', 0.15)
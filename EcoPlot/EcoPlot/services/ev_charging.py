@@ -0,0 +1,374 @@
+# EcoPlot/services/ev_charging.py
+import json
+import logging
+import time
+from datetime import datetime, timezone
+import numpy as np
+from flask import current_app
+from sqlalchemy import Integer, delete, func, insert, select
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.ev_charge_plan import EVChargePlan
+from EcoPlot.models.usage_rollup import UsageRollup
+from EcoPlot.models.user import User
+from EcoPlot.services.energy_aggregation import timezone_from_name
+from EcoPlot.services.tariffs import get_tariff_engine
+from EcoPlot.services.usage_rollups import _to_datetime
+
+logger = logging.getLogger(__name__)
+
+# ev_charging_preference values; users without one charge at the cheapest times
+PREFERENCES = ('cheapest', 'greenest', 'fastest')
+DEFAULT_PREFERENCE = 'cheapest'
+
+# Weight of the other signal when optimizing one, so equal-price slots are split by carbon
+TIE_BREAK = 1e-3
+
+# Plans cover the next day
+HORIZON_HOURS = 24
+
+# Days of hourly grid carbon history averaged into the intensity profiles
+CARBON_HISTORY_DAYS = 28
+
+
+def _hour_of_day(column):
+    """SQL expression for the hour of a naive UTC datetime column"""
+    if db.engine.dialect.name == 'sqlite':
+        return func.cast(func.strftime('%H', column), Integer)
+    return func.extract('hour', column)
+
+
+def grid_carbon_profiles(user_ids, start):
+    """
+    Grid carbon intensity of each user by UTC hour of day, in one query over the hourly rollups.
+
+    Args:
+        user_ids (list): Users to read
+        start (int): End of the history, UTC epoch seconds
+
+    Returns:
+        ndarray: (users, 24) kg CO2 per grid kWh; hours without data use the user's overall
+            intensity, or GRID_CARBON_INTENSITY_KG_PER_KWH for users without any
+    """
+    table = UsageRollup.__table__
+    hour = _hour_of_day(table.c.bucket_start)
+    query = select(
+        table.c.user_id, hour, func.sum(table.c.grid_kwh), func.sum(table.c.grid_carbon_kg)
+    ).where(
+        table.c.grain == 'hour',
+        table.c.user_id.in_(user_ids),
+        table.c.device_id == UsageRollup.ALL_DEVICES,
+        table.c.bucket_start >= _to_datetime(start - CARBON_HISTORY_DAYS * 86400),
+        table.c.bucket_start < _to_datetime(start)
+    ).group_by(table.c.user_id, hour)
+
+    row_of = {user_id: row for row, user_id in enumerate(user_ids)}
+    grid_kwh = np.zeros((len(user_ids), 24))
+    grid_carbon = np.zeros((len(user_ids), 24))
+    for user_id, hour_of_day, kwh, carbon in db.session.execute(query):
+        grid_kwh[row_of[user_id], int(hour_of_day)] = kwh or 0
+        grid_carbon[row_of[user_id], int(hour_of_day)] = carbon or 0
+
+    total_kwh = grid_kwh.sum(axis=1, keepdims=True)
+    total_carbon = grid_carbon.sum(axis=1, keepdims=True)
+    default = current_app.config.get('GRID_CARBON_INTENSITY_KG_PER_KWH', 0.4)
+    overall = np.where((total_kwh > 0) & (total_carbon > 0), total_carbon / np.maximum(total_kwh, 1e-9), default)
+    has_data = (grid_kwh > 0) & (grid_carbon > 0)
+    return np.where(has_data, grid_carbon / np.where(has_data, grid_kwh, 1), overall)
+
+
+def _clock_minutes(value, default_hour):
+    return value.hour * 60 + value.minute if value is not None else default_hour * 60
+
+
+def charging_inputs(users, chargers, start, slot_minutes):
+    """
+    Build the per-charger arrays the solver works on.
+
+    Each charger gets its share of the owner's typical daily usage as the energy
+    target, its rate as the per-slot limit, and the first plug-in window of the
+    horizon as the slots it may charge in. A charger's window runs from its
+    preferred start time (plug-in) to its preferred end time (departure), or
+    EV_DEFAULT_PLUG_IN_HOUR to EV_DEFAULT_DEPARTURE_HOUR local time.
+
+    Args:
+        users (list): Owners of the chargers
+        chargers (list): EV charger devices
+        start (int): First slot, UTC epoch seconds on a slot boundary
+        slot_minutes (int): 15 or 60
+
+    Returns:
+        dict: Per-charger arrays: user_row, rate_kw, target_kwh, preference,
+            and (chargers, slots) arrays window, price, export_price, carbon and
+            generation_kw; plus the slot epoch and slot_hours
+    """
+    from EcoPlot.services.solar_model import get_solar_model, solar_sites
+    from EcoPlot.services.wind_model import get_wind_model, wind_sites
+    config = current_app.config
+    slots = HORIZON_HOURS * 60 // slot_minutes
+    slot_hours = slot_minutes / 60
+    edges = start + np.arange(slots + 1, dtype=np.int64) * slot_minutes * 60
+    user_row = {user.id: row for row, user in enumerate(users)}
+    rows = np.array([user_row[charger.user_id] for charger in chargers], dtype=np.int64)
+
+    # Local minute of day of each slot, computed once per timezone
+    zones, zone_of_user = {}, []
+    for user in users:
+        tz = timezone_from_name(user.timezone)
+        zone_of_user.append(zones.setdefault(tz.key, len(zones)))
+    zone_minutes = np.zeros((len(zones), slots), dtype=np.int64)
+    for key, index in zones.items():
+        tz = timezone_from_name(key)
+        local = [datetime.fromtimestamp(edge, tz) for edge in edges[:-1].tolist()]
+        zone_minutes[index] = [moment.hour * 60 + moment.minute for moment in local]
+    local_minute = zone_minutes[np.array(zone_of_user, dtype=np.int64)[rows]]
+
+    # First plug-in window of the horizon; the run ends at departure
+    opens = np.array([_clock_minutes(charger.preferred_start_time, config.get('EV_DEFAULT_PLUG_IN_HOUR', 18))
+                      for charger in chargers])[:, None]
+    closes = np.array([_clock_minutes(charger.preferred_end_time, config.get('EV_DEFAULT_DEPARTURE_HOUR', 7))
+                       for charger in chargers])[:, None]
+    length = (closes - opens) % 1440
+    length[length == 0] = 1440
+    inside = (local_minute - opens) % 1440 + slot_minutes <= length
+    opened = np.cumsum(inside, axis=1) > 0
+    window = inside & (np.cumsum(opened & ~inside, axis=1) == 0)
+
+    # Energy drawn to replace a day of driving, within the battery and split between the user's chargers
+    efficiency = config.get('EV_CHARGING_EFFICIENCY', 0.9)
+    chargers_per_user = np.bincount(rows, minlength=len(users))
+    daily = np.array([user.ev_typical_daily_usage_kwh or config.get('EV_DEFAULT_DAILY_USAGE_KWH', 10.0)
+                      for user in users])
+    battery = np.array([charger.ev_battery_capacity_kwh or users[row].ev_battery_capacity_kwh or np.inf
+                        for charger, row in zip(chargers, rows.tolist())])
+    target = np.minimum(daily[rows] / chargers_per_user[rows], battery) / efficiency
+    rate = np.array([charger.charging_rate_kw or charger.power_consumption_watts / 1000.0 for charger in chargers])
+
+    # Prices from each owner's compiled rate plan, grid carbon by UTC hour
+    engine = get_tariff_engine()
+    tariffs = [engine.series(user, edges[:-1]) for user in users]
+    price = np.array([tariff['price'] for tariff in tariffs]).reshape(len(users), slots)[rows]
+    export_price = np.array([tariff['export_price'] for tariff in tariffs]).reshape(len(users), slots)[rows]
+    utc_hour = (edges[:-1] // 3600) % 24
+    carbon = grid_carbon_profiles([user.id for user in users], start)[rows][:, utc_hour]
+
+    # Modeled on-site output, scaled down for clouds and the base load
+    generation = (get_solar_model().energy(solar_sites(users), edges)
+                  + get_wind_model().energy(wind_sites(users), edges)) / slot_hours
+    generation *= config.get('SCHEDULE_GENERATION_SHARE', 0.5)
+
+    return {
+        'epoch': edges[:-1],
+        'slot_hours': slot_hours,
+        'user_row': rows,
+        'rate_kw': rate,
+        'target_kwh': target,
+        'preference': np.array([PREFERENCES.index(users[row].ev_charging_preference)
+                                if users[row].ev_charging_preference in PREFERENCES
+                                else PREFERENCES.index(DEFAULT_PREFERENCE) for row in rows.tolist()]),
+        'window': window,
+        'price': price,
+        'export_price': export_price,
+        'carbon': carbon,
+        'generation_kw': generation[rows]
+    }
+
+
+def solve_charging(inputs):
+    """
+    Charge each EV in its cheapest, greenest or earliest slots until the target is met.
+
+    Every slot is split into an on-site segment (up to the generation or the rate)
+    and a grid segment (the rest of the rate). With linear slot values and one
+    energy target this is a fractional knapsack, so filling the segments in order
+    of value is the LP optimum. All chargers are solved together with one sort.
+
+    Args:
+        inputs (dict): From charging_inputs
+
+    Returns:
+        dict: (chargers, slots) charge_kwh and onsite_kwh, and per-charger energy_kwh,
+            cost and carbon_kg
+    """
+    window = inputs['window']
+    count, slots = window.shape
+    hours = inputs['slot_hours']
+    step = inputs['rate_kw'][:, None] * hours * window
+    onsite_cap = np.minimum(inputs['generation_kw'] * hours, step)
+    grid_cap = step - onsite_cap
+
+    preference = inputs['preference'][:, None]
+    cost_weight = np.where(preference == PREFERENCES.index('greenest'), TIE_BREAK, 1.0)
+    carbon_weight = np.where(preference == PREFERENCES.index('greenest'), 1.0, TIE_BREAK)
+    grid_value = cost_weight * inputs['price'] + carbon_weight * inputs['carbon']
+    onsite_value = cost_weight * inputs['export_price']
+    # Fastest charges in slot order, on-site output first within a slot
+    earliest = np.arange(slots, dtype=np.float64)
+    fastest = preference == PREFERENCES.index('fastest')
+    grid_value = np.where(fastest, earliest + 0.5, grid_value)
+    onsite_value = np.where(fastest, earliest, onsite_value)
+
+    capacity = np.concatenate([onsite_cap, grid_cap], axis=1)
+    order = np.argsort(np.concatenate([onsite_value, grid_value], axis=1), axis=1, kind='stable')
+    ordered = np.take_along_axis(capacity, order, axis=1)
+    before = np.cumsum(ordered, axis=1) - ordered
+    filled = np.clip(inputs['target_kwh'][:, None] - before, 0, ordered)
+    fill = np.empty_like(filled)
+    np.put_along_axis(fill, order, filled, axis=1)
+    onsite, grid = fill[:, :slots], fill[:, slots:]
+
+    return {
+        'charge_kwh': onsite + grid,
+        'onsite_kwh': onsite,
+        'energy_kwh': fill.sum(axis=1),
+        'cost': (grid * inputs['price']).sum(axis=1) + (onsite * inputs['export_price']).sum(axis=1),
+        'carbon_kg': (grid * inputs['carbon']).sum(axis=1)
+    }
+
+
+def plan_start(now=None, slot_minutes=15):
+    """First slot boundary at or after now, UTC epoch seconds"""
+    now = now or datetime.now(timezone.utc)
+    slot_seconds = slot_minutes * 60
+    return -(-int(now.timestamp()) // slot_seconds) * slot_seconds
+
+
+class EVChargingService:
+    """Charging plans for EV chargers that meet the owner's daily driving by departure"""
+
+    @staticmethod
+    def plan(users, chargers, now=None, slot_minutes=None):
+        """
+        Plan the next charging session of each charger.
+
+        Args:
+            users (list): Owners of the chargers
+            chargers (list): EV charger devices
+            now (datetime, optional): Aware reference time, defaults to the current time
+            slot_minutes (int, optional): 15 or 60, defaults to EV_PLAN_SLOT_MINUTES
+
+        Returns:
+            list: EVChargePlan column values, one dict per charger
+        """
+        if not chargers:
+            return []
+        slot_minutes = slot_minutes or current_app.config.get('EV_PLAN_SLOT_MINUTES', 15)
+        start = plan_start(now, slot_minutes)
+        inputs = charging_inputs(users, chargers, start, slot_minutes)
+        result = solve_charging(inputs)
+
+        window = inputs['window']
+        has_window = window.any(axis=1)
+        first = np.argmax(window, axis=1)
+        last = window.shape[1] - 1 - np.argmax(window[:, ::-1], axis=1)
+        slot_seconds = slot_minutes * 60
+        charge_kw = np.round(result['charge_kwh'] / inputs['slot_hours'], 3)
+        created = datetime.utcnow()
+
+        plans = []
+        for index, charger in enumerate(chargers):
+            plans.append({
+                'device_id': charger.id,
+                'user_id': charger.user_id,
+                'preference': PREFERENCES[inputs['preference'][index]],
+                'plan_start': _to_datetime(start),
+                'slot_minutes': slot_minutes,
+                'charge_kw_json': json.dumps(charge_kw[index].tolist()),
+                'plug_in': _to_datetime(start + first[index] * slot_seconds) if has_window[index] else None,
+                'departure': _to_datetime(start + (last[index] + 1) * slot_seconds) if has_window[index] else None,
+                'target_kwh': round(float(inputs['target_kwh'][index]), 3),
+                'energy_kwh': round(float(result['energy_kwh'][index]), 3),
+                'onsite_kwh': round(float(result['onsite_kwh'][index].sum()), 3),
+                'cost': round(float(result['cost'][index]), 4),
+                'carbon_kg': round(float(result['carbon_kg'][index]), 4),
+                'created_at': created
+            })
+        return plans
+
+    @staticmethod
+    def store(plans, user_ids=()):
+        """
+        Replace the stored plans of the planned chargers.
+
+        Args:
+            plans (list): EVChargePlan column values returned by plan
+            user_ids (iterable): Users whose other plans are removed too, e.g. plans of
+                devices that are no longer EV chargers
+        """
+        table = EVChargePlan.__table__
+        user_ids = list(user_ids)
+        if user_ids:
+            db.session.execute(delete(table).where(table.c.user_id.in_(user_ids)))
+        if plans:
+            db.session.execute(delete(table).where(table.c.device_id.in_([plan['device_id'] for plan in plans])))
+            db.session.execute(insert(table), plans)
+        db.session.commit()
+
+    @staticmethod
+    def invalidate(user_id):
+        """
+        Drop the stored plans of a user, e.g. after a charger was changed or removed.
+        The next GET /api/schedule/ev plans the remaining chargers again. Runs in the
+        caller's transaction.
+        """
+        table = EVChargePlan.__table__
+        db.session.execute(delete(table).where(table.c.user_id == user_id))
+
+    @staticmethod
+    def plan_user(user, now=None):
+        """
+        Plan and store the chargers of one user.
+
+        Returns:
+            list: The user's EVChargePlan rows
+        """
+        chargers = Device.query.filter_by(user_id=user.id, is_ev_charger=True).all()
+        EVChargingService.store(EVChargingService.plan([user], chargers, now), user_ids=[user.id])
+        return EVChargePlan.query.filter_by(user_id=user.id).all()
+
+    @staticmethod
+    def plan_all(now=None, chunk_users=None, progress=None):
+        """
+        Plan every EV user's chargers in chunks, as the nightly job does.
+
+        Args:
+            now (datetime, optional): Aware reference time, defaults to the current time
+            chunk_users (int, optional): Users planned together, defaults to EV_PLAN_CHUNK_USERS
+            progress (callable, optional): Called with the number of users planned so far
+
+        Returns:
+            dict: Users and chargers planned, shortfalls and timings
+        """
+        chunk_users = chunk_users or current_app.config.get('EV_PLAN_CHUNK_USERS', 1000)
+        user_ids = db.session.scalars(
+            select(Device.user_id).where(Device.is_ev_charger.is_(True)).distinct().order_by(Device.user_id)
+        ).all()
+        started = time.perf_counter()
+        # Plans of devices that were deleted or are no longer EV chargers
+        table = EVChargePlan.__table__
+        db.session.execute(delete(table).where(
+            table.c.device_id.not_in(select(Device.id).where(Device.is_ev_charger.is_(True)))
+        ))
+        db.session.commit()
+        planned = short = 0
+        for offset in range(0, len(user_ids), chunk_users):
+            ids = user_ids[offset:offset + chunk_users]
+            users = User.query.filter(User.id.in_(ids)).all()
+            chargers = Device.query.filter(Device.user_id.in_(ids), Device.is_ev_charger.is_(True)) \
+                .order_by(Device.user_id, Device.id).all()
+            plans = EVChargingService.plan(users, chargers, now)
+            EVChargingService.store(plans)
+            planned += len(plans)
+            short += sum(plan['energy_kwh'] < plan['target_kwh'] - 1e-6 for plan in plans)
+            if progress:
+                progress(min(offset + chunk_users, len(user_ids)))
+
+        seconds = time.perf_counter() - started
+        logger.info(f"Planned {planned} EV chargers of {len(user_ids)} users in {seconds:.1f}s")
+        return {
+            'users': len(user_ids),
+            'chargers': planned,
+            'short_of_target': short,
+            'seconds': round(seconds, 3),
+            'ms_per_user': round(seconds * 1000 / max(len(user_ids), 1), 3)
+        }
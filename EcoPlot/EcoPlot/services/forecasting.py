@@ -0,0 +1,355 @@
+# EcoPlot/services/forecasting.py
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from itertools import chain
+import numpy as np
+from flask import current_app
+from sqlalchemy import bindparam, delete, insert, select
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.forecast_model import ForecastModel
+from EcoPlot.models.usage_rollup import UsageRollup, UsageRollupStatus
+from EcoPlot.models.user import User
+from EcoPlot.services.energy_aggregation import KWH, _epoch_seconds, distribute, load_usage, timezone_from_name
+from EcoPlot.services.usage_rollups import _to_datetime, driver_datetimes, fetch_driver_rows
+
+logger = logging.getLogger(__name__)
+
+# Local hour-of-day cells of weekdays then weekends
+CELLS = 48
+
+# Coefficient layout: intercept, hour of day, hour of a weekday or weekend day, trend per week
+INTERCEPT = 0
+HOUR = 1
+DAY_HOUR = HOUR + 24
+TREND = DAY_HOUR + CELLS
+FEATURES = TREND + 1
+
+WEEK_SECONDS = 7 * 86400
+
+# Keeps the intercept solvable for users without any weighted hours
+INTERCEPT_JITTER = 1e-9
+
+
+def _cell_design():
+    """(CELLS, TREND) 0/1 features of each cell other than the trend"""
+    design = np.zeros((CELLS, TREND))
+    cells = np.arange(CELLS)
+    design[:, INTERCEPT] = 1
+    design[cells, HOUR + cells % 24] = 1
+    design[cells, DAY_HOUR + cells] = 1
+    return design
+
+
+CELL_DESIGN = _cell_design()
+
+
+def local_cells(epoch, zones):
+    """
+    Weekday/weekend hour-of-day cell of hours in each timezone.
+
+    Args:
+        epoch (ndarray): Start of each hour, UTC epoch seconds
+        zones (list): Timezone names
+
+    Returns:
+        ndarray: (len(zones), len(epoch)) cells 0-47; weekends are 24-47
+    """
+    from EcoPlot.services.carbon_accounting import local_epoch
+    epoch = np.asarray(epoch, dtype=np.int64)
+    zone = np.repeat(np.arange(len(zones)), epoch.size)
+    local = local_epoch(np.tile(epoch, len(zones)), zone, zones).reshape(len(zones), epoch.size)
+    # 1970-01-01 was a Thursday
+    weekend = (local // 86400 + 3) % 7 >= 5
+    return (weekend * 24 + local // 3600 % 24).astype(np.int64)
+
+
+def fit_batch(kwh, cells, weights, alpha):
+    """
+    Fit the ridge regression of every household at once.
+
+    Each hour's features are one cell of the weekday/weekend hour-of-day grid
+    plus the trend, so the normal equations only need each household's
+    weighted sums per cell: the design matrix is never built.
+
+    Args:
+        kwh (ndarray): (households, hours) energy used in each hour
+        cells (ndarray): (households, hours) local cell of each hour
+        weights (ndarray): (households, hours) sample weights, 0 for hours without history
+        alpha (float): Ridge penalty of every coefficient but the intercept
+
+    Returns:
+        tuple: ((households, FEATURES) coefficients, (households,) weighted RMSE of an hour)
+    """
+    households, hours = kwh.shape
+    # Trend in weeks from the end of the history to the middle of each hour
+    trend = np.broadcast_to((np.arange(hours) + 0.5 - hours) / (WEEK_SECONDS / 3600), kwh.shape)
+    index = (np.arange(households)[:, None] * CELLS + cells).ravel()
+
+    def per_cell(values):
+        return np.bincount(index, weights=values.ravel(), minlength=households * CELLS).reshape(households, CELLS)
+
+    weight_trend = weights * trend
+    s0, s1, s2 = per_cell(weights), per_cell(weight_trend), (weight_trend * trend).sum(axis=1)
+    y0, y1 = per_cell(weights * kwh), (weight_trend * kwh).sum(axis=1)
+
+    gram = np.empty((households, FEATURES, FEATURES))
+    gram[:, :TREND, :TREND] = np.matmul((s0[:, :, None] * CELL_DESIGN).transpose(0, 2, 1), CELL_DESIGN)
+    gram[:, :TREND, TREND] = gram[:, TREND, :TREND] = s1 @ CELL_DESIGN
+    gram[:, TREND, TREND] = s2
+    moments = np.empty((households, FEATURES))
+    moments[:, :TREND] = y0 @ CELL_DESIGN
+    moments[:, TREND] = y1
+
+    penalty = np.full(FEATURES, float(alpha))
+    penalty[INTERCEPT] = INTERCEPT_JITTER
+    coefficients = np.linalg.solve(gram + np.diag(penalty), moments[:, :, None])[:, :, 0]
+
+    total = weights.sum(axis=1)
+    squared = (weights * kwh * kwh).sum(axis=1) - 2 * np.einsum('uf,uf->u', coefficients, moments) \
+        + np.einsum('uf,ufg,ug->u', coefficients, gram, coefficients)
+    rmse = np.sqrt(np.maximum(squared, 0) / np.maximum(total, 1e-12))
+    return coefficients, rmse
+
+
+def predict(coefficients, cells, trend):
+    """
+    Forecast energy from fitted coefficients.
+
+    Args:
+        coefficients (ndarray): (..., FEATURES) fitted coefficients
+        cells (ndarray): Local cell of each forecast hour
+        trend (ndarray): Weeks since the end of the fitted history of each hour
+
+    Returns:
+        ndarray: kWh per hour, never negative
+    """
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    forecast = coefficients[..., INTERCEPT, None] + coefficients[..., HOUR + cells % 24] \
+        + coefficients[..., DAY_HOUR + cells] + coefficients[..., TREND, None] * trend
+    return np.maximum(forecast, 0)
+
+
+def history_matrix(users, start, end):
+    """
+    Hourly energy of users between two UTC hour boundaries.
+
+    Reads the hourly rollups of all users in one query; users whose rollups have
+    not been built have their logs distributed over the hours instead.
+
+    Args:
+        users (list): Users to read
+        start, end (int): UTC epoch seconds on hour boundaries
+
+
+    Returns:
+        tuple: ((users, hours) kWh, (users,) index of each user's first hour with usage,
+            or hours when there is none)
+    """
+    hours = (end - start) // 3600
+    ids = np.array([user.id for user in users], dtype=np.int64)
+    order = np.argsort(ids)
+    kwh = np.zeros((len(users), hours))
+
+    built = set(db.session.scalars(
+        select(UsageRollupStatus.user_id).where(UsageRollupStatus.user_id.in_(ids.tolist()))
+    ))
+    if built:
+        table = UsageRollup.__table__
+        query = select(table.c.user_id, _epoch_seconds(table.c.bucket_start), table.c.kwh).where(
+            table.c.grain == 'hour',
+            table.c.user_id.in_(sorted(built)),
+            table.c.device_id == UsageRollup.ALL_DEVICES,
+            table.c.bucket_start >= bindparam('start'),
+            table.c.bucket_start < bindparam('end')
+        )
+        connection = db.session.connection()
+        window = driver_datetimes([start, end], connection.dialect.name)
+        rows = fetch_driver_rows(connection, query, {'start': window[0], 'end': window[1]})
+        data = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * 3).reshape(-1, 3)
+        user_rows = order[np.searchsorted(ids, data[:, 0].astype(np.int64), sorter=order)]
+        hour = ((np.rint(data[:, 1]) - start) // 3600).astype(np.int64)
+        kwh[user_rows, hour] = data[:, 2]
+
+    # Users without devices have no logs to fall back to
+    unbuilt = set(ids.tolist()) - built
+    with_devices = set(db.session.scalars(
+        select(Device.user_id).where(Device.user_id.in_(unbuilt)).distinct()
+    )) if unbuilt else set()
+    edges = np.arange(start, end + 1, 3600, dtype=np.int64)
+    for row, user in enumerate(users):
+        if user.id in with_devices:
+            _, log_start, log_end, values = load_usage(user.id, start, end)
+            kwh[row] = distribute(edges, log_start, log_end, values[KWH:KWH + 1])[0]
+
+    used = kwh > 0
+    first = np.where(used.any(axis=1), np.argmax(used, axis=1), hours)
+    return kwh, first
+
+
+class ForecastService:
+    """Hourly consumption forecasts from ridge regressions fitted on each household's history"""
+
+    @staticmethod
+    def fit(users, now=None):
+        """
+        Fit the forecast models of users on their recent hourly history.
+
+        Samples are weighted down exponentially with age, so the level follows
+        recent usage. Hours before a household's first usage in the window carry
+        no weight.
+
+        Args:
+            users (list): Households to fit
+            now (datetime, optional): Aware reference time, defaults to the current time
+
+        Returns:
+            list: ForecastModel column values of the users with any history
+        """
+        if not users:
+            return []
+        config = current_app.config
+        end = int((now or datetime.now(timezone.utc)).timestamp()) // 3600 * 3600
+        hours = config.get('FORECAST_HISTORY_DAYS', 84) * 24
+        start = end - hours * 3600
+
+        kwh, first = history_matrix(users, start, end)
+        keys = [timezone_from_name(user.timezone).key for user in users]
+        zones = sorted(set(keys))
+        zone = np.searchsorted(zones, keys)
+        cells = local_cells(np.arange(start, end, 3600), zones)[zone]
+
+        age = (hours - 0.5 - np.arange(hours)) / 24
+        decay = 0.5 ** (age / config.get('FORECAST_HALF_LIFE_DAYS', 21))
+        weights = np.where(np.arange(hours) >= first[:, None], decay, 0.0)
+        coefficients, rmse = fit_batch(kwh, cells, weights, config.get('FORECAST_RIDGE_ALPHA', 1.0))
+
+        fitted = datetime.utcnow()
+        models = []
+        for row, user in enumerate(users):
+            if first[row] >= hours:
+                continue
+            models.append({
+                'user_id': user.id,
+                'timezone_name': zones[zone[row]],
+                'history_start': _to_datetime(start + int(first[row]) * 3600),
+                'history_end': _to_datetime(end),
+                'history_hours': int(hours - first[row]),
+                'coefficients_json': json.dumps(np.round(coefficients[row], 6).tolist()),
+                'rmse_kwh': round(float(rmse[row]), 4),
+                'fitted_at': fitted
+            })
+        return models
+
+    @staticmethod
+    def store(models):
+        """Replace the stored models of the fitted users"""
+        if not models:
+            return
+        table = ForecastModel.__table__
+        db.session.execute(delete(table).where(table.c.user_id.in_([model['user_id'] for model in models])))
+        db.session.execute(insert(table), models)
+        db.session.commit()
+
+    @staticmethod
+    def fit_user(user, now=None):
+        """
+        Fit and store one user's model.
+
+        Returns:
+            ForecastModel: The stored model, or None without any usage history
+        """
+        ForecastService.store(ForecastService.fit([user], now))
+        return db.session.get(ForecastModel, user.id)
+
+    @staticmethod
+    def fit_all(now=None, chunk_users=None, progress=None):
+        """
+        Fit every user's model in chunks, as the nightly job does.
+
+        Args:
+            now (datetime, optional): Aware reference time, defaults to the current time
+            chunk_users (int, optional): Users fitted together, defaults to FORECAST_CHUNK_USERS
+            progress (callable, optional): Called with the number of users fitted so far
+
+        Returns:
+            dict: Users fitted and skipped for lack of history, and timings
+        """
+        chunk_users = chunk_users or current_app.config.get('FORECAST_CHUNK_USERS', 1000)
+        user_ids = db.session.scalars(select(User.id).order_by(User.id)).all()
+        started = time.perf_counter()
+        fitted = 0
+        for offset in range(0, len(user_ids), chunk_users):
+            users = User.query.filter(User.id.in_(user_ids[offset:offset + chunk_users])).all()
+            models = ForecastService.fit(users, now)
+            ForecastService.store(models)
+            fitted += len(models)
+            if progress:
+                progress(min(offset + chunk_users, len(user_ids)))
+
+        seconds = time.perf_counter() - started
+        logger.info(f"Fitted {fitted} forecast models of {len(user_ids)} users in {seconds:.1f}s")
+        return {
+            'users': len(user_ids),
+            'fitted': fitted,
+            'without_history': len(user_ids) - fitted,
+            'seconds': round(seconds, 3),
+            'ms_per_user': round(seconds * 1000 / max(len(user_ids), 1), 3)
+        }
+
+    @staticmethod
+    def forecast(user, hours=24, now=None, refresh=False):
+        """
+        Forecast the user's hourly consumption from the current hour on.
+
+        Uses the stored model of the nightly fit; the user is fitted now when
+        there is none, it is older than FORECAST_MAX_AGE_HOURS, it was fitted in
+        another timezone or refresh is set.
+
+        Args:
+            user (User): Household to forecast
+            hours (int): Hours ahead, up to FORECAST_MAX_HOURS
+            now (datetime, optional): Aware reference time, defaults to the current time
+            refresh (bool): Refit before forecasting
+
+        Returns:
+            dict: Hourly and daily kWh with the model's history and error
+
+        Raises:
+            ValueError: For an out-of-range horizon or a user without usage history
+        """
+        config = current_app.config
+        limit = config.get('FORECAST_MAX_HOURS', 168)
+        if not 1 <= hours <= limit:
+            raise ValueError(f"Forecast between 1 and {limit} hours ahead")
+        tz = timezone_from_name(user.timezone)
+        now = now or datetime.now(timezone.utc)
+
+        model = db.session.get(ForecastModel, user.id)
+        max_age = config.get('FORECAST_MAX_AGE_HOURS', 36) * 3600
+        if refresh or model is None or model.timezone_name != tz.key or \
+                now.timestamp() - model.history_end.replace(tzinfo=timezone.utc).timestamp() > max_age:
+            model = ForecastService.fit_user(user, now)
+        if model is None:
+            raise ValueError('No usage history to forecast from yet')
+
+        start = int(now.timestamp()) // 3600 * 3600
+        epoch = np.arange(start, start + hours * 3600, 3600, dtype=np.int64)
+        history_end = model.history_end.replace(tzinfo=timezone.utc).timestamp()
+        kwh = predict(model.coefficients(), local_cells(epoch, [tz.key])[0], (epoch + 1800 - history_end) / WEEK_SECONDS)
+
+        daily = {}
+        for hour, value in zip(epoch.tolist(), kwh.tolist()):
+            day = datetime.fromtimestamp(hour, tz).date().isoformat()
+            daily[day] = daily.get(day, 0.0) + value
+        return {
+            'timezone': tz.key,
+            'start': datetime.fromtimestamp(start, tz).isoformat(),
+            'step_minutes': 60,
+            'kwh': np.round(kwh, 3).tolist(),
+            'daily': [{'date': day, 'kwh': round(value, 2)} for day, value in daily.items()],
+            'total_kwh': round(float(kwh.sum()), 2),
+            'model': model.to_dict(tz)
+        }
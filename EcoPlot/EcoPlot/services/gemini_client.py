@@ -0,0 +1,139 @@
+# EcoPlot/services/gemini_client.py
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+import httpx
+from flask import current_app
+from google import genai
+from google.genai import types
+
+
+class GeminiClientRegistry:
+    """
+    Process-wide registry of long-lived Gemini clients.
+
+    A client keeps its HTTP connections alive between requests, so reusing one per
+    API key avoids a new TCP/TLS handshake on every recommendation call. A semaphore
+    caps how many calls this process has in flight at once.
+    """
+    def __init__(self, max_in_flight=8, acquire_timeout=30, request_timeout=60,
+                 keepalive_expiry=60, base_url=None):
+        self.pid = os.getpid()
+        self.max_in_flight = max_in_flight
+        self.acquire_timeout = acquire_timeout
+        self.request_timeout = request_timeout
+        self.keepalive_expiry = keepalive_expiry
+        self.base_url = base_url
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._in_flight = 0
+        self._closed = False
+
+    def get_client(self, api_key):
+        """
+        Get the shared client for an API key, creating it on first use.
+
+        Args:
+            api_key (str): Gemini API key
+
+        Returns:
+            genai.Client: Long-lived client
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Gemini client registry has been shut down")
+
+            client = self._clients.get(api_key)
+            if client is None:
+                http_options = types.HttpOptions(
+                    base_url=self.base_url,
+                    timeout=int(self.request_timeout * 1000),  # milliseconds
+                    client_args={
+                        'limits': httpx.Limits(
+                            max_connections=self.max_in_flight,
+                            max_keepalive_connections=self.max_in_flight,
+                            keepalive_expiry=self.keepalive_expiry
+                        )
+                    }
+                )
+                client = genai.Client(api_key=api_key, http_options=http_options)
+                self._clients[api_key] = client
+            return client
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the in-flight call slots for the duration of a Gemini call"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError("Too many Gemini calls in flight, try again later")
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight
+            }
+
+    def shutdown(self, timeout=10):
+        """Wait for in-flight calls to finish, then close all pooled connections"""
+        with self._lock:
+            self._closed = True
+
+        deadline = time.monotonic() + timeout
+        while self._in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_gemini_client_registry():
+    """
+    Return the registry of this worker process, creating it from the app config.
+    A registry inherited through fork is replaced because sockets cannot be shared.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None or _registry.pid != os.getpid():
+            config = current_app.config
+            _registry = GeminiClientRegistry(
+                max_in_flight=config.get('GEMINI_MAX_IN_FLIGHT', 8),
+                acquire_timeout=config.get('GEMINI_SLOT_TIMEOUT', 30),
+                request_timeout=config.get('GEMINI_REQUEST_TIMEOUT', 60),
+                keepalive_expiry=config.get('GEMINI_KEEPALIVE_EXPIRY', 60),
+                base_url=config.get('GEMINI_API_BASE_URL')
+            )
+        return _registry
+
+
+def shutdown_gemini_clients():
+    """Close the pooled Gemini clients of this process"""
+    with _registry_lock:
+        registry = _registry
+    if registry is not None and registry.pid == os.getpid():
+        registry.shutdown()
+
+
+atexit.register(shutdown_gemini_clients)
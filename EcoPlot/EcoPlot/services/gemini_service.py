@@ -1,8 +1,16 @@
 # EcoPlot/services/gemini_service.py
-import os
 import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
-from google import genai
+from google.genai import types
+from EcoPlot.services.circuit_breaker import get_circuit_breaker
+from EcoPlot.services.gemini_client import get_gemini_client_registry
+from EcoPlot.services.json_stream import IncrementalSectionParser
+from EcoPlot.services.prompt_builder import PromptBuilder, merge_recommendations
+from EcoPlot.services.recommendation_schema import RESPONSE_SCHEMA, validate_device_entry, validate_recommendations
+
+logger = logging.getLogger(__name__)
 
 class GeminiService:
     """
@@ -16,14 +24,25 @@ class GeminiService:
         if not api_key:
             raise ValueError("Gemini API key not found in configuration")
 
-        # Initialize the Gemini client with the API key directly
-        self.client = genai.Client(api_key=api_key)
+        # Reuse the process-wide client so HTTP connections stay alive between requests
+        self.registry = get_gemini_client_registry()
+        self.client = self.registry.get_client(api_key)
+        # Fail fast instead of waiting for timeouts while Gemini is having trouble
+        self.breaker = get_circuit_breaker()
         # Use the Gemini flash model for efficient responses
         self.model_name = "gemini-2.0-flash-001"
+        # Compact prompts, split into parallel calls above the token budget
+        self.prompt_builder = PromptBuilder.from_config()
+        # Ask for JSON matching the response schema instead of free text
+        self.generation_config = types.GenerateContentConfig(
+            response_mime_type='application/json',
+            response_schema=RESPONSE_SCHEMA
+        )
 
     def generate_device_recommendations(self, user_data, devices_data):
         """
         Generate personalized recommendations for device usage optimization.
+        Large households are split into several prompts that run in parallel.
 
         Args:
             user_data (dict): User preferences and energy setup details
@@ -33,149 +52,123 @@ class GeminiService:
             dict: Structured recommendations or error message
         """
         try:
-            # Create the prompt for Gemini API
-            prompt = self._create_recommendation_prompt(user_data, devices_data)
-            
-            # Generate content using Gemini API through the models interface
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt
-            )
-            
-            # Parse the response to extract structured recommendations
-            return self._parse_recommendations(response.text)
+            # Create the prompts for Gemini API within the token budget
+            plan = self.prompt_builder.plan(user_data, devices_data)
+
+            if len(plan.prompts) == 1:
+                result = self._generate_from_prompt(plan.prompts[0])
+                if result.get('success', False):
+                    plan.expand_device_recommendations(result['recommendations'])
+                return result
+
+            # Each call holds its own in-flight slot, so the fan-out respects the process limit
+            workers = min(len(plan.prompts), self.registry.max_in_flight)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self._generate_from_prompt, plan.prompts))
+
+            for index, result in enumerate(results):
+                if not result.get('success', False):
+                    return result
+                plan.expand_device_recommendations(result['recommendations'], index)
+
+            return {
+                "success": True,
+                "recommendations": merge_recommendations([result['recommendations'] for result in results])
+            }
         except Exception as e:
-            print(f"Error generating recommendations: {str(e)}")
+            logger.error(f"Error generating recommendations: {str(e)}")
             return {
                 "success": False,
                 "error": str(e),
                 "recommendations": []
             }
 
-    def _create_recommendation_prompt(self, user_data, devices_data):
+    def stream_device_recommendations(self, user_data, devices_data):
         """
-        Create a detailed prompt for Gemini to generate energy optimization recommendations.
-        
+        Stream recommendations section by section as the model generates them.
+
         Args:
-            user_data (dict): User preferences and energy setup
-            devices_data (list): User's devices information
-            
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+
+        Yields:
+            tuple: Parser events ('item', section, value) and ('entry', section, key, value)
+                while streaming, then ('done', recommendations) with the same structure
+                generate_device_recommendations returns
+        """
+        try:
+            plan = self.prompt_builder.plan(user_data, devices_data)
+
+            if len(plan.prompts) > 1:
+                # Chunked requests are merged before anything can be shown
+                result = self.generate_device_recommendations(user_data, devices_data)
+                if result.get('success', False):
+                    recommendations = result['recommendations']
+                    for section in ('overall_recommendations', 'schedule_optimization', 'energy_saving_tips'):
+                        for item in recommendations.get(section, []):
+                            yield ('item', section, item)
+                    for key, value in recommendations.get('device_recommendations', {}).items():
+                        yield ('entry', 'device_recommendations', key, value)
+                yield ('done', result)
+                return
+
+            parser = IncrementalSectionParser()
+            groups = {group.ids[0]: group for group in plan.chunks[0]}
+
+            with self.breaker.guard(), self.registry.slot():
+                for chunk in self.client.models.generate_content_stream(
+                    model=self.model_name,
+                    contents=plan.prompts[0],
+                    config=self.generation_config
+                ):
+                    for event in parser.feed(chunk.text or ''):
+                        if event[0] == 'item' and event[1] == 'device_recommendations':
+                            # Device recommendations arrive as array items; key them by device id
+                            device_entry = validate_device_entry(event[2])
+                            if device_entry is None:
+                                continue
+                            event = ('entry', event[1]) + device_entry
+                        if event[0] == 'entry' and event[1] == 'device_recommendations' \
+                                and event[2] in groups and isinstance(event[3], dict):
+                            # One row covers identical devices; send an entry for each of them
+                            for device_id, device in zip(groups[event[2]].ids, groups[event[2]].devices):
+                                yield ('entry', event[1], device_id, dict(event[3], name=device.get('name')))
+                        elif event[0] != 'field':
+                            yield event
+
+            # Validate the complete document the same way as the non-streaming call
+            result = self._parse_recommendations(parser.text)
+            if result.get('success', False):
+                plan.expand_device_recommendations(result['recommendations'])
+            yield ('done', result)
+        except Exception as e:
+            logger.error(f"Error streaming recommendations: {str(e)}")
+            yield ('done', {
+                "success": False,
+                "error": str(e),
+                "recommendations": []
+            })
+
+    def _generate_from_prompt(self, prompt):
+        """
+        Send one prompt to Gemini and parse the response.
+
+        Args:
+            prompt (str): Prompt built by the PromptBuilder
+
         Returns:
-            str: Formatted prompt for Gemini API
+            dict: Parsed recommendations or error message
         """
-        # Format devices data for the prompt
-        devices_text = ""
-        for device in devices_data:
-            device_info = (
-                f"- {device.get('name', 'Unknown Device')} ({device.get('device_type_name', 'Unknown Type')}):\n"
-                f"  - ID: {device.get('id', 'Unknown')}\n"
-                f"  - Brand: {device.get('brand_name', 'Unknown')}\n"
-                f"  - Power Consumption: {device.get('power_consumption_watts', 0)}W\n"
+        # Generate content using Gemini API through the models interface
+        with self.breaker.guard(), self.registry.slot():
+            response = self.client.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=self.generation_config
             )
-            
-            # Add optional device details if available
-            if device.get('standby_power_watts') is not None:
-                device_info += f"  - Standby Power: {device.get('standby_power_watts')}W\n"
-            
-            if device.get('average_usage_hours_per_day') is not None:
-                device_info += f"  - Average Daily Usage: {device.get('average_usage_hours_per_day')} hours/day\n"
-            
-            if device.get('usage_flexibility') is not None:
-                device_info += f"  - Usage Flexibility: {device.get('usage_flexibility')}/10\n"
-            
-            # Add flags for special device types
-            flags = []
-            if device.get('is_schedulable'):
-                flags.append("Schedulable")
-            if device.get('is_smart_device'):
-                flags.append("Smart Device")
-            if device.get('is_ev_charger'):
-                flags.append("EV Charger")
-                
-            if flags:
-                device_info += f"  - Features: {', '.join(flags)}\n"
-                
-            devices_text += device_info + "\n"
-
-        # Safeguard missing user data with default values
-        location = user_data.get('location', user_data.get('city', 'Unknown'))
-        has_solar = user_data.get('has_solar', False)
-        solar_capacity = user_data.get('solar_capacity_kw', 0) if has_solar else 0
-        has_battery = user_data.get('has_battery_storage', False)
-        battery_capacity = user_data.get('battery_capacity_kwh', 0) if has_battery else 0
-        
-        # Build the complete prompt for Gemini
-        prompt = f"""
-        You are an energy optimization expert for the EcoPlot application.
-        Your task is to analyze user data and device information to create personalized
-        recommendations for optimizing energy usage, reducing costs, and minimizing
-        environmental impact.
-
-        ## User Information:
-        - Location: {location}
-        - Has Solar Panels: {has_solar}
-        - Solar Capacity: {solar_capacity} kW
-        - Solar Panel Orientation: {user_data.get('solar_panel_orientation', 'Unknown')}
-        - Has Battery Storage: {has_battery}
-        - Battery Capacity: {battery_capacity} kWh
-        - Has Electric Vehicle: {user_data.get('has_ev', False)}
-        - Electricity Rate Plan: {user_data.get('electricity_rate_plan', 'Unknown')}
-        - Peak Rate: ${user_data.get('peak_rate_per_kwh', 0)}/kWh
-        - Off-peak Rate: ${user_data.get('off_peak_rate_per_kwh', 0)}/kWh
-        - Energy Savings Goal: {user_data.get('energy_savings_goal', 0)}%
-        - Environmental Priority: {user_data.get('environmental_priority', 5)}/10
-
-        ## Devices Information:
-        {devices_text}
-
-        Based on this information, provide comprehensive energy optimization recommendations
-        in the following JSON format. Make sure all your recommendations are practical,
-        specific, and tailored to the user's situation:
-
-        ```json
-        {{
-          "overall_recommendations": [
-            "Install a smart energy management system",
-            "Shift high-consumption activities to off-peak hours",
-            "Consider upgrading to more energy-efficient devices"
-          ],
-          "device_recommendations": {{
-            "device_id_1": {{
-              "name": "Device Name",
-              "recommendation": "Specific optimization advice for this device",
-              "estimated_savings": 5.2
-            }},
-            "device_id_2": {{
-              "name": "Another Device",
-              "recommendation": "Specific optimization advice for this device",
-              "estimated_savings": 3.8
-            }}
-          }},
-          "schedule_optimization": [
-            "Charge EV between 10 AM and 3 PM to utilize solar production",
-            "Run dishwasher after 9 PM to utilize off-peak rates",
-            "Schedule washing machine for weekends when home energy demand is lower"
-          ],
-          "energy_saving_tips": [
-            "Turn off devices completely instead of leaving them on standby",
-            "Use natural light during the day instead of artificial lighting",
-            "Keep air conditioning filters clean to improve efficiency"
-          ],
-          "estimated_monthly_savings": 45.80,
-          "carbon_reduction_potential": 32.5
-        }}
-        ```
-
-        Ensure that:
-        1. All recommendations are realistic and specific
-        2. Device recommendations reference actual device IDs from the provided data
-        3. Estimated savings are realistic and based on device power consumption
-        4. If the user has solar, include recommendations to align usage with solar production
-        5. Consider the user's electricity rate plan when suggesting scheduling
-        6. Only respond with valid JSON that follows the exact structure shown above
-        """
 
-        return prompt
+        # Parse the response to extract structured recommendations
+        return self._parse_recommendations(response.text)
 
     def _parse_recommendations(self, response_text):
         """
@@ -188,50 +181,29 @@ class GeminiService:
             dict: Parsed recommendations or error message
         """
         try:
-            # Extract JSON content from the response using code block markers
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_text = response_text[json_start:json_end]
-                recommendations = json.loads(json_text)
-                
-                # Validate the required fields
-                required_fields = [
-                    'overall_recommendations', 
-                    'device_recommendations', 
-                    'schedule_optimization', 
-                    'energy_saving_tips'
-                ]
-                
-                for field in required_fields:
-                    if field not in recommendations:
-                        recommendations[field] = []
-                
-                # Ensure numeric fields are present
-                if 'estimated_monthly_savings' not in recommendations:
-                    recommendations['estimated_monthly_savings'] = 0
-                    
-                if 'carbon_reduction_potential' not in recommendations:
-                    recommendations['carbon_reduction_potential'] = 0
-                
-                return {
-                    "success": True,
-                    "recommendations": recommendations
-                }
-            else:
-                raise ValueError("No valid JSON structure found in response")
-        except json.JSONDecodeError as e:
-            print(f"JSON parse error: {str(e)}")
-            print(f"Response text: {response_text}")
+            try:
+                data = json.loads(response_text)
+            except ValueError:
+                # Responses without structured output may wrap the JSON in a code block
+                json_start = response_text.find('{')
+                json_end = response_text.rfind('}') + 1
+                if json_start < 0 or json_end <= json_start:
+                    raise ValueError("No valid JSON structure found in response")
+                data = json.loads(response_text[json_start:json_end])
+
+            # Coerce types and salvage the valid sections of a partly malformed response
+            recommendations, problems = validate_recommendations(data)
+            if problems:
+                logger.warning(f"Repaired recommendations response: {'; '.join(problems[:10])}")
+
             return {
-                "success": False,
-                "error": f"Could not parse recommendations: {str(e)}",
-                "raw_response": response_text
+                "success": True,
+                "recommendations": recommendations
             }
-        except Exception as e:
-            print(f"Error parsing recommendations: {str(e)}")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Could not parse recommendations: {str(e)}")
+            logger.debug(f"Unparseable response ({len(response_text or '')} chars): {(response_text or '')[:500]}")
             return {
                 "success": False,
-                "error": str(e)
-            }
\ No newline at end of file
+                "error": f"Could not parse recommendations: {str(e)}"
+            }
@@ -0,0 +1,131 @@
+# EcoPlot/services/json_stream.py
+import json
+
+
+class _Container:
+    """An open JSON object or array on the parser stack"""
+    __slots__ = ('is_object', 'expect_key', 'key', 'value_start')
+
+    def __init__(self, is_object):
+        self.is_object = is_object
+        self.expect_key = is_object
+        self.key = None
+        self.value_start = None
+
+
+class IncrementalSectionParser:
+    """
+    Incremental parser for a streamed recommendations document.
+
+    Text is fed in arbitrary chunks. Each time a top-level field or an element of a
+    top-level array/object is complete it is returned as an event, so the caller can
+    forward sections before the model has finished the whole document:
+
+        ('item', section, value)          element of a top-level array
+        ('entry', section, key, value)    member of a top-level object
+        ('field', key, value)             complete top-level value (sections included)
+
+    Text before the first '{' (such as a ```json fence) and after the closing '}' is ignored.
+    """
+    def __init__(self):
+        self.text = ''
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.string_is_key = False
+        self.started = False
+        self.finished = False
+
+    def feed(self, chunk):
+        """
+        Parse the next chunk of text.
+
+        Args:
+            chunk (str): Next piece of the streamed response
+
+        Returns:
+            list: Events completed by this chunk
+        """
+        self.text += chunk
+        events = []
+        text = self.text
+        stack = self.stack
+
+        for i in range(self.pos, len(text)):
+            if self.finished:
+                break
+            c = text[i]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == '\\':
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.string_is_key:
+                        stack[-1].key = json.loads(text[self.string_start:i + 1])
+                continue
+
+            if not self.started:
+                if c == '{':
+                    self.started = True
+                    stack.append(_Container(True))
+                continue
+
+            if c in ' \t\r\n':
+                continue
+
+            top = stack[-1]
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+                self.string_is_key = top.is_object and top.expect_key
+                if not self.string_is_key and top.value_start is None:
+                    top.value_start = i
+            elif c == ':':
+                top.expect_key = False
+            elif c == ',':
+                self._complete_value(i, events)
+                top.expect_key = top.is_object
+            elif c in '{[':
+                if top.value_start is None:
+                    top.value_start = i
+                stack.append(_Container(c == '{'))
+            elif c in '}]':
+                self._complete_value(i, events)
+                stack.pop()
+                # A closed container is a value of its parent and completes at the
+                # parent's next ',' or closing bracket
+                if not stack:
+                    self.finished = True
+            elif top.value_start is None:
+                top.value_start = i
+
+        self.pos = len(text)
+        return events
+
+    def _complete_value(self, end, events):
+        top = self.stack[-1]
+        if top.value_start is None:
+            return
+
+        depth = len(self.stack)
+        start = top.value_start
+        top.value_start = None
+        if depth > 2:
+            return
+
+        try:
+            value = json.loads(self.text[start:end])
+        except ValueError:
+            return
+
+        if depth == 1:
+            events.append(('field', top.key, value))
+        elif top.is_object:
+            events.append(('entry', self.stack[0].key, top.key, value))
+        else:
+            events.append(('item', self.stack[0].key, value))
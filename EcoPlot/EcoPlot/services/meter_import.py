@@ -0,0 +1,451 @@
+# EcoPlot/services/meter_import.py
+import csv
+import io
+import re
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from itertools import chain
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.services.energy_aggregation import _epoch_seconds, user_timezone
+from EcoPlot.services.usage_archive import archived_intervals
+from EcoPlot.services.usage_ingest import UsageIngestService
+
+FORMATS = ('greenbutton', 'csv')
+
+ESPI = '{http://naesb.org/espi}'
+_READING = ESPI + 'IntervalReading'
+_READING_TYPE = ESPI + 'ReadingType'
+_TIME_PERIOD = ESPI + 'timePeriod'
+_START = ESPI + 'start'
+_DURATION = ESPI + 'duration'
+_VALUE = ESPI + 'value'
+_COST = ESPI + 'cost'
+_ENTRY = '{http://www.w3.org/2005/Atom}entry'
+
+# ESPI codes
+UOM_WH = '72'
+FLOW_REVERSE = '19'  # energy received from the premises, i.e. exported
+COST_SCALE = 100000  # costs are in hundred-thousandths of the currency unit
+
+# Header names of utility interval CSV exports, compared lowercase without units
+CSV_COLUMNS = {
+    'date': ('date', 'read date', 'usage date', 'start date'),
+    'start': ('start time', 'start', 'interval start', 'start datetime',
+              'interval start time', 'timestamp', 'datetime', 'time', 'read time'),
+    'end': ('end time', 'end', 'interval end', 'end datetime', 'interval end time'),
+    'usage': ('usage', 'import', 'consumption', 'kwh', 'wh', 'value', 'energy', 'delivered',
+              'net usage', 'reading'),
+    'export': ('export', 'received', 'generation'),
+    'cost': ('cost', 'charge', 'amount'),
+    'units': ('units', 'unit', 'uom')
+}
+_EPOCH = datetime(1970, 1, 1)
+OVERLAP_LOOKBACK = 86400  # seconds; stored logs starting earlier are not checked for overlap
+_HEADER_SCAN_ROWS = 50  # metadata rows some utilities put above the header
+_UNITS_IN_HEADER = re.compile(r'\(([^)]*)\)')
+
+# Formats tried after ISO 8601, most common utility exports first
+_TIME_FORMATS = (
+    '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M %p', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%y %H:%M', '%m/%d/%y %I:%M %p', '%Y/%m/%d %H:%M', '%d.%m.%Y %H:%M', '%Y-%m-%d %I:%M %p'
+)
+
+
+class MeterImportError(ValueError):
+    """Raised when a file cannot be read as interval data"""
+
+
+def detect_format(filename, head):
+    """
+    Guess the format of an interval data file.
+
+    Args:
+        filename (str): Uploaded file name
+        head (bytes): First bytes of the file
+
+    Returns:
+        str: greenbutton or csv
+    """
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension == 'xml' or head.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'<'):
+        return 'greenbutton'
+    return 'csv'
+
+
+def iter_green_button(source):
+    """
+    Stream the interval readings of a Green Button (ESPI) XML file.
+
+    Readings are cleared once read and each feed entry once it ends, so memory does
+    not grow with the file beyond an empty element per entry. Readings use the scale
+    and flow direction of the ReadingType read last; Green Button files list it before
+    the interval blocks it describes.
+
+    Args:
+        source: Binary file object
+
+    Yields:
+        tuple: (start, end as UTC epoch seconds, kWh, cost or None, exported)
+    """
+    multiplier, uom, exported = 0, UOM_WH, False
+    for _, element in ET.iterparse(source):
+        tag = element.tag
+        if tag == _READING:
+            period = element.find(_TIME_PERIOD)
+            value = element.findtext(_VALUE)
+            if period is not None and value is not None:
+                start = int(period.findtext(_START))
+                end = start + int(period.findtext(_DURATION) or 0)
+                amount = int(value) * 10.0 ** multiplier
+                kwh = amount / 1000.0 if uom == UOM_WH else amount
+                cost = element.findtext(_COST)
+                yield start, end, kwh, int(cost) / COST_SCALE if cost is not None else None, exported
+            element.clear()
+        elif tag == _READING_TYPE:
+            multiplier = int(element.findtext(ESPI + 'powerOfTenMultiplier') or 0)
+            uom = element.findtext(ESPI + 'uom') or UOM_WH
+            exported = element.findtext(ESPI + 'flowDirection') == FLOW_REVERSE
+        elif tag == _ENTRY:
+            element.clear()
+
+
+class _LocalTimeParser:
+    """
+    Parse the wall-clock timestamps of utility exports into UTC epoch seconds.
+
+    Timestamps without an offset are taken in the user's timezone. The repeated hour
+    when DST ends is resolved from the order of the rows: a time that would not move
+    past the previous row's start, as the second 01:00 row of an hourly export, is
+    read as its second occurrence.
+    """
+    def __init__(self, tz):
+        self.tz = tz
+        self.time_format = None
+        self.previous = None
+
+    def _parse(self, text):
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+        if self.time_format is not None:
+            try:
+                return datetime.strptime(text, self.time_format)
+            except ValueError:
+                pass
+        for time_format in _TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(text, time_format)
+            except ValueError:
+                continue
+            self.time_format = time_format
+            return parsed
+        raise MeterImportError(f"invalid timestamp {text!r}")
+
+    def epoch(self, text, after=None, next_day=False):
+        parsed = self._parse(text.strip())
+        if next_day:
+            parsed += timedelta(days=1)  # a calendar day, which is not 24 hours across DST
+        if parsed.tzinfo is not None:
+            return parsed.timestamp()
+        first = parsed.replace(tzinfo=self.tz).timestamp()
+        second = parsed.replace(tzinfo=self.tz, fold=1).timestamp()
+        floor = after if after is not None else self.previous
+        if first != second and floor is not None and first <= floor:
+            return second
+        return first
+
+    def start(self, text):
+        self.previous = self.epoch(text)
+        return self.previous
+
+
+def _find_columns(header):
+    columns, units = {}, None
+    for index, name in enumerate(header):
+        name = name.strip().lower()
+        match = _UNITS_IN_HEADER.search(name)
+        if match:
+            units = units or match.group(1).strip()
+            name = _UNITS_IN_HEADER.sub('', name).strip()
+        elif name in ('kwh', 'wh'):
+            units = units or name
+        for column, aliases in CSV_COLUMNS.items():
+            if column not in columns and name in aliases:
+                columns[column] = index
+                break
+    if ('start' not in columns and 'date' not in columns) or 'usage' not in columns:
+        return None, None
+    return columns, units
+
+
+def _kwh_factor(units):
+    units = (units or 'kwh').strip().lower()
+    if units == 'wh':
+        return 0.001
+    if units in ('kwh', 'kw h', 'kilowatt-hours'):
+        return 1.0
+    raise MeterImportError(f"unsupported unit {units!r}")
+
+
+def iter_interval_csv(lines, tz, interval_minutes=15, errors=None):
+    """
+    Stream the intervals of a utility interval CSV export.
+
+    Metadata rows above the header are skipped. Start times may be split into date
+    and time columns; without an end column every interval lasts interval_minutes.
+
+    Args:
+        lines (iterable): Text lines
+        tz (ZoneInfo): Timezone of timestamps without an offset
+        interval_minutes (int): Interval length when the file has no end times
+        errors (list, optional): Receives (line number, message) for rows that are skipped
+
+    Yields:
+        tuple: (start, end as UTC epoch seconds, kWh, cost or None, exported)
+    """
+    reader = csv.reader(lines)
+    columns = header_units = None
+    for row in reader:
+        columns, header_units = _find_columns(row)
+        if columns is not None:
+            break
+        if reader.line_num >= _HEADER_SCAN_ROWS:
+            break
+    if columns is None:
+        raise MeterImportError("no header with a start time and a usage column found")
+
+    parser = _LocalTimeParser(tz)
+    duration = interval_minutes * 60
+    date_column, start_column = columns.get('date'), columns.get('start')
+    end_column, usage_column = columns.get('end'), columns['usage']
+    export_column, cost_column = columns.get('export'), columns.get('cost')
+    units_column = columns.get('units')
+    factor = _kwh_factor(header_units)
+
+    for row in reader:
+        if not row or not any(row):
+            continue
+        try:
+            if start_column is not None and date_column is not None:
+                start_text = f"{row[date_column]} {row[start_column]}"
+            else:
+                start_text = row[start_column if start_column is not None else date_column]
+            start = parser.start(start_text)
+
+            if end_column is not None and row[end_column].strip():
+                end_text = row[end_column].strip()
+                time_of_day = date_column is not None and len(end_text) <= 8
+                if time_of_day:
+                    end_text = f"{row[date_column]} {end_text}"  # a time on the start's date
+                end = parser.epoch(end_text, after=start)
+                if time_of_day and end <= start:
+                    end = parser.epoch(end_text, after=start, next_day=True)  # ends at or past midnight
+            else:
+                end = start + duration
+
+            row_factor = _kwh_factor(row[units_column]) if units_column is not None else factor
+            cost_text = row[cost_column].strip().lstrip('$') if cost_column is not None else ''
+            cost = float(cost_text.replace(',', '')) if cost_text else None
+
+            usage_text = row[usage_column].strip().replace(',', '')
+            if usage_text:
+                yield start, end, float(usage_text) * row_factor, cost, False
+            if export_column is not None and row[export_column].strip():
+                yield start, end, float(row[export_column].replace(',', '')) * row_factor, None, True
+        except (IndexError, ValueError) as e:
+            if errors is not None:
+                errors.append((reader.line_num, str(e) if isinstance(e, MeterImportError) else f"invalid row: {e}"))
+
+
+class _CountingReader(io.RawIOBase):
+    """Binary file wrapper counting the bytes read, for progress reporting"""
+    def __init__(self, source):
+        self.source = source
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.source.read(len(buffer))
+        self.bytes_read += len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def deduplicate(start, end, existing_start, existing_end):
+    """
+    Select the intervals to keep from a chunk of imported intervals.
+
+    Of intervals with the same start the last one in the file wins, as utilities
+    append corrected readings. Intervals overlapping an earlier interval of the
+    chunk or an interval already stored for the device are dropped.
+
+    Args:
+        start, end (ndarray): Chunk intervals in file order, epoch seconds
+        existing_start, existing_end (ndarray): Stored intervals near the chunk
+
+    Returns:
+        tuple: (indices to keep in ascending start order, number of duplicates,
+            overlaps within the chunk, overlaps with stored intervals)
+    """
+    if not start.size:
+        return np.array([], dtype=np.int64), 0, 0, 0
+
+    order = np.argsort(start, kind='stable')
+    sorted_start = start[order]
+    last_of_start = np.append(sorted_start[1:] != sorted_start[:-1], True)
+    order = order[last_of_start]
+    duplicates = start.size - order.size
+
+    # Overlap with an earlier interval of the chunk
+    chunk_start, chunk_end = start[order], end[order]
+    reach = np.maximum.accumulate(chunk_end)
+    keep = np.ones(order.size, dtype=bool)
+    keep[1:] = chunk_start[1:] >= reach[:-1]
+    overlaps = int((~keep).sum())
+
+    # Overlap with a stored interval: one starting before our end and ending after our start
+    if existing_start.size:
+        existing_order = np.argsort(existing_start)
+        stored_start = existing_start[existing_order]
+        stored_reach = np.maximum.accumulate(existing_end[existing_order])
+        before = np.searchsorted(stored_start, chunk_end, side='left')
+        overlapping = before > 0
+        overlapping[overlapping] = stored_reach[before[overlapping] - 1] > chunk_start[overlapping]
+        # Identical instants count as the same reading
+        same = np.isin(chunk_start, stored_start) & (chunk_end == chunk_start)
+        stored = keep & (overlapping | same)
+        keep &= ~stored
+    else:
+        stored = keep & False
+
+    return order[keep], duplicates, overlaps, int(stored.sum())
+
+
+class MeterImportService:
+    """Imports smart-meter interval data into the usage logs of a device"""
+
+    @staticmethod
+    def import_file(user, device_id, source, data_format, interval_minutes=None, progress=None):
+        """
+        Stream-parse an interval data file and bulk-load it as usage logs.
+
+        Intervals are processed in chunks, deduplicated against each other and against
+        the device's stored and archived logs, and inserted with the bulk ingest path.
+
+        Args:
+            user (User): Owner of the device
+            device_id (int): Device the meter data is stored under, e.g. a whole-home meter
+            source: Binary file object
+            data_format (str): greenbutton or csv
+            interval_minutes (int, optional): Interval length of CSV files without end times
+            progress (callable, optional): Called with (bytes read, intervals read) per chunk
+
+        Returns:
+            dict: Interval counts, skipped rows and timing
+        """
+        if data_format not in FORMATS:
+            raise ValueError(f"Unknown format: {data_format}")
+        device = db.session.execute(
+            select(Device.id).where(Device.id == device_id, Device.user_id == user.id)
+        ).scalar()
+        if device is None:
+            raise MeterImportError(f"device {device_id} not found")
+
+        config = current_app.config
+        chunk_size = config.get('METER_IMPORT_CHUNK_SIZE', 10000)
+        interval_minutes = interval_minutes or config.get('METER_IMPORT_DEFAULT_INTERVAL_MINUTES', 15)
+        max_errors = config.get('USAGE_INGEST_MAX_ERRORS', 100)
+
+        started = time.perf_counter()
+        counter = _CountingReader(source)
+        errors = []
+        if data_format == 'greenbutton':
+            intervals = iter_green_button(io.BufferedReader(counter, 1 << 16))
+        else:
+            lines = io.TextIOWrapper(io.BufferedReader(counter, 1 << 16), encoding='utf-8-sig', newline='')
+            intervals = iter_interval_csv(lines, user_timezone(user), interval_minutes, errors)
+
+        result = {
+            'format': data_format,
+            'intervals_read': 0,
+            'intervals_inserted': 0,
+            'duplicates': 0,
+            'overlaps_skipped': 0,
+            'already_stored': 0,
+            'exports_skipped': 0
+        }
+        chunk = []
+        try:
+            for interval in intervals:
+                result['intervals_read'] += 1
+                if interval[4]:
+                    result['exports_skipped'] += 1  # usage logs hold consumption only
+                    continue
+                chunk.append(interval)
+                if len(chunk) >= chunk_size:
+                    MeterImportService._load_chunk(user.id, device_id, chunk, result)
+                    chunk = []
+                    if progress is not None:
+                        progress(counter.bytes_read, result['intervals_read'])
+            MeterImportService._load_chunk(user.id, device_id, chunk, result)
+        except ET.ParseError as e:
+            raise MeterImportError(f"invalid Green Button XML: {e}")
+        if progress is not None:
+            progress(counter.bytes_read, result['intervals_read'])
+
+        elapsed = time.perf_counter() - started
+        result.update({
+            'rows_rejected': len(errors),
+            'errors': [{'line': line, 'error': error} for line, error in errors[:max_errors]],
+            'bytes_read': counter.bytes_read,
+            'seconds': round(elapsed, 3),
+            'intervals_per_second': round(result['intervals_read'] / elapsed) if elapsed > 0 else None
+        })
+        return result
+
+    @staticmethod
+    def _load_chunk(user_id, device_id, chunk, result):
+        if not chunk:
+            return
+        start = np.array([interval[0] for interval in chunk], dtype=np.float64)
+        end = np.array([interval[1] for interval in chunk], dtype=np.float64)
+
+        logs = DeviceUsageLog.__table__
+        stored_end = db.func.coalesce(logs.c.end_time, logs.c.start_time)
+        window_start = _EPOCH + timedelta(seconds=float(start.min()))
+        with db.engine.connect() as connection:
+            stored = connection.execute(
+                select(_epoch_seconds(logs.c.start_time), _epoch_seconds(stored_end)).where(
+                    logs.c.device_id == device_id,
+                    # Bounded on both sides so the (device_id, start_time) index is used
+                    logs.c.start_time >= window_start - timedelta(seconds=OVERLAP_LOOKBACK),
+                    logs.c.start_time < _EPOCH + timedelta(seconds=float(end.max())),
+                    stored_end >= window_start
+                )
+            ).all()
+            archived_start, archived_end = archived_intervals(connection, device_id, float(start.min()),
+                                                              float(end.max()))
+        stored = np.rint(np.fromiter(chain.from_iterable(stored), dtype=np.float64,
+                                     count=len(stored) * 2).reshape(-1, 2))
+        known_start = np.concatenate([stored[:, 0], archived_start])
+        known_end = np.concatenate([stored[:, 1], archived_end])
+
+        keep, duplicates, overlaps, already_stored = deduplicate(start, end, known_start, known_end)
+        result['duplicates'] += duplicates
+        result['overlaps_skipped'] += overlaps
+        result['already_stored'] += already_stored
+        batch = [
+            (device_id, chunk[index][0], chunk[index][1], chunk[index][2], chunk[index][3], None, 'grid', False)
+            for index in keep.tolist()
+        ]
+        if batch:
+            result['intervals_inserted'] += UsageIngestService.write_batch(user_id, batch)
@@ -0,0 +1,328 @@
+# EcoPlot/services/prompt_builder.py
+import math
+from flask import current_app
+
+# Rough characters-per-token ratio of Gemini tokenizers for English and tabular text
+CHARS_PER_TOKEN = 4
+
+DEVICE_TABLE_HEADER = "ids|name|type|brand|watts|standby_w|hours_per_day|flexibility|features"
+
+PROMPT_TEMPLATE = """You are an energy optimization expert for the EcoPlot application.
+Your task is to analyze user data and device information to create personalized
+recommendations for optimizing energy usage, reducing costs, and minimizing
+environmental impact.
+
+## User Information:
+- Location: {location}
+- Has Solar Panels: {has_solar}
+- Solar Capacity: {solar_capacity} kW
+- Solar Panel Orientation: {solar_panel_orientation}
+- Has Battery Storage: {has_battery}
+- Battery Capacity: {battery_capacity} kWh
+- Has Electric Vehicle: {has_ev}
+- Electricity Rate Plan: {electricity_rate_plan}
+- Peak Rate: ${peak_rate}/kWh
+- Off-peak Rate: ${off_peak_rate}/kWh
+- Energy Savings Goal: {energy_savings_goal}%
+- Environmental Priority: {environmental_priority}/10
+
+## Devices Information:
+{part_note}One row per device model, columns separated by "|". Rows listing several
+comma-separated ids are identical devices; usage columns are their average.
+{devices_table}
+
+Based on this information, provide comprehensive energy optimization recommendations
+in the following JSON format. Make sure all your recommendations are practical,
+specific, and tailored to the user's situation:
+
+```json
+{{
+  "overall_recommendations": ["Shift high-consumption activities to off-peak hours"],
+  "device_recommendations": [
+    {{
+      "device_id": "12",
+      "name": "Device Name",
+      "recommendation": "Specific optimization advice for this device",
+      "estimated_savings": 5.2
+    }}
+  ],
+  "schedule_optimization": ["Run dishwasher after 9 PM to utilize off-peak rates"],
+  "energy_saving_tips": ["Turn off devices completely instead of leaving them on standby"],
+  "estimated_monthly_savings": 45.80,
+  "carbon_reduction_potential": 32.5
+}}
+```
+
+Ensure that:
+1. All recommendations are realistic and specific
+2. Give one device recommendation per row with device_id set to the first id of the row; its estimated_savings is per device in kWh/month
+3. Estimated savings are realistic and based on device power consumption
+4. If the user has solar, include recommendations to align usage with solar production
+5. Consider the user's electricity rate plan when suggesting scheduling
+6. Only respond with valid JSON that follows the exact structure shown above
+"""
+
+PART_NOTE = ("This is part {part} of {parts} of the household's devices. Estimate savings, carbon "
+             "reduction and advice for the listed devices only.\n")
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens a prompt will use without calling the API.
+
+    Args:
+        text (str): Prompt text
+
+    Returns:
+        int: Estimated token count
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _format_number(value):
+    if value is None:
+        return ''
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+class DeviceGroup:
+    """Devices of the same type, brand, wattage and features, sent to the model as one row"""
+    __slots__ = ('devices',)
+
+    def __init__(self):
+        self.devices = []
+
+    @property
+    def ids(self):
+        return [str(device.get('id')) for device in self.devices]
+
+    def _mean(self, field):
+        values = [device.get(field) for device in self.devices if device.get(field) is not None]
+        if not values:
+            return None
+        return round(sum(values) / len(values), 2)
+
+    def row(self):
+        """Encode the group as one compact table row"""
+        first = self.devices[0]
+        name = first.get('name', 'Unknown Device')
+        if len(self.devices) > 1:
+            name = f"{name} (x{len(self.devices)})"
+
+        features = []
+        if first.get('is_schedulable'):
+            features.append('schedulable')
+        if first.get('is_smart_device'):
+            features.append('smart')
+        if first.get('is_ev_charger'):
+            features.append('ev_charger')
+
+        columns = [
+            ','.join(self.ids),
+            name,
+            first.get('device_type_name', 'Unknown Type'),
+            first.get('brand_name', 'Unknown'),
+            _format_number(first.get('power_consumption_watts', 0)),
+            _format_number(self._mean('standby_power_watts')),
+            _format_number(self._mean('average_usage_hours_per_day')),
+            _format_number(self._mean('usage_flexibility')),
+            ','.join(features)
+        ]
+        # Keep the delimiter unambiguous
+        return '|'.join(str(column).replace('|', '/').replace('\n', ' ') for column in columns)
+
+
+def group_devices(devices_data):
+    """
+    Group identical devices so they share one table row.
+
+    Args:
+        devices_data (list): List of user's devices with their specifications
+
+    Returns:
+        list: DeviceGroup objects in order of first appearance
+    """
+    groups = {}
+    for device in devices_data:
+        key = (
+            device.get('device_type_name'),
+            device.get('brand_name'),
+            device.get('power_consumption_watts'),
+            bool(device.get('is_schedulable')),
+            bool(device.get('is_smart_device')),
+            bool(device.get('is_ev_charger'))
+        )
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = DeviceGroup()
+        group.devices.append(device)
+    return list(groups.values())
+
+
+class PromptPlan:
+    """Prompts for one recommendation request, with the device groups each covers"""
+    def __init__(self, prompts, chunks):
+        self.prompts = prompts
+        self.chunks = chunks
+
+    @property
+    def estimated_tokens(self):
+        return sum(estimate_tokens(prompt) for prompt in self.prompts)
+
+    def expand_device_recommendations(self, recommendations, chunk_index=None):
+        """
+        Copy each row's recommendation to every device in the row, keyed by device id.
+
+        Args:
+            recommendations (dict): Parsed recommendations for one prompt of the plan
+            chunk_index (int, optional): Prompt the recommendations answer, all when omitted
+        """
+        chunks = self.chunks if chunk_index is None else [self.chunks[chunk_index]]
+        device_recommendations = recommendations.get('device_recommendations')
+        if not isinstance(device_recommendations, dict):
+            return
+
+        for groups in chunks:
+            for group in groups:
+                ids = group.ids
+                row_rec = device_recommendations.get(ids[0]) or device_recommendations.get(','.join(ids))
+                if not isinstance(row_rec, dict):
+                    continue
+                row_rec.setdefault('name', group.devices[0].get('name'))
+                device_recommendations.pop(','.join(ids), None)
+                for device_id, device in zip(ids, group.devices):
+                    if device_id not in device_recommendations:
+                        device_recommendations[device_id] = dict(row_rec, name=device.get('name', row_rec.get('name')))
+
+
+class PromptBuilder:
+    """
+    Builds compact recommendation prompts within a token budget.
+
+    Identical devices share one row of a tabular device encoding. When the prompt would
+    still exceed the budget the device rows are split into several prompts that can be
+    sent in parallel and merged with merge_recommendations.
+    """
+    def __init__(self, token_budget=6000, max_chunks=16):
+        self.token_budget = token_budget
+        self.max_chunks = max_chunks
+
+    @classmethod
+    def from_config(cls):
+        """Create a builder using the budget from the app config"""
+        return cls(
+            token_budget=current_app.config.get('GEMINI_PROMPT_TOKEN_BUDGET', 6000),
+            max_chunks=current_app.config.get('GEMINI_PROMPT_MAX_CHUNKS', 16)
+        )
+
+    def render(self, user_data, groups, part=None, parts=None):
+        """
+        Render the prompt for a set of device groups.
+
+        Args:
+            user_data (dict): User preferences and energy setup
+            groups (list): DeviceGroup objects to include
+            part (int, optional): 1-based index of this prompt when the devices are split
+            parts (int, optional): Total number of prompts
+
+        Returns:
+            str: Prompt text
+        """
+        has_solar = user_data.get('has_solar', False)
+        has_battery = user_data.get('has_battery_storage', False)
+        rows = [DEVICE_TABLE_HEADER] + [group.row() for group in groups]
+
+        return PROMPT_TEMPLATE.format(
+            location=user_data.get('location') or user_data.get('city') or 'Unknown',
+            has_solar=has_solar,
+            solar_capacity=user_data.get('solar_capacity_kw', 0) if has_solar else 0,
+            solar_panel_orientation=user_data.get('solar_panel_orientation', 'Unknown'),
+            has_battery=has_battery,
+            battery_capacity=user_data.get('battery_capacity_kwh', 0) if has_battery else 0,
+            has_ev=user_data.get('has_ev', False),
+            electricity_rate_plan=user_data.get('electricity_rate_plan', 'Unknown'),
+            peak_rate=user_data.get('peak_rate_per_kwh', 0),
+            off_peak_rate=user_data.get('off_peak_rate_per_kwh', 0),
+            energy_savings_goal=user_data.get('energy_savings_goal', 0),
+            environmental_priority=user_data.get('environmental_priority', 5),
+            part_note=PART_NOTE.format(part=part, parts=parts) if parts and parts > 1 else '',
+            devices_table='\n'.join(rows)
+        )
+
+    def plan(self, user_data, devices_data):
+        """
+        Build the prompts for a request, splitting the devices when over the token budget.
+
+        Args:
+            user_data (dict): User preferences and energy setup
+            devices_data (list): User's devices information
+
+        Returns:
+            PromptPlan: Prompts and the device groups each one covers
+        """
+        groups = group_devices(devices_data)
+        base_tokens = estimate_tokens(self.render(user_data, []))
+        row_budget = max(self.token_budget - base_tokens, 1)
+
+        chunks = []
+        current, current_tokens = [], 0
+        for group in groups:
+            row_tokens = estimate_tokens(group.row()) + 1
+            if current and current_tokens + row_tokens > row_budget:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(group)
+            current_tokens += row_tokens
+        if current or not chunks:
+            chunks.append(current)
+
+        if len(chunks) > self.max_chunks:
+            # Spread the rows evenly over the allowed number of calls, exceeding the budget
+            per_chunk = math.ceil(len(groups) / self.max_chunks)
+            chunks = [groups[i:i + per_chunk] for i in range(0, len(groups), per_chunk)]
+
+        parts = len(chunks)
+        prompts = [
+            self.render(user_data, chunk, part=index + 1, parts=parts)
+            for index, chunk in enumerate(chunks)
+        ]
+        return PromptPlan(prompts, chunks)
+
+
+def merge_recommendations(parts):
+    """
+    Merge the recommendations of several prompts covering disjoint sets of devices.
+
+    Args:
+        parts (list): Parsed recommendation dicts, one per prompt
+
+    Returns:
+        dict: One recommendations dict with all device recommendations
+    """
+    merged = {
+        'overall_recommendations': [],
+        'device_recommendations': {},
+        'schedule_optimization': [],
+        'energy_saving_tips': [],
+        'estimated_monthly_savings': 0,
+        'carbon_reduction_potential': 0
+    }
+
+    for part in parts:
+        for section in ('overall_recommendations', 'schedule_optimization', 'energy_saving_tips'):
+            for item in part.get(section) or []:
+                # Each part sees the same profile, so general advice often repeats
+                if item not in merged[section]:
+                    merged[section].append(item)
+        merged['device_recommendations'].update(part.get('device_recommendations') or {})
+
+        # Parts cover different devices, so their savings add up
+        for field in ('estimated_monthly_savings', 'carbon_reduction_potential'):
+            try:
+                merged[field] += float(part.get(field) or 0)
+            except (TypeError, ValueError):
+                pass
+
+    for field in ('estimated_monthly_savings', 'carbon_reduction_potential'):
+        merged[field] = round(merged[field], 2)
+    return merged
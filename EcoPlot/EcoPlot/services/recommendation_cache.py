@@ -0,0 +1,339 @@
+# EcoPlot/services/recommendation_cache.py
+import hashlib
+import importlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+
+
+# Profile fields that do not change the generated advice
+PROFILE_FINGERPRINT_EXCLUDED = ('id', 'username', 'is_pro')
+
+
+def _digest(payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def recommendation_fingerprint(user_data, devices_data):
+    """
+    Build a stable hash of the exact inputs passed to the recommendation prompt.
+
+    Args:
+        user_data (dict): User preferences and energy setup details
+        devices_data (list): List of user's devices with their specifications
+
+    Returns:
+        str: Hex encoded sha256 digest
+    """
+    return _digest({
+        'user': user_data,
+        'devices': sorted(devices_data, key=lambda device: str(device.get('id')))
+    })
+
+
+def device_fingerprint(device_data):
+    """Hash the fields of a single device that are passed to the recommendation prompt"""
+    return _digest(device_data)
+
+
+def profile_fingerprint(user_data):
+    """Hash the profile fields that affect the advice for every device"""
+    return _digest({
+        key: value for key, value in user_data.items()
+        if key not in PROFILE_FINGERPRINT_EXCLUDED
+    })
+
+
+class MemoryCacheBackend:
+    """In-process LRU backend. Entries are lost when the worker restarts."""
+    name = 'memory'
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    Backend storing entries in the recommendation_cache table so they are shared
+    by every worker process using the same database file.
+    """
+    name = 'sqlite'
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+
+    @property
+    def _table(self):
+        from EcoPlot.models.recommendation_cache import RecommendationCacheEntry
+        return RecommendationCacheEntry.__table__
+
+    @property
+    def _engine(self):
+        from EcoPlot import db
+        return db.engine
+
+    def get(self, key):
+        table = self._table
+        now = datetime.utcnow()
+        with self._engine.begin() as conn:
+            row = conn.execute(
+                table.select().where(table.c.key == key, table.c.expires_at > now)
+            ).first()
+            if row is None:
+                return None
+            conn.execute(table.update().where(table.c.key == key).values(last_accessed_at=now))
+            return row.value_json
+
+    def set(self, key, value, ttl):
+        table = self._table
+        now = datetime.utcnow()
+        with self._engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.key == key))
+            conn.execute(table.insert().values(
+                key=key,
+                value_json=value,
+                created_at=now,
+                expires_at=now + timedelta(seconds=ttl),
+                last_accessed_at=now
+            ))
+            # Drop expired rows, then the least recently used ones above the limit
+            conn.execute(table.delete().where(table.c.expires_at <= now))
+            stale_keys = table.select().with_only_columns(table.c.key)\
+                .order_by(table.c.last_accessed_at.desc())\
+                .offset(self.max_entries)
+            conn.execute(table.delete().where(table.c.key.in_(stale_keys.scalar_subquery())))
+
+    def delete(self, key):
+        table = self._table
+        with self._engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.key == key))
+
+    def clear(self):
+        with self._engine.begin() as conn:
+            conn.execute(self._table.delete())
+
+    def size(self):
+        from sqlalchemy import func, select
+        with self._engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(self._table)).scalar()
+
+
+class RedisCacheBackend:
+    """
+    Backend for any Redis-compatible server. Expiry is delegated to the server and
+    LRU order is tracked in a sorted set so the entry limit holds on shared servers.
+
+    A local stand-in (for example ``fakeredis.FakeRedis()``) can be passed as client,
+    or selected through RECOMMENDATION_CACHE_CLIENT_FACTORY (see redis_client_factory).
+    """
+    name = 'redis'
+
+    def __init__(self, max_entries, url=None, client=None, prefix='ecoplot:recs:'):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("The redis cache backend requires the 'redis' package")
+            client = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+        self.client = client
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.lru_key = prefix + 'lru'
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.client.zrem(self.lru_key, key)
+            return None
+        self.client.zadd(self.lru_key, {key: time.time()})
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+        self.client.zadd(self.lru_key, {key: time.time()})
+        overflow = self.client.zcard(self.lru_key) - self.max_entries
+        if overflow > 0:
+            evicted = self.client.zrange(self.lru_key, 0, overflow - 1)
+            for evicted_key in evicted:
+                if isinstance(evicted_key, bytes):
+                    evicted_key = evicted_key.decode('utf-8')
+                self.client.delete(self.prefix + evicted_key)
+            self.client.zremrangebyrank(self.lru_key, 0, overflow - 1)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+        self.client.zrem(self.lru_key, key)
+
+    def clear(self):
+        for key in self.client.zrange(self.lru_key, 0, -1):
+            if isinstance(key, bytes):
+                key = key.decode('utf-8')
+            self.client.delete(self.prefix + key)
+        self.client.delete(self.lru_key)
+
+    def size(self):
+        return self.client.zcard(self.lru_key)
+
+
+class RecommendationCache:
+    """
+    TTL cache for generated recommendations with hit/miss counters.
+    Values are stored as JSON so every backend holds the same representation.
+    """
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Look up cached recommendations.
+
+        Args:
+            key (str): Input fingerprint
+
+        Returns:
+            dict: Cached recommendations or None on a miss
+        """
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            current_app.logger.warning(f"Recommendation cache lookup failed: {str(e)}")
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, recommendations):
+        """
+        Store recommendations under the given key.
+
+        Args:
+            key (str): Input fingerprint
+            recommendations (dict): Recommendations returned by GeminiService
+        """
+        try:
+            self.backend.set(key, json.dumps(recommendations), self.ttl)
+        except Exception as e:
+            current_app.logger.warning(f"Recommendation cache write failed: {str(e)}")
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        try:
+            size = self.backend.size()
+        except Exception:
+            size = None
+        return {
+            'backend': self.backend.name,
+            'ttl_seconds': self.ttl,
+            'max_entries': self.backend.max_entries,
+            'size': size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def redis_client_factory(factory):
+    """
+    Resolve the configured Redis client factory.
+
+    Args:
+        factory: A callable taking the cache URL, a "module:attribute" path to one
+            (e.g. "fakeredis:FakeRedis.from_url"), or None for redis.Redis.from_url
+
+    Returns:
+        callable: Factory building a client from the URL, or None for the default client
+    """
+    if factory is None or callable(factory):
+        return factory
+    module_name, _, attribute = factory.partition(':')
+    if not attribute:
+        raise ValueError(f"RECOMMENDATION_CACHE_CLIENT_FACTORY must be module:attribute, not {factory!r}")
+    try:
+        target = importlib.import_module(module_name)
+    except ImportError:
+        raise RuntimeError(f"Cannot import {module_name} for the redis cache client")
+    for name in attribute.split('.'):
+        target = getattr(target, name)
+    return target
+
+
+def init_recommendation_cache(app):
+    """Create the recommendation cache configured for the app"""
+    backend_name = app.config.get('RECOMMENDATION_CACHE_BACKEND', 'memory')
+    max_entries = app.config.get('RECOMMENDATION_CACHE_MAX_ENTRIES', 1024)
+
+    if backend_name == 'sqlite':
+        backend = SQLiteCacheBackend(max_entries)
+    elif backend_name == 'redis':
+        url = app.config.get('RECOMMENDATION_CACHE_URL')
+        factory = redis_client_factory(app.config.get('RECOMMENDATION_CACHE_CLIENT_FACTORY'))
+        client = factory(url or 'redis://localhost:6379/0') if factory else None
+        backend = RedisCacheBackend(max_entries, url=url, client=client)
+    elif backend_name == 'memory':
+        backend = MemoryCacheBackend(max_entries)
+    else:
+        raise ValueError(f"Unknown recommendation cache backend: {backend_name}")
+
+    cache = RecommendationCache(backend, app.config.get('RECOMMENDATION_CACHE_TTL', 24 * 60 * 60))
+    app.extensions['recommendation_cache'] = cache
+    return cache
+
+
+def get_recommendation_cache():
+    """Return the recommendation cache of the current app"""
+    return current_app.extensions['recommendation_cache']
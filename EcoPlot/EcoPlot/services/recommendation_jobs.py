@@ -0,0 +1,264 @@
+# EcoPlot/services/recommendation_jobs.py
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from EcoPlot import db
+from EcoPlot.models.recommendation_job import RecommendationJob
+from EcoPlot.models.recommendation_job_event import RecommendationJobEvent
+from EcoPlot.services.circuit_breaker import get_circuit_breaker
+
+
+class RecommendationJobQueue:
+    """
+    Worker pool running recommendation jobs stored in the recommendation_jobs table.
+
+    Jobs survive restarts because the table is the queue: workers claim a queued row
+    with a conditional UPDATE, so threads in this process and dedicated worker
+    processes (``flask recommendations worker``) can safely share it. Nothing is claimed
+    while Gemini's circuit is open, and jobs answered by the rules fallback go back to the
+    queue with an exponential backoff instead of succeeding. Full runs stream from Gemini
+    and store each section as a job event while the rest is generated.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.worker_count = app.config.get('RECOMMENDATION_JOB_WORKERS', 2)
+        self.poll_interval = app.config.get('RECOMMENDATION_JOB_POLL_INTERVAL', 1.0)
+        self.job_timeout = app.config.get('RECOMMENDATION_JOB_TIMEOUT', 300)
+        self.max_attempts = app.config.get('RECOMMENDATION_JOB_MAX_ATTEMPTS', 6)
+        self.retry_backoff = app.config.get('RECOMMENDATION_JOB_RETRY_BACKOFF', 15)
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, worker_count=None):
+        """Start the worker threads if they are not already running"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            self.requeue_stalled()
+            for index in range(worker_count or self.worker_count):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'recommendation-worker-{index}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def shutdown(self, wait=True):
+        """Stop the workers after their current job"""
+        self._stopping.set()
+        self._wakeup.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def enqueue(self, user_id, user_data, devices_data, force_refresh=False, not_before=None, device_id=None):
+        """
+        Queue recommendation generation for a user.
+
+        Args:
+            user_id (int): User ID
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+            force_refresh (bool): Skip the recommendation cache
+            not_before (datetime, optional): Earliest time (UTC) a worker may run the job
+            device_id (int, optional): Generate only this device, the single entry of devices_data
+
+        Returns:
+            RecommendationJob: The queued job
+        """
+        job = RecommendationJob(
+            user_id=user_id,
+            force_refresh=force_refresh,
+            not_before=not_before,
+            device_id=device_id,
+            input_json=job_inputs(user_data, devices_data)
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        if self.app.config.get('RECOMMENDATION_JOB_INLINE_WORKERS', True):
+            self.start()
+        self._wakeup.set()
+        return job
+
+    def requeue_stalled(self):
+        """Put jobs back in the queue whose worker died while running them"""
+        table = RecommendationJob.__table__
+        cutoff = datetime.utcnow() - timedelta(seconds=self.job_timeout)
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(
+                    table.update()
+                    .where(table.c.status == RecommendationJob.STATUS_RUNNING, table.c.started_at < cutoff)
+                    .values(status=RecommendationJob.STATUS_QUEUED)
+                )
+
+    def run_pending(self):
+        """
+        Claim and run one queued job in the calling thread.
+
+        Returns:
+            bool: True if a job was run
+        """
+        with self.app.app_context():
+            job_id = self._claim_next()
+            if job_id is None:
+                return False
+            self._run(job_id)
+            return True
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_pending():
+                    continue
+            except Exception as e:
+                self.app.logger.error(f"Recommendation worker error: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def retry_at(self, attempts):
+        """
+        Get the time a job that could not reach Gemini is tried again.
+
+        Args:
+            attempts (int): Attempts made so far, including the failed one; 0 for a new job
+
+        Returns:
+            datetime: Earliest time (UTC) of the next attempt, never before the circuit reopens
+        """
+        backoff = self.retry_backoff * 2 ** (attempts - 1) if attempts else 0
+        delay = max(backoff, get_circuit_breaker().retry_after())
+        return datetime.utcnow() + timedelta(seconds=delay)
+
+    def _claim_next(self):
+        # Jobs claimed now would only get the rules fallback
+        if get_circuit_breaker().is_open():
+            return None
+
+        table = RecommendationJob.__table__
+        with db.engine.begin() as conn:
+            while True:
+                job_id = conn.execute(
+                    table.select().with_only_columns(table.c.id)
+                    .where(
+                        table.c.status == RecommendationJob.STATUS_QUEUED,
+                        or_(table.c.not_before.is_(None), table.c.not_before <= datetime.utcnow())
+                    )
+                    .order_by(table.c.created_at)
+                    .limit(1)
+                ).scalar()
+                if job_id is None:
+                    return None
+
+                # Only one worker can move the row out of the queued state
+                claimed = conn.execute(
+                    table.update()
+                    .where(table.c.id == job_id, table.c.status == RecommendationJob.STATUS_QUEUED)
+                    .values(
+                        status=RecommendationJob.STATUS_RUNNING,
+                        started_at=datetime.utcnow(),
+                        attempts=table.c.attempts + 1
+                    )
+                ).rowcount
+                if claimed:
+                    return job_id
+
+    def _run(self, job_id):
+        from EcoPlot.services.recommendation_service import RecommendationService
+
+        job = db.session.get(RecommendationJob, job_id)
+        inputs = json.loads(job.input_json)
+        user_data = inputs['user_data']
+        devices_data = inputs['devices_data']
+
+        try:
+            if job.device_id is not None:
+                recommendations, cached = RecommendationService.refresh_device(
+                    user_data, devices_data[0], force_refresh=job.force_refresh
+                )
+            else:
+                if job.attempts > 1:
+                    # Clients drop the sections shown from the failed attempt
+                    self.record_event(job_id, 'restart', {'attempt': job.attempts})
+
+                recommendations, cached = RecommendationService.generate(
+                    user_data, devices_data, force_refresh=job.force_refresh,
+                    on_section=lambda event, payload: self.record_event(job_id, event, payload)
+                )
+
+            if recommendations.get('fallback') and job.attempts < self.max_attempts:
+                # Gemini was not reached; keep the job instead of succeeding with rule output
+                job.status = RecommendationJob.STATUS_QUEUED
+                job.not_before = self.retry_at(job.attempts)
+                job.error = recommendations.get('upstream_error')
+                db.session.commit()
+                return
+            elif recommendations.get('fallback'):
+                job.status = RecommendationJob.STATUS_FAILED
+                job.error = recommendations.get('upstream_error') or 'Gemini is unavailable'
+            elif recommendations.get('success', False):
+                if not cached and job.device_id is None:
+                    history = RecommendationService.record_history(
+                        job.user_id, recommendations, user_data, devices_data
+                    )
+                    job.history_id = history.id
+                job.status = RecommendationJob.STATUS_SUCCEEDED
+            else:
+                job.status = RecommendationJob.STATUS_FAILED
+                job.error = recommendations.get('error', 'Failed to generate recommendations')
+
+            job.result_json = json.dumps(recommendations)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error running recommendation job {job_id}: {str(e)}")
+            job = db.session.get(RecommendationJob, job_id)
+            job.status = RecommendationJob.STATUS_FAILED
+            job.error = str(e)
+
+        job.finished_at = datetime.utcnow()
+        # The result holds every section, so the streamed copies are no longer needed
+        RecommendationJobEvent.query.filter_by(job_id=job_id).delete()
+        db.session.commit()
+
+    def record_event(self, job_id, event, payload):
+        """
+        Store a streamed section of a running job for its event stream.
+
+        Args:
+            job_id (str): Job ID
+            event (str): Event name, e.g. overall_recommendation
+            payload: JSON-serializable section content
+        """
+        # Committed on its own connection so clients see it before the job finishes
+        with db.engine.begin() as conn:
+            conn.execute(RecommendationJobEvent.__table__.insert().values(
+                job_id=job_id,
+                event=event,
+                payload_json=json.dumps(payload),
+                created_at=datetime.utcnow()
+            ))
+
+
+def job_inputs(user_data, devices_data):
+    """Serialize the prompt inputs stored on a job; equal inputs give equal text"""
+    return json.dumps({'user_data': user_data, 'devices_data': devices_data}, default=str)
+
+
+def init_recommendation_jobs(app):
+    """Create the recommendation job queue for the app. Workers start on first use."""
+    queue = RecommendationJobQueue(app)
+    app.extensions['recommendation_jobs'] = queue
+    return queue
+
+
+def get_recommendation_jobs():
+    """Return the recommendation job queue of the current app"""
+    return current_app.extensions['recommendation_jobs']
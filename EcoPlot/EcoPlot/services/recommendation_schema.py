@@ -0,0 +1,230 @@
+# EcoPlot/services/recommendation_schema.py
+import re
+
+# Response schema sent to Gemini in structured-output mode. Device recommendations are an
+# array because the schema subset Gemini accepts cannot describe objects with dynamic keys;
+# validate_recommendations turns it back into the map keyed by device id the app uses.
+RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'overall_recommendations': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'device_recommendations': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {
+                    'device_id': {'type': 'STRING'},
+                    'name': {'type': 'STRING'},
+                    'recommendation': {'type': 'STRING'},
+                    'estimated_savings': {'type': 'NUMBER'}
+                },
+                'required': ['device_id', 'recommendation'],
+                'propertyOrdering': ['device_id', 'name', 'recommendation', 'estimated_savings']
+            }
+        },
+        'schedule_optimization': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'energy_saving_tips': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'estimated_monthly_savings': {'type': 'NUMBER'},
+        'carbon_reduction_potential': {'type': 'NUMBER'}
+    },
+    'required': [
+        'overall_recommendations',
+        'device_recommendations',
+        'schedule_optimization',
+        'energy_saving_tips',
+        'estimated_monthly_savings',
+        'carbon_reduction_potential'
+    ],
+    # Stream the lists the page shows first before the totals
+    'propertyOrdering': [
+        'overall_recommendations',
+        'device_recommendations',
+        'schedule_optimization',
+        'energy_saving_tips',
+        'estimated_monthly_savings',
+        'carbon_reduction_potential'
+    ]
+}
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+class SchemaError(ValueError):
+    """Raised when a value cannot be coerced to its schema type"""
+
+
+def _coerce_string(value, path, warnings):
+    if isinstance(value, bool) or isinstance(value, (dict, list)) or value is None:
+        raise SchemaError(f"{path}: expected a string")
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # device ids sometimes come back as 5.0
+    text = str(value).strip()
+    if not text:
+        raise SchemaError(f"{path}: empty string")
+    return text
+
+
+def _coerce_number(value, path, warnings):
+    if isinstance(value, bool):
+        raise SchemaError(f"{path}: expected a number")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        # Accept values such as "$45.80", "1,200 kWh" or "12%"
+        match = _NUMBER.search(value.replace(',', ''))
+        if match:
+            return float(match.group())
+    raise SchemaError(f"{path}: expected a number")
+
+
+def _coerce_boolean(value, path, warnings):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    raise SchemaError(f"{path}: expected a boolean")
+
+
+def compile_schema(schema):
+    """
+    Compile a response schema into a validator function.
+
+    The returned function coerces a decoded value to the schema in one pass. Invalid
+    array items are dropped and reported instead of failing the whole array.
+
+    Args:
+        schema (dict): Schema in the format sent to Gemini
+
+    Returns:
+        callable: validate(value, path, warnings) returning the coerced value or
+            raising SchemaError
+    """
+    kind = schema['type'].upper()
+
+    if kind == 'STRING':
+        return _coerce_string
+    if kind in ('NUMBER', 'INTEGER'):
+        return _coerce_number
+    if kind == 'BOOLEAN':
+        return _coerce_boolean
+
+    if kind == 'ARRAY':
+        validate_item = compile_schema(schema['items'])
+
+        def validate_array(value, path, warnings):
+            if value is None:
+                return []
+            if not isinstance(value, list):
+                value = [value]  # a single item where a list was expected
+            result = []
+            for index, item in enumerate(value):
+                try:
+                    result.append(validate_item(item, f"{path}[{index}]", warnings))
+                except SchemaError as e:
+                    warnings.append(str(e))
+            return result
+        return validate_array
+
+    if kind == 'OBJECT':
+        fields = [(name, compile_schema(field)) for name, field in schema.get('properties', {}).items()]
+        required = set(schema.get('required', []))
+
+        def validate_object(value, path, warnings):
+            if not isinstance(value, dict):
+                raise SchemaError(f"{path}: expected an object")
+            result = {}
+            for name, validate_field in fields:
+                field_value = value.get(name)
+                if field_value is None:
+                    if name in required:
+                        raise SchemaError(f"{path}.{name}: missing")
+                    continue
+                result[name] = validate_field(field_value, f"{path}.{name}", warnings)
+            return result
+        return validate_object
+
+    raise ValueError(f"Unsupported schema type: {schema['type']}")
+
+
+_SECTION_VALIDATORS = {
+    name: compile_schema(field) for name, field in RESPONSE_SCHEMA['properties'].items()
+}
+_validate_device = compile_schema(RESPONSE_SCHEMA['properties']['device_recommendations']['items'])
+
+
+def _device_items(value):
+    """Accept the device map of older prompts as well as the array of the schema"""
+    if not isinstance(value, dict):
+        return value
+    items = []
+    for key, entry in value.items():
+        if isinstance(entry, dict):
+            items.append(dict(entry, device_id=entry.get('device_id', key)))
+        else:
+            items.append({'device_id': key, 'recommendation': entry})
+    return items
+
+
+def validate_device_entry(value):
+    """
+    Coerce one streamed device recommendation.
+
+    Args:
+        value: Decoded element of the device_recommendations array
+
+    Returns:
+        tuple: (device id, recommendation dict), or None if the entry is unusable
+    """
+    try:
+        entry = _validate_device(value, 'device_recommendations[]', [])
+    except SchemaError:
+        return None
+    device_id = entry.pop('device_id')
+    return device_id, entry
+
+
+def validate_recommendations(data):
+    """
+    Validate and coerce a decoded recommendations document.
+
+    Each section is validated on its own, so a malformed section falls back to an empty
+    default instead of discarding the sections that are valid.
+
+    Args:
+        data: Decoded JSON response
+
+    Returns:
+        tuple: (recommendations dict with device recommendations keyed by device id,
+            list of problems that were repaired)
+    """
+    if not isinstance(data, dict):
+        raise SchemaError("response is not a JSON object")
+
+    warnings = []
+    recommendations = {}
+    for name, validate_section in _SECTION_VALIDATORS.items():
+        value = data.get(name)
+        if name == 'device_recommendations':
+            value = _device_items(value)
+
+        default = 0 if RESPONSE_SCHEMA['properties'][name]['type'] == 'NUMBER' else []
+        if value is None:
+            warnings.append(f"{name}: missing")
+            recommendations[name] = default
+            continue
+        try:
+            recommendations[name] = validate_section(value, name, warnings)
+        except SchemaError as e:
+            warnings.append(str(e))
+            recommendations[name] = default
+
+    device_recommendations = {}
+    for entry in recommendations['device_recommendations']:
+        device_recommendations[entry.pop('device_id')] = entry
+    recommendations['device_recommendations'] = device_recommendations
+
+    if not any(recommendations[name] for name, field in RESPONSE_SCHEMA['properties'].items()
+               if field['type'] == 'ARRAY'):
+        raise SchemaError("response contains no usable recommendations")
+
+    return recommendations, warnings
@@ -0,0 +1,482 @@
+# EcoPlot/services/recommendation_service.py
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_type import DeviceType
+from EcoPlot.models.device_brand import DeviceBrand
+from EcoPlot.models.recommendation import RecommendationHistory
+from EcoPlot.models.recommendation_fingerprint import RecommendationFingerprint
+from EcoPlot.models.recommendation_job import RecommendationJob
+from EcoPlot.services.circuit_breaker import get_circuit_breaker
+from EcoPlot.services.gemini_service import GeminiService
+from EcoPlot.services.rule_engine import RuleBasedRecommender
+from EcoPlot.services.recommendation_cache import (
+    get_recommendation_cache, recommendation_fingerprint, device_fingerprint, profile_fingerprint
+)
+from EcoPlot.services.single_flight import get_single_flight
+from EcoPlot.services.recommendation_jobs import get_recommendation_jobs, job_inputs
+
+# Top-level list sections forwarded item by item while streaming, with their event names
+STREAMED_LIST_SECTIONS = {
+    'overall_recommendations': 'overall_recommendation',
+    'schedule_optimization': 'schedule_optimization',
+    'energy_saving_tips': 'energy_saving_tip'
+}
+
+class RecommendationService:
+    @staticmethod
+    def build_user_data(user):
+        """Create user profile data for recommendations"""
+        return {
+            'id': user.id,
+            'username': user.username,
+            'is_pro': user.is_subscription_active(),
+            'location': f"{user.city}, {user.state}, {user.country}"
+                if (user.city and user.state and user.country) else None,
+            'city': user.city,
+            'state': user.state,
+            'country': user.country,
+            'has_solar': user.has_solar,
+            'solar_capacity_kw': user.solar_capacity_kw,
+            'solar_panel_orientation': user.solar_panel_orientation,
+            'solar_panel_tilt': user.solar_panel_tilt,
+            'has_battery_storage': user.has_battery_storage,
+            'battery_capacity_kwh': user.battery_capacity_kwh,
+            'has_ev': user.has_ev,
+            'ev_battery_capacity_kwh': user.ev_battery_capacity_kwh,
+            'energy_savings_goal': user.energy_savings_goal,
+            'environmental_priority': user.environmental_priority,
+            'electricity_rate_plan': user.electricity_rate_plan,
+            'peak_rate_per_kwh': user.peak_rate_per_kwh,
+            'off_peak_rate_per_kwh': user.off_peak_rate_per_kwh,
+            'solar_feed_in_tariff': user.solar_feed_in_tariff,
+        }
+
+    @staticmethod
+    def build_devices_data(user_id, device_id=None):
+        """
+        Get user devices with their type and brand names formatted for the Gemini service.
+
+        Args:
+            user_id (int): Owner of the devices
+            device_id (int, optional): Restrict the result to a single device
+
+        Returns:
+            list: Device dictionaries ordered by device id
+        """
+        devices_query = db.session.query(
+            Device,
+            DeviceType.name.label('device_type_name'),
+            DeviceBrand.name.label('brand_name')
+        ).join(
+            DeviceType, Device.device_type_id == DeviceType.id
+        ).join(
+            DeviceBrand, Device.brand_id == DeviceBrand.id
+        ).filter(
+            Device.user_id == user_id
+        )
+
+        if device_id is not None:
+            devices_query = devices_query.filter(Device.id == device_id)
+
+        devices_data = []
+        for device, device_type_name, brand_name in devices_query.order_by(Device.id).all():
+            devices_data.append({
+                'id': device.id,
+                'name': device.name,
+                'device_type_name': device_type_name,
+                'brand_name': brand_name,
+                'power_consumption_watts': device.power_consumption_watts,
+                'standby_power_watts': device.standby_power_watts,
+                'average_usage_hours_per_day': device.average_usage_hours_per_day,
+                'usage_flexibility': device.usage_flexibility,
+                'is_schedulable': device.is_schedulable,
+                'is_smart_device': device.is_smart_device,
+                'is_ev_charger': device.is_ev_charger,
+                'priority_level': device.priority_level,
+                'preferred_start_time': device.preferred_start_time.strftime('%H:%M') if device.preferred_start_time else None,
+                'preferred_end_time': device.preferred_end_time.strftime('%H:%M') if device.preferred_end_time else None,
+                'operation_duration_minutes': device.operation_duration_minutes,
+                'charging_rate_kw': device.charging_rate_kw
+            })
+        return devices_data
+
+    @staticmethod
+    def generate(user_data, devices_data, force_refresh=False, on_section=None):
+        """
+        Get recommendations for the given inputs, serving repeat requests from the cache
+        and sharing one Gemini call between concurrent identical requests. Free-tier
+        users and failed Gemini calls are answered by the rule-based engine.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+            force_refresh (bool): Skip the cache lookup and call Gemini
+            on_section (callable, optional): Stream the Gemini call and pass each section to
+                on_section(event name, payload) as soon as it is complete
+
+        Returns:
+            tuple: (recommendations dict, True unless the result was freshly generated
+                by Gemini for this call, i.e. cached, shared with a concurrent request
+                or produced by the rule engine)
+        """
+        if RecommendationService.uses_rule_engine(user_data):
+            return RecommendationService.generate_quick(user_data, devices_data), True
+
+        cache = get_recommendation_cache()
+        key = recommendation_fingerprint(user_data, devices_data)
+
+        if not force_refresh:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached, True
+
+        def call_gemini():
+            if on_section is None:
+                recommendations = GeminiService().generate_device_recommendations(user_data, devices_data)
+            else:
+                recommendations = RecommendationService.stream_sections(user_data, devices_data, on_section)
+
+            # Only successful responses are cached so failures are retried on the next request
+            if recommendations.get('success', False):
+                cache.set(key, recommendations)
+            return recommendations
+
+        recommendations, shared = get_single_flight().do(key, call_gemini, recheck=lambda: cache.get(key))
+
+        if not recommendations.get('success', False):
+            # Serve rule-based advice instead of an error during Gemini outages
+            fallback = RecommendationService.generate_quick(user_data, devices_data)
+            fallback['fallback'] = True
+            fallback['upstream_error'] = recommendations.get('error')
+            return fallback, True
+
+        return recommendations, shared
+
+    @staticmethod
+    def stream_sections(user_data, devices_data, on_section):
+        """
+        Stream recommendations from Gemini, handing each section over while the rest is generated.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+            on_section (callable): Called with (event name, payload) for every complete section
+
+        Returns:
+            dict: The complete recommendations, as GeminiService.generate_device_recommendations returns them
+        """
+        recommendations = {'success': False, 'error': 'Recommendation stream ended unexpectedly'}
+        for event in GeminiService().stream_device_recommendations(user_data, devices_data):
+            kind = event[0]
+            if kind == 'item' and event[1] in STREAMED_LIST_SECTIONS:
+                on_section(STREAMED_LIST_SECTIONS[event[1]], event[2])
+            elif kind == 'entry' and event[1] == 'device_recommendations' and isinstance(event[3], dict):
+                on_section('device_recommendation', dict(event[3], id=event[2]))
+            elif kind == 'done':
+                recommendations = event[1]
+        return recommendations
+
+    @staticmethod
+    def serve_stale(user_data, devices_data, force_refresh=False):
+        """
+        Queue generation for inputs that have to go to Gemini and get the user's latest
+        stored recommendations to show meanwhile. While Gemini's circuit is open the job is
+        a revalidation shared by every request of the outage, and the stored ones carry its
+        id as revalidation_job_id since they stay on screen until Gemini recovers.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+            force_refresh (bool): Skip the cache when the job runs
+
+        Returns:
+            tuple: (stored recommendations marked as stale or None if nothing is stored,
+                the job generating new ones)
+        """
+        circuit_open = get_circuit_breaker().is_open()
+        if circuit_open:
+            job = RecommendationService.revalidate(user_data, devices_data)
+        else:
+            job = RecommendationService.queue(user_data, devices_data, force_refresh=force_refresh)
+
+        stale = RecommendationService.stored(user_data['id'])
+        if stale is not None and circuit_open:
+            stale['revalidation_job_id'] = job.id
+        return stale, job
+
+    @staticmethod
+    def stored(user_id):
+        """
+        Get the user's latest stored recommendations.
+
+        Args:
+            user_id (int): User ID
+
+        Returns:
+            dict: Stored recommendations marked as stale, or None if nothing is stored
+        """
+        history = RecommendationHistory.query\
+            .filter_by(user_id=user_id)\
+            .order_by(RecommendationHistory.created_at.desc(), RecommendationHistory.id.desc())\
+            .first()
+        if history is None:
+            return None
+
+        return {
+            'success': True,
+            'stale': True,
+            'stale_since': history.created_at.isoformat(),
+            'history_id': history.id,
+            'recommendations': json.loads(history.recommendations_json or '{}')
+        }
+
+    @staticmethod
+    def lookup(user_data, devices_data, force_refresh=False):
+        """
+        Get recommendations that are available without calling Gemini.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+            force_refresh (bool): Skip the cache lookup
+
+        Returns:
+            tuple: (recommendations dict, 'rules' or 'cache'), or (None, None) when they
+                have to be generated by a job
+        """
+        if RecommendationService.uses_rule_engine(user_data):
+            return RecommendationService.generate_quick(user_data, devices_data), 'rules'
+        if not force_refresh:
+            cached = get_recommendation_cache().get(recommendation_fingerprint(user_data, devices_data))
+            if cached is not None:
+                return cached, 'cache'
+        return None, None
+
+    @staticmethod
+    def queue(user_data, devices_data, force_refresh=False, device_id=None):
+        """
+        Queue generation in the background, reusing the user's unfinished job for the same
+        inputs so repeated requests do not pile up jobs.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+            force_refresh (bool): Skip the cache when the job runs
+            device_id (int, optional): Generate only this device, the single entry of devices_data
+
+        Returns:
+            RecommendationJob: The unfinished or newly queued job
+        """
+        query = RecommendationJob.query.filter(
+            RecommendationJob.user_id == user_data['id'],
+            RecommendationJob.status.in_([RecommendationJob.STATUS_QUEUED, RecommendationJob.STATUS_RUNNING]),
+            RecommendationJob.device_id.is_(None) if device_id is None else RecommendationJob.device_id == device_id,
+            RecommendationJob.input_json == job_inputs(user_data, devices_data)
+        )
+        if force_refresh:
+            # A pending job that may be answered from the cache does not satisfy a refresh
+            query = query.filter(RecommendationJob.force_refresh.is_(True))
+        job = query.order_by(RecommendationJob.created_at.desc()).first()
+        if job is not None:
+            return job
+
+        jobs = get_recommendation_jobs()
+        return jobs.enqueue(
+            user_data['id'], user_data, devices_data, force_refresh=force_refresh,
+            not_before=jobs.retry_at(0), device_id=device_id
+        )
+
+    @staticmethod
+    def revalidate(user_data, devices_data):
+        """
+        Queue a background refresh of the user's recommendations unless one is pending or
+        finished recently. The new job waits until Gemini's circuit lets calls through again.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+
+        Returns:
+            RecommendationJob: The pending, recently finished or newly queued refresh job
+        """
+        interval = current_app.config.get('RECOMMENDATION_REVALIDATE_INTERVAL', 300)
+        cutoff = datetime.utcnow() - timedelta(seconds=interval)
+
+        # Every request during an outage lands here, so they must share one job
+        job = RecommendationJob.query.filter(
+            RecommendationJob.user_id == user_data['id'],
+            or_(
+                RecommendationJob.status.in_([RecommendationJob.STATUS_QUEUED, RecommendationJob.STATUS_RUNNING]),
+                RecommendationJob.finished_at >= cutoff
+            )
+        ).order_by(RecommendationJob.created_at.desc()).first()
+        if job is not None:
+            return job
+
+        jobs = get_recommendation_jobs()
+        return jobs.enqueue(user_data['id'], user_data, devices_data, not_before=jobs.retry_at(0))
+
+    @staticmethod
+    def generate_quick(user_data, devices_data):
+        """Compute rule-based recommendations locally without calling Gemini"""
+        return RuleBasedRecommender.from_config().generate_device_recommendations(user_data, devices_data)
+
+    @staticmethod
+    def uses_rule_engine(user_data):
+        """Check whether the user's plan is served by the rule engine only"""
+        free_tier_engine = current_app.config.get('FREE_TIER_RECOMMENDATION_ENGINE', 'rules')
+        return not user_data.get('is_pro') and free_tier_engine == 'rules'
+
+    @staticmethod
+    def resolve_device(user_data, device_data, force_refresh=False):
+        """
+        Get recommendations for a single device without calling Gemini, reusing the entry
+        of the latest full run while the device and the relevant profile fields are unchanged.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            device_data (dict): The device with its specifications
+            force_refresh (bool): Skip stored and cached results
+
+        Returns:
+            tuple: (recommendations dict, source of the result: 'history', 'cache' or 'rules'),
+                or (None, None) when the device has to be generated by a job
+        """
+        if RecommendationService.uses_rule_engine(user_data):
+            return RecommendationService.generate_quick(user_data, [device_data]), 'rules'
+        if force_refresh:
+            return None, None
+
+        history = db.session.query(RecommendationHistory).join(
+            RecommendationFingerprint, RecommendationFingerprint.history_id == RecommendationHistory.id
+        ).filter(
+            RecommendationHistory.user_id == user_data['id'],
+            RecommendationFingerprint.device_id == device_data['id'],
+            RecommendationFingerprint.device_fingerprint == device_fingerprint(device_data),
+            RecommendationFingerprint.profile_fingerprint == profile_fingerprint(user_data)
+        ).order_by(RecommendationHistory.created_at.desc(), RecommendationHistory.id.desc()).first()
+
+        if history is not None:
+            stored = json.loads(history.recommendations_json or '{}')
+            device_key = str(device_data['id'])
+            device_rec = stored.get('device_recommendations', {}).get(device_key)
+            if device_rec is not None:
+                return {
+                    'success': True,
+                    'history_id': history.id,
+                    'recommendations': {'device_recommendations': {device_key: device_rec}}
+                }, 'history'
+
+        return RecommendationService.lookup(user_data, [device_data])
+
+    @staticmethod
+    def refresh_device(user_data, device_data, force_refresh=False):
+        """
+        Generate recommendations for a single device and merge them into the latest stored run.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            device_data (dict): The device with its specifications
+            force_refresh (bool): Skip the cache lookup and call Gemini
+
+        Returns:
+            tuple: (recommendations dict, True unless freshly generated by Gemini)
+        """
+        recommendations, cached = RecommendationService.generate(
+            user_data, [device_data], force_refresh=force_refresh
+        )
+        if not cached:
+            try:
+                RecommendationService.merge_device_into_history(
+                    user_data, device_data, recommendations,
+                    device_fingerprint(device_data), profile_fingerprint(user_data)
+                )
+            except Exception as history_error:
+                db.session.rollback()
+                current_app.logger.error(f"Error merging device recommendation into history: {str(history_error)}")
+        return recommendations, cached
+
+    @staticmethod
+    def merge_device_into_history(user_data, device_data, recommendations, device_fp, profile_fp):
+        """
+        Replace a device's entry in the user's latest stored run with a freshly generated one.
+
+        Args:
+            user_data (dict): Profile data the recommendation was generated from
+            device_data (dict): Device the recommendation was generated from
+            recommendations (dict): Single-device recommendations returned by GeminiService
+            device_fp (str): Fingerprint of device_data
+            profile_fp (str): Fingerprint of the relevant fields of user_data
+
+        Returns:
+            RecommendationHistory: Updated history entry, or None if there is nothing to merge into
+        """
+        device_key = str(device_data['id'])
+        device_rec = recommendations.get('recommendations', {}).get('device_recommendations', {}).get(device_key)
+        if device_rec is None:
+            return None
+
+        history = RecommendationHistory.query\
+            .filter_by(user_id=user_data['id'])\
+            .order_by(RecommendationHistory.created_at.desc(), RecommendationHistory.id.desc())\
+            .first()
+        if history is None:
+            return None
+
+        stored = json.loads(history.recommendations_json or '{}')
+        stored.setdefault('device_recommendations', {})[device_key] = device_rec
+        history.recommendations_json = json.dumps(stored)
+
+        fingerprint = db.session.get(RecommendationFingerprint, (history.id, device_data['id']))
+        if fingerprint is None:
+            fingerprint = RecommendationFingerprint(history_id=history.id, device_id=device_data['id'])
+            db.session.add(fingerprint)
+        fingerprint.device_fingerprint = device_fp
+        fingerprint.profile_fingerprint = profile_fp
+
+        db.session.commit()
+        return history
+
+    @staticmethod
+    def record_history(user_id, recommendations, user_data, devices_data):
+        """
+        Store freshly generated recommendations for historical comparison, along with the
+        fingerprints of the inputs each device recommendation was generated from.
+
+        Args:
+            user_id (int): User ID
+            recommendations (dict): Recommendations returned by GeminiService
+            user_data (dict): Profile data the recommendations were generated from
+            devices_data (list): Devices the recommendations were generated from
+
+        Returns:
+            RecommendationHistory: New history entry
+        """
+        history = RecommendationHistory.create_from_response(
+            user_id=user_id,
+            recommendations_data=recommendations,
+            device_count=len(devices_data),
+            has_solar=user_data.get('has_solar', False),
+            has_ev=user_data.get('has_ev', False),
+            has_battery=user_data.get('has_battery_storage', False)
+        )
+        db.session.add(history)
+        db.session.flush()
+
+        device_recommendations = recommendations.get('recommendations', {}).get('device_recommendations', {})
+        profile_fp = profile_fingerprint(user_data)
+        for device in devices_data:
+            if str(device['id']) in device_recommendations:
+                db.session.add(RecommendationFingerprint(
+                    history_id=history.id,
+                    device_id=device['id'],
+                    device_fingerprint=device_fingerprint(device),
+                    profile_fingerprint=profile_fp
+                ))
+
+        db.session.commit()
+        return history
@@ -0,0 +1,250 @@
+# EcoPlot/services/rule_engine.py
+import numpy as np
+from flask import current_app
+
+# Fallbacks when the user has not entered their tariff
+DEFAULT_PEAK_RATE = 0.30  # $/kWh
+DEFAULT_OFF_PEAK_RATE = 0.15  # $/kWh
+DEFAULT_FEED_IN_TARIFF = 0.05  # $/kWh
+GRID_CARBON_KG_PER_KWH = 0.4
+
+# Share of standby consumption removed by switching a device off at the wall
+STANDBY_REDUCTION = 0.75
+# Share of active consumption saved by better settings on a device used all day
+ALWAYS_ON_EFFICIENCY = 0.10
+
+# Levers compared per device, in column order of the savings matrix
+LEVER_SHIFT, LEVER_SOLAR, LEVER_STANDBY, LEVER_EFFICIENCY = range(4)
+
+DEVICE_TIPS = {
+    'Refrigerator': "Keep the refrigerator at 3-4°C and the freezer at -18°C; colder settings waste energy",
+    'Dishwasher': "Only run the dishwasher with a full load and use the eco programme",
+    'Washing Machine': "Wash clothes at 30°C; most of a washing machine's energy goes into heating water",
+    'Dryer': "Air-dry clothes when the weather allows and clean the dryer lint filter after every load",
+    'HVAC': "Set the thermostat 1-2°C closer to the outdoor temperature and keep air filters clean",
+    'Water Heater': "Lower the water heater thermostat to 50-55°C and insulate exposed hot water pipes",
+    'EV Charger': "Set your EV to stop charging at 80% for daily driving to save energy and battery life",
+    'Lighting': "Replace remaining incandescent or halogen bulbs with LEDs",
+    'Television': "Enable the TV's energy saving mode and lower the backlight brightness",
+    'Computer': "Let computers sleep after 10 minutes of inactivity instead of running a screensaver",
+    'Pool Pump': "Run the pool pump fewer hours per day; 6-8 hours is usually enough to keep water clean",
+}
+
+GENERAL_TIPS = [
+    "Turn off devices completely instead of leaving them on standby",
+    "Use natural light during the day instead of artificial lighting",
+    "Check door and window seals to reduce heating and cooling losses",
+]
+
+
+class RuleBasedRecommender:
+    """
+    Deterministic recommendation engine computing advice directly from device and
+    profile fields. Produces the same JSON schema as GeminiService, in milliseconds,
+    so it can serve first paint, free-tier users and Gemini outages.
+    """
+    def __init__(self, peak_start_hour=16, peak_end_hour=21):
+        self.peak_start = peak_start_hour * 60
+        self.peak_end = peak_end_hour * 60
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            peak_start_hour=current_app.config.get('TOU_PEAK_START_HOUR', 16),
+            peak_end_hour=current_app.config.get('TOU_PEAK_END_HOUR', 21)
+        )
+
+    def generate_device_recommendations(self, user_data, devices_data):
+        """
+        Generate recommendations for device usage optimization.
+
+        Args:
+            user_data (dict): User preferences and energy setup details
+            devices_data (list): List of user's devices with their specifications
+
+        Returns:
+            dict: Structured recommendations in the GeminiService response format
+        """
+        peak_rate = user_data.get('peak_rate_per_kwh') or DEFAULT_PEAK_RATE
+        off_peak_rate = user_data.get('off_peak_rate_per_kwh') or min(DEFAULT_OFF_PEAK_RATE, peak_rate)
+        feed_in_tariff = user_data.get('solar_feed_in_tariff') or DEFAULT_FEED_IN_TARIFF
+        has_solar = bool(user_data.get('has_solar')) and bool(user_data.get('solar_capacity_kw'))
+        has_battery = bool(user_data.get('has_battery_storage'))
+        rate_spread = max(peak_rate - off_peak_rate, 0.0)
+
+        n = len(devices_data)
+        if n == 0:
+            return self._response([], {}, [], list(GENERAL_TIPS), 0.0, 0.0)
+
+        def column(key, default=0.0):
+            return np.fromiter(
+                (d.get(key) if d.get(key) is not None else default for d in devices_data),
+                dtype=np.float64, count=n
+            )
+
+        power_w = column('power_consumption_watts')
+        standby_w = column('standby_power_watts')
+        hours = np.clip(column('average_usage_hours_per_day'), 0, 24)
+        flexibility = np.clip(column('usage_flexibility'), 0, 10) / 10
+        schedulable = column('is_schedulable').astype(bool)
+        ev = column('is_ev_charger').astype(bool)
+        start_min = np.fromiter((_minutes(d.get('preferred_start_time'), -1) for d in devices_data), dtype=np.float64, count=n)
+        end_min = np.fromiter((_minutes(d.get('preferred_end_time'), -1) for d in devices_data), dtype=np.float64, count=n)
+
+        # Monthly consumption split into active and standby use
+        active_kwh = power_w * hours / 1000 * 30
+        standby_kwh = standby_w * (24 - hours) / 1000 * 30
+
+        # Share of active use falling in the peak window: the preferred window when
+        # known, otherwise usage spread evenly over the day
+        has_window = (start_min >= 0) & (end_min > start_min)
+        window_len = np.where(has_window, end_min - start_min, 1440)
+        overlap = np.clip(np.minimum(end_min, self.peak_end) - np.maximum(start_min, self.peak_start), 0, None)
+        peak_share = np.where(has_window, overlap / window_len, (self.peak_end - self.peak_start) / 1440)
+
+        # How much active use can realistically move; devices running all day cannot
+        always_on = hours >= 20
+        shiftable = np.where(always_on, 0.0, flexibility * np.where(schedulable | ev, 1.0, 0.5))
+        shiftable_kwh = active_kwh * shiftable
+
+        # Dollar savings per lever (columns) for every device (rows)
+        savings = np.zeros((n, 4))
+        savings[:, LEVER_SHIFT] = shiftable_kwh * peak_share * rate_spread
+        if has_solar:
+            # Self-consumed solar displaces the average import price instead of earning the feed-in tariff
+            import_rate = peak_rate * peak_share + off_peak_rate * (1 - peak_share)
+            savings[:, LEVER_SOLAR] = shiftable_kwh * 0.5 * np.clip(import_rate - feed_in_tariff, 0, None)
+        standby_saved_kwh = standby_kwh * STANDBY_REDUCTION
+        savings[:, LEVER_STANDBY] = standby_saved_kwh * off_peak_rate
+        efficiency_saved_kwh = np.where(always_on, active_kwh * ALWAYS_ON_EFFICIENCY, 0.0)
+        savings[:, LEVER_EFFICIENCY] = efficiency_saved_kwh * (peak_rate + off_peak_rate) / 2
+
+        best_lever = savings.argmax(axis=1)
+        best_saving = savings[np.arange(n), best_lever]
+        saved_kwh = np.where(best_lever == LEVER_STANDBY, standby_saved_kwh,
+                             np.where(best_lever == LEVER_EFFICIENCY, efficiency_saved_kwh, 0.0))
+        solar_kwh = np.where(best_lever == LEVER_SOLAR, shiftable_kwh * 0.5, 0.0)
+
+        monthly_savings = float(best_saving.sum())
+        carbon_reduction = float((saved_kwh.sum() + solar_kwh.sum()) * GRID_CARBON_KG_PER_KWH)
+
+        device_recommendations = {}
+        for i, device in enumerate(devices_data):
+            device_recommendations[str(device.get('id'))] = {
+                'name': device.get('name', 'Unknown Device'),
+                'recommendation': self._device_text(
+                    device, best_lever[i], best_saving[i], standby_w[i], peak_rate, off_peak_rate
+                ),
+                'estimated_savings': round(float(saved_kwh[i] + solar_kwh[i]), 1)
+            }
+
+        overall = self._overall_recommendations(
+            savings, standby_kwh, active_kwh, has_solar, has_battery, rate_spread, user_data
+        )
+        schedule = self._schedule_optimization(devices_data, savings, has_solar)
+        tips = self._tips(devices_data)
+
+        return self._response(overall, device_recommendations, schedule, tips, monthly_savings, carbon_reduction)
+
+    def _device_text(self, device, lever, saving, standby_w, peak_rate, off_peak_rate):
+        name = device.get('name', 'this device')
+        if saving <= 0.01:
+            return f"{name} is already used efficiently; keep your current usage pattern."
+        if lever == LEVER_SHIFT:
+            return (f"Run {name} outside the {self._peak_label()} peak window to pay "
+                    f"${off_peak_rate:.2f}/kWh instead of ${peak_rate:.2f}/kWh, saving about ${saving:.2f} per month.")
+        if lever == LEVER_SOLAR:
+            return (f"Run {name} between 10:00 and 15:00 to use your own solar production, "
+                    f"saving about ${saving:.2f} per month.")
+        if lever == LEVER_STANDBY:
+            return (f"{name} draws {standby_w:g}W on standby. Switch it off at the wall or use a smart plug "
+                    f"to save about ${saving:.2f} per month.")
+        return (f"{name} runs most of the day. Check its temperature or power settings and maintenance "
+                f"to save about ${saving:.2f} per month.")
+
+    def _overall_recommendations(self, savings, standby_kwh, active_kwh, has_solar, has_battery, rate_spread, user_data):
+        lever_totals = savings.sum(axis=0)
+        overall = []
+        if lever_totals[LEVER_SHIFT] > 1:
+            overall.append(f"Shift flexible appliances out of the {self._peak_label()} peak window "
+                           f"to save about ${lever_totals[LEVER_SHIFT]:.2f} per month")
+        if lever_totals[LEVER_SOLAR] > 1:
+            overall.append("Run flexible loads while your solar panels are producing instead of exporting the energy")
+        if standby_kwh.sum() > 5:
+            overall.append(f"Your devices use {standby_kwh.sum():.0f} kWh per month on standby; "
+                           "smart plugs or power strips can remove most of it")
+        if has_solar and not has_battery and rate_spread > 0.05:
+            overall.append("Consider home battery storage to use surplus solar energy during peak hours")
+        if not has_solar and active_kwh.sum() > 300:
+            overall.append("Your consumption is high enough that rooftop solar could pay back well; get a site assessment")
+        if not user_data.get('electricity_rate_plan'):
+            overall.append("Add your electricity rate plan to your profile for more accurate savings estimates")
+        if not overall:
+            overall.append("Your devices are already used efficiently; keep monitoring usage for changes")
+        return overall
+
+    def _schedule_optimization(self, devices_data, savings, has_solar):
+        flexible = savings[:, LEVER_SHIFT] + savings[:, LEVER_SOLAR]
+        # Only suggest fixed run times for loads the user can actually schedule
+        movable = np.fromiter(
+            (bool(d.get('is_schedulable') or d.get('is_ev_charger') or (d.get('usage_flexibility') or 0) >= 5)
+             for d in devices_data), dtype=bool, count=len(devices_data)
+        )
+        flexible = np.where(movable, flexible, 0.0)
+        order = np.argsort(-flexible)
+        schedule = []
+        for i in order[:5]:
+            if flexible[i] <= 0.01:
+                break
+            device = devices_data[i]
+            name = device.get('name', 'Device')
+            if device.get('is_ev_charger'):
+                window = "10:00 and 15:00 to charge from solar" if has_solar else f"{self._peak_end_label()} and 06:00 at off-peak rates"
+                schedule.append(f"Charge your EV with {name} between {window}")
+            elif has_solar and savings[i, LEVER_SOLAR] >= savings[i, LEVER_SHIFT]:
+                schedule.append(f"Run {name} between 10:00 and 15:00 to use solar production")
+            else:
+                schedule.append(f"Run {name} after {self._peak_end_label()} to use off-peak rates")
+        return schedule
+
+    def _tips(self, devices_data):
+        tips = []
+        for type_name in dict.fromkeys(d.get('device_type_name') for d in devices_data):
+            tip = DEVICE_TIPS.get(type_name)
+            if tip:
+                tips.append(tip)
+        return (tips + GENERAL_TIPS)[:5]
+
+    def _peak_label(self):
+        return f"{self.peak_start // 60:02d}:00-{self._peak_end_label()}"
+
+    def _peak_end_label(self):
+        return f"{self.peak_end // 60:02d}:00"
+
+    @staticmethod
+    def _response(overall, device_recommendations, schedule, tips, monthly_savings, carbon_reduction):
+        return {
+            "success": True,
+            "source": "rules",
+            "recommendations": {
+                "overall_recommendations": overall,
+                "device_recommendations": device_recommendations,
+                "schedule_optimization": schedule,
+                "energy_saving_tips": tips,
+                "estimated_monthly_savings": round(monthly_savings, 2),
+                "carbon_reduction_potential": round(carbon_reduction, 1)
+            }
+        }
+
+
+def _minutes(value, default):
+    """Convert an 'HH:MM' string or time object to minutes after midnight"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        try:
+            hours, minutes = map(int, value.split(':')[:2])
+        except ValueError:
+            return default
+        return hours * 60 + minutes
+    return value.hour * 60 + value.minute
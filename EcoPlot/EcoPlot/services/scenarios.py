@@ -0,0 +1,495 @@
+# EcoPlot/services/scenarios.py
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import shared_memory
+import numpy as np
+from flask import current_app
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.services.battery_simulator import (
+    STEP_HOURS, STEP_SECONDS, STRATEGIES, clip_to_history, dispatch, household_series
+)
+from EcoPlot.services.energy_aggregation import KWH, distribute, load_usage, local_midnight, user_timezone
+from EcoPlot.services.tariffs import bill_from_inputs, get_tariff_engine
+
+logger = logging.getLogger(__name__)
+
+# Overrides a scenario may set on top of the current household
+OVERRIDES = ('solar_kw', 'battery_kwh', 'battery_kw', 'ev_daily_kwh', 'ev_charge_kw', 'swap', 'rate_plan', 'capex')
+
+# Per-slot arrays of each rate plan a request prices
+PLAN_ARRAYS = ('price', 'export_price', 'demand')
+
+
+def parse_scenario(spec, plans, devices):
+    """
+    Validate one scenario of a request.
+
+    Args:
+        spec (dict): name and any of OVERRIDES; swap is a list of
+            {device_id, power_watts, cost} replacing a device with one of another power
+        plans (dict): Rate plans by name
+        devices (dict): The user's devices by id
+
+    Returns:
+        dict: The scenario with numeric overrides as floats
+
+    Raises:
+        ValueError: For unknown overrides, plans or devices and negative amounts
+    """
+    if not isinstance(spec, dict):
+        raise ValueError('Each scenario must be an object')
+    unknown = set(spec) - set(OVERRIDES) - {'name'}
+    if unknown:
+        raise ValueError(f"Unknown scenario fields: {', '.join(sorted(unknown))}")
+
+    scenario = {'name': str(spec.get('name') or '')[:100]}
+    for field in ('solar_kw', 'battery_kwh', 'battery_kw', 'ev_daily_kwh', 'ev_charge_kw', 'capex'):
+        value = spec.get(field)
+        if value is None:
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a number")
+        if not math.isfinite(value) or value < 0:
+            raise ValueError(f"{field} must be a non-negative number")
+        scenario[field] = value
+
+    if spec.get('rate_plan') is not None:
+        if spec['rate_plan'] not in plans:
+            raise ValueError(f"Unknown rate plan: {spec['rate_plan']}")
+        scenario['rate_plan'] = spec['rate_plan']
+
+    swaps = []
+    for swap in spec.get('swap') or []:
+        try:
+            device_id = int(swap['device_id'])
+            power_watts = float(swap['power_watts'])
+            cost = float(swap.get('cost') or 0)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Each swap needs a device_id and power_watts')
+        device = devices.get(device_id)
+        if device is None:
+            raise ValueError(f"Device {device_id} not found")
+        if not device.power_consumption_watts:
+            raise ValueError(f"Device {device_id} has no power rating to scale its usage by")
+        if power_watts < 0 or cost < 0:
+            raise ValueError('Swap power and cost must be non-negative')
+        swaps.append({'device_id': device_id, 'scale': power_watts / device.power_consumption_watts, 'cost': cost})
+    if swaps:
+        scenario['swap'] = swaps
+    return scenario
+
+
+def device_series(user, tz, edges, device_ids):
+    """
+    Energy of some devices in each step, from their hourly rollups or else their logs.
+
+    Returns:
+        dict: device id -> kWh per step
+    """
+    from EcoPlot.services.usage_rollups import load_rollup_bins
+    per_hour = 3600 // STEP_SECONDS
+    series = {}
+    missing = []
+    for device_id in device_ids:
+        bins = None
+        if edges[0] % 3600 == 0 and (edges.size - 1) % per_hour == 0:
+            bins = load_rollup_bins(user.id, tz, 'hour', edges[::per_hour], device_id=device_id)
+        if bins is None:
+            missing.append(device_id)
+        else:
+            series[device_id] = np.repeat(bins[KWH] / per_hour, per_hour)
+    if missing:
+        log_devices, start, end, values = load_usage(user.id, int(edges[0]), int(edges[-1]))
+        for device_id in missing:
+            rows = log_devices == device_id
+            series[device_id] = distribute(edges, start[rows], end[rows], values[KWH:KWH + 1, rows])[0]
+    return series
+
+
+def ev_load(local_minute, peak, daily_kwh, charge_kw, plug_in_minute, departure_minute):
+    """
+    Energy an added EV draws in each step when charged every night.
+
+    Each night's session fills the off-peak steps of the plug-in window first, in
+    time order, then the peak ones, as the EV planner's cheapest preference does.
+
+    Args:
+        local_minute (ndarray): Local minute of day of each step
+        peak (ndarray): True in steps priced above the plan's cheapest period
+        daily_kwh (float): Energy drawn per night
+        charge_kw (float): Charger power
+        plug_in_minute, departure_minute (int): Local window of each session
+
+    Returns:
+        ndarray: kWh per step
+    """
+    load = np.zeros(local_minute.size)
+    step_minutes = STEP_SECONDS // 60
+    width = ((departure_minute - plug_in_minute) % 1440 or 1440) // step_minutes
+    starts = np.flatnonzero((local_minute // step_minutes) == plug_in_minute // step_minutes)
+    starts = starts[starts + width <= local_minute.size]
+    if not starts.size or daily_kwh <= 0 or charge_kw <= 0:
+        return load
+    steps = starts[:, None] + np.arange(width)
+    # Off-peak steps first, each group in time order
+    order = np.argsort(peak[steps] * width + np.arange(width), axis=1, kind='stable')
+    step_kwh = charge_kw * STEP_HOURS
+    filled = np.clip(daily_kwh - np.arange(width) * step_kwh, 0, step_kwh)
+    load[np.take_along_axis(steps, order, axis=1)] = filled
+    return load
+
+
+def evaluate(arrays, scenario, plans, settings):
+    """
+    Run the consumption, solar, battery and tariff pipelines for one scenario.
+
+    Args:
+        arrays (dict): Base household arrays from household_model, possibly shared memory views
+        scenario (dict): From parse_scenario, with rate_plan filled in
+        plans (dict): Plan name -> bill terms (months, month_share, tiers, demand_charge_per_kw,
+            fixed_monthly)
+        settings (dict): Battery and EV assumptions of the request, and the share of the
+            year the arrays cover
+
+    Returns:
+        dict: Annual cost and carbon, scaled up from the covered share of the year, and
+            the energy figures and bill of the covered window
+    """
+    plan = scenario['rate_plan']
+    inputs = dict(plans[plan], month=arrays['month'],
+                  **{name: arrays[f"{plan}:{name}"] for name in PLAN_ARRAYS})
+    price = inputs['price']
+    peak = price > price.min() + 1e-9
+
+    consumption = arrays['consumption']
+    for swap in scenario.get('swap', []):
+        consumption = consumption + arrays[f"device:{swap['device_id']}"] * (swap['scale'] - 1)
+    if scenario.get('ev_daily_kwh'):
+        consumption = consumption + ev_load(
+            arrays['local_minute'], peak, scenario['ev_daily_kwh'] / settings['ev_efficiency'],
+            scenario.get('ev_charge_kw') or settings['ev_charge_kw'],
+            settings['ev_plug_in_minute'], settings['ev_departure_minute']
+        )
+    production = arrays['production']
+    if scenario.get('solar_kw'):
+        production = production + scenario['solar_kw'] * arrays['solar_per_kw']
+
+    net = (consumption - production)[None]
+    strategies = [None]
+    capacity = scenario.get('battery_kwh') or 0.0
+    if capacity > 0:
+        power = scenario.get('battery_kw') or capacity * settings['battery_c_rate']
+        efficiency = settings['battery_efficiency']
+        off_peak = price[~peak]
+        grid_charging = bool(production.sum() <= 0 and peak.any() and off_peak.size
+                             and price[peak].min() * efficiency > off_peak.max())
+        result = dispatch(consumption, production, peak, capacity, power, efficiency,
+                          settings['battery_reserve'], grid_charging=grid_charging)
+        net = net + result['charge_kwh'] - result['discharge_kwh']
+        strategies = list(STRATEGIES)
+
+    # The battery runs the strategy with the lowest bill
+    best = None
+    for index, strategy in enumerate(strategies):
+        grid_import = np.maximum(net[index], 0)
+        grid_export = np.maximum(-net[index], 0)
+        bill = bill_from_inputs(inputs, grid_import, grid_export, monthly=False)
+        if best is None or bill['total'] < best[0]['total']:
+            best = (bill, strategy, grid_import, grid_export)
+    bill, strategy, grid_import, grid_export = best
+
+    total_consumption = float(consumption.sum())
+    imported = float(grid_import.sum())
+    return {
+        'annual_cost': round(bill['total'] / settings['coverage'], 2),
+        'bill': {name: round(value, 2) for name, value in bill.items()},
+        'carbon_kg': round(float(grid_import @ arrays['intensity']) / settings['coverage'], 1),
+        'consumption_kwh': round(total_consumption, 1),
+        'production_kwh': round(float(production.sum()), 1),
+        'grid_import_kwh': round(imported, 1),
+        'grid_export_kwh': round(float(grid_export.sum()), 1),
+        'self_sufficiency': round(max(1 - imported / total_consumption, 0), 3) if total_consumption else None,
+        'battery_strategy': strategy
+    }
+
+
+def share_arrays(arrays):
+    """
+    Copy arrays into one shared memory block.
+
+    Returns:
+        tuple: (SharedMemory, layout of name -> (offset, shape, dtype)) to attach with attach_arrays
+    """
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        offset = -(-offset // 64) * 64  # keep each array aligned
+        layout[name] = (offset, array.shape, array.dtype.str)
+        offset += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, array in arrays.items():
+        start, shape, dtype = layout[name]
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)[...] = array
+    return block, layout
+
+
+def attach_arrays(name, layout):
+    """Read-only views of the arrays in a block written by share_arrays"""
+    block = shared_memory.SharedMemory(name=name)
+    arrays = {}
+    for array_name, (offset, shape, dtype) in layout.items():
+        view = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+        view.flags.writeable = False
+        arrays[array_name] = view
+    return block, arrays
+
+
+def evaluate_shared(block_name, layout, scenarios, plans, settings):
+    """Worker entry point: evaluate scenarios against the base arrays in shared memory"""
+    block, arrays = attach_arrays(block_name, layout)
+    try:
+        return [evaluate(arrays, scenario, plans, settings) for scenario in scenarios]
+    finally:
+        del arrays
+        block.close()
+
+
+class ScenarioPool:
+    """Worker processes evaluating scenarios, started on first use and kept for later requests"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def map(self, arrays, scenarios, plans, settings):
+        """
+        Evaluate scenarios in the workers, one chunk per worker, sharing the base arrays.
+        A pool broken by a dead worker is replaced and the scenarios are tried once more.
+
+        Returns:
+            list: Results in the order of scenarios
+
+        Raises:
+            BrokenProcessPool: If the replacement pool breaks as well
+        """
+        block, layout = share_arrays(arrays)
+        try:
+            size = -(-len(scenarios) // self.workers)
+            for attempt in range(2):
+                executor = self.executor()
+                try:
+                    futures = [
+                        executor.submit(evaluate_shared, block.name, layout, scenarios[offset:offset + size],
+                                        plans, settings)
+                        for offset in range(0, len(scenarios), size)
+                    ]
+                    return [result for future in futures for result in future.result()]
+                except BrokenProcessPool:
+                    # A worker died, e.g. killed for memory; the executor takes no more work
+                    self._discard(executor)
+                    if attempt:
+                        raise
+                    logger.warning("Scenario worker pool broke, starting a new one")
+        finally:
+            block.close()
+            block.unlink()
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+def household_model(user, scenarios, now=None):
+    """
+    Build the base arrays of the household's last 365 days at 15-minute resolution,
+    clipped to its usage history when that is shorter.
+
+    Args:
+        user (User): Household being modeled
+        scenarios (list): Parsed scenarios, deciding which plans and devices are needed
+        now (datetime, optional): Aware reference time, defaults to the current time
+
+    Returns:
+        tuple: (arrays dict, plan terms by name, first and last edge of the window, share
+            of the year the window covers)
+
+    Raises:
+        ValueError: Without a location for added solar or with too little usage history
+    """
+    from EcoPlot.services.carbon_accounting import get_grid_intensity, local_epoch, local_hour_of_year
+    from EcoPlot.services.solar_model import get_solar_model, solar_sites
+    tz = user_timezone(user)
+    today = local_midnight((now or datetime.now(tz)).astimezone(tz), tz)
+    end = int(today.timestamp()) // 3600 * 3600
+    edges = np.arange(end - 365 * 86400, end + 1, STEP_SECONDS, dtype=np.int64)
+
+    consumption, production = household_series(user, edges, tz)
+    edges, consumption, production, coverage = clip_to_history(edges, consumption, production)
+    epoch = edges[:-1]
+    arrays = {'consumption': consumption, 'production': production}
+
+    # Output of 1 kW of new panels at the household's site and orientation
+    if any(scenario.get('solar_kw') for scenario in scenarios):
+        if user.latitude is None or user.longitude is None:
+            raise ValueError('Set a location in your profile to model added solar')
+        site = {
+            'latitude': user.latitude, 'longitude': user.longitude, 'has_solar': True, 'solar_capacity_kw': 1.0,
+            'solar_panel_tilt': user.solar_panel_tilt, 'solar_panel_orientation': user.solar_panel_orientation
+        }
+        arrays['solar_per_kw'] = get_solar_model().energy(solar_sites([site]), edges)[0] * \
+            current_app.config.get('BATTERY_SIM_CLEAR_SKY_SHARE', 0.75)
+
+    zone = np.zeros(epoch.size, dtype=np.int64)
+    arrays['local_minute'] = (local_epoch(epoch, zone, [tz.key]) % 86400 // 60).astype(np.int16)
+    profiles = get_grid_intensity()
+    arrays['intensity'] = profiles.table[profiles.region_row(user.country, user.state),
+                                         local_hour_of_year(epoch + STEP_SECONDS // 2, zone, [tz.key])]
+
+    swapped = sorted({swap['device_id'] for scenario in scenarios for swap in scenario.get('swap', [])})
+    for device_id, series in device_series(user, tz, edges, swapped).items():
+        arrays[f"device:{device_id}"] = series
+
+    engine = get_tariff_engine()
+    plans = {}
+    for name in sorted({scenario['rate_plan'] for scenario in scenarios}):
+        inputs = engine.bill_inputs(user, int(epoch[0]), epoch.size, name)
+        for array_name in PLAN_ARRAYS:
+            arrays[f"{name}:{array_name}"] = inputs[array_name]
+        arrays['month'] = inputs['month']
+        plans[name] = {key: inputs[key] for key in ('months', 'month_share', 'tiers', 'demand_charge_per_kw',
+                                                    'fixed_monthly')}
+    return arrays, plans, (int(edges[0]), int(edges[-1])), coverage
+
+
+class ScenarioService:
+    """What-if comparisons of the household with added solar, a battery, an EV or swapped devices"""
+
+    @staticmethod
+    def compare(user, specs, now=None):
+        """
+        Evaluate scenarios against the current household over the last year.
+
+        Args:
+            user (User): Household being modeled
+            specs (list): Scenario dicts, see parse_scenario
+            now (datetime, optional): Aware reference time, defaults to the current time
+
+        Returns:
+            dict: The current household's figures and each scenario's figures with
+                annual savings, carbon saved, capital cost and payback
+
+        Raises:
+            ValueError: For malformed scenarios or too many of them
+        """
+        config = current_app.config
+        limit = config.get('SCENARIO_MAX_PER_REQUEST', 50)
+        if not isinstance(specs, list) or not specs:
+            raise ValueError('Send a non-empty list of scenarios')
+        if len(specs) > limit:
+            raise ValueError(f"At most {limit} scenarios per request")
+
+        engine = get_tariff_engine()
+        devices = {device.id: device for device in db.session.query(Device).filter_by(user_id=user.id)}
+        current_plan = engine.plan_name(user)
+        scenarios = [{'name': 'current', 'rate_plan': current_plan}]
+        for index, spec in enumerate(specs):
+            scenario = parse_scenario(spec, engine.plans, devices)
+            scenario['name'] = scenario['name'] or f"scenario {index + 1}"
+            scenario.setdefault('rate_plan', current_plan)
+            scenarios.append(scenario)
+
+        settings = {
+            'battery_c_rate': config.get('BATTERY_MAX_C_RATE', 0.5),
+            'battery_efficiency': config.get('BATTERY_ROUND_TRIP_EFFICIENCY', 0.9),
+            'battery_reserve': config.get('BATTERY_BACKUP_RESERVE', 0.2),
+            'ev_efficiency': config.get('EV_CHARGING_EFFICIENCY', 0.9),
+            'ev_charge_kw': config.get('SCENARIO_EV_CHARGE_KW', 7.2),
+            'ev_plug_in_minute': config.get('EV_DEFAULT_PLUG_IN_HOUR', 18) * 60,
+            'ev_departure_minute': config.get('EV_DEFAULT_DEPARTURE_HOUR', 7) * 60
+        }
+
+        started = time.perf_counter()
+        arrays, plans, (start, end), coverage = household_model(user, scenarios, now)
+        settings['coverage'] = coverage
+        model_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        pool = get_scenario_pool()
+        if pool.workers > 1 and len(scenarios) >= config.get('SCENARIO_MIN_PARALLEL', 4):
+            results = pool.map(arrays, scenarios, plans, settings)
+        else:
+            results = [evaluate(arrays, scenario, plans, settings) for scenario in scenarios]
+        evaluate_ms = (time.perf_counter() - started) * 1000
+
+        baseline = results[0]
+        compared = []
+        for scenario, result in zip(scenarios[1:], results[1:]):
+            capex = scenario.get('capex')
+            if capex is None:
+                capex = (scenario.get('solar_kw', 0) * config.get('SCENARIO_SOLAR_COST_PER_KW', 2500.0)
+                         + scenario.get('battery_kwh', 0) * config.get('SCENARIO_BATTERY_COST_PER_KWH', 800.0)
+                         + sum(swap['cost'] for swap in scenario.get('swap', [])))
+            savings = baseline['annual_cost'] - result['annual_cost']
+            compared.append({
+                'name': scenario['name'],
+                'overrides': {key: value for key, value in scenario.items() if key != 'name'},
+                **result,
+                'annual_savings': round(savings, 2),
+                'carbon_saved_kg': round(baseline['carbon_kg'] - result['carbon_kg'], 1),
+                'capex': round(capex, 2),
+                'payback_years': round(capex / savings, 1) if capex > 0 and savings > 0 else None
+            })
+
+        logger.info(f"Evaluated {len(scenarios)} scenarios for user {user.id}: model {model_ms:.0f} ms, "
+                    f"scenarios {evaluate_ms:.0f} ms")
+        tz = user_timezone(user)
+        return {
+            'start': datetime.fromtimestamp(start, tz).isoformat(),
+            'end': datetime.fromtimestamp(end, tz).isoformat(),
+            'history_days': round((end - start) / 86400, 1),
+            'coverage': round(coverage, 3),
+            'months': next(iter(plans.values()))['months'],
+            'current': {'rate_plan': current_plan, **baseline},
+            'scenarios': compared,
+            'model_ms': round(model_ms, 1),
+            'evaluate_ms': round(evaluate_ms, 1)
+        }
+
+
+def init_scenarios(app):
+    """Create the scenario worker pool; its processes start on the first parallel request"""
+    workers = app.config.get('SCENARIO_WORKERS') or os.cpu_count() or 1
+    pool = ScenarioPool(workers)
+    app.extensions['scenario_pool'] = pool
+    return pool
+
+
+def get_scenario_pool():
+    """Return the scenario worker pool of the current app"""
+    return current_app.extensions['scenario_pool']
@@ -0,0 +1,164 @@
+# EcoPlot/services/single_flight.py
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from EcoPlot import db
+from EcoPlot.models.recommendation_lock import RecommendationLock
+
+
+class _Call:
+    """A call in flight that concurrent callers in this process wait on"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key so only one of them does the work.
+
+    Threads in the same process wait on the leader's in-flight call. Across processes
+    the leader holds a row in recommendation_locks; other processes wait for the row
+    to go away and then re-read the shared result (for example from the SQLite or Redis
+    recommendation cache) before falling back to doing the work themselves.
+    """
+    def __init__(self, lock_ttl=120, poll_interval=0.1):
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_across_processes = 0
+        self.lock_timeouts = 0
+
+    def do(self, key, fn, recheck=None):
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Args:
+            key (str): Input fingerprint identifying identical calls
+            fn (callable): Function doing the actual work
+            recheck (callable, optional): Returns the result another process stored
+                while we waited for its lock, or None
+
+        Returns:
+            tuple: (result, True if the result was produced by another caller)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                is_leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                is_leader = True
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+            waited = self._acquire_lock(key, owner)
+            try:
+                result = recheck() if (waited and recheck is not None) else None
+                if result is not None:
+                    with self._lock:
+                        self.coalesced_across_processes += 1
+                    shared = True
+                else:
+                    result = fn()
+            finally:
+                self._release_lock(key, owner)
+            call.result = result
+            return result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Return coalescing counters for monitoring"""
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesced_across_processes': self.coalesced_across_processes,
+                'lock_timeouts': self.lock_timeouts,
+                'in_flight': len(self._calls)
+            }
+
+    def _try_lock(self, key, owner):
+        table = RecommendationLock.__table__
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                # Take over locks left behind by a crashed holder
+                conn.execute(table.delete().where(table.c.key == key, table.c.expires_at < now))
+                conn.execute(table.insert().values(
+                    key=key,
+                    owner=owner,
+                    acquired_at=now,
+                    expires_at=now + timedelta(seconds=self.lock_ttl)
+                ))
+            return True
+        except IntegrityError:
+            return False
+
+    def _acquire_lock(self, key, owner):
+        """
+        Take the cross-process lock for key, waiting while another process holds it.
+
+        Returns:
+            bool: True if another process held the lock while we waited
+        """
+        if self._try_lock(key, owner):
+            return False
+
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            if self._try_lock(key, owner):
+                return True
+
+        # Never block forever on a stuck holder; do the work without the lock
+        with self._lock:
+            self.lock_timeouts += 1
+        return True
+
+    def _release_lock(self, key, owner):
+        table = RecommendationLock.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key, table.c.owner == owner))
+        except Exception as e:
+            current_app.logger.warning(f"Could not release recommendation lock: {str(e)}")
+
+
+def init_single_flight(app):
+    """Create the recommendation single-flight group for the app"""
+    single_flight = SingleFlight(
+        lock_ttl=app.config.get('RECOMMENDATION_LOCK_TTL', 120),
+        poll_interval=app.config.get('RECOMMENDATION_LOCK_POLL_INTERVAL', 0.1)
+    )
+    app.extensions['recommendation_single_flight'] = single_flight
+    return single_flight
+
+
+def get_single_flight():
+    """Return the recommendation single-flight group of the current app"""
+    return current_app.extensions['recommendation_single_flight']
@@ -0,0 +1,361 @@
+# EcoPlot/services/solar_model.py
+import math
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+import numpy as np
+from flask import current_app
+
+SOLAR_CONSTANT = 1361.0  # W/m2 at 1 AU
+DEFAULT_TILT = 20.0  # degrees, for profiles without a panel tilt
+ALBEDO = 0.2  # ground reflectance
+SAMPLE_SECONDS = 300  # resolution of the cached irradiance days
+SAMPLES_PER_DAY = 86400 // SAMPLE_SECONDS
+COMPUTE_BLOCK_DAYS = 64  # site-days of irradiance computed per vectorized pass
+
+# Panel orientation -> azimuth in degrees clockwise from north
+ORIENTATIONS = {
+    'north': 0, 'northeast': 45, 'east': 90, 'southeast': 135,
+    'south': 180, 'southwest': 225, 'west': 270, 'northwest': 315
+}
+
+
+def panel_azimuth(orientation, latitude=0.0):
+    """
+    Azimuth of a panel orientation from a profile.
+
+    Args:
+        orientation (str): Compass direction such as south or south-west, or degrees
+        latitude (float): Site latitude; panels without an orientation face the equator
+
+    Returns:
+        float: Degrees clockwise from north
+    """
+    if orientation:
+        text = str(orientation).strip().lower().replace('-', '').replace(' ', '')
+        if text in ORIENTATIONS:
+            return float(ORIENTATIONS[text])
+        try:
+            return float(text) % 360
+        except ValueError:
+            pass
+    return 0.0 if latitude < 0 else 180.0
+
+
+def _epoch(value):
+    if value is None:
+        return np.nan
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, tzinfo=timezone.utc).timestamp()
+    return float(value)
+
+
+def solar_sites(users):
+    """
+    Collect the panel setup of users as site arrays.
+
+    Users without solar, a capacity or a location get a capacity of 0 and so
+    produce nothing.
+
+    Args:
+        users (list): User models or dicts with the profile's solar fields
+
+    Returns:
+        dict: latitude, longitude, tilt, azimuth (degrees), capacity_kw and installed
+            (epoch seconds, NaN when unknown) arrays, in the order of users
+    """
+    def field(user, name):
+        return user.get(name) if isinstance(user, dict) else getattr(user, name, None)
+
+    latitude, longitude, tilt, azimuth, capacity, installed = [], [], [], [], [], []
+    for user in users:
+        lat, lon = field(user, 'latitude'), field(user, 'longitude')
+        located = lat is not None and lon is not None
+        latitude.append(lat if located else 0.0)
+        longitude.append(lon if located else 0.0)
+        panel_tilt = field(user, 'solar_panel_tilt')
+        tilt.append(DEFAULT_TILT if panel_tilt is None else panel_tilt)
+        azimuth.append(panel_azimuth(field(user, 'solar_panel_orientation'), latitude[-1]))
+        has_panels = located and field(user, 'has_solar') and field(user, 'solar_capacity_kw')
+        capacity.append(field(user, 'solar_capacity_kw') if has_panels else 0.0)
+        installed.append(_epoch(field(user, 'solar_installation_date')))
+    return {
+        'latitude': np.array(latitude, dtype=np.float64),
+        'longitude': np.array(longitude, dtype=np.float64),
+        'tilt': np.clip(np.array(tilt, dtype=np.float64), 0, 90),
+        'azimuth': np.array(azimuth, dtype=np.float64),
+        'capacity_kw': np.array(capacity, dtype=np.float64),
+        'installed': np.array(installed, dtype=np.float64)
+    }
+
+
+def sun_ephemeris(epoch):
+    """
+    Low-precision sun ephemeris (Astronomical Almanac), about 0.01 degrees through 2050.
+
+    Args:
+        epoch (ndarray): UTC epoch seconds
+
+    Returns:
+        tuple: (declination and Greenwich hour angle in radians, extraterrestrial
+            irradiance in W/m2)
+    """
+    n = epoch / 86400.0 - 10957.5  # days since 2000-01-01 12:00 UTC
+    mean_longitude = np.radians((280.460 + 0.9856474 * n) % 360)
+    anomaly = np.radians((357.528 + 0.9856003 * n) % 360)
+    ecliptic = mean_longitude + np.radians(1.915) * np.sin(anomaly) + np.radians(0.020) * np.sin(2 * anomaly)
+    obliquity = np.radians(23.439 - 0.0000004 * n)
+    right_ascension = np.arctan2(np.cos(obliquity) * np.sin(ecliptic), np.cos(ecliptic))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(ecliptic))
+    sidereal = np.radians(((18.697374558 + 24.06570982441908 * n) % 24) * 15)
+    distance = 1.00014 - 0.01671 * np.cos(anomaly) - 0.00014 * np.cos(2 * anomaly)  # AU
+    return declination, sidereal - right_ascension, SOLAR_CONSTANT / distance ** 2
+
+
+def plane_of_array(declination, cos_hour, sin_hour, extraterrestrial, latitude, tilt, azimuth):
+    """
+    Clear-sky irradiance on tilted panels.
+
+    Beam irradiance follows Meinel's air mass model with Young's air mass, diffuse
+    sky irradiance is taken as isotropic and the ground reflects ALBEDO of the
+    global horizontal irradiance. Sun and panel are compared as vectors and the air
+    mass is a rational function of the sun's height, so no angles are recovered
+    per sample.
+
+    Args:
+        declination (ndarray): Sun declination in radians
+        cos_hour, sin_hour (ndarray): Cosine and sine of the local hour angle
+        extraterrestrial (ndarray): Irradiance above the atmosphere in W/m2
+        latitude, tilt, azimuth (ndarray): Site and panel in degrees; all arguments
+            are broadcast together
+
+    Returns:
+        ndarray: Plane-of-array irradiance in W/m2
+    """
+    phi = np.radians(latitude)
+    sin_phi, cos_phi = np.sin(phi), np.cos(phi)
+    sin_dec, cos_dec = np.sin(declination), np.cos(declination)
+    # Sun direction in east, north, up coordinates
+    east = -cos_dec * sin_hour
+    north = sin_dec * cos_phi - cos_dec * sin_phi * cos_hour
+    up = sin_dec * sin_phi + cos_dec * cos_phi * cos_hour
+
+    c = np.maximum(up, 1e-3)
+    c2 = c * c
+    air_mass = (1.002432 * c2 + 0.148386 * c + 0.0096467) / (c2 * c + 0.149864 * c2 + 0.0102963 * c + 0.000303978)
+    beam = np.where(up > 0, extraterrestrial * np.exp(math.log(0.7) * np.exp(0.678 * np.log(air_mass))), 0)
+    diffuse = 0.1 * beam
+    horizontal = beam * c + diffuse
+
+    tilt, azimuth = np.radians(tilt), np.radians(azimuth)
+    sin_tilt, cos_tilt = np.sin(tilt), np.cos(tilt)
+    cos_incidence = sin_tilt * (east * np.sin(azimuth) + north * np.cos(azimuth)) + up * cos_tilt
+    return (beam * np.maximum(cos_incidence, 0) + diffuse * (1 + cos_tilt) / 2
+            + horizontal * ALBEDO * (1 - cos_tilt) / 2)
+
+
+def clear_sky_irradiance(epoch, latitude, longitude, tilt, azimuth):
+    """
+    Clear-sky plane-of-array irradiance at arbitrary timestamps, without caching.
+
+    Args:
+        epoch (ndarray): UTC epoch seconds
+        latitude, longitude, tilt, azimuth (ndarray): Site and panel in degrees,
+            broadcast against epoch
+
+    Returns:
+        ndarray: W/m2
+    """
+    declination, greenwich_hour, extraterrestrial = sun_ephemeris(np.asarray(epoch, dtype=np.float64))
+    hour = greenwich_hour + np.radians(longitude)
+    return plane_of_array(declination, np.cos(hour), np.sin(hour), extraterrestrial, latitude, tilt, azimuth)
+
+
+# Hour angle of each sample of a day relative to noon UTC, shared by all cached days
+_SAMPLE_ANGLE = 2 * np.pi * (np.arange(SAMPLES_PER_DAY) * SAMPLE_SECONDS / 86400.0 - 0.5)
+_COS_SAMPLE, _SIN_SAMPLE = np.cos(_SAMPLE_ANGLE).astype(np.float32), np.sin(_SAMPLE_ANGLE).astype(np.float32)
+
+
+def _day_irradiance(days, latitude, longitude, tilt, azimuth):
+    """
+    Irradiance of whole UTC days at SAMPLE_SECONDS steps.
+
+    The ephemeris is evaluated once per day at noon: within a day the declination
+    moves under 0.5 degrees and the equation of time under 30 seconds.
+
+    Args:
+        days (ndarray): UTC days since the epoch
+        latitude, longitude, tilt, azimuth (ndarray): Site and panel of each day
+
+    Returns:
+        ndarray: (days, SAMPLES_PER_DAY) float32 W/m2
+    """
+    declination, greenwich_hour, extraterrestrial = sun_ephemeris(days * 86400.0 + 43200)
+    offset = greenwich_hour + np.radians(longitude)
+    cos_offset, sin_offset = column(np.cos(offset)), column(np.sin(offset))
+    # Angle sum identities keep the per-sample work to multiplications
+    cos_hour = cos_offset * _COS_SAMPLE - sin_offset * _SIN_SAMPLE
+    sin_hour = sin_offset * _COS_SAMPLE + cos_offset * _SIN_SAMPLE
+    return plane_of_array(column(declination), cos_hour, sin_hour, column(extraterrestrial),
+                          column(latitude), column(tilt), column(azimuth))
+
+
+def column(values):
+    return np.asarray(values, dtype=np.float32)[:, None]
+
+
+class SolarModel:
+    """
+    Clear-sky production of rooftop panels, vectorized over sites and timestamps.
+
+    Irradiance is computed per (location tile, tilt, azimuth, UTC day) at
+    SAMPLE_SECONDS resolution and kept in an LRU cache, so households on nearby
+    roofs with the same panel geometry share the work. Output at other timestamps
+    is interpolated from the cached days.
+    """
+
+    def __init__(self, tile_degrees=0.05, max_days=20000, performance_ratio=0.8, degradation_per_year=0.005):
+        self.tile_degrees = tile_degrees
+        self.max_days = max_days
+        self.performance_ratio = performance_ratio  # AC output per kW of rating at 1000 W/m2
+        self.degradation_per_year = degradation_per_year
+        self._days = OrderedDict()
+        self._lock = threading.Lock()
+        self.computed_days = 0
+
+    def _geometry_keys(self, sites):
+        """Cache keys of the sites' tiles and panel geometry, and the index of each site's key"""
+        geometry = np.stack([
+            np.round(sites['latitude'] / self.tile_degrees),
+            np.round(sites['longitude'] / self.tile_degrees),
+            np.round(sites['tilt']),
+            np.round(sites['azimuth']) % 360
+        ], axis=1).astype(np.int64)
+        return np.unique(geometry, axis=0, return_inverse=True)
+
+    def irradiance_days(self, sites, first_day, days):
+        """
+        Plane-of-array irradiance of the sites over whole UTC days.
+
+        Args:
+            sites (dict): From solar_sites
+            first_day (int): First UTC day, in days since the epoch
+            days (int): Number of days
+
+        Returns:
+            ndarray: (sites, days * SAMPLES_PER_DAY + 1) W/m2 at SAMPLE_SECONDS steps
+                from the start of first_day, including the end of the last day
+        """
+        keys, inverse = self._geometry_keys(sites)
+        wanted = range(first_day, first_day + days + 1)  # the next day supplies the closing sample
+        rows = np.empty((len(keys), days + 1, SAMPLES_PER_DAY), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for key_index, key in enumerate(map(tuple, keys.tolist())):
+                for day_index, day in enumerate(wanted):
+                    cached = self._days.get(key + (day,))
+                    if cached is None:
+                        missing.append((key_index, day_index))
+                    else:
+                        self._days.move_to_end(key + (day,))
+                        rows[key_index, day_index] = cached
+
+        if missing:
+            key_index, day_index = np.array(missing, dtype=np.int64).T
+            geometry = keys[key_index].astype(np.float64)
+            computed = np.empty((len(missing), SAMPLES_PER_DAY), dtype=np.float32)
+            # Blocks of days small enough for the temporaries to stay in the CPU cache
+            for block in range(0, len(missing), COMPUTE_BLOCK_DAYS):
+                part = slice(block, block + COMPUTE_BLOCK_DAYS)
+                computed[part] = _day_irradiance(first_day + day_index[part], geometry[part, 0] * self.tile_degrees,
+                                                 geometry[part, 1] * self.tile_degrees, geometry[part, 2],
+                                                 geometry[part, 3])
+            rows[key_index, day_index] = computed
+            with self._lock:
+                for index, (key_row, day) in enumerate(zip(keys[key_index].tolist(), (first_day + day_index).tolist())):
+                    self._days[tuple(key_row) + (day,)] = computed[index]
+                while len(self._days) > self.max_days:
+                    self._days.popitem(last=False)
+                self.computed_days += len(missing)
+
+        flat = rows.reshape(len(keys), -1)[:, :days * SAMPLES_PER_DAY + 1]
+        return flat[inverse.reshape(-1)]
+
+    def _derating(self, sites, epoch):
+        """Output per W/m2 of irradiance in kW, with age-based degradation at the given times"""
+        age_years = np.maximum(epoch - sites['installed'][:, None], 0) / (365.25 * 86400)
+        age_years = np.nan_to_num(age_years)
+        return (sites['capacity_kw'][:, None] * self.performance_ratio / 1000
+                * np.maximum(1 - self.degradation_per_year * age_years, 0))
+
+    def _window(self, epoch_start, epoch_end):
+        first_day = int(np.floor(epoch_start / 86400))
+        days = max(int(np.ceil(epoch_end / 86400)) - first_day, 1)
+        return first_day, days
+
+    def power(self, sites, epoch):
+        """
+        Clear-sky AC output of the sites at arbitrary timestamps.
+
+        Args:
+            sites (dict): From solar_sites
+            epoch (ndarray): UTC epoch seconds, shared by all sites
+
+        Returns:
+            ndarray: (sites, timestamps) kW
+        """
+        epoch = np.asarray(epoch, dtype=np.float64)
+        if not epoch.size or not len(sites['capacity_kw']):
+            return np.zeros((len(sites['capacity_kw']), epoch.size))
+        first_day, days = self._window(epoch.min(), epoch.max())
+        irradiance = self.irradiance_days(sites, first_day, days)
+        position = (epoch - first_day * 86400.0) / SAMPLE_SECONDS
+        lower = np.minimum(position.astype(np.int64), irradiance.shape[1] - 2)
+        weight = (position - lower).astype(np.float32)
+        interpolated = irradiance[:, lower] * (1 - weight) + irradiance[:, lower + 1] * weight
+        return interpolated * self._derating(sites, epoch)
+
+    def energy(self, sites, edges):
+        """
+        Clear-sky AC energy of the sites between consecutive bin edges.
+
+        Args:
+            sites (dict): From solar_sites
+            edges (ndarray): Increasing UTC epoch seconds
+
+        Returns:
+            ndarray: (sites, len(edges) - 1) kWh
+        """
+        edges = np.asarray(edges, dtype=np.float64)
+        if edges.size < 2 or not len(sites['capacity_kw']):
+            return np.zeros((len(sites['capacity_kw']), max(edges.size - 1, 0)))
+        first_day, days = self._window(edges[0], edges[-1])
+        irradiance = self.irradiance_days(sites, first_day, days)
+        # Trapezoidal running total of Wh/m2 on the sample grid, interpolated at the edges
+        steps = (irradiance[:, 1:] + irradiance[:, :-1]) * (SAMPLE_SECONDS / 3600 / 2)
+        cumulative = np.zeros(irradiance.shape, dtype=np.float64)
+        np.cumsum(steps, axis=1, out=cumulative[:, 1:])
+        position = np.clip((edges - first_day * 86400.0) / SAMPLE_SECONDS, 0, irradiance.shape[1] - 1)
+        lower = np.minimum(position.astype(np.int64), irradiance.shape[1] - 2)
+        weight = position - lower
+        at_edges = cumulative[:, lower] * (1 - weight) + cumulative[:, lower + 1] * weight
+        return np.diff(at_edges, axis=1) * self._derating(sites, (edges[1:] + edges[:-1]) / 2)
+
+
+def init_solar_model(app):
+    """Create the solar production model and its irradiance cache for the app"""
+    model = SolarModel(
+        tile_degrees=app.config.get('SOLAR_MODEL_TILE_DEGREES', 0.05),
+        max_days=app.config.get('SOLAR_MODEL_CACHE_DAYS', 20000),
+        performance_ratio=app.config.get('SOLAR_PERFORMANCE_RATIO', 0.8),
+        degradation_per_year=app.config.get('SOLAR_DEGRADATION_PER_YEAR', 0.005)
+    )
+    app.extensions['solar_model'] = model
+    return model
+
+
+def get_solar_model():
+    """Return the solar production model of the current app"""
+    return current_app.extensions['solar_model']
@@ -0,0 +1,618 @@
+# EcoPlot/services/synthetic_data.py
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_brand import DeviceBrand
+from EcoPlot.models.device_type import DeviceType
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.user import User
+from EcoPlot.services.usage_archive import UsageArchiveService
+from EcoPlot.services.energy_aggregation import usage_values
+from EcoPlot.services.usage_rollups import UsageRollupService, driver_datetimes, execute_driver_many
+
+RESOLUTIONS = {'hour': 60, 'minute': 1}  # minutes covered by one log
+STORAGES = ('rows', 'archive')
+PASSWORD = 'synthetic'  # of every generated user
+MIN_DUTY = 0.02  # share of an hour below which a device counts as off
+INSERT_BATCH_SIZE = 5000
+
+# Energy sources of the generated logs, by code
+SOURCES = ('grid', 'solar', 'battery')
+GRID, SOLAR, BATTERY = range(3)
+
+# City, state, timezone, latitude, longitude, mean temperature and seasonal amplitude in C
+CITIES = (
+    ('Seattle', 'WA', 'America/Los_Angeles', 47.6, -122.3, 11.5, 7.5),
+    ('Los Angeles', 'CA', 'America/Los_Angeles', 34.1, -118.2, 18.5, 4.5),
+    ('Phoenix', 'AZ', 'America/Phoenix', 33.4, -112.1, 24.0, 10.0),
+    ('Denver', 'CO', 'America/Denver', 39.7, -105.0, 10.5, 11.5),
+    ('Austin', 'TX', 'America/Chicago', 30.3, -97.7, 21.0, 8.5),
+    ('Chicago', 'IL', 'America/Chicago', 41.9, -87.6, 10.5, 13.5),
+    ('Atlanta', 'GA', 'America/New_York', 33.7, -84.4, 17.5, 9.0),
+    ('Miami', 'FL', 'America/New_York', 25.8, -80.2, 25.5, 3.5),
+    ('New York', 'NY', 'America/New_York', 40.7, -74.0, 13.0, 11.5),
+    ('Boston', 'MA', 'America/New_York', 42.4, -71.1, 11.0, 12.0),
+)
+
+# Usage through the local day, scaled to a mean of 1 below
+FLAT = (1,) * 24
+MORNING_EVENING = (3, 3, 3, 3, 4, 6, 9, 10, 8, 6, 5, 5, 5, 5, 5, 6, 7, 9, 10, 10, 9, 8, 6, 4)
+EVENING = (2, 1, 1, 1, 1, 2, 4, 5, 4, 3, 3, 3, 3, 3, 3, 4, 6, 9, 10, 10, 10, 9, 7, 4)
+DAYTIME = (1, 1, 1, 1, 1, 1, 1, 3, 6, 8, 9, 10, 10, 10, 10, 9, 8, 7, 6, 5, 3, 2, 1, 1)
+MEALS = (0, 0, 0, 0, 0, 1, 6, 10, 6, 2, 1, 3, 6, 3, 1, 1, 2, 6, 10, 7, 3, 1, 0, 0)
+AFTER_DINNER = (1, 0, 0, 0, 0, 0, 1, 2, 2, 1, 1, 1, 1, 1, 1, 1, 1, 2, 4, 8, 10, 8, 4, 2)
+DAYTIME_CHORES = (0, 0, 0, 0, 0, 0, 1, 3, 6, 8, 9, 8, 7, 7, 7, 6, 6, 6, 5, 5, 4, 2, 1, 0)
+
+# Device type of the seeded catalog -> how households own and use it.
+# share: households owning one; watts: rated power range; kind duty: level is the mean
+# share of each hour the device runs; kind runs: level is runs per week, each up to an
+# hour long and starting at hours drawn from the shape; weekend: weekend usage factor
+DEVICE_TEMPLATES = {
+    'Refrigerator': {'share': 1.0, 'watts': (100, 200), 'kind': 'duty', 'shape': FLAT, 'level': 0.4,
+                     'weekend': 1.0, 'season': 'fridge'},
+    'HVAC': {'share': 0.9, 'watts': (2500, 5000), 'kind': 'duty', 'shape': MORNING_EVENING, 'level': 1.0,
+             'weekend': 1.1, 'season': 'hvac'},
+    'Water Heater': {'share': 0.8, 'watts': (3000, 4500), 'kind': 'duty', 'shape': MORNING_EVENING,
+                     'level': 0.1, 'weekend': 1.1, 'season': 'winter'},
+    'Lighting': {'share': 1.0, 'watts': (100, 400), 'kind': 'duty', 'shape': EVENING, 'level': 0.3,
+                 'weekend': 1.05, 'season': 'daylight'},
+    'Television': {'share': 0.9, 'watts': (80, 200), 'kind': 'duty', 'shape': EVENING, 'level': 0.2,
+                   'weekend': 1.3, 'season': None},
+    'Computer': {'share': 0.8, 'watts': (60, 250), 'kind': 'duty', 'shape': DAYTIME, 'level': 0.3,
+                 'weekend': 0.7, 'season': None},
+    'Small Kitchen Appliance': {'share': 0.9, 'watts': (800, 1500), 'kind': 'duty', 'shape': MEALS,
+                                'level': 0.04, 'weekend': 1.2, 'season': None},
+    'Smart Speaker': {'share': 0.5, 'watts': (3, 8), 'kind': 'duty', 'shape': FLAT, 'level': 1.0,
+                      'weekend': 1.0, 'season': None},
+    'Pool Pump': {'share': 0.12, 'watts': (750, 1500), 'kind': 'duty', 'shape': DAYTIME, 'level': 0.45,
+                  'weekend': 1.0, 'season': 'summer'},
+    'Dishwasher': {'share': 0.7, 'watts': (1200, 1800), 'kind': 'runs', 'shape': AFTER_DINNER, 'level': 5,
+                   'weekend': 1.2, 'season': None},
+    'Washing Machine': {'share': 0.85, 'watts': (400, 900), 'kind': 'runs', 'shape': DAYTIME_CHORES,
+                        'level': 4, 'weekend': 1.8, 'season': None},
+    'Dryer': {'share': 0.65, 'watts': (2000, 3500), 'kind': 'runs', 'shape': DAYTIME_CHORES, 'level': 3,
+              'weekend': 1.8, 'season': None},
+}
+EV_CHARGER = 'EV Charger'  # owned by the households with an EV
+TYPE_NAMES = tuple(DEVICE_TEMPLATES) + (EV_CHARGER,)
+SHAPES = np.array([DEVICE_TEMPLATES[name]['shape'] for name in DEVICE_TEMPLATES] + [FLAT], dtype=np.float32)
+SHAPES /= SHAPES.mean(axis=1, keepdims=True)
+FLEXIBLE_TYPES = ('Dishwasher', 'Washing Machine', 'Dryer', 'Pool Pump', EV_CHARGER)
+
+EV_MODELS = (('Tesla', 'Model 3', 60, 11.5), ('Tesla', 'Model Y', 75, 11.5), ('Nissan', 'Leaf', 40, 7.2),
+             ('Chevrolet', 'Bolt', 65, 7.2), ('Ford', 'Mustang Mach-E', 88, 11.5), ('Hyundai', 'Ioniq 5', 77, 11.5))
+BATTERY_BRANDS = ('Tesla Powerwall', 'Enphase', 'LG RESU', 'Generac PWRcell')
+
+
+def load_catalog():
+    """
+    Read the seeded device catalog.
+
+    Returns:
+        dict: Device type name -> (type id, [(brand id, brand name)])
+    """
+    types = DeviceType.__table__
+    brands = DeviceBrand.__table__
+    type_brands = {}
+    for brand_id, name, type_id in db.session.execute(
+        select(brands.c.id, brands.c.name, brands.c.device_type_id).order_by(brands.c.id)
+    ):
+        type_brands.setdefault(type_id, []).append((brand_id, name))
+    return {name: (type_id, type_brands[type_id])
+            for type_id, name in db.session.execute(select(types.c.id, types.c.name)) if type_id in type_brands}
+
+
+class TimeGrid:
+    """Hourly UTC time axis of the generated logs with the local time and weather of every city"""
+
+    def __init__(self, start, days, rng):
+        self.start = int(start.timestamp())
+        self.days = days
+        self.hours = days * 24
+        utc_hours = np.arange(self.hours)
+        first_day = self.start // 86400
+
+        self.local_hour = np.empty((len(CITIES), self.hours), dtype=np.int8)
+        self.local_day = np.empty((len(CITIES), self.hours), dtype=np.int32)  # from -1, days since start
+        self.local_hours = np.empty((len(CITIES), self.hours), dtype=np.float64)
+        self.weekend = np.empty((len(CITIES), self.hours), dtype=bool)
+        self.temperature = np.empty((len(CITIES), self.hours), dtype=np.float32)
+        self.sun = np.empty((len(CITIES), self.hours), dtype=np.float32)  # sine of the solar elevation
+
+        day_of_year = (utc_hours / 24.0 + (start - datetime(start.year, 1, 1, tzinfo=timezone.utc)).days) % 365.25
+        declination = np.radians(23.44) * np.sin(2 * np.pi * (284 + day_of_year) / 365.25)
+        for index, (_, _, tz_name, latitude, longitude, mean, amplitude) in enumerate(CITIES):
+            tz = ZoneInfo(tz_name)
+            # The UTC offset changes at most twice a year; look it up once per day and at the changes
+            offsets = np.array([(start + timedelta(hours=hour)).astimezone(tz).utcoffset().total_seconds() / 3600
+                                for hour in range(0, self.hours, 24)])
+            hourly_offset = np.repeat(offsets, 24)
+            for day in np.flatnonzero(np.diff(offsets)):
+                for hour in range(day * 24, day * 24 + 48):
+                    hourly_offset[hour] = (start + timedelta(hours=hour)).astimezone(tz).utcoffset().total_seconds() / 3600
+            local = utc_hours + hourly_offset
+            self.local_hours[index] = local
+            self.local_hour[index] = np.floor(local) % 24
+            self.local_day[index] = np.floor(local / 24)
+            self.weekend[index] = (first_day + self.local_day[index] + 3) % 7 >= 5  # 1970-01-01 was a Thursday
+
+            weather = np.repeat(np.convolve(rng.normal(0, 4, days + 2), np.ones(3) / 3, mode='same'), 24)
+            self.temperature[index] = (mean + amplitude * np.cos(2 * np.pi * (day_of_year - 200) / 365.25)
+                                       + 4 * np.cos(2 * np.pi * (self.local_hour[index] - 15) / 24)
+                                       + weather[self.local_day[index] + 1])
+
+            hour_angle = np.radians(15 * ((utc_hours + 0.5 + longitude / 15) % 24 - 12))
+            latitude = np.radians(latitude)
+            self.sun[index] = np.maximum(np.sin(latitude) * np.sin(declination)
+                                         + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle), 0)
+        # Cloud cover of each city and day
+        self.clearness = rng.beta(5, 2, (len(CITIES), days + 2)).astype(np.float32)
+        self.day_of_year = day_of_year
+
+
+def household_profiles(rng, count):
+    """
+    Draw household profiles with their solar, EV and battery mix.
+
+    Args:
+        rng (Generator): Random source
+        count (int): Households to draw
+
+    Returns:
+        dict: Profile attribute -> array of length count
+    """
+    city = rng.integers(0, len(CITIES), count)
+    sunny = np.isin(city, [1, 2, 4, 7])  # Los Angeles, Phoenix, Austin, Miami
+    occupants = rng.choice([1, 2, 3, 4, 5, 6], count, p=[0.25, 0.33, 0.16, 0.15, 0.07, 0.04])
+    has_solar = rng.random(count) < np.where(sunny, 0.35, 0.15)
+    has_ev = rng.random(count) < 0.18
+    ev_model = rng.integers(0, len(EV_MODELS), count)
+    time_of_use = rng.random(count) < 0.6
+    peak_rate = np.round(np.where(time_of_use, rng.uniform(0.28, 0.45, count), rng.uniform(0.12, 0.22, count)), 3)
+    return {
+        'city': city,
+        'home_type': np.where(rng.random(count) < 0.3, 'apartment', 'house'),
+        'home_size_sqft': np.round(np.clip(rng.lognormal(np.log(1800), 0.4, count), 450, 6000), -1),
+        'occupants': occupants,
+        'usage_scale': rng.lognormal(0, 0.25, count) * (0.6 + 0.2 * occupants),
+        'has_solar': has_solar,
+        'solar_capacity_kw': np.where(has_solar, np.round(rng.uniform(3, 12, count), 1), np.nan),
+        'has_ev': has_ev,
+        'ev_model': ev_model,
+        'ev_daily_kwh': np.where(has_ev, np.round(rng.uniform(6, 18, count), 1), np.nan),
+        'ev_charge_hour': np.where(has_ev, rng.integers(19, 24, count), 0),
+        'has_battery': rng.random(count) < np.where(has_solar, 0.45, 0.03),
+        'battery_capacity_kwh': np.round(rng.choice([10.0, 13.5, 16.0, 27.0], count), 1),
+        'time_of_use': time_of_use,
+        'peak_rate': peak_rate,
+        'off_peak_rate': np.where(time_of_use, np.round(rng.uniform(0.09, 0.16, count), 3), peak_rate),
+        'carbon_intensity': rng.uniform(0.2, 0.65, count)  # kg CO2 per grid kWh
+    }
+
+
+def plan_devices(rng, profiles, catalog):
+    """
+    Pick the devices of each household from the catalog.
+
+    Args:
+        rng (Generator): Random source
+        profiles (dict): From household_profiles
+        catalog (dict): From load_catalog
+
+    Returns:
+        dict: Device attribute -> array, ordered by household
+    """
+    households, types, type_ids, watts, brand_ids, brand_names = [], [], [], [], [], []
+    available = [(index, name) for index, name in enumerate(TYPE_NAMES) if name in catalog]
+    for household in range(len(profiles['city'])):
+        for type_index, name in available:
+            if name == EV_CHARGER:
+                owned = profiles['has_ev'][household]
+            else:
+                owned = name in ('Refrigerator', 'Lighting') or rng.random() < DEVICE_TEMPLATES[name]['share']
+            if not owned:
+                continue
+            brands = catalog[name][1]
+            brand_id, brand_name = brands[rng.integers(0, len(brands))]
+            households.append(household)
+            types.append(type_index)
+            type_ids.append(catalog[name][0])
+            if name == EV_CHARGER:
+                watts.append(EV_MODELS[profiles['ev_model'][household]][3] * 1000)
+            else:
+                low, high = DEVICE_TEMPLATES[name]['watts']
+                watts.append(round(float(rng.uniform(low, high)), -1))
+            brand_ids.append(brand_id)
+            brand_names.append(brand_name)
+    return {
+        'household': np.array(households, dtype=np.int64),
+        'type': np.array(types, dtype=np.int64),
+        'type_id': type_ids,
+        'watts': np.array(watts, dtype=np.float32),
+        'brand_id': brand_ids,
+        'brand_name': brand_names
+    }
+
+
+def device_duty(rng, grid, profiles, devices):
+    """
+    Simulate the share of every hour each device runs.
+
+    Args:
+        rng (Generator): Random source
+        grid (TimeGrid): Time axis
+        profiles (dict): From household_profiles
+        devices (dict): From plan_devices
+
+    Returns:
+        ndarray: (devices, hours) float32 duty in [0, 1]
+    """
+    count = len(devices['type'])
+    city = profiles['city'][devices['household']]
+    hour = grid.local_hour[city]
+    day = grid.local_day[city] + 1
+    weekend = grid.weekend[city]
+    temperature = grid.temperature[city]
+    scale = profiles['usage_scale'][devices['household']].astype(np.float32)[:, None]
+
+    duty = np.zeros((count, grid.hours), dtype=np.float32)
+    daily_noise = rng.lognormal(0, 0.2, (count, grid.days + 2)).astype(np.float32)
+    for type_index, name in enumerate(TYPE_NAMES):
+        rows = np.flatnonzero(devices['type'] == type_index)
+        if not rows.size:
+            continue
+        shape = SHAPES[type_index][hour[rows]]
+        noise = daily_noise[rows[:, None], day[rows]]
+
+        if name == EV_CHARGER:
+            duty[rows] = _ev_duty(rng, grid, profiles, devices, rows, city[rows])
+            continue
+        template = DEVICE_TEMPLATES[name]
+        week = np.where(weekend[rows], np.float32(template['weekend']), np.float32(1))
+
+        if template['kind'] == 'runs':
+            # Runs per week spread over the days by the weekend factor and over the hours by the shape
+            per_hour = template['level'] / (5 + 2 * template['weekend']) / 24
+            starts = rng.random((rows.size, grid.hours), dtype=np.float32) < per_hour * shape * week * scale[rows] * noise
+            duty[rows] = starts * rng.uniform(0.6, 1.0, (rows.size, grid.hours)).astype(np.float32)
+            continue
+
+        level = template['level'] * shape * week * noise
+        season = template['season']
+        if season == 'hvac':
+            heating = np.maximum(18 - temperature[rows], 0)
+            cooling = np.maximum(temperature[rows] - 23, 0)
+            size = (profiles['home_size_sqft'][devices['household'][rows]] / 2000).astype(np.float32)[:, None]
+            level = (0.03 * heating + 0.045 * cooling) * size * (0.6 + 0.4 * shape) * noise
+        else:
+            level = level * scale[rows] if name != 'Refrigerator' else level
+            if season == 'fridge':
+                level = level * (1 + 0.02 * (temperature[rows] - 20))
+            elif season == 'daylight':
+                level = level * (1 + 0.35 * np.cos(2 * np.pi * (grid.day_of_year - 355) / 365.25)).astype(np.float32)
+            elif season == 'winter':
+                level = level * (1 + 0.25 * np.cos(2 * np.pi * (grid.day_of_year - 15) / 365.25)).astype(np.float32)
+            elif season == 'summer':
+                level = level * np.clip((temperature[rows] - 18) / 8, 0, 1.2)
+        duty[rows] = level * rng.lognormal(0, 0.3, (rows.size, grid.hours)).astype(np.float32)
+
+    np.clip(duty, 0, 1, out=duty)
+    duty[duty < MIN_DUTY] = 0
+    return duty
+
+
+def _ev_duty(rng, grid, profiles, devices, rows, city):
+    """Overnight charging sessions replacing each day's driving, at the charger's rate"""
+    household = devices['household'][rows]
+    rate = devices['watts'][rows] / 1000
+    charge_hour = profiles['ev_charge_hour'][household][:, None]
+    # Sessions start at the charge hour of each local day and run until the day's energy is in
+    since_start = grid.local_hours[city] - charge_hour
+    session = np.floor(since_start / 24).astype(np.int64) + 1
+    hours_in = since_start - 24 * (session - 1)
+
+    sessions = grid.days + 2
+    first_day = grid.start // 86400
+    weekend = (first_day + np.arange(sessions) - 1 + 3) % 7 >= 5
+    energy = (profiles['ev_daily_kwh'][household][:, None] * np.where(weekend, 0.6, 1.0)
+              * rng.lognormal(0, 0.3, (rows.size, sessions)) * (rng.random((rows.size, sessions)) > 0.15))
+    needed = np.take_along_axis(energy, np.clip(session, 0, sessions - 1), axis=1) / rate[:, None]
+    return np.clip(needed - hours_in, 0, 1).astype(np.float32)
+
+
+def _source_shares(grid, profiles, devices, kwh):
+    """Share of each household's hourly load met by its solar panels and by its battery"""
+    households = len(profiles['city'])
+    first = np.searchsorted(devices['household'], np.arange(households))
+    load = np.add.reduceat(kwh, first, axis=0)
+    city = profiles['city']
+
+    capacity = np.nan_to_num(profiles['solar_capacity_kw']).astype(np.float32)[:, None]
+    day = grid.local_day[city] + 1
+    production = 0.8 * capacity * grid.sun[city] * np.take_along_axis(grid.clearness[city], day, axis=1)
+    solar = np.where(load > 0, np.minimum(production / np.maximum(load, 1e-9), 1), 0).astype(np.float32)
+
+    # Surplus solar charges the battery during the day; it covers the evening deficit
+    key = (np.arange(households)[:, None] * (grid.days + 2) + day).ravel()
+    size = households * (grid.days + 2)
+    charge = np.bincount(key, weights=np.maximum(production - load, 0).ravel(), minlength=size)
+    capacity = np.where(profiles['has_battery'], profiles['battery_capacity_kwh'] * 0.9, 0)
+    charge = np.minimum(charge.reshape(households, -1), capacity[:, None])
+    hour = grid.local_hour[city]
+    evening = (hour >= 17) & (hour < 23)
+    deficit = np.bincount(key, weights=(evening * load * (1 - solar)).ravel(), minlength=size).reshape(households, -1)
+    covered = np.where(deficit > 0, np.minimum(charge / np.maximum(deficit, 1e-9), 1), 0)
+    battery = (evening * (1 - solar) * np.take_along_axis(covered, day, axis=1)).astype(np.float32)
+    return solar, battery
+
+
+def usage_logs(rng, grid, profiles, devices, resolution='hour'):
+    """
+    Generate the usage logs of a group of households.
+
+    Args:
+        rng (Generator): Random source
+        grid (TimeGrid): Time axis
+        profiles (dict): From household_profiles
+        devices (dict): From plan_devices
+        resolution (str): hour for one log per device and hour of use, minute for one
+            per minute of use
+
+    Returns:
+        dict: Log columns ordered by device and start: device (index into devices),
+            household, start, end (epoch seconds), kwh, cost, carbon, source (code)
+            and optimal
+    """
+    duty = device_duty(rng, grid, profiles, devices)
+    kwh_hourly = duty * (devices['watts'] / 1000)[:, None]
+    solar, battery = _source_shares(grid, profiles, devices, kwh_hourly)
+
+    device, hour = np.nonzero(duty)
+    household = devices['household'][device]
+    draw = rng.random(device.size, dtype=np.float32)
+    solar_share = solar[household, hour]
+    source = np.where(draw < solar_share, SOLAR,
+                      np.where(draw < solar_share + battery[household, hour], BATTERY, GRID)).astype(np.int8)
+    start = grid.start + hour.astype(np.int64) * 3600
+    kwh = kwh_hourly[device, hour].astype(np.float64)
+
+    if RESOLUTIONS[resolution] == 60:
+        end = start + 3600
+    else:
+        # Each hour of use becomes a contiguous run of one-minute logs at a random offset
+        minutes = np.clip(np.rint(duty[device, hour] * 60), 1, 60).astype(np.int64)
+        offset = (rng.random(device.size) * (61 - minutes)).astype(np.int64)
+        repeat = np.repeat(np.arange(device.size), minutes)
+        within = np.arange(repeat.size) - np.repeat(np.cumsum(minutes) - minutes, minutes)
+        kwh = (kwh / minutes)[repeat]
+        device, household, hour, source = device[repeat], household[repeat], hour[repeat], source[repeat]
+        start = start[repeat] + (offset[repeat] + within) * 60
+        end = start + 60
+
+    local_hour = grid.local_hour[profiles['city'][household], hour]
+    peak = (local_hour >= current_app.config.get('TOU_PEAK_START_HOUR', 16)) & \
+           (local_hour < current_app.config.get('TOU_PEAK_END_HOUR', 21))
+    grid_kwh = np.where(source == GRID, kwh, 0)
+    rate = np.where(peak, profiles['peak_rate'][household], profiles['off_peak_rate'][household])
+    intensity = profiles['carbon_intensity'][household] * (1 + 0.15 * np.cos(2 * np.pi * (local_hour - 19) / 24))
+    flexible = np.isin(devices['type'], [TYPE_NAMES.index(name) for name in FLEXIBLE_TYPES])[device]
+    return {
+        'device': device,
+        'household': household,
+        'start': start,
+        'end': end,
+        'kwh': np.round(kwh, 5),
+        'cost': np.round(grid_kwh * rate, 5),
+        'carbon': np.round(grid_kwh * intensity, 5),
+        'source': source,
+        'optimal': flexible & (~peak | (source != GRID))
+    }
+
+
+class SyntheticDataService:
+    """Generates households, devices and usage logs for scale testing"""
+
+    @staticmethod
+    def generate(users, days, resolution='hour', storage='rows', rollups=True, seed=None,
+                 start=None, prefix='synthetic', progress=None):
+        """
+        Generate synthetic households with devices from the catalog and their usage logs.
+
+        Households are generated and written in chunks of SYNTHETIC_DATA_CHUNK_USERS,
+        one transaction each. Every generated user has the password PASSWORD.
+
+        Args:
+            users (int): Households to create
+            days (int): Days of usage logs, ending at start + days
+            resolution (str): hour or minute, see usage_logs
+            storage (str): rows to insert usage logs into the database, archive to write
+                them straight to the columnar archive
+            rollups (bool): Build the users' rollups; without them dashboards read the logs
+            seed (int, optional): Seed for a reproducible data set
+            start (datetime, optional): First day, defaults to days before today (UTC)
+            prefix (str): Start of the usernames
+            progress (callable, optional): Called with (users done, logs written) per chunk
+
+        Returns:
+            dict: Counts, the time range and throughput
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        if storage not in STORAGES:
+            raise ValueError(f"Unknown storage: {storage}")
+        catalog = load_catalog()
+        if not catalog:
+            raise ValueError("The device catalog is empty; seed the device types and brands first")
+
+        if start is None:
+            start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        start = start.replace(tzinfo=start.tzinfo or timezone.utc)
+        rng = np.random.default_rng(seed)
+        grid = TimeGrid(start, days, rng)
+        chunk_size = current_app.config.get('SYNTHETIC_DATA_CHUNK_USERS', 50)
+        run = secrets.token_hex(3)
+        password_hash = generate_password_hash(PASSWORD)  # hashing is slow, so it is shared
+
+        started = time.perf_counter()
+        result = {'users': 0, 'devices': 0, 'logs': 0, 'rollup_rows': 0, 'storage': storage,
+                  'resolution': resolution, 'start': start.isoformat(),
+                  'end': (start + timedelta(days=days)).isoformat()}
+        for offset in range(0, users, chunk_size):
+            count = min(chunk_size, users - offset)
+            profiles = household_profiles(rng, count)
+            devices = plan_devices(rng, profiles, catalog)
+            logs = usage_logs(rng, grid, profiles, devices, resolution)
+            names = [f"{prefix}_{run}_{offset + index:06d}" for index in range(count)]
+
+            with db.engine.begin() as connection:
+                user_ids = SyntheticDataService._insert_users(connection, names, profiles, password_hash, start)
+                device_ids = SyntheticDataService._insert_devices(connection, user_ids, devices)
+                SyntheticDataService._store_logs(connection, storage, device_ids, logs)
+                if rollups:
+                    result['rollup_rows'] += SyntheticDataService._build_rollups(
+                        connection, user_ids, profiles, device_ids, logs)
+
+            result['users'] += count
+            result['devices'] += len(device_ids)
+            result['logs'] += len(logs['start'])
+            if progress is not None:
+                progress(result['users'], result['logs'])
+
+        elapsed = time.perf_counter() - started
+        result['seconds'] = round(elapsed, 3)
+        result['logs_per_second'] = round(result['logs'] / elapsed) if elapsed > 0 else None
+        return result
+
+    @staticmethod
+    def _insert_users(connection, names, profiles, password_hash, created_at):
+        rows = []
+        for index, name in enumerate(names):
+            city, state, tz_name, latitude, longitude, _, _ = CITIES[profiles['city'][index]]
+            has_solar = bool(profiles['has_solar'][index])
+            has_ev = bool(profiles['has_ev'][index])
+            has_battery = bool(profiles['has_battery'][index])
+            ev_make, ev_model, ev_capacity, _ = EV_MODELS[profiles['ev_model'][index]]
+            rows.append({
+                'username': name,
+                'email': f"{name}@example.com",
+                'password_hash': password_hash,
+                'timezone': tz_name,
+                'latitude': latitude,
+                'longitude': longitude,
+                'city': city,
+                'state': state,
+                'country': 'United States',
+                'home_size_sqft': float(profiles['home_size_sqft'][index]),
+                'home_type': str(profiles['home_type'][index]),
+                'occupants_count': int(profiles['occupants'][index]),
+                'has_solar': has_solar,
+                'solar_capacity_kw': float(profiles['solar_capacity_kw'][index]) if has_solar else None,
+                'solar_panel_orientation': 'south' if has_solar else None,
+                'solar_panel_tilt': 25.0 if has_solar else None,
+                'has_ev': has_ev,
+                'ev_battery_capacity_kwh': float(ev_capacity) if has_ev else None,
+                'ev_typical_daily_usage_kwh': float(profiles['ev_daily_kwh'][index]) if has_ev else None,
+                'ev_manufacturer': ev_make if has_ev else None,
+                'ev_model': ev_model if has_ev else None,
+                'ev_charging_preference': 'cheapest' if has_ev else None,
+                'has_battery_storage': has_battery,
+                'battery_capacity_kwh': float(profiles['battery_capacity_kwh'][index]) if has_battery else None,
+                'battery_brand': BATTERY_BRANDS[index % len(BATTERY_BRANDS)] if has_battery else None,
+                'electricity_rate_plan': 'time-of-use' if profiles['time_of_use'][index] else 'flat-rate',
+                'peak_rate_per_kwh': float(profiles['peak_rate'][index]),
+                'off_peak_rate_per_kwh': float(profiles['off_peak_rate'][index]),
+                'created_at': created_at.replace(tzinfo=None),
+                'updated_at': created_at.replace(tzinfo=None)
+            })
+        users = User.__table__
+        connection.execute(users.insert(), rows)
+        ids = dict(connection.execute(select(users.c.username, users.c.id).where(users.c.username.in_(names))).all())
+        return [ids[name] for name in names]
+
+    @staticmethod
+    def _insert_devices(connection, user_ids, devices):
+        rows = []
+        for index, household in enumerate(devices['household'].tolist()):
+            type_name = TYPE_NAMES[devices['type'][index]]
+            brand_name = devices['brand_name'][index]
+            watts = float(devices['watts'][index])
+            is_ev = type_name == EV_CHARGER
+            rows.append({
+                'user_id': user_ids[household],
+                'device_type_id': devices['type_id'][index],
+                'brand_id': devices['brand_id'][index],
+                'name': type_name if brand_name == 'Other' else f"{brand_name} {type_name}",
+                'power_consumption_watts': watts,
+                'standby_power_watts': round(watts * 0.01, 1),
+                'usage_flexibility': 8 if type_name in FLEXIBLE_TYPES else 2,
+                'priority_level': 5,
+                'is_schedulable': type_name in FLEXIBLE_TYPES,
+                'is_ev_charger': is_ev,
+                'charging_rate_kw': watts / 1000 if is_ev else None,
+                'is_smart_device': bool(index % 3 == 0),
+                'api_controllable': False
+            })
+        table = Device.__table__
+        connection.execute(table.insert(), rows)
+        ids = {
+            (user_id, name): device_id for device_id, user_id, name in connection.execute(
+                select(table.c.id, table.c.user_id, table.c.name).where(table.c.user_id.in_(user_ids))
+            ).all()
+        }
+        return np.array([ids[(row['user_id'], row['name'])] for row in rows], dtype=np.int64)
+
+    @staticmethod
+    def _store_logs(connection, storage, device_ids, logs):
+        source_names = np.array(SOURCES, dtype=object)[logs['source']]
+        if storage == 'archive':
+            bounds = np.searchsorted(logs['device'], np.arange(device_ids.size + 1))
+            for index, device_id in enumerate(device_ids.tolist()):
+                rows = slice(bounds[index], bounds[index + 1])
+                if rows.start == rows.stop:
+                    continue
+                UsageArchiveService.store_logs(connection, device_id, {
+                    'start': logs['start'][rows],
+                    'duration': logs['end'][rows] - logs['start'][rows],
+                    'kwh': logs['kwh'][rows],
+                    'cost': logs['cost'][rows],
+                    'carbon': logs['carbon'][rows],
+                    'source': source_names[rows],
+                    'optimal': logs['optimal'][rows]
+                }, sync=False)
+            return
+
+        dialect_name = connection.dialect.name
+        execute_driver_many(connection, DeviceUsageLog.__table__.insert(), {
+            'device_id': device_ids[logs['device']].tolist(),
+            'start_time': driver_datetimes(logs['start'], dialect_name),
+            'end_time': driver_datetimes(logs['end'], dialect_name),
+            'energy_consumed_kwh': logs['kwh'].tolist(),
+            'cost': logs['cost'].tolist(),
+            'carbon_footprint_kg': logs['carbon'].tolist(),
+            'energy_source': source_names.tolist(),
+            'is_optimal_usage': logs['optimal'].tolist(),
+            'created_at': driver_datetimes([time.time()], dialect_name) * len(logs['start'])
+        }, INSERT_BATCH_SIZE)
+
+    @staticmethod
+    def _build_rollups(connection, user_ids, profiles, device_ids, logs):
+        values = usage_values(logs['kwh'], logs['cost'], logs['carbon'], (logs['source'] == SOLAR).astype(np.float64),
+                              (logs['source'] == BATTERY).astype(np.float64))
+        bounds = np.searchsorted(logs['household'], np.arange(len(user_ids) + 1))
+        written = 0
+        for household, user_id in enumerate(user_ids):
+            rows = slice(bounds[household], bounds[household + 1])
+            tz = ZoneInfo(CITIES[profiles['city'][household]][2])
+            written += UsageRollupService.replace(
+                connection, user_id, tz, device_ids[logs['device'][rows]],
+                logs['start'][rows].astype(np.float64), logs['end'][rows].astype(np.float64), values[:, rows],
+                existing=False
+            )
+        return written
@@ -0,0 +1,422 @@
+# EcoPlot/services/usage_archive.py
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from flask import current_app
+from sqlalchemy import delete, select
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.usage_archive import UsageArchiveSegment
+from EcoPlot.services.energy_aggregation import BATTERY_SOURCES, ONSITE_SOURCES, _epoch_seconds, usage_values
+
+# Column -> dtype of segment files; start is in seconds from the start of the month
+COLUMNS = {
+    'start': '<u4',
+    'duration': '<i4',
+    'kwh': '<f4',
+    'cost': '<f4',
+    'carbon': '<f4',
+    'source': 'u1',  # index into the segment's source names
+    'optimal': 'u1'
+}
+NO_END = -1  # duration of logs without an end time
+SOURCE_NAME_LENGTH = 50  # DeviceUsageLog.energy_source
+DELETE_BATCH_SIZE = 500
+
+
+def archive_dir():
+    """Directory holding the segment files, one subdirectory per device"""
+    return current_app.config.get('USAGE_ARCHIVE_DIR') or os.path.join(current_app.root_path, 'data', 'archive')
+
+
+def segment_path(device_id, month, version):
+    return os.path.join(archive_dir(), str(device_id), f"{month:%Y-%m}.v{version}.npy")
+
+
+def _is_constant(column):
+    return np.array_equal(column, np.broadcast_to(column[:1], column.shape), equal_nan=column.dtype.kind == 'f')
+
+
+def write_segment(path, columns, source_names, sync=True):
+    """
+    Write one month of a device's logs as a columnar .npy file.
+
+    The file holds a single structured record whose fields are whole columns, so
+    np.load with mmap_mode gives every column as a contiguous, zero-copy array.
+    A column holding one repeated value, e.g. the duration of fixed meter intervals,
+    is stored once as a scalar field.
+
+    Args:
+        path (str): File to create
+        columns (dict): Arrays of the COLUMNS, ordered by start
+        source_names (list): Energy sources the source column indexes; '' for none
+        sync (bool): fsync the file before returning
+
+    Returns:
+        int: Size of the file in bytes
+    """
+    rows = len(columns['start'])
+    fields, values = [], {}
+    for name, dtype in COLUMNS.items():
+        column = np.asarray(columns[name]).astype(dtype)
+        if name != 'start' and _is_constant(column):
+            fields.append((name, dtype))
+            values[name] = column[0]
+        else:
+            fields.append((name, dtype, (rows,)))
+            values[name] = column
+    fields.append(('source_names', f'<U{SOURCE_NAME_LENGTH}', (len(source_names),)))
+    values['source_names'] = source_names
+
+    record = np.zeros((), dtype=fields)
+    for name, value in values.items():
+        record[name] = value
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as out:
+        np.save(out, record)
+        if sync:
+            out.flush()
+            os.fsync(out.fileno())  # on disk before the segment row that points at it is committed
+    return os.path.getsize(path)
+
+
+def read_segment(path):
+    """
+    Memory-map a segment file.
+
+    Args:
+        path (str): File written by write_segment
+
+    Returns:
+        dict: Column name -> read-only array of equal length, plus source_names
+    """
+    record = np.load(path, mmap_mode='r')
+    rows = record['start'].shape[0]
+    columns = {name: record[name] if record[name].shape else np.broadcast_to(record[name], (rows,))
+               for name in COLUMNS}
+    columns['source_names'] = [str(name) for name in record['source_names']]
+    return columns
+
+
+def _to_datetime(epoch_seconds):
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).replace(tzinfo=None)
+
+
+def _month_starts(start):
+    """UTC month start of every epoch second as datetime64[s]"""
+    return start.astype('datetime64[s]').astype('datetime64[M]').astype('datetime64[s]')
+
+
+def _read_window(connection, device_filter, window_start=None, window_end=None):
+    """
+    Read the archived logs of some devices overlapping a window.
+
+    Args:
+        connection (Connection): Connection the segment rows are read through
+        device_filter: SQL condition on the devices table
+        window_start (int, optional): Window start, UTC epoch seconds
+        window_end (int, optional): Window end, UTC epoch seconds
+
+    Yields:
+        tuple: device id, start and end (epoch seconds) arrays and the segment's
+            columns sliced to the same rows
+    """
+    segments = UsageArchiveSegment.__table__
+    devices = Device.__table__
+    query = select(
+        segments.c.device_id, segments.c.month, segments.c.version
+    ).select_from(
+        segments.join(devices, segments.c.device_id == devices.c.id)
+    ).where(device_filter)
+    if window_end is not None:
+        query = query.where(segments.c.month < _to_datetime(window_end))
+    if window_start is not None:
+        query = query.where(segments.c.last_end >= _to_datetime(window_start))
+
+    for device_id, month, version in connection.execute(query).all():
+        columns = read_segment(segment_path(device_id, month, version))
+        month_epoch = int(np.datetime64(month, 's').astype(np.int64))
+
+        # Logs are ordered by start, so the window end is a slice; the start needs the ends
+        stop = len(columns['start'])
+        if window_end is not None:
+            stop = int(np.searchsorted(columns['start'], window_end - month_epoch, side='left'))
+        start = columns['start'][:stop] + float(month_epoch)
+        duration = columns['duration'][:stop]
+        end = np.where(duration == NO_END, start, start + duration)
+        rows = slice(None)
+        if window_start is not None:
+            rows = end >= window_start
+        sliced = {name: columns[name][:stop][rows] for name in COLUMNS}
+        sliced['source_names'] = columns['source_names']
+        yield device_id, start[rows], end[rows], sliced
+
+
+def load_archived_usage(connection, user_id, window_start=None, window_end=None):
+    """
+    Load the user's archived usage logs overlapping a window, as load_usage does.
+
+    Args:
+        connection (Connection): Connection the segment rows are read through
+        user_id (int): Owner of the devices
+        window_start (int, optional): Window start, UTC epoch seconds
+        window_end (int, optional): Window end, UTC epoch seconds
+
+    Returns:
+        tuple: device id, start and end arrays and the usage_values matrix, or None
+            when nothing archived overlaps the window
+    """
+    parts = list(_read_window(connection, Device.__table__.c.user_id == user_id, window_start, window_end))
+    if not parts:
+        return None
+
+    device_ids = np.concatenate([np.full(len(start), device_id, dtype=np.int64)
+                                 for device_id, start, _, _ in parts])
+    start = np.concatenate([part[1] for part in parts])
+    end = np.concatenate([part[2] for part in parts])
+    kwh, cost, carbon = (np.nan_to_num(np.concatenate([part[3][name] for part in parts]).astype(np.float64))
+                         for name in ('kwh', 'cost', 'carbon'))
+    is_onsite, is_battery = (np.concatenate([
+        np.isin([name.lower() for name in columns['source_names']], sources)[columns['source']]
+        for _, _, _, columns in parts
+    ]).astype(np.float64) for sources in (ONSITE_SOURCES, BATTERY_SOURCES))
+    return device_ids, start, end, usage_values(kwh, cost, carbon, is_onsite, is_battery)
+
+
+def archived_intervals(connection, device_id, window_start, window_end):
+    """
+    Return the intervals of a device's archived logs overlapping a window.
+
+    Args:
+        connection (Connection): Connection the segment rows are read through
+        device_id (int): Device to read
+        window_start, window_end (int): Window, UTC epoch seconds
+
+    Returns:
+        tuple: start and end arrays, epoch seconds
+    """
+    parts = list(_read_window(connection, Device.__table__.c.id == device_id, window_start, window_end))
+    return (np.concatenate([part[1] for part in parts] or [np.zeros(0)]),
+            np.concatenate([part[2] for part in parts] or [np.zeros(0)]))
+
+
+class UsageArchiveService:
+    """Moves old usage logs out of the database into per-device monthly column files"""
+
+    @staticmethod
+    def archive(before=None, user_id=None):
+        """
+        Archive the usage logs that started before a cutoff.
+
+        Only whole UTC months are archived: the cutoff is rounded down to a month
+        start. Logs added later for an archived month are merged into a new version
+        of its file on the next run. A device's files are written before its logs
+        are deleted, and readers only find them through the segment rows committed
+        with that delete, so an interrupted run leaves stray files behind but never
+        loses or double-counts a log. Rollups are not touched; archived logs keep
+        counting in them.
+
+        Args:
+            before (datetime, optional): Naive UTC cutoff, defaults to
+                USAGE_ARCHIVE_AFTER_DAYS ago
+            user_id (int, optional): Archive one user's devices only
+
+        Returns:
+            dict: Cutoff, counts of devices, segments and logs archived, bytes written
+                and timing
+        """
+        if before is None:
+            before = datetime.utcnow() - timedelta(days=current_app.config.get('USAGE_ARCHIVE_AFTER_DAYS', 365))
+        cutoff = datetime(before.year, before.month, 1)
+
+        devices = Device.__table__
+        query = select(devices.c.id).order_by(devices.c.id)
+        if user_id is not None:
+            query = query.where(devices.c.user_id == user_id)
+        with db.engine.connect() as connection:
+            device_ids = connection.execute(query).scalars().all()
+
+        started = time.perf_counter()
+        result = {'cutoff': cutoff.isoformat(), 'devices': 0, 'segments_written': 0,
+                  'logs_archived': 0, 'bytes_written': 0}
+        for device_id in device_ids:
+            UsageArchiveService._remove_stale_files(device_id)
+            archived = UsageArchiveService._archive_device(device_id, cutoff, result)
+            result['devices'] += 1 if archived else 0
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        return result
+
+    @staticmethod
+    def _archive_device(device_id, cutoff, result):
+        logs = DeviceUsageLog.__table__
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(
+                    logs.c.id,
+                    _epoch_seconds(logs.c.start_time),
+                    _epoch_seconds(logs.c.end_time),
+                    logs.c.energy_consumed_kwh,
+                    logs.c.cost,
+                    logs.c.carbon_footprint_kg,
+                    logs.c.energy_source,
+                    logs.c.is_optimal_usage
+                ).where(
+                    logs.c.device_id == device_id,
+                    logs.c.start_time < cutoff
+                ).order_by(logs.c.start_time, logs.c.id)
+            ).all()
+            if not rows:
+                return False
+
+            ids, start, end, kwh, cost, carbon, source, optimal = zip(*rows)
+            start = np.rint(np.array(start, dtype=np.float64)).astype(np.int64)
+            end = np.array(end, dtype=np.float64)  # NULL becomes NaN
+            new = {
+                'start': start,
+                'duration': np.where(np.isnan(end), NO_END, np.rint(end - start)).astype(np.int64),
+                'kwh': np.array(kwh, dtype=np.float64),
+                'cost': np.array(cost, dtype=np.float64),
+                'carbon': np.array(carbon, dtype=np.float64),
+                'source': np.array([name or '' for name in source], dtype=object),
+                'optimal': np.array(optimal, dtype=bool)
+            }
+
+            segments_written, bytes_written = UsageArchiveService.store_logs(connection, device_id, new)
+            result['segments_written'] += segments_written
+            result['bytes_written'] += bytes_written
+
+            # Rows are deleted by id so logs written since the select stay live
+            for offset in range(0, len(ids), DELETE_BATCH_SIZE):
+                connection.execute(delete(logs).where(logs.c.id.in_(ids[offset:offset + DELETE_BATCH_SIZE])))
+            result['logs_archived'] += len(ids)
+        return True
+
+    @staticmethod
+    def store_logs(connection, device_id, columns, sync=True):
+        """
+        Write logs of a device into its monthly segments, merging with stored months.
+
+        The segment rows are written through the connection, so the files only become
+        visible when its transaction commits.
+
+        Args:
+            connection (Connection): Connection of an open transaction
+            device_id (int): Device the logs belong to
+            columns (dict): start (int epoch seconds), duration (NO_END for none), kwh,
+                cost and carbon (NaN for none), source (str, '' for none) and optimal
+                arrays, ordered by start
+            sync (bool): fsync each file before returning
+
+        Returns:
+            tuple: (segments written, bytes written)
+        """
+        segments = UsageArchiveSegment.__table__
+        existing = {
+            month: version for month, version in connection.execute(
+                select(segments.c.month, segments.c.version).where(segments.c.device_id == device_id)
+            ).all()
+        }
+        manifest = []
+        months = _month_starts(columns['start'])
+        bounds = np.flatnonzero(np.append(True, months[1:] != months[:-1]))
+        for first, last in zip(bounds, np.append(bounds[1:], months.size)):
+            month = months[first].astype(datetime)
+            month_columns = {name: column[first:last] for name, column in columns.items()}
+            version = existing.get(month)
+            if version is not None:
+                month_columns = UsageArchiveService._merge(segment_path(device_id, month, version),
+                                                           month_columns, month)
+            version = (version or 0) + 1
+
+            month_epoch = int(months[first].astype(np.int64))
+            source_names, codes = np.unique(month_columns['source'].astype(str), return_inverse=True)
+            file_columns = dict(month_columns, start=month_columns['start'] - month_epoch, source=codes)
+            size = write_segment(segment_path(device_id, month, version), file_columns,
+                                 source_names.tolist(), sync=sync)
+
+            start, duration = month_columns['start'], month_columns['duration']
+            ends = np.where(duration == NO_END, start, start + duration)
+            manifest.append({
+                'device_id': device_id, 'month': month, 'version': version, 'rows': len(start),
+                'size_bytes': size, 'last_end': _to_datetime(int(ends.max())), 'archived_at': datetime.utcnow()
+            })
+
+        replaced = [row['month'] for row in manifest if row['month'] in existing]
+        if replaced:
+            connection.execute(delete(segments).where(segments.c.device_id == device_id,
+                                                      segments.c.month.in_(replaced)))
+        if manifest:
+            connection.execute(segments.insert(), manifest)
+        return len(manifest), sum(row['size_bytes'] for row in manifest)
+
+    @staticmethod
+    def replace_column(connection, device_id, month, version, name, values, sync=True):
+        """
+        Write a new version of a segment with one column replaced, e.g. carbon values
+        computed after the logs were archived.
+
+        The segment row is moved to the new version before the file is written, and only
+        if it still names the version whose rows the values belong to; a run that wrote
+        another version meanwhile wins, and nothing is written. The file becomes visible
+        when the connection's transaction commits.
+
+        Args:
+            connection (Connection): Connection of an open transaction
+            device_id (int): Device of the segment
+            month (datetime): Month of the segment
+            version (int): Version the values were computed from
+            name (str): One of the COLUMNS
+            values (ndarray): New column, one value per row of the segment
+            sync (bool): fsync the file before returning
+
+        Returns:
+            bool: False when the segment has changed since that version
+        """
+        segments = UsageArchiveSegment.__table__
+        key = (segments.c.device_id == device_id, segments.c.month == month)
+        claimed = connection.execute(
+            segments.update().where(*key, segments.c.version == version).values(version=version + 1)
+        ).rowcount
+        if not claimed:
+            return False
+
+        stored = read_segment(segment_path(device_id, month, version))
+        columns = {column: np.asarray(stored[column]) for column in COLUMNS}
+        columns[name] = values
+        size = write_segment(segment_path(device_id, month, version + 1), columns, stored['source_names'], sync=sync)
+        connection.execute(segments.update().where(*key).values(size_bytes=size, archived_at=datetime.utcnow()))
+        return True
+
+    @staticmethod
+    def _merge(path, columns, month):
+        """Combine logs being archived with those already in a month's segment, ordered by start"""
+        stored = read_segment(path)
+        month_epoch = int(np.datetime64(month, 's').astype(np.int64))
+        stored_columns = {name: np.asarray(stored[name]) for name in COLUMNS}
+        stored_columns['start'] = stored_columns['start'].astype(np.int64) + month_epoch
+        stored_columns['source'] = np.array(stored['source_names'], dtype=object)[stored_columns['source']]
+
+        merged = {name: np.concatenate([stored_columns[name], columns[name]]) for name in columns}
+        order = np.argsort(merged['start'], kind='stable')
+        return {name: column[order] for name, column in merged.items()}
+
+    @staticmethod
+    def _remove_stale_files(device_id):
+        """Delete files of earlier segment versions and of runs that did not commit"""
+        directory = os.path.join(archive_dir(), str(device_id))
+        if not os.path.isdir(directory):
+            return
+        segments = UsageArchiveSegment.__table__
+        with db.engine.connect() as connection:
+            current = {
+                os.path.basename(segment_path(device_id, month, version))
+                for month, version in connection.execute(
+                    select(segments.c.month, segments.c.version).where(segments.c.device_id == device_id)
+                ).all()
+            }
+        for name in os.listdir(directory):
+            if name.endswith('.npy') and name not in current:
+                os.remove(os.path.join(directory, name))
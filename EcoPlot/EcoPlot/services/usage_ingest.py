@@ -0,0 +1,300 @@
+# EcoPlot/services/usage_ingest.py
+import csv
+import json
+import time
+from datetime import datetime, timezone
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.user import User
+from EcoPlot.services.carbon_accounting import CarbonAccountingService
+from EcoPlot.services.energy_aggregation import source_flags, usage_values
+from EcoPlot.services.usage_rollups import UsageRollupService, driver_datetimes, execute_driver_many
+
+FORMATS = ('ndjson', 'csv')
+
+# Content types accepted for each format
+CONTENT_TYPES = {
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv'
+}
+
+# Epoch seconds of datetime.min and datetime.max
+_MIN_EPOCH = -62135596800
+_MAX_EPOCH = 253402300800
+_TRUE = ('1', 'true', 'yes', 't', 'y')
+
+
+class IngestError(ValueError):
+    """Raised for a usage record that cannot be stored"""
+
+
+def parse_ndjson(lines):
+    """
+    Parse newline-delimited JSON one line at a time.
+
+    Args:
+        lines (iterable): Text lines, e.g. a file or a wrapped request stream
+
+    Yields:
+        tuple: (line number, record dict or None, error message or None)
+    """
+    decode = json.JSONDecoder().decode
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = decode(line)
+        except ValueError as e:
+            yield number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "expected a JSON object"
+            continue
+        yield number, record, None
+
+
+def parse_csv(lines):
+    """
+    Parse CSV with a header row one row at a time.
+
+    Args:
+        lines (iterable): Text lines, e.g. a file or a wrapped request stream
+
+    Yields:
+        tuple: (line number, record dict or None, error message or None)
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [name.strip() for name in header]
+    for row in reader:
+        if not row:
+            continue
+        if len(row) != len(header):
+            yield reader.line_num, None, f"expected {len(header)} columns, got {len(row)}"
+            continue
+        yield reader.line_num, dict(zip(header, row)), None
+
+
+PARSERS = {
+    'ndjson': parse_ndjson,
+    'csv': parse_csv
+}
+
+
+def format_for_content_type(mimetype):
+    """Return the ingest format of a request content type, or None"""
+    return CONTENT_TYPES.get((mimetype or '').lower())
+
+
+def _parse_time(value, name):
+    """Parse an ISO 8601 timestamp or epoch seconds into UTC epoch seconds"""
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            try:
+                value = float(value)
+            except ValueError:
+                raise IngestError(f"{name}: invalid timestamp {value!r}")
+        else:
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)  # naive input is taken as UTC
+            return parsed.timestamp()
+    elif isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise IngestError(f"{name}: expected a timestamp")
+
+    if not _MIN_EPOCH <= value < _MAX_EPOCH:
+        raise IngestError(f"{name}: timestamp out of range")
+    return float(value)
+
+
+def _parse_float(value, name):
+    if value.__class__ is float and value >= 0:
+        return value  # the common case for NDJSON
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise IngestError(f"{name}: expected a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"{name}: expected a number, got {value!r}")
+    if number < 0 or number != number:
+        raise IngestError(f"{name}: must be a non-negative number")
+    return number
+
+
+def validate_record(record, device_ids):
+    """
+    Validate one usage record against the user's devices.
+
+    Args:
+        record (dict): Parsed NDJSON object or CSV row
+        device_ids (set): Ids of the devices the user owns
+
+    Returns:
+        tuple: device_id, start and end (UTC epoch seconds, end None when missing),
+            energy_consumed_kwh, cost, carbon_footprint_kg, energy_source, is_optimal_usage
+    """
+    device_id = record.get('device_id')
+    try:
+        device_id = int(device_id)
+    except (TypeError, ValueError):
+        raise IngestError("device_id: missing or not an integer")
+    if device_id not in device_ids:
+        raise IngestError(f"device_id: device {device_id} not found")
+
+    start = record.get('start_time')
+    if start is None or start == '':
+        raise IngestError("start_time: missing")
+    start = _parse_time(start, 'start_time')
+    end = record.get('end_time')
+    end = None if end is None or end == '' else _parse_time(end, 'end_time')
+    if end is not None and end < start:
+        raise IngestError("end_time: before start_time")
+
+    energy_source = record.get('energy_source') or None
+    if energy_source is not None:
+        energy_source = str(energy_source).strip()[:50] or None
+
+    optimal = record.get('is_optimal_usage')
+    if isinstance(optimal, str):
+        optimal = optimal.strip().lower() in _TRUE
+
+    return (
+        device_id,
+        start,
+        end,
+        _parse_float(record.get('energy_consumed_kwh'), 'energy_consumed_kwh'),
+        _parse_float(record.get('cost'), 'cost'),
+        _parse_float(record.get('carbon_footprint_kg'), 'carbon_footprint_kg'),
+        energy_source,
+        bool(optimal)
+    )
+
+
+class UsageIngestService:
+    """Bulk import of device usage logs from NDJSON or CSV streams"""
+
+    @staticmethod
+    def ingest(user_id, lines, data_format, batch_size=None, max_errors=None):
+        """
+        Stream, validate and insert usage logs in batches.
+
+        Every batch is inserted with one executemany and committed together with the
+        matching rollup update, so a failure part way keeps the batches before it.
+
+        Args:
+            user_id (int): Owner of the devices the logs belong to
+            lines (iterable): Text lines of the body; read lazily
+            data_format (str): ndjson or csv
+            batch_size (int, optional): Rows per insert, defaults to USAGE_INGEST_BATCH_SIZE
+            max_errors (int, optional): Row errors to report, defaults to USAGE_INGEST_MAX_ERRORS
+
+        Returns:
+            dict: Row counts, reported row errors and throughput
+        """
+        if data_format not in PARSERS:
+            raise ValueError(f"Unknown format: {data_format}")
+        batch_size = batch_size or current_app.config.get('USAGE_INGEST_BATCH_SIZE', 5000)
+        if max_errors is None:
+            max_errors = current_app.config.get('USAGE_INGEST_MAX_ERRORS', 100)
+
+        devices = Device.__table__
+        with db.engine.connect() as connection:
+            device_ids = set(connection.execute(
+                select(devices.c.id).where(devices.c.user_id == user_id)
+            ).scalars())
+
+        started = time.perf_counter()
+        received = inserted = rejected = batches = 0
+        errors = []
+        batch = []
+        for number, record, error in PARSERS[data_format](lines):
+            received += 1
+            if error is None:
+                try:
+                    batch.append(validate_record(record, device_ids))
+                except IngestError as e:
+                    error = str(e)
+            if error is not None:
+                rejected += 1
+                if len(errors) < max_errors:
+                    errors.append({'line': number, 'error': error})
+                continue
+
+            if len(batch) >= batch_size:
+                inserted += UsageIngestService.write_batch(user_id, batch)
+                batches += 1
+                batch = []
+        if batch:
+            inserted += UsageIngestService.write_batch(user_id, batch)
+            batches += 1
+
+        elapsed = time.perf_counter() - started
+        return {
+            'format': data_format,
+            'rows_received': received,
+            'rows_inserted': inserted,
+            'rows_rejected': rejected,
+            'batches': batches,
+            'errors': errors,
+            'errors_truncated': rejected > len(errors),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(received / elapsed) if elapsed > 0 else None
+        }
+
+    @staticmethod
+    def write_batch(user_id, batch):
+        """
+        Insert one batch of validated rows and add it to the user's rollups.
+
+        Args:
+            user_id (int): Owner of the devices
+            batch (list): Tuples in the order validate_record returns
+
+        Returns:
+            int: Number of rows inserted
+        """
+        columns = list(zip(*batch))
+        device_ids = np.array(columns[0], dtype=np.int64)
+        start = np.array(columns[1], dtype=np.float64)
+        end = np.array(columns[2], dtype=np.float64)  # None becomes NaN
+        missing_end = np.isnan(end)
+        kwh, cost, carbon = (np.array(column, dtype=np.float64) for column in columns[3:6])
+        # Carbon of logs sent without it, at the regional grid intensity of their hours
+        carbon = CarbonAccountingService.fill_missing(db.session.get(User, user_id), start,
+                                                      np.where(missing_end, start, end), kwh, columns[6], carbon)
+        is_onsite, is_battery = source_flags(columns[6])
+        # Missing amounts are NULL in the table and count as zero in the rollups
+        values = np.nan_to_num(usage_values(kwh, cost, carbon, is_onsite, is_battery))
+
+        with db.engine.begin() as connection:
+            dialect_name = connection.dialect.name
+            end_times = driver_datetimes(np.where(missing_end, start, end), dialect_name)
+            for index in np.flatnonzero(missing_end).tolist():
+                end_times[index] = None
+
+            execute_driver_many(connection, DeviceUsageLog.__table__.insert(), {
+                'device_id': columns[0],
+                'start_time': driver_datetimes(start, dialect_name),
+                'end_time': end_times,
+                'energy_consumed_kwh': columns[3],
+                'cost': columns[4],
+                'carbon_footprint_kg': [None if value != value else value for value in carbon.tolist()],
+                'energy_source': columns[6],
+                'is_optimal_usage': columns[7],
+                'created_at': driver_datetimes([time.time()], dialect_name) * len(batch)
+            })
+            UsageRollupService.add_logs(connection, user_id, device_ids, start,
+                                        np.where(missing_end, start, end), values)
+        return len(batch)
+
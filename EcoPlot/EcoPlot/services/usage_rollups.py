@@ -0,0 +1,564 @@
+# EcoPlot/services/usage_rollups.py
+import threading
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+import numpy as np
+from flask import current_app
+from sqlalchemy import delete, event, inspect, or_, select
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.usage_rollup import UsageRollup, UsageRollupStatus
+from EcoPlot.models.user import User
+from EcoPlot.services.energy_aggregation import (
+    _epoch_seconds, distribute, load_usage, local_midnight, month_start, source_flags,
+    timezone_from_name, usage_values
+)
+
+GRAINS = ('hour', 'day', 'month')
+
+# Rollup columns in the row order of usage_values
+VALUE_COLUMNS = ('kwh', 'onsite_kwh', 'cost', 'carbon_kg', 'grid_kwh', 'grid_cost', 'grid_carbon_kg', 'battery_kwh')
+
+# DeviceUsageLog attributes the rollups depend on
+TRACKED_ATTRIBUTES = ('device_id', 'start_time', 'end_time', 'energy_consumed_kwh', 'cost',
+                      'carbon_footprint_kg', 'energy_source')
+
+BATCH_SIZE = 500
+
+
+def _to_datetime(epoch_seconds):
+    """Naive UTC datetime as stored in the database"""
+    return datetime.fromtimestamp(int(epoch_seconds), timezone.utc).replace(tzinfo=None)
+
+
+def _to_epoch(value):
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def grain_edges(grain, tz, start, end):
+    """
+    Build the bucket edges of a grain covering [start, end].
+
+    Hours are UTC hours; days and months start at local midnight in the user's timezone.
+
+    Args:
+        grain (str): hour, day or month
+        tz (ZoneInfo): Timezone of the day and month buckets
+        start (float): First instant to cover, UTC epoch seconds
+        end (float): Last instant to cover, UTC epoch seconds
+
+    Returns:
+        ndarray: Ascending bucket edges, UTC epoch seconds
+    """
+    if grain == 'hour':
+        first = int(start // 3600) * 3600
+        return np.arange(first, int(end // 3600) * 3600 + 3601, 3600, dtype=np.int64)
+
+    first_day = datetime.fromtimestamp(start, tz).date()
+    last_day = datetime.fromtimestamp(end, tz).date()
+    if grain == 'day':
+        bounds = [local_midnight(first_day + timedelta(days=offset), tz)
+                  for offset in range((last_day - first_day).days + 2)]
+    else:
+        months = (last_day.year - first_day.year) * 12 + last_day.month - first_day.month
+        bounds = [month_start(first_day, offset, tz) for offset in range(months + 2)]
+    return np.array([int(bound.timestamp()) for bound in bounds], dtype=np.int64)
+
+
+def rollup_rows(user_id, tz, device_ids, start, end, values):
+    """
+    Sum usage logs into rollup rows of every grain, per device and for all devices.
+
+    Args:
+        user_id (int): Owner of the devices
+        tz (ZoneInfo): Timezone of the day and month buckets
+        device_ids, start, end (ndarray): Per-log device id and interval, epoch seconds
+        values (ndarray): usage_values matrix; negated values subtract logs
+
+    Returns:
+        dict: Column name -> values of the usage_rollups rows, with bucket_start as
+            epoch seconds; empty buckets are skipped
+    """
+    grains, bucket_devices, bucket_starts, bucket_values = [], [], [], []
+
+    def add(grain, device_id, edges, bins):
+        index = np.flatnonzero(np.any(bins != 0, axis=0))
+        grains.extend([grain] * index.size)
+        bucket_devices.extend([device_id] * index.size)
+        bucket_starts.append(edges[index])
+        bucket_values.append(bins[:, index])
+
+    if start.size:
+        span_start = float(start.min())
+        span_end = float(max(end.max(), start.max()))
+        devices = np.unique(device_ids)
+
+        for grain in GRAINS:
+            edges = grain_edges(grain, tz, span_start, span_end)
+            total = np.zeros((len(VALUE_COLUMNS), edges.size - 1))
+            for device_id in devices:
+                mask = device_ids == device_id
+                bins = distribute(edges, start[mask], end[mask], values[:, mask])
+                total += bins
+                add(grain, int(device_id), edges, bins)
+            add(grain, UsageRollup.ALL_DEVICES, edges, total)
+
+    rows = {
+        'grain': grains,
+        'user_id': [user_id] * len(grains),
+        'device_id': bucket_devices,
+        'bucket_start': np.concatenate(bucket_starts) if bucket_starts else np.zeros(0)
+    }
+    stacked = np.hstack(bucket_values) if bucket_values else np.zeros((len(VALUE_COLUMNS), 0))
+    rows.update(zip(VALUE_COLUMNS, stacked.tolist()))
+    return rows
+
+
+def driver_datetimes(epoch_seconds, dialect_name):
+    """
+    Convert epoch seconds to datetime parameters for the database driver.
+
+    SQLite gets text in the format SQLAlchemy writes and compares; other drivers
+    take naive UTC datetimes.
+
+    Args:
+        epoch_seconds (ndarray): UTC epoch seconds
+        dialect_name (str): Name of the connection's dialect
+
+    Returns:
+        list: One parameter per timestamp
+    """
+    micros = np.rint(np.asarray(epoch_seconds, dtype=np.float64) * 1e6).astype(np.int64)
+    # Bulk writes repeat the same timestamps across devices, so each is formatted once
+    micros, inverse = np.unique(micros, return_inverse=True)
+    micros = micros.view('datetime64[us]')
+    if dialect_name == 'sqlite':
+        values = np.char.replace(np.datetime_as_string(micros, unit='us'), 'T', ' ').astype(object)
+    else:
+        values = micros.astype(object)
+    return values[inverse.reshape(-1)].tolist()
+
+
+def execute_driver_many(connection, statement, columns, batch_size=None):
+    """
+    Execute a statement for many rows with parameters passed to the driver as-is.
+
+    SQLAlchemy's per-row bind processing costs more than the SQLite insert itself for
+    bulk writes, so the values must already be in the driver's types (see
+    driver_datetimes).
+
+    Args:
+        connection (Connection): Connection to execute on
+        statement: Insert statement
+        columns (dict): Column name -> list of values, one per row
+        batch_size (int, optional): Rows per executemany, all at once by default
+    """
+    compiled = statement.compile(dialect=connection.dialect, column_keys=list(columns))
+    names = compiled.positiontup if compiled.positional else list(columns)
+    rows = list(zip(*[columns[name] for name in names]))
+    if not compiled.positional:
+        rows = [dict(zip(names, row)) for row in rows]
+
+    batch_size = batch_size or len(rows)
+    for offset in range(0, len(rows), batch_size):
+        connection.exec_driver_sql(str(compiled), rows[offset:offset + batch_size])
+
+
+def fetch_driver_rows(connection, statement, params):
+    """
+    Run a select and return the driver's row tuples as-is.
+
+    Building SQLAlchemy rows costs about as much as the SQLite read itself for
+    large results, so bulk reads skip it; parameters must already be in the
+    driver's types (see driver_datetimes).
+
+    Args:
+        connection (Connection): Connection to execute on
+        statement: Select statement; values given in it, such as in_() lists, are bound as they are
+        params (dict): Value of each bindparam placeholder
+
+    Returns:
+        list: One tuple per row
+    """
+    compiled = statement.params(params).compile(dialect=connection.dialect,
+                                                compile_kwargs={'render_postcompile': True})
+    values = compiled.params
+    if compiled.positional:
+        values = tuple(values[name] for name in compiled.positiontup)
+    result = connection.exec_driver_sql(str(compiled), values)
+    try:
+        return result.cursor.fetchall()
+    finally:
+        result.close()
+
+
+def _write_rows(connection, rows, upsert=False):
+    """Insert rollup rows; with upsert their values are added to existing buckets"""
+    if not rows['grain']:
+        return
+    table = UsageRollup.__table__
+    statement = table.insert()
+    if upsert:
+        if connection.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.grain, table.c.user_id, table.c.device_id, table.c.bucket_start],
+            set_={name: table.c[name] + statement.excluded[name] for name in VALUE_COLUMNS}
+        )
+    columns = dict(rows, bucket_start=driver_datetimes(rows['bucket_start'], connection.dialect.name))
+    execute_driver_many(connection, statement, columns, BATCH_SIZE)
+
+
+def _snapshot_arrays(snapshots):
+    """Turn log snapshots into the device id, interval and value arrays of load_usage"""
+    device_ids = np.array([snapshot[0] for snapshot in snapshots], dtype=np.int64)
+    start = np.array([_to_epoch(snapshot[1]) for snapshot in snapshots], dtype=np.float64)
+    end = np.array([_to_epoch(snapshot[2] or snapshot[1]) for snapshot in snapshots], dtype=np.float64)
+    kwh, cost, carbon = (np.array([snapshot[index] or 0.0 for snapshot in snapshots], dtype=np.float64)
+                         for index in (3, 4, 5))
+    is_onsite, is_battery = source_flags([snapshot[6] for snapshot in snapshots])
+    return device_ids, start, end, usage_values(kwh, cost, carbon, is_onsite, is_battery)
+
+
+def load_rollup_bins(user_id, tz, grain, edges, device_id=UsageRollup.ALL_DEVICES):
+    """
+    Sum the user's rollups into bins whose edges fall on bucket boundaries.
+
+    Args:
+        user_id (int): User whose totals are read
+        tz (ZoneInfo): Timezone the bins were built in
+        grain (str): hour, day or month
+        edges (ndarray): Bin edges, UTC epoch seconds
+        device_id (int, optional): One device's rollups instead of the user's totals
+
+    Returns:
+        ndarray: (8, len(edges) - 1) per-bin sums in the rows of usage_values, or None
+            when the rollups cannot answer and the raw logs have to be read
+    """
+    status = db.session.get(UsageRollupStatus, user_id)
+    if status is None or status.timezone != tz.key:
+        return None
+    if grain == 'hour' and np.any(edges % 3600):
+        return None  # local hours of half-hour offset zones do not line up with UTC hours
+
+    table = UsageRollup.__table__
+    query = select(
+        _epoch_seconds(table.c.bucket_start),
+        *[table.c[name] for name in VALUE_COLUMNS]
+    ).where(
+        table.c.grain == grain,
+        table.c.user_id == user_id,
+        table.c.device_id == device_id,
+        table.c.bucket_start >= _to_datetime(edges[0]),
+        table.c.bucket_start < _to_datetime(edges[-1])
+    )
+    rows = db.session.execute(query).all()
+
+    width = len(VALUE_COLUMNS) + 1
+    data = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * width).reshape(-1, width)
+    index = np.searchsorted(edges, np.rint(data[:, 0]), side='right') - 1
+    return np.vstack([
+        np.bincount(index, weights=data[:, column], minlength=edges.size - 1)
+        for column in range(1, width)
+    ])
+
+
+class UsageRollupService:
+    """Maintains the per-user and per-device usage rollups"""
+
+    @staticmethod
+    def rebuild_user(user_id, connection=None):
+        """
+        Recompute all rollups of a user from the usage logs.
+
+        Args:
+            user_id (int): User to rebuild
+            connection (Connection, optional): Connection of an open transaction
+
+        Returns:
+            int: Number of rollup rows written
+        """
+        if connection is None:
+            with db.engine.begin() as conn:
+                return UsageRollupService.rebuild_user(user_id, conn)
+
+        users = User.__table__
+        tz = timezone_from_name(connection.execute(
+            select(users.c.timezone).where(users.c.id == user_id)
+        ).scalar())
+
+        device_ids, start, end, values = load_usage(user_id, connection=connection)
+        return UsageRollupService.replace(connection, user_id, tz, device_ids, start, end, values)
+
+    @staticmethod
+    def replace(connection, user_id, tz, device_ids, start, end, values, existing=True):
+        """
+        Replace a user's rollups with the sums of the given logs and mark them complete.
+
+        Args:
+            connection (Connection): Connection of an open transaction
+            user_id (int): Owner of the devices
+            tz (ZoneInfo): User's timezone
+            device_ids, start, end (ndarray): Per-log device id and interval, epoch seconds;
+                all of the user's logs
+            values (ndarray): usage_values matrix of the logs
+            existing (bool): False for a user created in this transaction, skipping the
+                delete of rollups they cannot have yet
+
+        Returns:
+            int: Number of rollup rows written
+        """
+        rows = rollup_rows(user_id, tz, device_ids, start, end, values)
+
+        status = UsageRollupStatus.__table__
+        if existing:
+            connection.execute(delete(UsageRollup.__table__).where(UsageRollup.user_id == user_id))
+            connection.execute(delete(status).where(status.c.user_id == user_id))
+        _write_rows(connection, rows)
+        connection.execute(status.insert().values(
+            user_id=user_id, timezone=tz.key, rebuilt_at=datetime.utcnow()
+        ))
+        return len(rows['grain'])
+
+    @staticmethod
+    def apply(connection, added, removed, rebuild_devices=()):
+        """
+        Update the rollups for inserted, corrected and deleted usage logs.
+
+        Users whose rollups were never built, or were built for another timezone, are
+        rebuilt from the logs instead.
+
+        Args:
+            connection (Connection): Connection of the transaction that changed the logs
+            added (list): Snapshots of new and corrected logs, as in TRACKED_ATTRIBUTES
+            removed (list): Snapshots of deleted logs and of corrected logs before the change
+            rebuild_devices (iterable, optional): Devices whose owners are rebuilt because
+                the previous values of a changed log are unknown
+        """
+        snapshots = [(snapshot, 1.0) for snapshot in added] + [(snapshot, -1.0) for snapshot in removed]
+        snapshots = [(snapshot, sign) for snapshot, sign in snapshots
+                     if snapshot[0] is not None and snapshot[1] is not None]
+        rebuild_devices = set(rebuild_devices)
+        if not snapshots and not rebuild_devices:
+            return
+
+        devices = Device.__table__
+        device_ids = {snapshot[0] for snapshot, _ in snapshots} | rebuild_devices
+        owners = dict(connection.execute(
+            select(devices.c.id, devices.c.user_id).where(devices.c.id.in_(device_ids))
+        ).all())
+
+        rebuild = {owners[device_id] for device_id in rebuild_devices if device_id in owners}
+        for user_id in rebuild:
+            UsageRollupService.rebuild_user(user_id, connection)
+
+        by_user = {}
+        for snapshot, sign in snapshots:
+            user_id = owners.get(snapshot[0])
+            if user_id is not None and user_id not in rebuild:
+                by_user.setdefault(user_id, []).append((snapshot, sign))
+
+        for user_id, user_snapshots in by_user.items():
+            device_ids, start, end, values = _snapshot_arrays([snapshot for snapshot, _ in user_snapshots])
+            values *= np.array([sign for _, sign in user_snapshots])
+            UsageRollupService.add_logs(connection, user_id, device_ids, start, end, values)
+
+    @staticmethod
+    def add_logs(connection, user_id, device_ids, start, end, values):
+        """
+        Add usage logs already written in the transaction to a user's rollups.
+
+        Rollups that were never built, or were built for another timezone, are rebuilt
+        from the logs instead.
+
+        Args:
+            connection (Connection): Connection of the transaction that wrote the logs
+            user_id (int): Owner of the devices
+            device_ids, start, end (ndarray): Per-log device id and interval, epoch seconds
+            values (ndarray): usage_values matrix; negated values subtract logs
+        """
+        users = User.__table__
+        status = UsageRollupStatus.__table__
+        tz = timezone_from_name(connection.execute(
+            select(users.c.timezone).where(users.c.id == user_id)
+        ).scalar())
+        built = connection.execute(
+            select(status.c.timezone).where(status.c.user_id == user_id)
+        ).scalar()
+
+        if built != tz.key:
+            UsageRollupService.rebuild_user(user_id, connection)
+        else:
+            _write_rows(connection, rollup_rows(user_id, tz, device_ids, start, end, values), upsert=True)
+
+
+def pending_rebuilds(connection):
+    """
+    Find the users whose rollups were built for another timezone than their profile's.
+
+    Args:
+        connection (Connection): Connection to read from
+
+    Returns:
+        list: User IDs
+    """
+    users = User.__table__
+    status = UsageRollupStatus.__table__
+    rows = connection.execute(
+        select(status.c.user_id, status.c.timezone, users.c.timezone)
+        .join(users, users.c.id == status.c.user_id)
+        .where(or_(users.c.timezone.is_(None), users.c.timezone != status.c.timezone))
+    ).all()
+    # Missing and unknown names fall back to the default timezone
+    return [user_id for user_id, built, name in rows if timezone_from_name(name).key != built]
+
+
+class RollupRebuildQueue:
+    """
+    Background worker rebuilding the rollups of users who changed their timezone.
+
+    Day and month buckets start at local midnight, so rollups built for another
+    timezone cannot answer, and the dashboard reads the raw logs until they are rebuilt.
+    The usage_rollup_status table is the queue: every user whose status names another
+    timezone than the profile is pending, so rebuilds interrupted by a restart are
+    picked up the next time the worker runs, or by ``flask rollups rebuild --pending``.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker thread if it is not already running"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._worker_loop, name='rollup-rebuild-worker', daemon=True)
+            self._thread.start()
+
+    def shutdown(self, wait=True):
+        """Stop the worker after its current rebuild"""
+        self._stopping.set()
+        self._wakeup.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def wake(self):
+        """Have the worker rebuild the pending users, e.g. after a timezone change was committed"""
+        if self.app.config.get('USAGE_ROLLUP_REBUILD_INLINE_WORKER', True):
+            self.start()
+        self._wakeup.set()
+
+    def run_pending(self):
+        """
+        Rebuild the rollups of every pending user in the calling thread.
+
+        Returns:
+            int: Number of users rebuilt
+        """
+        rebuilt = 0
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                user_ids = pending_rebuilds(conn)
+            for user_id in user_ids:
+                try:
+                    UsageRollupService.rebuild_user(user_id)
+                    rebuilt += 1
+                except Exception as e:
+                    # The user stays pending and is retried on the next wakeup
+                    self.app.logger.warning(f"Could not rebuild usage rollups for user {user_id}: {e}")
+        return rebuilt
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.run_pending()
+            except Exception as e:
+                self.app.logger.error(f"Rollup rebuild worker error: {str(e)}")
+
+
+def _committed_snapshot(log):
+    """Values of a log as last flushed, or None when an old value was never loaded"""
+    state = inspect(log)
+    snapshot = []
+    for name in TRACKED_ATTRIBUTES:
+        history = state.attrs[name].history
+        if history.deleted:
+            snapshot.append(history.deleted[0])
+        elif history.added:
+            return None  # changed before the old value was loaded
+        else:
+            # Unchanged; reading it loads expired attributes from the database
+            snapshot.append(getattr(log, name))
+    return tuple(snapshot)
+
+
+def _current_snapshot(log):
+    return tuple(getattr(log, name) for name in TRACKED_ATTRIBUTES)
+
+
+def _before_flush(session, flush_context, instances):
+    # Replaces what a failed earlier flush left behind
+    with session.no_autoflush:
+        session.info['usage_rollup_changes'] = _collect_changes(session)
+
+
+def _collect_changes(session):
+    added, removed, rebuild = [], [], set()
+    for log in session.new:
+        if isinstance(log, DeviceUsageLog):
+            added.append(log)
+    for log in session.dirty:
+        if isinstance(log, DeviceUsageLog) and session.is_modified(log):
+            previous = _committed_snapshot(log)
+            if previous is None:
+                rebuild.add(log.device_id)
+            elif previous != _current_snapshot(log):
+                removed.append(previous)
+                added.append(log)
+    for log in session.deleted:
+        if isinstance(log, DeviceUsageLog):
+            previous = _committed_snapshot(log)
+            if previous is None:
+                rebuild.add(log.device_id)
+            else:
+                removed.append(previous)
+    return added, removed, rebuild
+
+
+def _after_flush(session, flush_context):
+    added, removed, rebuild = session.info.pop('usage_rollup_changes', ((), (), ()))
+    if not (added or removed or rebuild):
+        return
+
+    UsageRollupService.apply(session.connection(), [_current_snapshot(log) for log in added],
+                             removed, rebuild)
+
+
+def init_usage_rollups(app):
+    """
+    Keep the usage rollups up to date with usage logs changed through the ORM session,
+    and create the queue rebuilding them after timezone changes. Its worker starts on
+    first use.
+    """
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'after_flush', _after_flush)
+    app.extensions['rollup_rebuilds'] = RollupRebuildQueue(app)
+
+
+def get_rollup_rebuilds():
+    """Return the rollup rebuild queue of the current app"""
+    return current_app.extensions['rollup_rebuilds']
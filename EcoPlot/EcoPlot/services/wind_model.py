@@ -0,0 +1,324 @@
+# EcoPlot/services/wind_model.py
+import csv
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+import numpy as np
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HUB_HEIGHT = 20.0  # meters, for profiles without a turbine height
+LOOKUP_STEP = 0.05  # m/s between power curve lookup table entries
+
+# Generic small turbine power curve: wind speed at hub height in m/s -> share of rated
+# power. Cut-in at 3 m/s, rated from 13 m/s, cut-out above 25 m/s.
+POWER_CURVE = (
+    (0.0, 0.0), (2.9, 0.0), (3.0, 0.01), (4.0, 0.04), (5.0, 0.09), (6.0, 0.17), (7.0, 0.28),
+    (8.0, 0.42), (9.0, 0.57), (10.0, 0.72), (11.0, 0.86), (12.0, 0.96), (13.0, 1.0), (25.0, 1.0)
+)
+
+# Accepted weather file column names
+TIME_COLUMNS = ('timestamp', 'time', 'datetime', 'date_time')
+SPEED_COLUMNS = ('wind_speed', 'wind_speed_ms', 'wind_speed_m_s', 'windspeed', 'wspd', 'ws')
+HEIGHT_COLUMNS = ('height', 'measurement_height', 'height_m')
+LATITUDE_COLUMNS = ('latitude', 'lat')
+LONGITUDE_COLUMNS = ('longitude', 'lon', 'lng')
+
+
+class WeatherFileError(ValueError):
+    """The wind weather file cannot be read"""
+
+
+def power_curve_table(curve=POWER_CURVE, step=LOOKUP_STEP):
+    """
+    Tabulate a power curve at fixed wind speed steps.
+
+    Args:
+        curve (tuple): (wind speed in m/s, share of rated power) points
+        step (float): m/s between entries
+
+    Returns:
+        ndarray: Share of rated power at 0, step, 2 * step, ... up to the cut-out
+            speed, followed by a 0 entry for all faster winds
+    """
+    speeds, shares = np.array(curve, dtype=np.float64).T
+    table = np.interp(np.arange(0, speeds[-1] + step / 2, step), speeds, shares)
+    return np.append(table, 0.0).astype(np.float32)
+
+
+def shear_factor(measurement_height, hub_height, model='log', roughness_length=0.1, exponent=1 / 7):
+    """
+    Ratio of the wind speed at hub height to the speed at the measurement height.
+
+    Args:
+        measurement_height (ndarray): Anemometer height in meters
+        hub_height (ndarray): Turbine hub height in meters
+        model (str): log for the logarithmic profile over roughness_length, power for
+            the power law with exponent
+        roughness_length (float): Surface roughness length in meters
+        exponent (float): Power law (Hellmann) exponent
+
+    Returns:
+        ndarray: Speed multiplier, broadcast over the heights
+    """
+    if model == 'power':
+        return (np.maximum(hub_height, 0.5) / np.maximum(measurement_height, 0.5)) ** exponent
+    if model != 'log':
+        raise ValueError(f"Unknown wind shear model: {model}")
+    # The log profile only holds above the roughness elements
+    lowest = 2 * roughness_length
+    return (np.log(np.maximum(hub_height, lowest) / roughness_length)
+            / np.log(np.maximum(measurement_height, lowest) / roughness_length))
+
+
+def wind_sites(users):
+    """
+    Collect the turbine setup of users as site arrays.
+
+    Users without a turbine or a capacity get a capacity of 0 and so produce nothing.
+
+    Args:
+        users (list): User models or dicts with the profile's wind fields
+
+    Returns:
+        dict: latitude, longitude (NaN when unknown), capacity_kw and hub_height arrays,
+            in the order of users
+    """
+    def field(user, name):
+        return user.get(name) if isinstance(user, dict) else getattr(user, name, None)
+
+    latitude, longitude, capacity, height = [], [], [], []
+    for user in users:
+        latitude.append(field(user, 'latitude'))
+        longitude.append(field(user, 'longitude'))
+        has_turbine = field(user, 'has_wind_turbine') and field(user, 'wind_turbine_capacity_kw')
+        capacity.append(field(user, 'wind_turbine_capacity_kw') if has_turbine else 0.0)
+        height.append(field(user, 'wind_turbine_height_meters') or DEFAULT_HUB_HEIGHT)
+    to_array = lambda values: np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return {
+        'latitude': to_array(latitude),
+        'longitude': to_array(longitude),
+        'capacity_kw': np.array(capacity, dtype=np.float64),
+        'hub_height': np.array(height, dtype=np.float64)
+    }
+
+
+def _parse_time(text):
+    text = text.strip()
+    try:
+        return float(text)  # epoch seconds
+    except ValueError:
+        pass
+    moment = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    return moment.replace(tzinfo=moment.tzinfo or timezone.utc).timestamp()
+
+
+def read_weather_file(path, default_height=10.0):
+    """
+    Read wind speed measurements from a CSV weather file.
+
+    The file needs a timestamp column (ISO 8601, UTC unless it has an offset, or
+    epoch seconds) and a wind speed column in m/s. Optional columns give the
+    measurement height and the station's latitude and longitude; rows of several
+    stations may be mixed.
+
+    Args:
+        path (str): CSV file
+        default_height (float): Measurement height in meters when the file has none
+
+    Returns:
+        list: One dict per station with latitude, longitude (None when the file has
+            no location), height, and epoch and speed arrays ordered by time
+    """
+    def pick(names, fieldnames):
+        lowered = {name.strip().lower(): name for name in fieldnames}
+        return next((lowered[name] for name in names if name in lowered), None)
+
+    stations = {}
+    with open(path, newline='', encoding='utf-8') as source:
+        reader = csv.DictReader(line for line in source if not line.startswith('#'))
+        fieldnames = reader.fieldnames or []
+        time_column, speed_column = pick(TIME_COLUMNS, fieldnames), pick(SPEED_COLUMNS, fieldnames)
+        if time_column is None or speed_column is None:
+            raise WeatherFileError(f"{path} needs a timestamp and a wind speed column")
+        height_column = pick(HEIGHT_COLUMNS, fieldnames)
+        latitude_column, longitude_column = pick(LATITUDE_COLUMNS, fieldnames), pick(LONGITUDE_COLUMNS, fieldnames)
+
+        for line, row in enumerate(reader, start=2):
+            speed = (row.get(speed_column) or '').strip()
+            if not speed:
+                continue  # missing measurement
+            try:
+                location = None
+                if latitude_column and longitude_column and row.get(latitude_column):
+                    location = (float(row[latitude_column]), float(row[longitude_column]))
+                height = float(row[height_column]) if height_column and row.get(height_column) else default_height
+                station = stations.setdefault(location, {'height': height, 'epoch': [], 'speed': []})
+                station['epoch'].append(_parse_time(row[time_column]))
+                station['speed'].append(max(float(speed), 0.0))
+            except (TypeError, ValueError) as e:
+                raise WeatherFileError(f"{path} line {line}: {e}")
+
+    result = []
+    for location, station in stations.items():
+        epoch = np.array(station['epoch'], dtype=np.float64)
+        order = np.argsort(epoch, kind='stable')
+        result.append({
+            'latitude': location[0] if location else None,
+            'longitude': location[1] if location else None,
+            'height': station['height'],
+            'epoch': epoch[order],
+            'speed': np.array(station['speed'], dtype=np.float32)[order]
+        })
+    return result
+
+
+class WindModel:
+    """
+    Wind turbine output from measured wind speeds, vectorized over sites and timestamps.
+
+    Speeds come from the nearest station of the weather file, extrapolated to hub
+    height and mapped through the power curve lookup table. The file is read once
+    and again only when it changes. Timestamps outside the measured range wrap
+    around a file covering at least a year, so a typical-year file serves every
+    year.
+    """
+
+    def __init__(self, weather_file, measurement_height=10.0, shear_model='log', roughness_length=0.1,
+                 shear_exponent=1 / 7, losses=0.1):
+        self.weather_file = weather_file
+        self.measurement_height = measurement_height
+        self.shear_model = shear_model
+        self.roughness_length = roughness_length
+        self.shear_exponent = shear_exponent
+        self.losses = losses  # share lost to downtime, wakes and electrical losses
+        self.table = power_curve_table()
+        self._stations = None
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+
+    def stations(self):
+        """Stations of the weather file, reloaded when it changes; empty without a usable file"""
+        try:
+            mtime = os.path.getmtime(self.weather_file) if self.weather_file else None
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._loaded_mtime or self._stations is None:
+                self._stations = []
+                if mtime:
+                    try:
+                        self._stations = read_weather_file(self.weather_file, self.measurement_height)
+                    except (OSError, WeatherFileError) as e:
+                        logger.warning(f"Wind weather file not used: {str(e)}")
+                self._loaded_mtime = mtime
+            return self._stations
+
+    @property
+    def available(self):
+        return bool(self.stations())
+
+    def _nearest_station(self, sites, stations):
+        """Index of the station nearest to each site; sites without a location get the first"""
+        located = [index for index, station in enumerate(stations) if station['latitude'] is not None]
+        nearest = np.zeros(len(sites['capacity_kw']), dtype=np.int64)
+        if len(located) < 2:
+            return nearest + (located[0] if located else 0)
+        latitude = np.radians([stations[index]['latitude'] for index in located])
+        longitude = np.radians([stations[index]['longitude'] for index in located])
+        site_latitude = np.radians(np.nan_to_num(sites['latitude']))[:, None]
+        site_longitude = np.radians(np.nan_to_num(sites['longitude']))[:, None]
+        # Haversine distance up to a constant factor
+        distance = (np.sin((latitude - site_latitude) / 2) ** 2
+                    + np.cos(site_latitude) * np.cos(latitude) * np.sin((longitude - site_longitude) / 2) ** 2)
+        return np.array(located, dtype=np.int64)[np.argmin(distance, axis=1)]
+
+    @staticmethod
+    def _station_speed(station, epoch):
+        """Wind speed interpolated at the timestamps, wrapping around a year or more of data"""
+        measured = station['epoch']
+        span = measured[-1] - measured[0]
+        period = span + span / max(len(measured) - 1, 1)  # the last sample covers one more step
+        if period >= 365 * 86400:
+            return np.interp(epoch, measured, station['speed'], period=period)
+        return np.interp(epoch, measured, station['speed'])
+
+    def power(self, sites, epoch):
+        """
+        Turbine output of the sites at arbitrary timestamps.
+
+        Args:
+            sites (dict): From wind_sites
+            epoch (ndarray): UTC epoch seconds, shared by all sites
+
+        Returns:
+            ndarray: (sites, timestamps) kW; zeros without a weather file
+        """
+        epoch = np.asarray(epoch, dtype=np.float64)
+        output = np.zeros((len(sites['capacity_kw']), epoch.size), dtype=np.float32)
+        stations = self.stations()
+        producing = np.flatnonzero(sites['capacity_kw'] > 0)
+        if not stations or not producing.size or not epoch.size:
+            return output
+
+        nearest = self._nearest_station(sites, stations)
+        for station_index in np.unique(nearest[producing]).tolist():
+            station = stations[station_index]
+            rows = producing[nearest[producing] == station_index]
+            speed = self._station_speed(station, epoch).astype(np.float32)
+            factor = shear_factor(station['height'], sites['hub_height'][rows], self.shear_model,
+                                  self.roughness_length, self.shear_exponent).astype(np.float32)
+            index = np.minimum((speed * factor[:, None] * (1 / LOOKUP_STEP) + 0.5).astype(np.int64),
+                               len(self.table) - 1)
+            rated = (sites['capacity_kw'][rows] * (1 - self.losses)).astype(np.float32)
+            output[rows] = self.table[index] * rated[:, None]
+        return output
+
+    def energy(self, sites, edges, step=3600):
+        """
+        Turbine energy of the sites between consecutive bin edges.
+
+        Args:
+            sites (dict): From wind_sites
+            edges (ndarray): Increasing UTC epoch seconds
+            step (int): Seconds between the evaluated output samples
+
+        Returns:
+            ndarray: (sites, len(edges) - 1) kWh
+        """
+        edges = np.asarray(edges, dtype=np.float64)
+        bins = max(edges.size - 1, 0)
+        if not bins:
+            return np.zeros((len(sites['capacity_kw']), 0))
+        samples = np.arange(edges[0], edges[-1] + step, step)
+        power = self.power(sites, samples)
+        # Trapezoidal running total of kWh on the sample grid, interpolated at the edges
+        cumulative = np.zeros(power.shape, dtype=np.float64)
+        np.cumsum((power[:, 1:] + power[:, :-1]) * (step / 3600 / 2), axis=1, out=cumulative[:, 1:])
+        position = (edges - edges[0]) / step
+        lower = np.minimum(position.astype(np.int64), max(samples.size - 2, 0))
+        weight = position - lower
+        upper = np.minimum(lower + 1, samples.size - 1)
+        at_edges = cumulative[:, lower] * (1 - weight) + cumulative[:, upper] * weight
+        return np.diff(at_edges, axis=1)
+
+
+def init_wind_model(app):
+    """Create the wind production model for the app"""
+    model = WindModel(
+        weather_file=app.config.get('WIND_WEATHER_FILE'),
+        measurement_height=app.config.get('WIND_MEASUREMENT_HEIGHT_M', 10.0),
+        shear_model=app.config.get('WIND_SHEAR_MODEL', 'log'),
+        roughness_length=app.config.get('WIND_ROUGHNESS_LENGTH_M', 0.1),
+        shear_exponent=app.config.get('WIND_SHEAR_EXPONENT', 1 / 7),
+        losses=app.config.get('WIND_LOSSES', 0.1)
+    )
+    app.extensions['wind_model'] = model
+    return model
+
+
+def get_wind_model():
+    """Return the wind production model of the current app"""
+    return current_app.extensions['wind_model']
@@ -291,7 +291,9 @@ function loadEnergyUsageData() {
                 // Update chart with API data
                 energyUsageChart.data.labels = data.labels;
                 energyUsageChart.data.datasets[0].data = data.consumption;
-                energyUsageChart.data.datasets[1].data = data.production;
+                // Without logged production, show the modeled output of the profile's panels
+                const logged = data.production.some(value => value > 0);
+                energyUsageChart.data.datasets[1].data = logged ? data.production : data.expected_production;
                 energyUsageChart.update();
             }
         })
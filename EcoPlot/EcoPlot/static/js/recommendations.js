@@ -6,35 +6,51 @@ document.addEventListener('DOMContentLoaded', function () {
 
     // Set up refresh button event listener
     document.getElementById('refreshRecommendations').addEventListener('click', function () {
-        fetchRecommendations();
+        fetchRecommendations(true);
     });
 });
 
 /**
  * Fetches recommendations from the API
+ * @param {boolean} refresh - Bypass cached recommendations and generate new ones
  */
-async function fetchRecommendations() {
+async function fetchRecommendations(refresh = false) {
+    let showingInterim = false;
+
     try {
         // Show loading indicator, hide content and error
         document.getElementById('loadingRecommendations').style.display = 'block';
         document.getElementById('recommendationsContent').style.display = 'none';
         document.getElementById('recommendationError').style.display = 'none';
 
-        // Fetch recommendations from the API
-        const response = await fetch('/api/recommendations');
-        const data = await response.json();
+        // Queue a recommendation job; cached results come back immediately
+        const data = await queueRecommendationsJob(refresh);
+        let recommendations = data.recommendations;
 
-        if (data.success && data.recommendations && data.recommendations.success) {
-            // Hide loading indicator and show content
-            document.getElementById('loadingRecommendations').style.display = 'none';
-            document.getElementById('recommendationsContent').style.display = 'block';
+        // Stored recommendations served while Gemini is unavailable stay on screen until
+        // their revalidation job succeeds; otherwise the stored or rule-based ones are
+        // shown while the job streams the new sections
+        if (!data.cached && !recommendations.revalidation_job_id) {
+            showingInterim = showRecommendations(recommendations);
+            recommendations = await waitForRecommendations(data.job.id);
+        }
+
+        if (recommendations && recommendations.success) {
+            showRecommendations(recommendations);
 
-            // Display the recommendations
-            displayRecommendations(data.recommendations.recommendations);
+            if (recommendations.stale && recommendations.revalidation_job_id) {
+                showRevalidatedRecommendations(recommendations.revalidation_job_id);
+            }
         } else {
-            throw new Error(data.error || data.recommendations.error || 'Failed to get recommendations');
+            throw new Error((recommendations && recommendations.error) || 'Failed to get recommendations');
         }
     } catch (error) {
+        if (showingInterim) {
+            // Keep the stored or rule-based recommendations on screen
+            console.warn('Could not refresh recommendations:', error);
+            return;
+        }
+
         console.error('Error fetching recommendations:', error);
 
         // Hide loading, show error
@@ -44,6 +60,169 @@ async function fetchRecommendations() {
     }
 }
 
+/**
+ * Hides the loading indicator and displays a recommendations result
+ * @param {Object} result - Recommendations result with success and recommendations
+ * @returns {boolean} Whether recommendations were displayed
+ */
+function showRecommendations(result) {
+    if (!result || !result.success) {
+        return false;
+    }
+    document.getElementById('loadingRecommendations').style.display = 'none';
+    document.getElementById('recommendationsContent').style.display = 'block';
+    displayRecommendations(result.recommendations);
+    return true;
+}
+
+/**
+ * Creates the handlers rendering streamed recommendation sections as they arrive
+ * @returns {Object} Handlers keyed by job event name
+ */
+function sectionRenderers() {
+    let startedSections = new Set();
+
+    // Replace the current content of a section when its first streamed item arrives
+    const sectionElement = function (elementId) {
+        const element = document.getElementById(elementId);
+        if (!startedSections.has(elementId)) {
+            startedSections.add(elementId);
+            element.innerHTML = '';
+            document.getElementById('loadingRecommendations').style.display = 'none';
+            document.getElementById('recommendationsContent').style.display = 'block';
+        }
+        return element;
+    };
+
+    return {
+        overall_recommendation: function (text) {
+            sectionElement('overallRecommendations')
+                .appendChild(createListItem('bi bi-check-circle-fill text-success', text));
+        },
+        device_recommendation: function (deviceRec) {
+            sectionElement('deviceRecommendations').appendChild(createDeviceCard(deviceRec.id, deviceRec));
+        },
+        schedule_optimization: function (text) {
+            sectionElement('scheduleOptimization')
+                .appendChild(createListItem('bi bi-clock text-primary', text));
+        },
+        energy_saving_tip: function (text) {
+            sectionElement('energySavingTips')
+                .appendChild(createListItem('bi bi-lightbulb text-warning', text));
+        },
+        // The job is retrying; its sections start over
+        restart: function () {
+            startedSections = new Set();
+        }
+    };
+}
+
+/**
+ * Queues a recommendation job
+ * @param {boolean} refresh - Bypass cached recommendations and generate new ones
+ * @returns {Promise<Object>} The response: cached recommendations, or the job with the
+ *     recommendations to show until it finishes
+ */
+async function queueRecommendationsJob(refresh) {
+    const response = await fetch('/api/recommendations/jobs', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh: refresh })
+    });
+    const data = await response.json();
+
+    if (!data.success) {
+        throw new Error(data.error || 'Failed to get recommendations');
+    }
+    return data;
+}
+
+/**
+ * Waits for a recommendation job, rendering each section as the job streams it
+ * @param {string} jobId - The job id returned when the job was queued
+ * @returns {Promise<Object>} The generated recommendations
+ */
+async function waitForRecommendations(jobId) {
+    const job = await waitForJob(jobId, sectionRenderers());
+    if (job.status !== 'succeeded') {
+        throw new Error(job.error || 'Failed to get recommendations');
+    }
+    return job.recommendations;
+}
+
+/**
+ * Replaces stale recommendations with the result of their revalidation job
+ * @param {string} jobId - The revalidation job id
+ */
+async function showRevalidatedRecommendations(jobId) {
+    try {
+        const job = await waitForJob(jobId);
+        const result = job.recommendations;
+        if (job.status === 'succeeded' && result && result.success && !result.fallback) {
+            displayRecommendations(result.recommendations);
+        }
+    } catch (error) {
+        console.warn('Could not revalidate recommendations:', error);
+    }
+}
+
+/**
+ * Waits for a recommendation job to finish, using Server-Sent Events when
+ * available and falling back to polling the status endpoint. The server answers
+ * each event request at once and the browser reconnects until the job is done.
+ * @param {string} jobId - The job id returned when the job was queued
+ * @param {Object} [handlers] - Handlers for the sections the job streams, keyed by event name
+ * @returns {Promise<Object>} The finished job
+ */
+function waitForJob(jobId, handlers = {}) {
+    if (!window.EventSource) {
+        return pollJob(jobId);
+    }
+
+    return new Promise((resolve) => {
+        const source = new EventSource(`/api/recommendations/jobs/${jobId}/events`);
+
+        Object.entries(handlers).forEach(([eventName, handler]) => {
+            source.addEventListener(eventName, function (event) {
+                handler(JSON.parse(event.data));
+            });
+        });
+
+        source.addEventListener('done', function (event) {
+            source.close();
+            resolve(JSON.parse(event.data));
+        });
+
+        // Reconnects are expected; fall back to polling only if the browser gave up
+        source.onerror = function () {
+            if (source.readyState === EventSource.CLOSED) {
+                resolve(pollJob(jobId));
+            }
+        };
+    });
+}
+
+/**
+ * Polls the job status endpoint until the job finishes
+ * @param {string} jobId - The job id returned when the job was queued
+ * @returns {Promise<Object>} The finished job
+ */
+async function pollJob(jobId) {
+    while (true) {
+        const response = await fetch(`/api/recommendations/jobs/${jobId}`);
+        const data = await response.json();
+
+        if (!data.success) {
+            throw new Error(data.error || 'Failed to get recommendation job status');
+        }
+        if (data.job.status === 'succeeded' || data.job.status === 'failed') {
+            return data.job;
+        }
+
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+
 /**
  * Displays recommendations in the UI
  * @param {Object} recommendations - The recommendations data
@@ -69,9 +248,7 @@ function displayRecommendations(recommendations) {
 
     if (recommendations.overall_recommendations && recommendations.overall_recommendations.length > 0) {
         recommendations.overall_recommendations.forEach(recommendation => {
-            const li = document.createElement('li');
-            li.innerHTML = `<i class="bi bi-check-circle-fill text-success"></i><span>${recommendation}</span>`;
-            overallRecommendationsList.appendChild(li);
+            overallRecommendationsList.appendChild(createListItem('bi bi-check-circle-fill text-success', recommendation));
         });
     } else {
         overallRecommendationsList.innerHTML = '<li>No overall recommendations available at this time.</li>';
@@ -87,38 +264,7 @@ function displayRecommendations(recommendations) {
     } else {
         deviceIds.forEach(deviceId => {
             const deviceRec = recommendations.device_recommendations[deviceId];
-
-            // Create device card
-            const deviceCard = document.createElement('div');
-            deviceCard.className = 'card device-card';
-
-            // Determine if we have a recommendation text or an array
-            let recommendationText = '';
-            if (typeof deviceRec.recommendation === 'string') {
-                recommendationText = deviceRec.recommendation;
-            } else if (Array.isArray(deviceRec.recommendation)) {
-                recommendationText = deviceRec.recommendation.join('<br>');
-            }
-
-            // Format estimated savings
-            let savingsHtml = '';
-            if (deviceRec.estimated_savings) {
-                savingsHtml = `<div class="savings-pill">
-                    <i class="bi bi-graph-up-arrow me-1"></i>
-                    Save ${formatNumber(deviceRec.estimated_savings)} kWh/month
-                </div>`;
-            }
-
-            // Set card content
-            deviceCard.innerHTML = `
-                <div class="card-header">
-                    ${deviceRec.name || `Device ${deviceId}`}
-                </div>
-                <div class="card-body">
-                    <p>${recommendationText}</p>
-                    ${savingsHtml}
-                </div>
-            `;
+            const deviceCard = createDeviceCard(deviceId, deviceRec);
 
             deviceRecommendationsDiv.appendChild(deviceCard);
         });
@@ -130,9 +276,7 @@ function displayRecommendations(recommendations) {
 
     if (recommendations.schedule_optimization && recommendations.schedule_optimization.length > 0) {
         recommendations.schedule_optimization.forEach(suggestion => {
-            const li = document.createElement('li');
-            li.innerHTML = `<i class="bi bi-clock text-primary"></i><span>${suggestion}</span>`;
-            scheduleOptimizationList.appendChild(li);
+            scheduleOptimizationList.appendChild(createListItem('bi bi-clock text-primary', suggestion));
         });
     } else {
         scheduleOptimizationList.innerHTML = '<li>No schedule optimization recommendations available.</li>';
@@ -144,15 +288,67 @@ function displayRecommendations(recommendations) {
 
     if (recommendations.energy_saving_tips && recommendations.energy_saving_tips.length > 0) {
         recommendations.energy_saving_tips.forEach(tip => {
-            const li = document.createElement('li');
-            li.innerHTML = `<i class="bi bi-lightbulb text-warning"></i><span>${tip}</span>`;
-            energySavingTipsList.appendChild(li);
+            energySavingTipsList.appendChild(createListItem('bi bi-lightbulb text-warning', tip));
         });
     } else {
         energySavingTipsList.innerHTML = '<li>No energy saving tips available.</li>';
     }
 }
 
+/**
+ * Creates a recommendation list item
+ * @param {string} iconClass - Bootstrap icon classes
+ * @param {string} text - The recommendation text
+ * @returns {HTMLLIElement} The list item
+ */
+function createListItem(iconClass, text) {
+    const li = document.createElement('li');
+    li.innerHTML = `<i class="${iconClass}"></i><span>${text}</span>`;
+    return li;
+}
+
+/**
+ * Creates the card for a device recommendation
+ * @param {string} deviceId - The device id
+ * @param {Object} deviceRec - The device recommendation
+ * @returns {HTMLDivElement} The device card
+ */
+function createDeviceCard(deviceId, deviceRec) {
+    // Create device card
+    const deviceCard = document.createElement('div');
+    deviceCard.className = 'card device-card';
+
+    // Determine if we have a recommendation text or an array
+    let recommendationText = '';
+    if (typeof deviceRec.recommendation === 'string') {
+        recommendationText = deviceRec.recommendation;
+    } else if (Array.isArray(deviceRec.recommendation)) {
+        recommendationText = deviceRec.recommendation.join('<br>');
+    }
+
+    // Format estimated savings
+    let savingsHtml = '';
+    if (deviceRec.estimated_savings) {
+        savingsHtml = `<div class="savings-pill">
+            <i class="bi bi-graph-up-arrow me-1"></i>
+            Save ${formatNumber(deviceRec.estimated_savings)} kWh/month
+        </div>`;
+    }
+
+    // Set card content
+    deviceCard.innerHTML = `
+        <div class="card-header">
+            ${deviceRec.name || `Device ${deviceId}`}
+        </div>
+        <div class="card-body">
+            <p>${recommendationText}</p>
+            ${savingsHtml}
+        </div>
+    `;
+
+    return deviceCard;
+}
+
 /**
  * Formats a number with commas and 2 decimal places
  * @param {number} number - The number to format
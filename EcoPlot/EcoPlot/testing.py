@@ -0,0 +1,45 @@
+# EcoPlot/testing.py
+"""
+Pytest fixtures for tests against a scratch EcoPlot database.
+
+Enable them in a conftest.py with:
+    pytest_plugins = ['EcoPlot.testing']
+"""
+import os
+import pytest
+from EcoPlot import create_app, db, seed_device_types_and_brands
+from EcoPlot.config import Config
+
+
+@pytest.fixture
+def ecoplot_app(tmp_path):
+    """App with an empty database and usage archive under tmp_path and the device catalog seeded"""
+
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(str(tmp_path), 'ecoplot.db')
+        USAGE_ARCHIVE_DIR = os.path.join(str(tmp_path), 'archive')
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        seed_device_types_and_brands()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def synthetic_households(ecoplot_app):
+    """
+    Factory creating synthetic households with usage logs, see SyntheticDataService.generate.
+
+    Usage:
+        result = synthetic_households(users=3, days=14, resolution='minute')
+    """
+    from EcoPlot.services.synthetic_data import SyntheticDataService
+
+    def create(users=5, days=30, seed=0, **options):
+        return SyntheticDataService.generate(users, days, seed=seed, **options)
+
+    return create
@@ -0,0 +1,109 @@
+# benchmarks/bench_carbon_accounting.py
+"""
+Time the vectorized carbon computation of usage logs.
+
+Builds a year of hourly regional intensity profiles and a batch of usage logs
+spread over households in several timezones, then times computing their carbon
+emitted and avoided in one call against a per-log Python loop.
+
+Usage:
+    python -m benchmarks.bench_carbon_accounting --logs 1000000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot.services.carbon_accounting import (
+    BATTERY, HOURS_PER_YEAR, ONSITE, GridIntensityProfiles, log_carbon
+)
+
+ZONES = ['America/Los_Angeles', 'America/Chicago', 'America/New_York', 'Europe/London']
+REGIONS = ('US-CA', 'US-TX', 'US', 'GB')
+
+
+def build_profiles(directory, rng):
+    for region in REGIONS:
+        hour = np.arange(HOURS_PER_YEAR) % 24
+        values = rng.uniform(0.15, 0.5) * (1 + 0.2 * np.cos(2 * np.pi * (hour - 19) / 24))
+        with open(os.path.join(directory, f"{region}.csv"), 'w') as output:
+            output.write('hour,kg_per_kwh\n')
+            output.writelines(f"{index},{value:.4f}\n" for index, value in enumerate(values))
+    return GridIntensityProfiles(directory, 0.4)
+
+
+def python_loop(profiles, region, zone, start, end, kwh, kind):
+    carbon = []
+    for row, zone_index, begin, finish, energy, source in zip(region.tolist(), zone.tolist(), start.tolist(),
+                                                              end.tolist(), kwh.tolist(), kind.tolist()):
+        if source != 0:
+            carbon.append(0.0)
+            continue
+        tz = ZoneInfo(ZONES[zone_index])
+        total = 0.0
+        for fraction in (0.125, 0.375, 0.625, 0.875):
+            local = datetime.fromtimestamp(begin + (finish - begin) * fraction, timezone.utc).astimezone(tz)
+            hour = (local.replace(tzinfo=None) - datetime(local.year, 1, 1)).total_seconds() // 3600
+            total += profiles.table[row, int(hour) % HOURS_PER_YEAR]
+        carbon.append(energy * total / 4)
+    return np.array(carbon)
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logs', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        profiles = build_profiles(directory, rng)
+
+    count = args.logs
+    households = rng.integers(0, 5000, count)
+    zone = (households % len(ZONES)).astype(np.int64)
+    region = (households % (len(REGIONS) + 1)).astype(np.int64)  # row 0 is the fallback
+    start = rng.integers(1735689600, 1767225600, count).astype(np.float64)
+    end = start + rng.choice([900, 3600, 7200], count)
+    kwh = rng.uniform(0.05, 3.0, count)
+    kind = rng.choice([0, ONSITE, BATTERY], count, p=[0.85, 0.13, 0.02]).astype(np.int8)
+    charged_onsite = households % 3 == 0
+
+    def run():
+        return log_carbon(profiles, region, zone, ZONES, start, end, kwh, kind, charged_onsite, 0.9)
+
+    run()  # fills the UTC offset tables
+    vectorized = best_of(args.repeat, run)
+    sample = slice(0, min(count, 20000))
+    loop = best_of(1, lambda: python_loop(profiles, region[sample], zone[sample], start[sample], end[sample],
+                                          kwh[sample], kind[sample]))
+    carbon, avoided = run()
+    grid = kind[sample] == 0
+    error = np.abs(carbon[sample][grid] - python_loop(profiles, region[sample], zone[sample], start[sample],
+                                                      end[sample], kwh[sample], kind[sample])[grid]).max()
+    per_log_loop = loop / (sample.stop - sample.start)
+
+    print(f"{count} logs in {len(ZONES)} timezones and {len(REGIONS)} regions")
+    print(f"vectorized: {vectorized * 1000:.0f} ms ({count / vectorized:,.0f} logs/s)")
+    print(f"python loop: {per_log_loop * 1e6:.1f} us per log ({1 / per_log_loop:,.0f} logs/s)")
+    print(f"max grid carbon difference: {error:.1e} kg; {carbon.sum():,.0f} kg emitted, {avoided.sum():,.0f} kg avoided")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/bench_forecasting.py
+"""
+Time the batched ridge fit of household consumption forecasts.
+
+Builds weeks of hourly usage for many households with daily and weekly
+patterns, then times fitting all of them at once from per-cell sums against
+solving each household's weighted least squares with its own design matrix,
+and checks that both give the same coefficients.
+
+Usage:
+    python -m benchmarks.bench_forecasting --households 5000 --days 84 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot.services.forecasting import CELLS, CELL_DESIGN, FEATURES, INTERCEPT, INTERCEPT_JITTER, fit_batch
+
+ALPHA = 1.0
+HALF_LIFE_DAYS = 21
+
+
+def households_usage(rng, households, days):
+    hours = days * 24
+    hour = np.arange(hours) % 24
+    weekend = (np.arange(hours) // 24 + 3) % 7 >= 5
+    cells = np.broadcast_to(weekend * 24 + hour, (households, hours))
+    level = rng.uniform(0.3, 1.5, (households, 1))
+    evening = np.exp(-((hour - rng.uniform(17, 21, (households, 1))) / 2.5) ** 2)
+    kwh = level * (0.4 + evening + 0.3 * weekend) * rng.gamma(4, 0.25, (households, hours))
+    age = (hours - 0.5 - np.arange(hours)) / 24
+    first = rng.integers(0, hours // 2, households) * (rng.random(households) < 0.2)
+    weights = np.where(np.arange(hours) >= first[:, None], 0.5 ** (age / HALF_LIFE_DAYS), 0.0)
+    return kwh, cells, weights
+
+
+def per_household(kwh, cells, weights):
+    hours = kwh.shape[1]
+    trend = (np.arange(hours) + 0.5 - hours) / 168
+    penalty = np.full(FEATURES, ALPHA)
+    penalty[INTERCEPT] = INTERCEPT_JITTER
+    coefficients = np.empty((kwh.shape[0], FEATURES))
+    for row in range(kwh.shape[0]):
+        design = np.hstack([CELL_DESIGN[cells[row]], trend[:, None]])
+        root = np.sqrt(weights[row])
+        # Ridge as least squares with the penalty appended as extra rows
+        a = np.vstack([design * root[:, None], np.diag(np.sqrt(penalty))])
+        b = np.concatenate([kwh[row] * root, np.zeros(FEATURES)])
+        coefficients[row] = np.linalg.lstsq(a, b, rcond=None)[0]
+    return coefficients
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--households', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=84)
+    parser.add_argument('--chunk', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    kwh, cells, weights = households_usage(np.random.default_rng(0), args.households, args.days)
+
+    def batched():
+        return [fit_batch(kwh[offset:offset + args.chunk], cells[offset:offset + args.chunk],
+                          weights[offset:offset + args.chunk], ALPHA)[0]
+                for offset in range(0, args.households, args.chunk)]
+
+    fit = best_of(args.repeat, batched)
+    sample = min(args.households, 200)
+    loop = best_of(1, lambda: per_household(kwh[:sample], cells[:sample], weights[:sample]))
+    error = np.abs(np.vstack(batched())[:sample] - per_household(kwh[:sample], cells[:sample], weights[:sample])).max()
+    per_fit = fit / args.households
+    per_loop = loop / sample
+    print(f"{args.households} households x {args.days * 24} hours, {FEATURES} features ({CELLS} cells + trend):")
+    print(f"  batched: {fit * 1000:.0f} ms ({per_fit * 1e6:.0f} us per household, "
+          f"50k in {per_fit * 50000:.1f}s)")
+    print(f"  per household: {per_loop * 1e6:.0f} us per household ({per_loop / per_fit:.0f}x), "
+          f"largest coefficient difference {error:.1e}")
+
+
+if __name__ == '__main__':
+    main()
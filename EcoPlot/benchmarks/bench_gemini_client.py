@@ -0,0 +1,125 @@
+# benchmarks/bench_gemini_client.py
+"""
+Compare building a Gemini client per request with the pooled client registry.
+
+A local HTTP server stands in for the Gemini endpoint, so the numbers measure
+client construction and connection setup rather than model latency. Against the
+real endpoint the pooled client also saves the TLS handshake on every call.
+
+Usage:
+    python -m benchmarks.bench_gemini_client --requests 200
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from google import genai
+from google.genai import types
+from EcoPlot.services.gemini_client import GeminiClientRegistry
+
+MODEL_NAME = "gemini-2.0-flash-001"
+RESPONSE_BODY = json.dumps({
+    "candidates": [{
+        "content": {
+            "role": "model",
+            "parts": [{"text": json.dumps({
+                "overall_recommendations": ["Shift laundry to off-peak hours"],
+                "device_recommendations": {},
+                "schedule_optimization": [],
+                "energy_saving_tips": [],
+                "estimated_monthly_savings": 12.5,
+                "carbon_reduction_potential": 4.2
+            })}]
+        },
+        "finishReason": "STOP"
+    }]
+}).encode('utf-8')
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every generateContent call with a fixed recommendations payload"""
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+    connections = set()
+
+    def setup(self):
+        super().setup()
+        # Avoid Nagle/delayed-ACK stalls between the header and body writes
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        StandInHandler.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stand_in():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run(label, call, requests):
+    StandInHandler.connections = set()
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    timings.sort()
+    print(f"{label:<22} mean {statistics.mean(timings):7.3f} ms   "
+          f"p50 {timings[len(timings) // 2]:7.3f} ms   "
+          f"p99 {timings[int(len(timings) * 0.99) - 1]:7.3f} ms   "
+          f"connections {len(StandInHandler.connections)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    server, base_url = start_stand_in()
+    prompt = "Recommend energy savings for a refrigerator and a dishwasher."
+
+    def per_request():
+        # What GeminiService did before: a new client for every request
+        client = genai.Client(api_key='benchmark', http_options=types.HttpOptions(base_url=base_url))
+        client.models.generate_content(model=MODEL_NAME, contents=prompt)
+        client.close()
+
+    registry = GeminiClientRegistry(base_url=base_url)
+
+    def pooled():
+        client = registry.get_client('benchmark')
+        with registry.slot():
+            client.models.generate_content(model=MODEL_NAME, contents=prompt)
+
+    # Warm up imports and the server before measuring
+    per_request()
+    pooled()
+
+    print(f"{args.requests} generate_content calls against {base_url}")
+    run('per-request client', per_request, args.requests)
+    run('pooled client', pooled, args.requests)
+
+    registry.shutdown()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# benchmarks/bench_prompt_builder.py
+"""
+Compare the old verbose per-device prompt with the compact, chunked prompt builder.
+
+For each household size the benchmark reports the prompt bytes, the estimated tokens,
+the number of parallel calls, and the end-to-end latency against a local stand-in for
+the Gemini endpoint. The stand-in sleeps in proportion to the input tokens and the
+number of device rows it has to answer, which is a rough model of prefill and decode time.
+
+Usage:
+    python -m benchmarks.bench_prompt_builder --sizes 10,50,100,250,500
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot.services.gemini_client import GeminiClientRegistry
+from EcoPlot.services.prompt_builder import PromptBuilder, estimate_tokens, merge_recommendations
+from benchmarks.bench_gemini_client import MODEL_NAME, RESPONSE_BODY, StandInHandler
+
+USER_DATA = {
+    'location': 'Austin, TX, USA',
+    'has_solar': True,
+    'solar_capacity_kw': 6.5,
+    'solar_panel_orientation': 'south',
+    'has_battery_storage': False,
+    'has_ev': True,
+    'electricity_rate_plan': 'time_of_use',
+    'peak_rate_per_kwh': 0.32,
+    'off_peak_rate_per_kwh': 0.11,
+    'energy_savings_goal': 20,
+    'environmental_priority': 7
+}
+
+DEVICE_MODELS = [
+    ('LED Bulb', 'Lighting', 'Philips', 9.0),
+    ('Smart Plug', 'Smart Home', 'TP-Link', 1.5),
+    ('Ceiling Fan', 'Cooling', 'Hunter', 60.0),
+    ('Television', 'Entertainment', 'Samsung', 120.0),
+    ('Laptop', 'Computing', 'Dell', 65.0),
+    ('Refrigerator', 'Kitchen', 'LG', 150.0),
+    ('Dishwasher', 'Kitchen', 'Bosch', 1800.0),
+    ('Washing Machine', 'Laundry', 'Whirlpool', 500.0),
+    ('Space Heater', 'Heating', 'Honeywell', 1500.0),
+    ('EV Charger', 'EV Charging', 'ChargePoint', 7200.0)
+]
+
+# Rough model of Gemini latency used by the stand-in
+BASE_LATENCY = 0.05  # seconds per call
+PREFILL_PER_1K_TOKENS = 0.02  # seconds
+DECODE_PER_DEVICE_ROW = 0.01  # seconds, the answer grows with the rows it covers
+DEVICE_ROW = re.compile(r'^\d[\d,]*\|', re.MULTILINE)
+
+
+def make_devices(count, seed=0):
+    """Build a household where most devices are one of a few common models"""
+    rng = random.Random(seed)
+    devices = []
+    for device_id in range(1, count + 1):
+        # Later models are rarer, like a real home with many bulbs and one EV charger
+        name, device_type, brand, watts = DEVICE_MODELS[min(int(rng.expovariate(0.5)), len(DEVICE_MODELS) - 1)]
+        if rng.random() < 0.2:
+            watts = round(watts * rng.uniform(0.8, 1.2))  # a different model of the same kind
+        devices.append({
+            'id': device_id,
+            'name': f"{name} {device_id}",
+            'device_type_name': device_type,
+            'brand_name': brand,
+            'power_consumption_watts': watts,
+            'standby_power_watts': round(watts * 0.01, 2),
+            'average_usage_hours_per_day': round(rng.uniform(0.5, 8), 1),
+            'usage_flexibility': rng.randint(1, 10),
+            'is_schedulable': device_type in ('Kitchen', 'Laundry', 'EV Charging'),
+            'is_smart_device': rng.random() < 0.3,
+            'is_ev_charger': device_type == 'EV Charging'
+        })
+    return devices
+
+
+def verbose_prompt(devices):
+    """The per-device block the service sent before the prompt builder"""
+    devices_text = ""
+    for device in devices:
+        devices_text += (
+            f"- {device['name']} ({device['device_type_name']}):\n"
+            f"  - ID: {device['id']}\n"
+            f"  - Brand: {device['brand_name']}\n"
+            f"  - Power Consumption: {device['power_consumption_watts']}W\n"
+            f"  - Standby Power: {device['standby_power_watts']}W\n"
+            f"  - Average Daily Usage: {device['average_usage_hours_per_day']} hours/day\n"
+            f"  - Usage Flexibility: {device['usage_flexibility']}/10\n"
+            "\n"
+        )
+    # The surrounding instructions were indented by eight spaces on every line
+    template = PromptBuilder().render(USER_DATA, [])
+    return '\n'.join('        ' + line for line in template.splitlines()) + devices_text
+
+
+class LatencyStandInHandler(StandInHandler):
+    """Stand-in that answers after a delay modelled on the prompt size"""
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        prompt = json.loads(body)['contents'][0]['parts'][0]['text']
+        rows = len(DEVICE_ROW.findall(prompt)) or prompt.count('  - ID: ')
+        time.sleep(BASE_LATENCY + PREFILL_PER_1K_TOKENS * estimate_tokens(prompt) / 1000
+                   + DECODE_PER_DEVICE_ROW * rows)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,50,100,250,500')
+    parser.add_argument('--budget', type=int, default=6000, help='estimated tokens per prompt')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LatencyStandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    registry = GeminiClientRegistry(base_url=f"http://127.0.0.1:{server.server_address[1]}")
+    client = registry.get_client('benchmark')
+    builder = PromptBuilder(token_budget=args.budget)
+
+    def call(prompt):
+        with registry.slot():
+            response = client.models.generate_content(model=MODEL_NAME, contents=prompt)
+        return json.loads(response.text)
+
+    print(f"{'devices':>7} | {'verbose bytes':>13} {'tokens':>7} {'latency':>9} | "
+          f"{'compact bytes':>13} {'tokens':>7} {'calls':>5} {'latency':>9}")
+    for size in [int(size) for size in args.sizes.split(',')]:
+        devices = make_devices(size)
+
+        prompt = verbose_prompt(devices)
+        started = time.perf_counter()
+        call(prompt)
+        verbose_latency = time.perf_counter() - started
+
+        started = time.perf_counter()
+        plan = builder.plan(USER_DATA, devices)
+        with ThreadPoolExecutor(max_workers=min(len(plan.prompts), registry.max_in_flight)) as pool:
+            merge_recommendations(list(pool.map(call, plan.prompts)))
+        compact_latency = time.perf_counter() - started
+        compact_bytes = sum(len(p.encode('utf-8')) for p in plan.prompts)
+
+        print(f"{size:>7} | {len(prompt.encode('utf-8')):>13} {estimate_tokens(prompt):>7} "
+              f"{verbose_latency * 1000:>7.0f}ms | {compact_bytes:>13} {plan.estimated_tokens:>7} "
+              f"{len(plan.prompts):>5} {compact_latency * 1000:>7.0f}ms")
+
+    registry.shutdown()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
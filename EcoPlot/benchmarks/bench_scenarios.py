@@ -0,0 +1,117 @@
+# benchmarks/bench_scenarios.py
+"""
+Time what-if scenario comparisons over a year at 15-minute resolution.
+
+Builds a year of household consumption, rooftop solar and grid intensity with
+prices under several rate plans, then times a batch of scenarios (added solar,
+batteries, an EV, rate plan changes) evaluated one after another in this
+process and spread over worker processes sharing the base arrays.
+
+Usage:
+    python -m benchmarks.bench_scenarios --scenarios 20 --workers 4 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot.services.battery_simulator import STEP_HOURS, STEP_SECONDS
+from EcoPlot.services.scenarios import PLAN_ARRAYS, ScenarioPool, evaluate
+from EcoPlot.services.tariffs import TariffEngine, builtin_plans
+
+STEPS = 365 * 96
+PLANS = ('tou', 'flat', 'demand')
+SETTINGS = {
+    'battery_c_rate': 0.5, 'battery_efficiency': 0.9, 'battery_reserve': 0.2, 'ev_efficiency': 0.9,
+    'ev_charge_kw': 7.2, 'ev_plug_in_minute': 18 * 60, 'ev_departure_minute': 7 * 60, 'coverage': 1.0
+}
+
+
+def base_arrays(rng, start, tz):
+    step = np.arange(STEPS)
+    hour = (step % 96) / 4
+    day = step // 96
+    season = 1 + 0.3 * np.cos(2 * np.pi * day / 365)
+    evening = 0.25 + 0.35 * np.exp(-((hour - 19) / 2.5) ** 2) + 0.15 * np.exp(-((hour - 7.5) / 1.5) ** 2)
+    sun = np.clip(np.sin((hour - 6) / 12 * np.pi), 0, None) * (2 - season)
+    arrays = {
+        'consumption': evening * season * rng.uniform(0.6, 1.4, STEPS) * STEP_HOURS * 4,
+        'production': np.zeros(STEPS),
+        'solar_per_kw': sun * rng.uniform(0.3, 1.0, STEPS) * STEP_HOURS,
+        'local_minute': (step % 96 * 15).astype(np.int16),
+        'intensity': 0.4 + 0.1 * np.cos((hour - 18) / 24 * 2 * np.pi)
+    }
+
+    engine = TariffEngine(builtin_plans({}))
+    user = SimpleNamespace(electricity_rate_plan='tou', timezone=tz.key, peak_rate_per_kwh=0.32,
+                           off_peak_rate_per_kwh=0.14, solar_feed_in_tariff=0.05)
+    plans = {}
+    for name in PLANS:
+        inputs = engine.bill_inputs(user, start, STEPS, name)
+        arrays.update({f"{name}:{array_name}": inputs[array_name] for array_name in PLAN_ARRAYS})
+        arrays['month'] = inputs['month']
+        plans[name] = {key: inputs[key] for key in ('months', 'month_share', 'tiers', 'demand_charge_per_kw',
+                                                    'fixed_monthly')}
+    return arrays, plans
+
+
+def scenarios(count):
+    batch = [{'name': 'current', 'rate_plan': 'tou'}]
+    for index in range(count):
+        scenario = {'name': f"scenario {index + 1}", 'rate_plan': PLANS[index % len(PLANS)],
+                    'solar_kw': float(index % 5 * 2)}
+        if index % 2:
+            scenario['battery_kwh'] = 5.0 + index % 3 * 5
+        if index % 4 == 3:
+            scenario['ev_daily_kwh'] = 10.0
+        batch.append(scenario)
+    return batch
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--timezone', default='America/Los_Angeles')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    tz = ZoneInfo(args.timezone)
+    start = int(datetime(2025, 1, 1, tzinfo=tz).timestamp()) // STEP_SECONDS * STEP_SECONDS
+    arrays, plans = base_arrays(np.random.default_rng(0), start, tz)
+    batch = scenarios(args.scenarios)
+
+    serial = best_of(args.repeat, lambda: [evaluate(arrays, scenario, plans, SETTINGS) for scenario in batch])
+    print(f"{len(batch)} scenarios in process: {serial * 1000:.0f} ms "
+          f"({serial / len(batch) * 1000:.1f} ms per scenario)")
+
+    pool = ScenarioPool(args.workers)
+    try:
+        cold = best_of(1, lambda: pool.map(arrays, batch, plans, SETTINGS))
+        warm = best_of(args.repeat, lambda: pool.map(arrays, batch, plans, SETTINGS))
+        same = pool.map(arrays, batch, plans, SETTINGS) == [evaluate(arrays, scenario, plans, SETTINGS)
+                                                              for scenario in batch]
+    finally:
+        pool.shutdown()
+    print(f"{len(batch)} scenarios on {args.workers} worker(s): first {cold * 1000:.0f} ms, "
+          f"warm {warm * 1000:.0f} ms, same results {same}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_solar_model.py
+"""
+Time the clear-sky solar production model for a year at 15-minute resolution.
+
+Reports the time per household for one household and for a batch of households
+spread over the continental US, with an empty irradiance cache (cold) and with
+the days already cached (warm), next to evaluating the ephemeris at every
+timestamp without the cache.
+
+Usage:
+    python -m benchmarks.bench_solar_model --households 500 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot.services.solar_model import SolarModel, clear_sky_irradiance, solar_sites
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def households(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return solar_sites([{
+        'latitude': float(rng.uniform(26, 48)),
+        'longitude': float(rng.uniform(-123, -70)),
+        'has_solar': True,
+        'solar_capacity_kw': float(rng.uniform(3, 12)),
+        'solar_panel_tilt': float(rng.integers(10, 40)),
+        'solar_panel_orientation': str(rng.choice(['south', 'southwest', 'southeast', 'west', 'east'])),
+        'solar_installation_date': datetime(int(rng.integers(2012, 2024)), 6, 1)
+    } for _ in range(count)])
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--households', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    epoch = START.timestamp() + np.arange(366 * 96) * 900.0
+    one = households(1)
+    many = households(args.households, seed=1)
+
+    direct = best_of(args.repeat, lambda: clear_sky_irradiance(
+        epoch, one['latitude'][0], one['longitude'][0], one['tilt'][0], one['azimuth'][0]))
+    cold_one = best_of(args.repeat, lambda: SolarModel().power(one, epoch))
+    warm_model = SolarModel()
+    warm_model.power(one, epoch)
+    warm_one = best_of(args.repeat, lambda: warm_model.power(one, epoch))
+
+    cache_days = args.households * 368
+    cold_many = best_of(max(args.repeat // 2, 1), lambda: SolarModel(max_days=cache_days).power(many, epoch))
+    warm_model = SolarModel(max_days=cache_days)
+    warm_model.power(many, epoch)
+    warm_many = best_of(max(args.repeat // 2, 1), lambda: warm_model.power(many, epoch))
+
+    edges = np.array([datetime(2024, month, 1, tzinfo=timezone.utc).timestamp() for month in range(1, 13)]
+                     + [datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()])
+    monthly = best_of(args.repeat, lambda: SolarModel().energy(one, edges))
+
+    print(f"1 year at 15 minutes ({epoch.size} timestamps), ms per household")
+    print(f"{'':>28} {'cold':>8} {'warm':>8}")
+    print(f"{'direct, no cache':>28} {direct * 1000:>8.2f} {'':>8}")
+    print(f"{'1 household':>28} {cold_one * 1000:>8.2f} {warm_one * 1000:>8.2f}")
+    print(f"{f'{args.households} households':>28} {cold_many * 1000 / args.households:>8.2f} "
+          f"{warm_many * 1000 / args.households:>8.2f}")
+    print(f"{'monthly kWh, 1 household':>28} {monthly * 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
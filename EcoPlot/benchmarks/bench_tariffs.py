@@ -0,0 +1,79 @@
+# benchmarks/bench_tariffs.py
+"""
+Time the compiled tariff engine.
+
+Compiles each built-in rate plan for a year, then times the cost of a day, a
+month and a year of 15-minute usage as a dot product with the compiled prices
+against pricing every slot from its local time, and a full monthly bill with
+tiers and demand charges.
+
+Usage:
+    python -m benchmarks.bench_tariffs --timezone America/New_York --repeat 200
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot.services.tariffs import SLOT_SECONDS, CompiledTariff, TariffEngine, builtin_plans
+
+PERIODS = (('day', 96), ('month', 96 * 30), ('year', 96 * 364))
+
+
+def slot_by_slot(kwh, start, tz, peak_rate, off_peak_rate):
+    cost = 0.0
+    for index, used in enumerate(kwh.tolist()):
+        local = datetime.fromtimestamp(start + index * SLOT_SECONDS, tz)
+        peak = local.weekday() < 5 and 16 <= local.hour < 21
+        cost += used * (peak_rate if peak else off_peak_rate)
+    return cost
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--timezone', default='America/New_York')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    tz = ZoneInfo(args.timezone)
+    engine = TariffEngine(builtin_plans({}))
+    for name in engine.plans:
+        compile_ms = best_of(3, lambda: CompiledTariff(name, engine.plans[name], tz, 2025))
+        print(f"compile {name:>6} for a year: {compile_ms * 1000:.1f} ms")
+
+    rng = np.random.default_rng(0)
+    start = int(datetime(2025, 1, 6, tzinfo=tz).timestamp())
+    user = SimpleNamespace(electricity_rate_plan='tou', timezone=args.timezone, peak_rate_per_kwh=0.32,
+                           off_peak_rate_per_kwh=0.14, solar_feed_in_tariff=0.05)
+    for period, slots in PERIODS:
+        kwh = rng.uniform(0, 0.5, slots)
+        compiled = best_of(args.repeat, lambda: engine.energy_cost(user, start, kwh))
+        loop = best_of(max(args.repeat // 50, 1), lambda: slot_by_slot(kwh, start, tz, 0.32, 0.14))
+        error = abs(engine.energy_cost(user, start, kwh) - slot_by_slot(kwh, start, tz, 0.32, 0.14))
+        print(f"{period:>5} cost: compiled {compiled * 1e6:.1f} us, slot by slot {loop * 1e6:.0f} us "
+              f"({loop / compiled:.0f}x), difference {error:.1e}")
+
+    user.electricity_rate_plan = 'demand'
+    kwh = rng.uniform(0, 0.5, 96 * 31)
+    bill = best_of(args.repeat, lambda: engine.bill(user, start, kwh, kwh * 0.1))
+    print(f"monthly bill with demand and fixed charges: {bill * 1e6:.1f} us")
+
+
+if __name__ == '__main__':
+    main()
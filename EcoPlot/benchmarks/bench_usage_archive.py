@@ -0,0 +1,106 @@
+# benchmarks/bench_usage_archive.py
+"""
+Compare usage log storage and scans in SQLite rows and in the columnar archive.
+
+Loads 15-minute meter readings for a few devices into a scratch database, measures
+the space and load_usage time of the rows, archives them and measures again.
+
+Usage:
+    python -m benchmarks.bench_usage_archive --days 730 --devices 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot import create_app, db
+from EcoPlot.config import Config
+from EcoPlot.models.device import Device
+from EcoPlot.models.user import User
+from EcoPlot.services.energy_aggregation import load_usage
+from EcoPlot.services.usage_archive import UsageArchiveService
+from EcoPlot.services.usage_ingest import UsageIngestService
+
+START = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+def log_table_bytes():
+    """Pages used by the usage log table and its indexes"""
+    return db.session.execute(db.text(
+        "SELECT sum(pgsize) FROM dbstat WHERE name = 'device_usage_logs' "
+        "OR name IN (SELECT name FROM sqlite_master WHERE tbl_name = 'device_usage_logs' AND type = 'index')"
+    )).scalar() or 0
+
+
+def timed_load(user_id, window=None, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, start, _, _ = load_usage(user_id, *(window or (None, None)))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return start.size, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--devices', type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ecoplot-archive-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        USAGE_ARCHIVE_DIR = os.path.join(workdir, 'archive')
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', timezone='America/Chicago')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.flush()
+        # SQLite does not enforce the type and brand foreign keys
+        devices = [Device(user_id=user.id, device_type_id=1, brand_id=1, name=f"Meter {index}",
+                          power_consumption_watts=100)
+                   for index in range(args.devices)]
+        db.session.add_all(devices)
+        db.session.commit()
+
+        rng = random.Random(0)
+        first = START.timestamp()
+        for device in devices:
+            batch = []
+            for index in range(args.days * 96):
+                begin = first + index * 900
+                kwh = round(rng.uniform(0, 0.5), 3)
+                batch.append((device.id, begin, begin + 900, kwh, round(kwh * 0.15, 4), None, 'grid', False))
+                if len(batch) == 5000:
+                    UsageIngestService.write_batch(user.id, batch)
+                    batch = []
+            if batch:
+                UsageIngestService.write_batch(user.id, batch)
+
+        month = (int((START + timedelta(days=200)).timestamp()), int((START + timedelta(days=230)).timestamp()))
+        rows_bytes = log_table_bytes()
+        rows, full_rows = timed_load(user.id)
+        _, month_rows = timed_load(user.id, month)
+
+        result = UsageArchiveService.archive(before=(START + timedelta(days=args.days + 31)).replace(tzinfo=None))
+        archived, full_archive = timed_load(user.id)
+        _, month_archive = timed_load(user.id, month)
+
+        print(f"{rows} logs, {result['segments_written']} segments archived in {result['seconds']}s")
+        print(f"{'storage':>8} | {'bytes/log':>9} {'full scan':>10} {'30 days':>8}")
+        print(f"{'rows':>8} | {rows_bytes / rows:>9.1f} {full_rows:>9.3f}s {month_rows:>7.4f}s")
+        print(f"{'archive':>8} | {result['bytes_written'] / archived:>9.1f} {full_archive:>9.3f}s "
+              f"{month_archive:>7.4f}s")
+
+
+if __name__ == '__main__':
+    main()
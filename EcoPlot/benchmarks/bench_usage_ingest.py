@@ -0,0 +1,113 @@
+# benchmarks/bench_usage_ingest.py
+"""
+Measure bulk usage log ingestion into a scratch SQLite database.
+
+Generates minute-level meter readings for a household, writes them as NDJSON and
+CSV files and imports each with the batched ingest service. For comparison a slice
+of the rows is also inserted one ORM object at a time with db.session.add.
+
+Usage:
+    python -m benchmarks.bench_usage_ingest --rows 200000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot import create_app, db
+from EcoPlot.config import Config
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.user import User
+from EcoPlot.services.usage_ingest import UsageIngestService
+
+FIELDS = ['device_id', 'start_time', 'end_time', 'energy_consumed_kwh', 'cost',
+          'carbon_footprint_kg', 'energy_source']
+
+
+def make_records(count, device_ids, seed=0):
+    """Minute readings cycling over the devices"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    for index in range(count):
+        begin = start + timedelta(minutes=index // len(device_ids))
+        kwh = round(rng.uniform(0, 0.05), 5)
+        yield {
+            'device_id': device_ids[index % len(device_ids)],
+            'start_time': begin.isoformat() + 'Z',
+            'end_time': (begin + timedelta(minutes=1)).isoformat() + 'Z',
+            'energy_consumed_kwh': kwh,
+            'cost': round(kwh * 0.15, 5),
+            'carbon_footprint_kg': round(kwh * 0.4, 5),
+            'energy_source': 'solar' if 8 <= begin.hour < 17 and rng.random() < 0.5 else 'grid'
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--devices', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--orm-rows', type=int, default=5000, help='rows inserted one by one for comparison')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ecoplot-ingest-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', timezone='America/Chicago')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.flush()
+        # SQLite does not enforce the type and brand foreign keys
+        devices = [Device(user_id=user.id, device_type_id=1, brand_id=1, name=f"Device {index}",
+                          power_consumption_watts=100)
+                   for index in range(args.devices)]
+        db.session.add_all(devices)
+        db.session.commit()
+        device_ids = [device.id for device in devices]
+
+        paths = {'ndjson': os.path.join(workdir, 'usage.ndjson'), 'csv': os.path.join(workdir, 'usage.csv')}
+        with open(paths['ndjson'], 'w', encoding='utf-8') as out:
+            for record in make_records(args.rows, device_ids):
+                out.write(json.dumps(record) + '\n')
+        with open(paths['csv'], 'w', encoding='utf-8', newline='') as out:
+            writer = csv.DictWriter(out, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(make_records(args.rows, device_ids, seed=1))
+
+        print(f"{'method':>10} | {'rows':>8} {'seconds':>8} {'rows/s':>9}")
+        for data_format, path in paths.items():
+            with open(path, encoding='utf-8', newline='') as source:
+                result = UsageIngestService.ingest(user.id, source, data_format, batch_size=args.batch_size)
+            print(f"{data_format:>10} | {result['rows_inserted']:>8} {result['seconds']:>8.2f} "
+                  f"{result['rows_per_second']:>9}")
+
+        started = time.perf_counter()
+        for record in make_records(args.orm_rows, device_ids, seed=2):
+            db.session.add(DeviceUsageLog(
+                device_id=record['device_id'],
+                start_time=datetime.fromisoformat(record['start_time']).replace(tzinfo=None),
+                end_time=datetime.fromisoformat(record['end_time']).replace(tzinfo=None),
+                energy_consumed_kwh=record['energy_consumed_kwh'],
+                cost=record['cost'],
+                carbon_footprint_kg=record['carbon_footprint_kg'],
+                energy_source=record['energy_source']
+            ))
+            db.session.commit()
+        elapsed = time.perf_counter() - started
+        print(f"{'orm add':>10} | {args.orm_rows:>8} {elapsed:>8.2f} {round(args.orm_rows / elapsed):>9}")
+
+
+if __name__ == '__main__':
+    main()
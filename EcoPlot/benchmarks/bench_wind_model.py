@@ -0,0 +1,90 @@
+# benchmarks/bench_wind_model.py
+"""
+Time the wind turbine production model for a year of hourly output.
+
+Writes a typical-year weather file with hourly Weibull wind speeds for a few
+stations, then times the first read of the file and the output of one site and
+of a batch of sites spread over the stations.
+
+Usage:
+    python -m benchmarks.bench_wind_model --sites 1000 --stations 10
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from EcoPlot.services.wind_model import WindModel, wind_sites
+
+YEAR = datetime(2019, 1, 1, tzinfo=timezone.utc)
+
+
+def write_weather_file(path, stations, rng):
+    locations = [(float(rng.uniform(26, 48)), float(rng.uniform(-123, -70))) for _ in range(stations)]
+    hours = [(YEAR + timedelta(hours=hour)).isoformat() for hour in range(8760)]
+    with open(path, 'w', newline='', encoding='utf-8') as target:
+        writer = csv.writer(target)
+        writer.writerow(['timestamp', 'wind_speed', 'height', 'latitude', 'longitude'])
+        for latitude, longitude in locations:
+            speeds = rng.weibull(2.0, len(hours)) * rng.uniform(4, 8)
+            for hour, speed in zip(hours, speeds.tolist()):
+                writer.writerow([hour, round(speed, 2), 10, latitude, longitude])
+    return locations
+
+
+def best_of(repeat, run):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sites', type=int, default=1000)
+    parser.add_argument('--stations', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    path = os.path.join(tempfile.mkdtemp(prefix='ecoplot-wind-'), 'wind.csv')
+    write_weather_file(path, args.stations, rng)
+    model = WindModel(path)
+    started = time.perf_counter()
+    model.stations()
+    load = time.perf_counter() - started
+
+    sites = wind_sites([{
+        'latitude': float(rng.uniform(26, 48)),
+        'longitude': float(rng.uniform(-123, -70)),
+        'has_wind_turbine': True,
+        'wind_turbine_capacity_kw': float(rng.uniform(2, 20)),
+        'wind_turbine_height_meters': float(rng.uniform(12, 40))
+    } for _ in range(args.sites)])
+    one = {name: values[:1] for name, values in sites.items()}
+    epoch = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp() + np.arange(8760) * 3600.0
+    edges = epoch[::730]
+
+    single = best_of(args.repeat, lambda: model.power(one, epoch))
+    batch = best_of(args.repeat, lambda: model.power(sites, epoch))
+    monthly = best_of(args.repeat, lambda: model.energy(one, edges))
+    output = model.power(sites, epoch)
+
+    print(f"weather file: {args.stations} stations x 8760 hours, read in {load * 1000:.0f} ms")
+    print(f"1 year hourly, 1 site:        {single * 1000:.3f} ms")
+    print(f"1 year hourly, {args.sites} sites: {batch * 1000:.1f} ms ({batch * 1000 / args.sites:.3f} ms per site)")
+    print(f"monthly kWh, 1 site:          {monthly * 1000:.3f} ms")
+    print(f"mean capacity factor:         {output.sum() / (sites['capacity_kw'].sum() * 8760):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest_plugins = ['EcoPlot.testing']
@@ -0,0 +1,95 @@
+# tests/test_appliance_scheduler.py
+from datetime import datetime, time, timezone
+from itertools import product
+import numpy as np
+import pytest
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_brand import DeviceBrand
+from EcoPlot.models.device_type import DeviceType
+from EcoPlot.models.user import User
+from EcoPlot.services.appliance_scheduler import (
+    SLOT_HOURS, SLOT_MINUTES, ApplianceSchedulerService, ScheduleProblem, window_mask
+)
+
+NOW = datetime(2026, 3, 18, 12, tzinfo=timezone.utc)
+
+
+def load(device_id, power_kw, slots, allowed=None, size=8):
+    return {
+        'device_id': device_id,
+        'name': f'Device {device_id}',
+        'power_kw': power_kw,
+        'slots': slots,
+        'priority': 0,
+        'fingerprint': (power_kw, slots),
+        'allowed': np.ones(size, dtype=bool) if allowed is None else np.asarray(allowed)
+    }
+
+
+def test_window_wraps_midnight():
+    local_minute = np.arange(0, 1440, SLOT_MINUTES)
+    mask = window_mask(local_minute, time(22, 0), time(2, 0))
+    assert mask.sum() == 16
+    assert mask[local_minute == 22 * 60] and mask[local_minute == 105] and not mask[local_minute == 120]
+
+
+def test_power_cap_keeps_loads_apart():
+    price = np.array([0.1, 0.1, 0.1, 0.1, 0.3, 0.3, 0.2, 0.2])
+    problem = ScheduleProblem([load(1, 4.0, 2), load(2, 4.0, 2)], np.zeros(8), price, np.zeros(8), 7.2)
+    problem.solve()
+
+    assert sorted(problem.starts) == [0, 2]
+    assert problem.load.max() == pytest.approx(4.0)
+
+
+def test_unplaceable_load_left_out():
+    problem = ScheduleProblem([load(1, 8.0, 1)], np.zeros(8), np.ones(8), np.zeros(8), 7.2)
+    problem.solve()
+    assert problem.starts == [None]
+
+
+def test_solve_matches_exhaustive_search():
+    rng = np.random.default_rng(4)
+    generation = rng.uniform(0, 3, 8)
+    grid, onsite = rng.uniform(0.1, 0.4, 8), np.full(8, 0.05)
+    loads = [load(1, 2.0, 3), load(2, 1.5, 2), load(3, 3.0, 1, allowed=np.arange(8) >= 4)]
+    problem = ScheduleProblem(loads, generation, grid, onsite, 7.2)
+    problem.solve()
+
+    def value(starts):
+        power = np.zeros(8)
+        for entry, start in zip(loads, starts):
+            power[start:start + entry['slots']] += entry['power_kw']
+        weighted = np.maximum(power - generation, 0) * grid + np.minimum(power, generation) * onsite
+        return float(weighted.sum()) * SLOT_HOURS
+
+    candidates = [[start for start in range(8 - entry['slots'] + 1) if entry['allowed'][start]] for entry in loads]
+    best = min(value(starts) for starts in product(*candidates))
+    assert value(problem.starts) == pytest.approx(best)
+    assert problem.lower_bound() <= value(problem.starts) + 1e-9
+
+
+def test_schedule_reuses_starts_of_unchanged_devices(ecoplot_app):
+    user = User(username='sched', email='sched@example.com', timezone='UTC')
+    db.session.add(user)
+    db.session.flush()
+    devices = [Device(user_id=user.id, name=name, power_consumption_watts=watts, is_schedulable=True,
+                      operation_duration_minutes=minutes, usage_flexibility=5,
+                      preferred_start_time=time(18, 0), preferred_end_time=time(8, 0),
+                      device_type_id=DeviceType.query.first().id, brand_id=DeviceBrand.query.first().id)
+               for name, watts, minutes in [('Dishwasher', 1800, 120), ('Dryer', 5000, 60), ('Heater', 3000, 90)]]
+    db.session.add_all(devices)
+    db.session.commit()
+
+    first = ApplianceSchedulerService.schedule(user, devices, now=NOW)
+    assert len(first['schedule']) == 3 and not first['unscheduled']
+    assert first['totals']['peak_kw'] <= 7.2
+    assert first['totals']['cost'] <= first['totals']['baseline_cost'] + 1e-9
+    for entry in first['schedule']:
+        assert datetime.fromisoformat(entry['start']) >= NOW.replace(hour=18)
+        assert datetime.fromisoformat(entry['end']) <= NOW.replace(day=19, hour=8)
+
+    devices[0].power_consumption_watts = 1200
+    second = ApplianceSchedulerService.schedule(user, devices, now=NOW)
+    assert second['incremental'] and second['replaced'] == 1
@@ -0,0 +1,37 @@
+# tests/test_battery_simulator.py
+import numpy as np
+import pytest
+from EcoPlot.services.battery_simulator import SCAN_BLOCK, clamp_scan
+
+
+def sequential(initial, increments, low, high):
+    state = np.empty_like(increments)
+    current = initial
+    for index in range(increments.shape[-1]):
+        current = np.clip(current + increments[..., index], low[..., index], high[..., index])
+        state[..., index] = current
+    return state
+
+
+@pytest.mark.parametrize('steps', [1, SCAN_BLOCK - 1, SCAN_BLOCK, SCAN_BLOCK * 7 + 3, 1000])
+def test_clamp_scan_matches_loop(steps):
+    rng = np.random.default_rng(steps)
+    increments = rng.normal(0, 2, (3, steps))
+    low = rng.uniform(0, 2, (3, steps))
+    high = low + rng.uniform(0, 8, (3, steps))
+    initial = rng.uniform(0, 5, (3, 1))
+
+    shift, lower, upper = clamp_scan(increments, low, high)
+
+    expected = sequential(initial[:, 0], increments, low, high)
+    np.testing.assert_allclose(np.clip(initial + shift, lower, upper), expected, atol=1e-9)
+
+
+def test_clamp_scan_broadcasts_bounds():
+    rng = np.random.default_rng(0)
+    increments = rng.normal(0, 1, 500)
+    low, high = np.zeros(500), np.full(500, 10.0)
+
+    shift, lower, upper = clamp_scan(increments, 0.0, 10.0)
+
+    np.testing.assert_allclose(np.clip(5.0 + shift, lower, upper), sequential(5.0, increments, low, high), atol=1e-9)
@@ -0,0 +1,51 @@
+# tests/test_carbon_accounting.py
+from datetime import datetime, timedelta
+import numpy as np
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_brand import DeviceBrand
+from EcoPlot.models.device_type import DeviceType
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.usage_archive import UsageArchiveSegment
+from EcoPlot.models.user import User
+from EcoPlot.services.carbon_accounting import CarbonAccountingService
+from EcoPlot.services.energy_aggregation import CARBON
+from EcoPlot.services.usage_archive import UsageArchiveService, load_archived_usage
+
+START = datetime(2025, 1, 10)
+
+
+def test_backfill_fills_archived_logs(ecoplot_app):
+    user = User(username='carbon', email='carbon@example.com', timezone='UTC', country='United States')
+    db.session.add(user)
+    db.session.flush()
+    device = Device(user_id=user.id, name='Heater', power_consumption_watts=2000,
+                    device_type_id=DeviceType.query.first().id, brand_id=DeviceBrand.query.first().id)
+    db.session.add(device)
+    db.session.flush()
+    # Two months of logs without carbon, the first archived; one log is solar
+    for day in range(40):
+        start = START + timedelta(days=day)
+        db.session.add(DeviceUsageLog(device_id=device.id, start_time=start, end_time=start + timedelta(hours=2),
+                                      energy_consumed_kwh=4.0, cost=0.6,
+                                      energy_source='solar' if day == 3 else 'grid'))
+    db.session.commit()
+    archived = UsageArchiveService.archive(before=datetime(2025, 2, 1))
+    assert archived['logs_archived'] == 22
+
+    result = CarbonAccountingService.backfill()
+    assert result['logs_updated'] == 40
+    assert result['segments_updated'] == 1
+    assert result['user_ids'] == [user.id]
+    assert db.session.get(UsageArchiveSegment, (device.id, datetime(2025, 1, 1))).version == 2
+
+    with db.engine.connect() as connection:
+        _, start, _, values = load_archived_usage(connection, user.id)
+    assert len(start) == 22
+    assert all(log.carbon_footprint_kg > 0 for log in DeviceUsageLog.query.filter_by(device_id=device.id))
+    carbon = values[CARBON]
+    assert carbon[3] == 0.0
+    assert np.all(np.delete(carbon, 3) > 0)
+
+    # Nothing is left to fill, so a second run leaves the archive alone
+    assert CarbonAccountingService.backfill()['segments_updated'] == 0
@@ -0,0 +1,40 @@
+# tests/test_energy_aggregation.py
+from datetime import datetime, timedelta, timezone
+import pytest
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_brand import DeviceBrand
+from EcoPlot.models.device_type import DeviceType
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.user import User
+from EcoPlot.services.energy_aggregation import EnergyAggregationService
+
+NOW = datetime(2026, 3, 18, 12, tzinfo=timezone.utc)
+
+
+def test_previous_savings_use_the_previous_rate(ecoplot_app):
+    user = User(username='rates', email='rates@example.com', timezone='UTC')
+    db.session.add(user)
+    db.session.flush()
+    device = Device(user_id=user.id, name='Meter', power_consumption_watts=1000,
+                    device_type_id=DeviceType.query.first().id, brand_id=DeviceBrand.query.first().id)
+    db.session.add(device)
+    db.session.flush()
+
+    def log(days_ago, kwh, cost, source):
+        start = (NOW - timedelta(days=days_ago)).replace(tzinfo=None)
+        db.session.add(DeviceUsageLog(device_id=device.id, start_time=start, end_time=start + timedelta(hours=1),
+                                      energy_consumed_kwh=kwh, cost=cost, carbon_footprint_kg=0.0,
+                                      energy_source=source))
+
+    # The grid rate went from 0.10 to 0.30 per kWh between the two weeks
+    log(10, 20.0, 2.0, 'grid')
+    log(9, 5.0, 0.0, 'solar')
+    log(3, 20.0, 6.0, 'grid')
+    log(2, 5.0, 0.0, 'solar')
+    db.session.commit()
+
+    aggregate = EnergyAggregationService.aggregate(user, 'week', NOW)
+
+    assert aggregate['cost_savings'].sum() == pytest.approx(5.0 * 0.30)
+    assert aggregate['previous']['cost_savings'] == pytest.approx(5.0 * 0.10)
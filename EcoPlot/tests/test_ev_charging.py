@@ -0,0 +1,118 @@
+# tests/test_ev_charging.py
+from datetime import datetime, time, timezone
+import numpy as np
+import pytest
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_brand import DeviceBrand
+from EcoPlot.models.device_type import DeviceType
+from EcoPlot.models.ev_charge_plan import EVChargePlan
+from EcoPlot.models.user import User
+from EcoPlot.services.ev_charging import PREFERENCES, EVChargingService, solve_charging
+
+NOW = datetime(2026, 3, 18, 12, tzinfo=timezone.utc)
+
+
+def add_household(name, chargers=2):
+    user = User(username=name, email=f'{name}@example.com', timezone='UTC', ev_typical_daily_usage_kwh=12.0)
+    db.session.add(user)
+    db.session.flush()
+    devices = [Device(user_id=user.id, name=f'Charger {index}', power_consumption_watts=7200, is_ev_charger=True,
+                      device_type_id=DeviceType.query.first().id, brand_id=DeviceBrand.query.first().id)
+               for index in range(chargers)]
+    db.session.add_all(devices)
+    db.session.commit()
+    return user, devices
+
+
+def inputs(preference, window=None, generation=None, target=6.0):
+    price = np.array([[0.30, 0.10, 0.20, 0.10, 0.40, 0.05]])
+    return {
+        'slot_hours': 1.0,
+        'rate_kw': np.array([2.0]),
+        'target_kwh': np.array([target]),
+        'preference': np.array([PREFERENCES.index(preference)]),
+        'window': np.ones((1, 6), dtype=bool) if window is None else np.array([window]),
+        'price': price,
+        'export_price': np.full((1, 6), 0.02),
+        'carbon': np.array([[0.2, 0.5, 0.1, 0.3, 0.2, 0.6]]),
+        'generation_kw': np.zeros((1, 6)) if generation is None else np.array([generation])
+    }
+
+
+def planned_devices(user_id):
+    return sorted(plan.device_id for plan in EVChargePlan.query.filter_by(user_id=user_id))
+
+
+def test_plan_user_drops_plans_of_former_chargers(ecoplot_app):
+    user, (first, second) = add_household('ev')
+    EVChargingService.plan_user(user, NOW)
+    assert planned_devices(user.id) == [first.id, second.id]
+
+    second.is_ev_charger = False
+    db.session.commit()
+    EVChargingService.plan_user(user, NOW)
+    assert planned_devices(user.id) == [first.id]
+
+    first.is_ev_charger = False
+    db.session.commit()
+    assert EVChargingService.plan_user(user, NOW) == []
+
+
+def test_invalidate_and_nightly_run_remove_stale_plans(ecoplot_app):
+    user, (first, second) = add_household('ev')
+    other, _ = add_household('other', chargers=1)
+    EVChargingService.plan_all(NOW)
+
+    EVChargingService.invalidate(user.id)
+    db.session.commit()
+    assert planned_devices(user.id) == []
+    assert len(planned_devices(other.id)) == 1
+
+    # Changes made outside the device routes are cleaned up by the next nightly run
+    EVChargingService.plan_all(NOW)
+    second.is_ev_charger = False
+    db.session.commit()
+    EVChargingService.plan_all(NOW)
+    assert planned_devices(user.id) == [first.id]
+
+
+def test_cheapest_fills_lowest_prices_first():
+    result = solve_charging(inputs('cheapest'))
+    assert result['charge_kwh'][0].tolist() == pytest.approx([0, 2, 0, 2, 0, 2])
+    assert result['cost'][0] == pytest.approx(0.5)
+
+
+def test_greenest_and_fastest():
+    assert solve_charging(inputs('greenest'))['charge_kwh'][0].tolist() == pytest.approx([2, 0, 2, 0, 2, 0])
+    assert solve_charging(inputs('fastest'))['charge_kwh'][0].tolist() == pytest.approx([2, 2, 2, 0, 0, 0])
+
+
+def test_onsite_output_used_before_grid():
+    result = solve_charging(inputs('cheapest', generation=[0, 0, 0, 0, 1.5, 0]))
+    assert result['onsite_kwh'][0].tolist() == pytest.approx([0, 0, 0, 0, 1.5, 0])
+    # Of the two 0.10 slots the one with cleaner grid energy fills first
+    assert result['charge_kwh'][0].tolist() == pytest.approx([0, 0.5, 0, 2, 1.5, 2])
+
+
+def test_short_window_charges_what_fits():
+    result = solve_charging(inputs('cheapest', window=[False, False, True, True, False, False]))
+    assert result['energy_kwh'][0] == pytest.approx(4.0)
+    assert result['charge_kwh'][0, [0, 1, 4, 5]].tolist() == [0, 0, 0, 0]
+
+
+def test_plan_window_and_target(ecoplot_app):
+    user, (charger, _) = add_household('window')
+    charger.preferred_start_time, charger.preferred_end_time = time(22, 0), time(6, 0)
+    db.session.commit()
+    plans = {plan.device_id: plan for plan in EVChargingService.plan_user(user, NOW)}
+
+    plan = plans[charger.id]
+    assert plan.plug_in == datetime(2026, 3, 18, 22) and plan.departure == datetime(2026, 3, 19, 6)
+    # Each of the two chargers replaces half of the 12 kWh day, drawn at 90% efficiency
+    assert plan.target_kwh == pytest.approx(6 / 0.9, abs=1e-3)
+    assert plan.energy_kwh == pytest.approx(plan.target_kwh, abs=1e-3)
+    # 15-minute slots from noon; nothing is drawn before plug-in or after departure
+    charge_kw = np.array(plan.to_dict()['charge_kw'])
+    assert not charge_kw[:40].any() and not charge_kw[72:].any()
+    assert charge_kw.max() <= 7.2
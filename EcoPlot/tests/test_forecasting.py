@@ -0,0 +1,91 @@
+# tests/test_forecasting.py
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from EcoPlot import db
+from EcoPlot.models.forecast_model import ForecastModel
+from EcoPlot.models.user import User
+from EcoPlot.services.forecasting import (
+    CELLS, DAY_HOUR, FEATURES, HOUR, INTERCEPT, TREND, WEEK_SECONDS, ForecastService, fit_batch, local_cells, predict
+)
+
+
+def design(cells, hours):
+    """Explicit (hours, FEATURES) design matrix of one household"""
+    matrix = np.zeros((hours, FEATURES))
+    matrix[:, INTERCEPT] = 1
+    matrix[np.arange(hours), HOUR + cells % 24] = 1
+    matrix[np.arange(hours), DAY_HOUR + cells] = 1
+    matrix[:, TREND] = (np.arange(hours) + 0.5 - hours) / (WEEK_SECONDS / 3600)
+    return matrix
+
+
+def test_local_cells_follow_timezone_and_weekend():
+    # Friday 2026-03-20 23:00 UTC is Friday 19:00 in New York and Saturday 08:00 in Tokyo
+    epoch = int(datetime(2026, 3, 20, 23, tzinfo=timezone.utc).timestamp())
+    cells = local_cells(np.array([epoch]), ['America/New_York', 'Asia/Tokyo'])
+    assert cells[:, 0].tolist() == [19, 24 + 8]
+
+
+def test_fit_batch_matches_explicit_ridge():
+    rng = np.random.default_rng(2)
+    hours, alpha = 3 * 168, 2.0
+    epoch = 1767225600 + np.arange(hours) * 3600
+    cells = np.vstack([local_cells(epoch, ['UTC'])[0], local_cells(epoch, ['Asia/Kolkata'])[0]])
+    kwh = rng.gamma(2.0, 0.4, (2, hours))
+    # The second household only has the later half of the history
+    weights = np.vstack([0.5 ** ((hours - np.arange(hours)) / (21 * 24)), np.arange(hours) >= hours // 2])
+
+    coefficients, rmse = fit_batch(kwh, cells, weights, alpha)
+
+    for row in range(2):
+        matrix = design(cells[row], hours)
+        penalty = np.full(FEATURES, alpha)
+        penalty[INTERCEPT] = 1e-9
+        gram = matrix.T @ (weights[row, :, None] * matrix) + np.diag(penalty)
+        expected = np.linalg.solve(gram, matrix.T @ (weights[row] * kwh[row]))
+        np.testing.assert_allclose(coefficients[row], expected, rtol=1e-6, atol=1e-9)
+        residual = kwh[row] - matrix @ expected
+        assert rmse[row] == pytest.approx(np.sqrt((weights[row] * residual ** 2).sum() / weights[row].sum()))
+
+
+def test_daily_pattern_recovered():
+    hours = 8 * 168
+    cells = local_cells(1767225600 + np.arange(hours) * 3600, ['UTC'])[0]
+    pattern = 0.3 + 0.6 * np.exp(-((np.arange(CELLS) % 24 - 19) / 2.0) ** 2) + (np.arange(CELLS) >= 24) * 0.2
+    coefficients, rmse = fit_batch(pattern[cells][None], cells[None], np.ones((1, hours)), 0.01)
+
+    ahead = np.arange(168)
+    forecast = predict(coefficients[0], cells[ahead], (ahead + 0.5) / 168)
+    np.testing.assert_allclose(forecast, pattern[cells[ahead]], atol=0.01)
+    assert rmse[0] < 0.01
+
+
+def test_forecast_fits_and_refits_on_timezone_change(ecoplot_app, synthetic_households):
+    synthetic_households(users=2, days=28, seed=3)
+    user = User.query.order_by(User.id).first()
+    now = datetime.now(timezone.utc)
+
+    result = ForecastService.forecast(user, hours=48, now=now)
+    assert len(result['kwh']) == 48 and min(result['kwh']) >= 0
+    assert sum(day['kwh'] for day in result['daily']) == pytest.approx(result['total_kwh'], abs=0.05)
+    model = db.session.get(ForecastModel, user.id)
+    # The logs end at midnight; the history runs on to the current hour
+    assert 27 * 24 <= model.history_hours <= 29 * 24
+    assert model.timezone_name == result['timezone']
+
+    user.timezone = 'Asia/Kolkata' if result['timezone'] != 'Asia/Kolkata' else 'Europe/Berlin'
+    db.session.commit()
+    assert ForecastService.forecast(user, hours=24, now=now)['timezone'] == user.timezone
+    assert db.session.get(ForecastModel, user.id).timezone_name == user.timezone
+    with pytest.raises(ValueError):
+        ForecastService.forecast(user, hours=0, now=now)
+
+
+def test_users_without_history_are_skipped(ecoplot_app):
+    user = User(username='empty', email='empty@example.com')
+    db.session.add(user)
+    db.session.commit()
+    assert ForecastService.fit([user]) == []
+    with pytest.raises(ValueError, match='No usage history'):
+        ForecastService.forecast(user)
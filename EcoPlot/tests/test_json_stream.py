@@ -0,0 +1,64 @@
+# tests/test_json_stream.py
+import json
+import pytest
+from EcoPlot.services.json_stream import IncrementalSectionParser
+
+DOCUMENT = {
+    'summary': 'Shift laundry to {off-peak} "hours"',
+    'estimated_monthly_savings': 12.5,
+    'general_recommendations': [
+        {'title': 'Laundry', 'tags': ['tou', 'water']},
+        'Seal windows, doors \\ vents'
+    ],
+    'device_specific': {'12': {'advice': ['Eco mode']}, '13': None},
+    'empty': []
+}
+
+EXPECTED = [
+    ('field', 'summary', DOCUMENT['summary']),
+    ('field', 'estimated_monthly_savings', 12.5),
+    ('item', 'general_recommendations', DOCUMENT['general_recommendations'][0]),
+    ('item', 'general_recommendations', DOCUMENT['general_recommendations'][1]),
+    ('field', 'general_recommendations', DOCUMENT['general_recommendations']),
+    ('entry', 'device_specific', '12', {'advice': ['Eco mode']}),
+    ('entry', 'device_specific', '13', None),
+    ('field', 'device_specific', DOCUMENT['device_specific']),
+    ('field', 'empty', [])
+]
+
+
+def parse(text, size):
+    parser = IncrementalSectionParser()
+    events = []
+    for offset in range(0, len(text), size):
+        events.extend(parser.feed(text[offset:offset + size]))
+    return parser, events
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 64, 10000])
+def test_events_independent_of_chunking(size):
+    text = '```json\n' + json.dumps(DOCUMENT, indent=2) + '\n```'
+
+    parser, events = parse(text, size)
+
+    assert events == EXPECTED
+    assert parser.finished
+
+
+def test_sections_complete_before_document():
+    text = json.dumps(DOCUMENT)
+    cut = text.index('"device_specific"')
+
+    parser, events = parse(text[:cut], 5)
+
+    assert events == EXPECTED[:5]
+    assert not parser.finished
+
+
+def test_text_after_document_ignored():
+    parser = IncrementalSectionParser()
+
+    events = parser.feed('{"a": 1} trailing {"b": 2}')
+
+    assert events == [('field', 'a', 1)]
+    assert parser.feed('{"c": 3}') == []
@@ -0,0 +1,66 @@
+# tests/test_meter_import.py
+import io
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+from EcoPlot.services.meter_import import deduplicate, iter_interval_csv
+
+LOS_ANGELES = ZoneInfo('America/Los_Angeles')
+
+
+def test_deduplicate_keeps_last_reading_of_a_start():
+    start = np.array([0, 900, 0, 1800], dtype=np.float64)
+    end = start + 900
+    empty = np.array([], dtype=np.float64)
+
+    keep, duplicates, overlaps, stored = deduplicate(start, end, empty, empty)
+
+    assert keep.tolist() == [2, 1, 3]
+    assert (duplicates, overlaps, stored) == (1, 0, 0)
+
+
+def test_deduplicate_drops_overlaps():
+    start = np.array([0, 600, 900, 3600, 7200], dtype=np.float64)
+    end = np.array([900, 900, 1800, 4500, 8100], dtype=np.float64)
+    stored_start = np.array([3000, 7200], dtype=np.float64)
+    stored_end = np.array([3700, 8100], dtype=np.float64)
+
+    keep, duplicates, overlaps, stored = deduplicate(start, end, stored_start, stored_end)
+
+    assert keep.tolist() == [0, 2]
+    assert (duplicates, overlaps, stored) == (0, 1, 2)
+
+
+def test_deduplicate_empty_chunk():
+    empty = np.array([], dtype=np.float64)
+    keep, duplicates, overlaps, stored = deduplicate(empty, empty, empty, empty)
+    assert keep.size == 0 and (duplicates, overlaps, stored) == (0, 0, 0)
+
+
+def test_repeated_hour_at_dst_end():
+    text = ("Date,Start Time,Usage (kWh)\n"
+            "2025-11-02,00:00,1.0\n"
+            "2025-11-02,01:00,1.1\n"
+            "2025-11-02,01:00,1.2\n"
+            "2025-11-02,02:00,1.3\n")
+
+    intervals = list(iter_interval_csv(io.StringIO(text), LOS_ANGELES, interval_minutes=60))
+
+    first = datetime(2025, 11, 2, tzinfo=LOS_ANGELES).timestamp()
+    assert [start - first for start, *_ in intervals] == [0, 3600, 7200, 10800]
+    assert [end - start for start, end, *_ in intervals] == [3600] * 4
+    assert [kwh for _, _, kwh, _, _ in intervals] == [1.0, 1.1, 1.2, 1.3]
+
+
+def test_end_times_across_dst_end():
+    text = ("Start,End,kWh\n"
+            "11/02/2025 00:30,11/02/2025 01:30,1.0\n"
+            "11/02/2025 01:30,11/02/2025 01:30,1.0\n"
+            "11/02/2025 01:30,11/02/2025 02:30,1.0\n")
+    errors = []
+
+    intervals = list(iter_interval_csv(io.StringIO(text), LOS_ANGELES, errors=errors))
+
+    assert not errors
+    assert [end - start for start, end, *_ in intervals] == [3600] * 3
+    assert intervals[1][0] == intervals[0][1] and intervals[2][0] == intervals[1][1]
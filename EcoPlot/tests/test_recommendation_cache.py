@@ -0,0 +1,32 @@
+# tests/test_recommendation_cache.py
+import fakeredis
+from EcoPlot.services.recommendation_cache import (
+    RecommendationCache, RedisCacheBackend, recommendation_fingerprint, redis_client_factory
+)
+
+USER = {'timezone': 'UTC', 'has_solar': True, 'solar_capacity_kw': 5.0}
+DEVICES = [{'id': 1, 'name': 'Heat pump', 'power_watts': 2000}, {'id': 2, 'name': 'Fridge', 'power_watts': 150}]
+
+
+def test_fingerprint_ignores_device_order():
+    assert recommendation_fingerprint(USER, DEVICES) == recommendation_fingerprint(USER, DEVICES[::-1])
+    assert recommendation_fingerprint(USER, DEVICES) != recommendation_fingerprint(dict(USER, has_solar=False), DEVICES)
+
+
+def test_redis_backend_evicts_least_recently_used(ecoplot_app):
+    cache = RecommendationCache(RedisCacheBackend(2, client=fakeredis.FakeRedis()), ttl=60)
+    cache.set('a', {'success': True, 'overall_recommendations': ['a']})
+    cache.set('b', {'success': True, 'overall_recommendations': ['b']})
+    assert cache.get('a')['overall_recommendations'] == ['a']
+
+    # b was read least recently, so it makes room for c
+    cache.set('c', {'success': True, 'overall_recommendations': ['c']})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['size'] == 2
+    assert cache.stats()['misses'] == 1
+
+
+def test_client_factory_resolves_module_path():
+    factory = redis_client_factory('fakeredis:FakeRedis.from_url')
+    assert isinstance(factory('redis://localhost:6379/0'), fakeredis.FakeRedis)
@@ -0,0 +1,109 @@
+# tests/test_scenarios.py
+import os
+import signal
+from datetime import datetime
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+import numpy as np
+import pytest
+from EcoPlot.services.battery_simulator import STEP_HOURS, STEP_SECONDS
+from EcoPlot.services.scenarios import PLAN_ARRAYS, ScenarioPool, ev_load, evaluate, parse_scenario
+from EcoPlot.services.tariffs import TariffEngine, builtin_plans
+
+STEPS = 14 * 96
+PLANS = ('tou', 'flat')
+SETTINGS = {
+    'battery_c_rate': 0.5, 'battery_efficiency': 0.9, 'battery_reserve': 0.2, 'ev_efficiency': 0.9,
+    'ev_charge_kw': 7.2, 'ev_plug_in_minute': 18 * 60, 'ev_departure_minute': 7 * 60, 'coverage': 1.0
+}
+
+
+@pytest.fixture(scope='module')
+def household():
+    """Two weeks of a household with a device, solar output per kW and two rate plans"""
+    tz = ZoneInfo('America/Los_Angeles')
+    start = int(datetime(2025, 6, 2, tzinfo=tz).timestamp()) // STEP_SECONDS * STEP_SECONDS
+    hour = np.arange(STEPS) % 96 / 4
+    device = np.where((hour >= 17) & (hour < 21), 2.0, 0.0) * STEP_HOURS
+    arrays = {
+        'consumption': 0.5 * STEP_HOURS + device,
+        'production': np.zeros(STEPS),
+        'solar_per_kw': np.clip(np.sin((hour - 6) / 12 * np.pi), 0, None) * 0.8 * STEP_HOURS,
+        'local_minute': (np.arange(STEPS) % 96 * 15).astype(np.int16),
+        'intensity': np.full(STEPS, 0.4),
+        'device:7': device
+    }
+    engine = TariffEngine(builtin_plans({}))
+    user = SimpleNamespace(electricity_rate_plan='tou', timezone=tz.key, peak_rate_per_kwh=0.32,
+                           off_peak_rate_per_kwh=0.14, solar_feed_in_tariff=0.05)
+    plans = {}
+    for name in PLANS:
+        inputs = engine.bill_inputs(user, start, STEPS, name)
+        arrays.update({f"{name}:{array_name}": inputs[array_name] for array_name in PLAN_ARRAYS})
+        arrays['month'] = inputs['month']
+        plans[name] = {key: inputs[key] for key in ('months', 'month_share', 'tiers', 'demand_charge_per_kw',
+                                                    'fixed_monthly')}
+    return arrays, plans
+
+
+def test_parse_rejects_bad_scenarios():
+    plans = {'tou': {}}
+    devices = {7: SimpleNamespace(power_consumption_watts=2000), 8: SimpleNamespace(power_consumption_watts=None)}
+    assert parse_scenario({'name': 'x', 'solar_kw': '4'}, plans, devices) == {'name': 'x', 'solar_kw': 4.0}
+    assert parse_scenario({'swap': [{'device_id': 7, 'power_watts': 500}]}, plans, devices)['swap'][0]['scale'] == 0.25
+    for spec in ({'wind_kw': 1}, {'solar_kw': -1}, {'battery_kwh': 'nan'}, {'rate_plan': 'nope'},
+                 {'swap': [{'device_id': 9, 'power_watts': 1}]}, {'swap': [{'device_id': 8, 'power_watts': 1}]}):
+        with pytest.raises(ValueError):
+            parse_scenario(spec, plans, devices)
+
+
+def test_ev_load_fills_off_peak_steps_of_the_window():
+    local_minute = np.arange(2 * 96) % 96 * 15
+    peak = (local_minute >= 16 * 60) & (local_minute < 21 * 60)
+    load = ev_load(local_minute, peak, 10.0, 4.0, 18 * 60, 7 * 60)
+
+    # One session starts in the horizon; the second night runs past its end
+    assert load.sum() == pytest.approx(10.0)
+    charged = np.flatnonzero(load)
+    assert local_minute[charged[0]] == 21 * 60 and not peak[charged].any()
+    assert load.max() == pytest.approx(4.0 * STEP_HOURS)
+
+
+def test_partial_history_scaled_to_a_year(household):
+    arrays, plans = household
+    full = evaluate(arrays, {'rate_plan': 'tou'}, plans, SETTINGS)
+    half = evaluate(arrays, {'rate_plan': 'tou'}, plans, dict(SETTINGS, coverage=0.5))
+    assert half['annual_cost'] == pytest.approx(2 * full['annual_cost'], abs=0.02)
+    assert half['carbon_kg'] == pytest.approx(2 * full['carbon_kg'], abs=0.2)
+    assert half['consumption_kwh'] == full['consumption_kwh']
+
+
+def test_overrides_change_the_right_figures(household):
+    arrays, plans = household
+    base = evaluate(arrays, {'rate_plan': 'tou'}, plans, SETTINGS)
+    solar = evaluate(arrays, {'rate_plan': 'tou', 'solar_kw': 4.0}, plans, SETTINGS)
+    swap = evaluate(arrays, {'rate_plan': 'tou', 'swap': [{'device_id': 7, 'scale': 0.5}]}, plans, SETTINGS)
+    battery = evaluate(arrays, {'rate_plan': 'tou', 'solar_kw': 4.0, 'battery_kwh': 10.0}, plans, SETTINGS)
+
+    assert solar['grid_import_kwh'] < base['grid_import_kwh'] and solar['grid_export_kwh'] > 0
+    assert swap['consumption_kwh'] == pytest.approx(base['consumption_kwh'] - 14 * 4 * 1.0, abs=0.1)
+    assert battery['battery_strategy'] is not None
+    assert battery['annual_cost'] <= solar['annual_cost']
+
+
+def test_pool_matches_serial_and_survives_dead_workers(household):
+    arrays, plans = household
+    batch = [{'rate_plan': plan, 'solar_kw': float(kw), 'battery_kwh': 5.0 if kw % 2 else 0.0}
+             for plan in PLANS for kw in range(4)]
+    serial = [evaluate(arrays, scenario, plans, SETTINGS) for scenario in batch]
+    pool = ScenarioPool(2)
+    try:
+        assert pool.map(arrays, batch, plans, SETTINGS) == serial
+
+        broken = pool.executor()
+        for pid in list(broken._processes):
+            os.kill(pid, signal.SIGKILL)
+        assert pool.map(arrays, batch, plans, SETTINGS) == serial
+        assert pool.executor() is not broken
+    finally:
+        pool.shutdown()
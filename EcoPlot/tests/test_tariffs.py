@@ -0,0 +1,57 @@
+# tests/test_tariffs.py
+import numpy as np
+import pytest
+from EcoPlot.services.tariffs import SLOT_HOURS, bill_from_inputs
+
+
+def inputs(**terms):
+    return {
+        'price': np.array([0.2, 0.2, 0.4, 0.4, 0.1, 0.1]),
+        'export_price': np.full(6, 0.05),
+        'demand': np.array([False, True, True, False, True, False]),
+        'month': np.array([0, 0, 0, 1, 1, 1]),
+        'months': ['2025-01', '2025-02'],
+        'month_share': np.array([1.0, 0.5]),
+        'tiers': [],
+        'demand_charge_per_kw': 0.0,
+        'fixed_monthly': 0.0,
+        **terms
+    }
+
+
+def test_energy_and_export_by_month():
+    drawn = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    exported = np.array([0.0, 0.0, 1.0, 0.0, 2.0, 0.0])
+
+    bill = bill_from_inputs(inputs(), drawn, exported)
+
+    assert [month['energy'] for month in bill['monthly']] == pytest.approx([1.8, 2.7])
+    assert [month['export_credit'] for month in bill['monthly']] == pytest.approx([0.05, 0.1])
+    assert bill['total'] == pytest.approx(1.8 + 2.7 - 0.15)
+
+
+def test_tiers_apply_per_month():
+    drawn = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+
+    bill = bill_from_inputs(inputs(tiers=[[5, 0.0], [10, 0.1], [None, 0.3]]), drawn)
+
+    # 6 kWh in January: 1 kWh in the second tier; 15 kWh in February: 5 and 5
+    assert [month['tiers'] for month in bill['monthly']] == pytest.approx([0.1, 0.5 + 1.5])
+    assert bill['tiers'] == pytest.approx(2.1)
+
+
+def test_demand_charge_uses_peak_window_of_each_month():
+    drawn = np.array([9.0, 2.0, 3.0, 8.0, 1.0, 6.0])
+
+    bill = bill_from_inputs(inputs(demand_charge_per_kw=10.0), drawn, monthly=True)
+
+    assert [month['demand'] for month in bill['monthly']] == pytest.approx(
+        [3.0 / SLOT_HOURS * 10, 1.0 / SLOT_HOURS * 10])
+
+
+def test_fixed_charge_prorated():
+    bill = bill_from_inputs(inputs(fixed_monthly=12.0), np.zeros(6), monthly=False)
+
+    assert bill['fixed'] == pytest.approx(18.0)
+    assert bill['total'] == pytest.approx(18.0)
+    assert 'monthly' not in bill
@@ -0,0 +1,97 @@
+# tests/test_usage_rollups.py
+"""Incrementally maintained rollups match a rebuild from the usage logs"""
+from datetime import datetime, timedelta
+import pytest
+from EcoPlot import db
+from EcoPlot.models.device import Device
+from EcoPlot.models.device_usage import DeviceUsageLog
+from EcoPlot.models.usage_rollup import UsageRollup
+from EcoPlot.models.user import User
+from EcoPlot.services.usage_rollups import VALUE_COLUMNS, UsageRollupService, get_rollup_rebuilds, pending_rebuilds
+
+
+def rollup_rows(user_id):
+    db.session.expire_all()
+    rows = {}
+    for rollup in UsageRollup.query.filter_by(user_id=user_id):
+        values = tuple(getattr(rollup, column) for column in VALUE_COLUMNS)
+        # Buckets emptied by deletes stay behind as zeros, and a rebuild spreads rounding
+        # dust from the stored timestamps into neighbouring hours; neither is usage
+        if any(abs(value) > 1e-6 for value in values):
+            rows[(rollup.grain, rollup.device_id, rollup.bucket_start)] = values
+    return rows
+
+
+def assert_matches_rebuild(user_id):
+    incremental = rollup_rows(user_id)
+    UsageRollupService.rebuild_user(user_id)
+    rebuilt = rollup_rows(user_id)
+    assert incremental.keys() == rebuilt.keys()
+    for key, values in rebuilt.items():
+        assert incremental[key] == pytest.approx(values, abs=1e-6), key
+
+
+@pytest.fixture
+def household(synthetic_households):
+    synthetic_households(users=1, days=20, seed=3)
+    user = User.query.first()
+    device = Device.query.filter_by(user_id=user.id).first()
+    return user.id, device.id
+
+
+def test_generated_rollups_match_rebuild(household):
+    user_id, _ = household
+    assert_matches_rebuild(user_id)
+
+
+def test_insert_correct_delete(household):
+    user_id, device_id = household
+    start = datetime.utcnow().replace(minute=20, second=0, microsecond=0) - timedelta(days=2)
+    logs = [
+        DeviceUsageLog(device_id=device_id, start_time=start, end_time=start + timedelta(hours=3),
+                       energy_consumed_kwh=4.5, cost=0.9, carbon_footprint_kg=1.8, energy_source='grid'),
+        DeviceUsageLog(device_id=device_id, start_time=start + timedelta(days=1), end_time=None,
+                       energy_consumed_kwh=1.2, cost=0.0, carbon_footprint_kg=0.0, energy_source='solar'),
+        DeviceUsageLog(device_id=device_id, start_time=start - timedelta(days=40),
+                       end_time=start - timedelta(days=40, hours=-1),
+                       energy_consumed_kwh=2.0, cost=0.3, carbon_footprint_kg=0.5, energy_source='battery')
+    ]
+    db.session.add_all(logs)
+    db.session.commit()
+    assert_matches_rebuild(user_id)
+
+    corrected = db.session.get(DeviceUsageLog, logs[0].id)
+    corrected.energy_consumed_kwh = 6.0
+    corrected.start_time = start - timedelta(days=5, minutes=50)
+    corrected.energy_source = 'wind'
+    db.session.commit()
+    assert_matches_rebuild(user_id)
+
+    db.session.delete(db.session.get(DeviceUsageLog, logs[1].id))
+    db.session.commit()
+    assert_matches_rebuild(user_id)
+
+
+def test_bulk_delete_of_expired_logs(household):
+    user_id, device_id = household
+    victims = DeviceUsageLog.query.filter_by(device_id=device_id).limit(25).all()
+    db.session.commit()  # expires the loaded logs
+    for log in victims:
+        db.session.delete(log)
+    db.session.commit()
+    assert_matches_rebuild(user_id)
+
+
+def test_timezone_change_rebuilt_by_queue(ecoplot_app, household):
+    user_id, _ = household
+    ecoplot_app.config['USAGE_ROLLUP_REBUILD_INLINE_WORKER'] = False
+    user = db.session.get(User, user_id)
+    user.timezone = 'Asia/Kolkata' if user.timezone != 'Asia/Kolkata' else 'Europe/Berlin'
+    db.session.commit()
+
+    with db.engine.connect() as conn:
+        assert pending_rebuilds(conn) == [user_id]
+    assert get_rollup_rebuilds().run_pending() == 1
+    with db.engine.connect() as conn:
+        assert pending_rebuilds(conn) == []
+    assert_matches_rebuild(user_id)